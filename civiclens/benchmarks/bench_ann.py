@@ -0,0 +1,96 @@
+"""
+Recall and speed of approximate paraphrase mining against the exact search.
+
+Builds synthetic corpora of embeddings, comments scattered around a number
+of topics with some near-duplicate form letters, and mines them with
+`util.paraphrase_mining_embeddings` and with the IVF index at a few probe
+counts, with no cap on the number of pairs. Recall is the share of the
+exact pairs above the similarity threshold that the index also finds; with
+more than `top_k` copies of a form letter the two searches can keep
+different, equally similar neighbours, so it can stay just under 1.
+
+    python -m civiclens.benchmarks.bench_ann --comments 10000 50000
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+import torch
+from sentence_transformers import util
+
+from civiclens.nlp.ann import ANN_MIN_SIMILARITY, ANN_TOP_K, IVFIndex, normalize
+
+
+def make_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(1, n // 40), dim))
+    vectors = topics[rng.integers(0, len(topics), n)]
+    vectors += rng.normal(scale=0.06, size=(n, dim))
+    # a tenth of the comments are copies of a few form letters
+    letters = rng.choice(n, size=20, replace=False)
+    copies = rng.choice(n, size=n // 10, replace=False)
+    vectors[copies] = vectors[rng.choice(letters, size=len(copies))]
+    vectors[copies] += rng.normal(scale=0.005, size=(len(copies), dim))
+    return normalize(vectors)
+
+
+def run(sizes: list[int], dim: int, probes: list[int], exact: bool) -> None:
+    for n in sizes:
+        embeddings = make_embeddings(n, dim)
+        # high enough that neither search drops pairs to stay under it
+        max_pairs = 2 * n * ANN_TOP_K
+        print(f"{n} comments")
+
+        expected = None
+        if exact:
+            start = time.perf_counter()
+            pairs = util.paraphrase_mining_embeddings(
+                torch.from_numpy(embeddings), max_pairs=max_pairs
+            )
+            expected = {
+                (i, j) for score, i, j in pairs if score >= ANN_MIN_SIMILARITY
+            }
+            print(
+                f"{'exact':>16}: {time.perf_counter() - start:.2f}s, "
+                f"{len(expected)} pairs"
+            )
+
+        start = time.perf_counter()
+        index = IVFIndex(embeddings)
+        print(
+            f"{'build index':>16}: {time.perf_counter() - start:.2f}s, "
+            f"{index.n_lists} lists"
+        )
+        for n_probe in probes:
+            start = time.perf_counter()
+            found = {
+                (i, j)
+                for _, i, j in index.pairs(n_probe=n_probe, max_pairs=max_pairs)
+            }
+            line = (
+                f"{f'ann n_probe={n_probe}':>16}: "
+                f"{time.perf_counter() - start:.2f}s, {len(found)} pairs"
+            )
+            if expected:
+                recall = len(found & expected) / len(expected)
+                line += f", recall {recall:.3f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--comments", type=int, nargs="+", default=[10_000, 50_000]
+    )
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument(
+        "--no-exact",
+        action="store_true",
+        help="skip the exact search, eg for corpora too large for it",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.comments, args.dim, args.probes, not args.no_exact)
@@ -0,0 +1,91 @@
+"""
+Microbenchmark for labelling comments with their clusters.
+
+Splits frames of comments into clusters of a fixed size, so the number of
+clusters grows with the number of comments, and times `assign_clusters`
+against the loop it replaced, which rebuilt the whole cluster column once
+per cluster. Time per comment staying flat as the frame grows shows the
+single pass scales linearly; the loop's grows with the number of clusters.
+
+    python -m civiclens.benchmarks.bench_assign_clusters --comments 10000 100000
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+import polars as pl
+
+from civiclens.nlp.comments import assign_clusters
+
+
+def assign_clusters_loop(
+    df: pl.DataFrame, clusters: list[set[int]]
+) -> pl.DataFrame:
+    rows = df.shape[0]
+    for i, cluster_data in enumerate(clusters):
+        df = df.with_columns(
+            pl.when(pl.arange(0, rows).is_in(cluster_data))
+            .then(i)
+            .otherwise(pl.col("cluster"))
+            .alias("cluster")
+        )
+    return df
+
+
+def make_clusters(n: int, cluster_size: int, seed: int = 0):
+    rows = np.random.default_rng(seed).permutation(n)
+    return [
+        set(rows[start : start + cluster_size].tolist())
+        for start in range(0, n, cluster_size)
+    ]
+
+
+def run(sizes: list[int], cluster_size: int, loop_limit: int) -> None:
+    for n in sizes:
+        df = pl.DataFrame(
+            {
+                "id": [f"C-{i}" for i in range(n)],
+                "cluster": pl.Series([None] * n, dtype=pl.Utf8),
+            }
+        )
+        clusters = make_clusters(n, cluster_size)
+        print(f"{n} comments, {len(clusters)} clusters")
+
+        start = time.perf_counter()
+        labelled = assign_clusters(df, clusters)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'single pass':>12}: {elapsed:.3f}s, "
+            f"{elapsed / n * 1e6:.2f}us per comment"
+        )
+
+        if len(clusters) > loop_limit:
+            print(f"{'loop':>12}: skipped, more than {loop_limit} clusters")
+            continue
+        start = time.perf_counter()
+        looped = assign_clusters_loop(df, clusters)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'loop':>12}: {elapsed:.3f}s, "
+            f"{elapsed / n * 1e6:.2f}us per comment"
+        )
+        assert looped.equals(labelled)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--comments", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--cluster-size", type=int, default=20)
+    parser.add_argument(
+        "--loop-limit",
+        type=int,
+        default=5_000,
+        help="skip the old loop above this many clusters",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.comments, args.cluster_size, args.loop_limit)
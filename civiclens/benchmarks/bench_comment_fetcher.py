@@ -0,0 +1,84 @@
+"""
+Throughput benchmark for the concurrent comment detail fetcher.
+
+Runs a local stub of the regulations.gov comment detail endpoint with a fixed
+per-request latency and compares fetching the same comments one at a time
+(max_concurrency=1, the old serial behaviour) against concurrent fetching.
+
+    python -m civiclens.benchmarks.bench_comment_fetcher --comments 500
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from civiclens.collect.comment_fetcher import iter_comment_details
+from civiclens.collect.quota import QuotaScheduler
+
+
+def make_handler(latency: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+        wbufsize = 1 << 16  # send headers and body in one write
+
+        def do_GET(self):
+            time.sleep(latency)
+            comment_id = self.path.split("/")[-1].split("?")[0]
+            payload = json.dumps(
+                {"data": {"id": comment_id, "attributes": {"comment": "x"}}}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def run(num_comments: int, latency: float, concurrency: list[int]) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v4/comments/"
+    comments = [{"id": f"BENCH-{i}"} for i in range(num_comments)]
+
+    print(f"{num_comments} comments, {latency * 1000:.0f}ms per request")
+    baseline = None
+    for max_concurrency in concurrency:
+        start = time.perf_counter()
+        fetched = sum(
+            1
+            for _ in iter_comment_details(
+                "DEMO_KEY",
+                comments,
+                max_concurrency=max_concurrency,
+                scheduler=QuotaScheduler(limit=10**9, burst=10**9),
+                base_url=base_url,
+            )
+        )
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"concurrency={max_concurrency:>3}: {fetched} comments in "
+            f"{elapsed:.2f}s ({fetched / elapsed:.1f}/s, "
+            f"{baseline / elapsed:.1f}x)"
+        )
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--comments", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 4, 8, 16, 32]
+    )
+    args = parser.parse_args()
+    run(args.comments, args.latency, args.concurrency)
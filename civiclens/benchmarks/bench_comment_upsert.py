@@ -0,0 +1,87 @@
+"""
+Benchmark for writing comments to the regulations_comment table.
+
+Compares the row-at-a-time path (`insert_comment_into_db`, one connection and
+one transaction per comment) against the batched path
+(`insert_comments_into_db`). Needs the database from the .env file and the id
+of a document already in it; run it against a development database only.
+The synthetic comments it writes have ids starting with "BENCH-" and are
+deleted at the end.
+
+    python -m civiclens.benchmarks.bench_comment_upsert DOC-ID --comments 2000
+"""
+
+import argparse
+import time
+
+from civiclens.collect.move_data_from_api_to_database import (
+    COMMENT_BATCH_SIZE,
+    db_cursor,
+    insert_comment_into_db,
+    insert_comments_into_db,
+)
+
+
+def make_comments(document_id: str, num_comments: int) -> list[dict]:
+    return [
+        {
+            "id": f"BENCH-{i}",
+            "attributes": {"objectId": "bench", "title": f"Comment {i}"},
+            "data": {
+                "attributes": {
+                    "commentOnDocumentId": document_id,
+                    "comment": "Benchmark comment text. " * 20,
+                    "modifyDate": "2024-01-01T00:00:00Z",
+                    "postedDate": "2024-01-01T00:00:00Z",
+                    "receiveDate": "2024-01-01T00:00:00Z",
+                }
+            },
+        }
+        for i in range(num_comments)
+    ]
+
+
+def delete_bench_comments() -> None:
+    with db_cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM regulations_comment WHERE id LIKE 'BENCH-%'"
+        )
+
+
+def run(document_id: str, num_comments: int, batch_size: int) -> None:
+    comments = make_comments(document_id, num_comments)
+    delete_bench_comments()
+
+    try:
+        start = time.perf_counter()
+        for comment in comments:
+            insert_comment_into_db(comment)
+        row_elapsed = time.perf_counter() - start
+        print(
+            f"row at a time: {num_comments} comments in {row_elapsed:.2f}s "
+            f"({num_comments / row_elapsed:.0f}/s)"
+        )
+
+        # delete the rows from the first pass so both time the same inserts
+        delete_bench_comments()
+        start = time.perf_counter()
+        result = insert_comments_into_db(comments, batch_size=batch_size)
+        batch_elapsed = time.perf_counter() - start
+        print(
+            f"batches of {batch_size}: {result['written']} comments in "
+            f"{batch_elapsed:.2f}s ({num_comments / batch_elapsed:.0f}/s, "
+            f"{row_elapsed / batch_elapsed:.1f}x)"
+        )
+    finally:
+        delete_bench_comments()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "document_id", help="id of a document already in the database"
+    )
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=COMMENT_BATCH_SIZE)
+    args = parser.parse_args()
+    run(args.document_id, args.comments, args.batch_size)
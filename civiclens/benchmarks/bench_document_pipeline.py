@@ -0,0 +1,159 @@
+"""
+Throughput benchmark for adding documents to the database.
+
+Serves synthetic Federal Register XML from a local stub with a fixed
+per-request latency, and stands in for the database with a fixed latency
+per statement, then compares the old one-document-at-a-time loop (fetch,
+parse, QA, insert) against the staged pipeline in `add_documents_to_db`.
+
+    python -m civiclens.benchmarks.bench_document_pipeline --documents 200
+"""
+
+import argparse
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from civiclens.benchmarks.bench_fr_xml import make_rule_xml
+from civiclens.collect import move_data_from_api_to_database as move_data
+
+
+def make_handler(latency: float, xml_content: bytes):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(xml_content)))
+            self.end_headers()
+            self.wfile.write(xml_content)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def make_documents(num_documents: int) -> list[dict]:
+    return [
+        {
+            "id": f"BENCH-{i}",
+            "attributes": {
+                "documentType": "Rule",
+                "lastModifiedDate": "2024-06-01T12:00:00Z",
+                "frDocNum": f"2024-{i:05d}",
+                "withdrawn": False,
+                "agencyId": "EPA",
+                "commentEndDate": "2024-08-01T03:59:59Z",
+                "postedDate": "2024-06-01T04:00:00Z",
+                "docketId": "BENCH",
+                "subtype": None,
+                "commentStartDate": "2024-06-01T04:00:00Z",
+                "openForComment": True,
+                "objectId": f"obj-{i}",
+                "title": "Benchmark rule",
+            },
+            "links": {"self": f"https://api.regulations.gov/v4/documents/{i}"},
+        }
+        for i in range(num_documents)
+    ]
+
+
+def serial(docs: list[dict]) -> None:
+    """
+    The loop `add_documents_to_db` ran before the pipeline.
+    """
+    for doc in docs:
+        full_doc_info = move_data.query_register_API_and_merge_document_data(
+            doc
+        )
+        move_data.qa_document_data(full_doc_info)
+        move_data.clean_document_data(full_doc_info)
+        move_data.insert_document_into_db(full_doc_info)
+
+
+def run(
+    num_documents: int,
+    latency: float,
+    db_latency: float,
+    megabytes: float,
+    parse_workers: list[int],
+) -> None:
+    xml_content = make_rule_xml(megabytes).encode()
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(latency, xml_content)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    xml_url = f"http://127.0.0.1:{server.server_port}/rule.xml"
+
+    def write_rows(rows):
+        time.sleep(db_latency)
+        return list(rows), []
+
+    print(
+        f"{num_documents} documents, {len(xml_content) / 2**20:.1f} MiB of "
+        f"XML each, {latency * 1000:.0f}ms per request, "
+        f"{db_latency * 1000:.0f}ms per statement"
+    )
+    with patch.object(
+        move_data, "fetch_fr_document_details", return_value=xml_url
+    ), patch.object(
+        move_data.fr_cache, "get_cache", return_value=None
+    ), patch.object(
+        move_data, "existing_ids", side_effect=lambda *args: set()
+    ), patch.object(
+        move_data,
+        "insert_document_into_db",
+        side_effect=lambda doc: time.sleep(db_latency),
+    ), patch.object(
+        move_data, "upsert_document_rows", side_effect=write_rows
+    ):
+        start = time.perf_counter()
+        serial(make_documents(num_documents))
+        baseline = time.perf_counter() - start
+        print(f"{'serial':>18}: {baseline:.2f}s")
+
+        for workers in parse_workers:
+            start = time.perf_counter()
+            stats = move_data.add_documents_to_db(
+                make_documents(num_documents),
+                print_statements=False,
+                parse_workers=workers,
+            )
+            elapsed = time.perf_counter() - start
+            print(
+                f"parse_workers={workers:>3}: {elapsed:.2f}s "
+                f"({baseline / elapsed:.1f}x); "
+                + ", ".join(
+                    f"{name} {stage['busy_seconds']:.1f}s busy, max queue "
+                    f"{stage['max_queue_depth']}"
+                    for name, stage in stats.items()
+                )
+            )
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--megabytes", type=float, default=1)
+    parser.add_argument(
+        "--parse-workers", type=int, nargs="+", default=[0, 2, 4]
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(
+        args.documents,
+        args.latency,
+        args.db_latency,
+        args.megabytes,
+        args.parse_workers,
+    )
@@ -0,0 +1,115 @@
+"""
+Benchmark for parsing Federal Register rule XML.
+
+Builds a synthetic rule shaped like the real ones (preamble, summary, dates,
+then a long supplementary information section of headings, paragraphs with
+emphasis, footnotes and extracts) at a given size, and compares the tree
+based `parse_xml_content` against the streaming `extract_fr_xml`, reading
+the XML from a string and, for the streaming extractor, from a file.
+
+    python -m civiclens.benchmarks.bench_fr_xml --megabytes 10 30
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from civiclens.collect.fr_xml import extract_fr_xml
+from civiclens.collect.move_data_from_api_to_database import parse_xml_content
+
+
+PREAMBLE = """<?xml version="1.0" encoding="UTF-8"?>
+<RULE>
+<PREAMB>
+<AGENCY TYPE="S">Environmental Protection Agency</AGENCY>
+<CFR>40 CFR Part 63</CFR>
+<DEPDOC>[EPA-HQ-OAR-2024-0001; FRL-1234-01-OAR]</DEPDOC>
+<RIN>RIN 2060-AV00</RIN>
+<SUBJECT>National Emission Standards for Hazardous Air Pollutants</SUBJECT>
+<AGY><HD SOURCE="HED">AGENCY:</HD><P>Environmental Protection Agency.</P></AGY>
+<SUM><HD SOURCE="HED">SUMMARY:</HD>
+<P>The EPA is finalizing amendments to the national emission standards.</P>
+</SUM>
+<DATES><HD SOURCE="HED">DATES:</HD>
+<P>This final rule is effective on July 1, 2024.</P></DATES>
+<FURINF><HD SOURCE="HED">FOR FURTHER INFORMATION CONTACT:</HD>
+<P>Jane Doe, Sector Policies and Programs Division.</P></FURINF>
+</PREAMB>
+<SUPLINF>
+<HD SOURCE="HED">SUPPLEMENTARY INFORMATION:</HD>
+"""
+
+SECTION = """<HD SOURCE="HD1">{n}. Background and Summary of Changes</HD>
+<P>Section {n} explains how the <E T="03">amended standards</E> apply to
+affected sources, including facilities constructed after the proposal
+date.<SU>{n}</SU> Owners and operators must comply within <E T="03">three
+years</E> of the effective date of this rule.</P>
+<HD SOURCE="HD2">{n}.1 Comments Received</HD>
+<P>Commenters stated that the compliance period was too short for sources
+that must install new control devices; the agency responds below.</P>
+<EXTRACT><P>Each owner or operator must demonstrate compliance with the
+emission limits in table {n} of this subpart.</P></EXTRACT>
+<FTNT><P><SU>{n}</SU> See the docket for the technical memorandum.</P></FTNT>
+"""
+
+CLOSING = """</SUPLINF>
+</RULE>
+"""
+
+
+def make_rule_xml(megabytes: float) -> str:
+    parts = [PREAMBLE]
+    size = len(PREAMBLE)
+    n = 0
+    while size < megabytes * 2**20:
+        n += 1
+        section = SECTION.format(n=n)
+        parts.append(section)
+        size += len(section)
+    parts.append(CLOSING)
+    return "".join(parts)
+
+
+def measure(label: str, parse, source) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = parse(source)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:>24}: {elapsed:.2f}s, peak {peak / 2**20:.1f} MiB, "
+        f"{len(result['supplementaryInformation']) / 2**20:.1f} MiB of "
+        "supplementary text"
+    )
+    return result
+
+
+def run(sizes: list[float]) -> None:
+    for megabytes in sizes:
+        xml_content = make_rule_xml(megabytes)
+        print(f"{len(xml_content) / 2**20:.0f} MiB rule")
+        measure("parse_xml_content", parse_xml_content, xml_content)
+        measure("extract_fr_xml", extract_fr_xml, xml_content)
+
+        with tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False) as f:
+            f.write(xml_content)
+        del xml_content
+        try:
+            with open(f.name, "rb") as xml_file:
+                measure("extract_fr_xml from file", extract_fr_xml, xml_file)
+        finally:
+            os.remove(f.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--megabytes", type=float, nargs="+", default=[1, 10, 30]
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.megabytes)
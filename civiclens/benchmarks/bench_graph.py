@@ -0,0 +1,82 @@
+"""
+Benchmark for building, clustering and finding the centre of comment graphs.
+
+Builds a synthetic frame of paraphrase pairs like `comment_similarity`
+returns, each comment linked to comments on the same topic, and compares
+the networkx path (`build_graph`, `get_clusters`, `find_central_node`)
+with the sparse one (`similarity_graph`, `louvain_clusters`,
+`central_nodes`), reporting the modularity each clustering reaches.
+
+    python -m civiclens.benchmarks.bench_graph --comments 10000 50000
+"""
+
+import argparse
+import logging
+import time
+
+import networkx as nx
+import numpy as np
+import polars as pl
+
+from civiclens.nlp import comments, graph
+
+
+def make_pairs(n: int, pairs_per_comment: int = 10, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    topics = rng.integers(0, max(1, n // 25), n)
+    # comments sorted by topic, each linked to others close by
+    order = np.argsort(topics)
+    position = np.empty(n, dtype=np.int64)
+    position[order] = np.arange(n)
+    idx1 = rng.integers(0, n, n * pairs_per_comment)
+    offsets = rng.integers(-30, 30, len(idx1))
+    idx2 = order[np.clip(position[idx1] + offsets, 0, n - 1)]
+    keep = idx1 != idx2
+    idx1, idx2 = idx1[keep], idx2[keep]
+    return pl.DataFrame(
+        {
+            "similarity": rng.uniform(0.3, 0.99, len(idx1)),
+            "idx1": np.minimum(idx1, idx2),
+            "idx2": np.maximum(idx1, idx2),
+        }
+    ).unique(subset=["idx1", "idx2"])
+
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:>22}: {time.perf_counter() - start:.2f}s")
+    return result
+
+
+def run(sizes: list[int]) -> None:
+    for n in sizes:
+        df = make_pairs(n)
+        print(f"{n} comments, {df.height} pairs")
+
+        G = timed("networkx build", comments.build_graph, df)
+        clusters = timed("networkx louvain", comments.get_clusters, G)
+        timed("networkx centrality", comments.find_central_node, G, clusters)
+        nx_modularity = nx.community.modularity(G, clusters)
+
+        sparse = timed("sparse build", graph.similarity_graph, df)
+        sparse_clusters = timed(
+            "sparse louvain", graph.louvain_clusters, sparse
+        )
+        timed("sparse centrality", graph.central_nodes, sparse, sparse_clusters)
+        print(
+            f"{'modularity':>22}: networkx {nx_modularity:.4f} "
+            f"({len(clusters)} clusters), sparse "
+            f"{nx.community.modularity(G, sparse_clusters):.4f} "
+            f"({len(sparse_clusters)} clusters)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--comments", type=int, nargs="+", default=[10_000, 50_000]
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.comments)
@@ -0,0 +1,79 @@
+"""
+Benchmark for checking comments against the data quality rules.
+
+Builds synthetic cleaned comments, a few percent of them failing a rule,
+and compares running the per-record checks of `qa_comment_data` on each
+one against validating the batch as a polars frame, timing the frame's
+construction from the JSON separately.
+
+    python -m civiclens.benchmarks.bench_qa_rules --comments 100000 1000000
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+
+from civiclens.collect import qa_rules
+from civiclens.collect.data_quality import run_checks
+
+
+def make_comments(n: int) -> list[dict]:
+    posted = datetime(2024, 5, 1)
+    comments = []
+    for i in range(n):
+        comments.append(
+            {
+                "id": f"EPA-HQ-OAR-2024-0001-{i:07d}",
+                "attributes": {"objectId": f"09000064{i:08x}"},
+                "data": {
+                    "attributes": {
+                        "commentOn": "0900006486d7b0c8",
+                        "duplicateComments": 0 if i % 50 else 2,
+                        "subtype": None if i % 7 else "Public Comment",
+                        "comment": f"Comment number {i} on the rule.",
+                        "modifyDate": posted + timedelta(seconds=i),
+                        "postedDate": posted + timedelta(seconds=i),
+                        "receiveDate": posted,
+                        "withdrawn": i % 97 == 0,
+                    }
+                },
+            }
+        )
+    return comments
+
+
+def run(sizes: list[int]) -> None:
+    checks = [rule.as_check() for rule in qa_rules.COMMENT_RULES]
+    for n in sizes:
+        comments = make_comments(n)
+        print(f"{n} comments")
+
+        start = time.perf_counter()
+        failures = sum(len(run_checks(comment, checks)) for comment in comments)
+        print(
+            f"{'per record':>16}: {time.perf_counter() - start:.2f}s, "
+            f"{failures} violations"
+        )
+
+        start = time.perf_counter()
+        df = qa_rules.records_to_frame(comments, qa_rules.COMMENT_RULES)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        violations = qa_rules.validate_frame(
+            df, qa_rules.COMMENT_RULES, "comment"
+        )
+        print(
+            f"{'frame':>16}: {time.perf_counter() - start:.2f}s "
+            f"(+{built:.2f}s to build it), {violations.height} violations"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--comments", type=int, nargs="+", default=[100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.comments)
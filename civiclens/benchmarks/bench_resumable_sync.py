@@ -0,0 +1,173 @@
+"""
+Demo of the resumable sync against a local fake of the regulations.gov
+documents search endpoint that fails a share of its requests.
+
+Each failure stops the sync, which is then rerun, as a cron job would. The
+demo compares requests spent when each rerun resumes from the saved cursor
+against starting the date range over, as `pull_reg_gov_data` did.
+
+    python -m civiclens.benchmarks.bench_resumable_sync --objects 20000
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from civiclens.collect import sync
+from civiclens.collect.access_api_data import (
+    format_datetime_for_api,
+    get_reg_gov_page,
+)
+from civiclens.collect.quota import QuotaScheduler
+
+
+def make_objects(num_objects: int) -> list[dict]:
+    start = datetime(2024, 4, 15, 12, tzinfo=timezone.utc)
+    return [
+        {
+            "id": f"BENCH-{i:06}",
+            "attributes": {
+                "lastModifiedDate": (start + timedelta(seconds=i)).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                )
+            },
+        }
+        for i in range(num_objects)
+    ]
+
+
+def make_handler(objects: list[dict], failure_rate: float, seed: int):
+    modified = [
+        format_datetime_for_api(obj["attributes"]["lastModifiedDate"])
+        for obj in objects
+    ]
+    rng = random.Random(seed)
+    counts = {"requests": 0, "failures": 0}
+
+    class FakeAPIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            counts["requests"] += 1
+            if rng.random() < failure_rate:
+                counts["failures"] += 1
+                self.send_json(500, {"errors": [{"status": "500"}]})
+                return
+
+            query = parse_qs(urlsplit(self.path).query)
+            since = query["filter[lastModifiedDate][ge]"][0]
+            size = int(query["page[size]"][0])
+            number = int(query["page[number]"][0])
+            matches = [
+                obj
+                for obj, date in zip(objects, modified, strict=True)
+                if date >= since
+            ]
+            start = (number - 1) * size
+            page = matches[start : start + size]
+            self.send_json(
+                200,
+                {
+                    "data": page,
+                    "meta": {"hasNextPage": start + len(page) < len(matches)},
+                },
+            )
+
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeAPIHandler, counts
+
+
+def sync_until_complete(
+    fetch_page, resume: bool, max_runs: int
+) -> tuple[int, int, bool]:
+    """
+    Rerun the sync after every failure, up to `max_runs` times. Returns the
+    number of runs, the number of objects written and whether the sync
+    finished.
+    """
+    state = sync.MemorySyncState()
+    written = 0
+    for runs in range(1, max_runs + 1):
+
+        def handle_page(objects):
+            nonlocal written
+            written += len(objects)
+
+        try:
+            sync.sync_date_range(
+                "DEMO_KEY",
+                "documents",
+                "2024-04-15",
+                "2024-04-20",
+                handle_page,
+                state=state,
+                restart=not resume,
+                fetch_page=fetch_page,
+            )
+            return runs, written, True
+        except requests.HTTPError:
+            continue
+
+    return max_runs, written, False
+
+
+def run(
+    num_objects: int, failure_rate: float, seed: int, max_runs: int
+) -> None:
+    objects = make_objects(num_objects)
+    print(
+        f"{num_objects} documents, {failure_rate:.0%} of requests fail, "
+        f"{-(-num_objects // sync.PAGE_SIZE)} pages"
+    )
+
+    for resume in (False, True):
+        handler, counts = make_handler(objects, failure_rate, seed)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        fetch_page = partial(
+            get_reg_gov_page,
+            api_url=f"http://127.0.0.1:{server.server_port}/v4/",
+            scheduler=QuotaScheduler(limit=10**9, burst=10**9),
+        )
+
+        runs, written, finished = sync_until_complete(
+            fetch_page, resume, max_runs
+        )
+        label = "resume from cursor" if resume else "start over"
+        print(
+            f"{label:>18}: {runs} runs, {counts['requests']} requests "
+            f"({counts['failures']} failed), {written} documents written"
+            + ("" if finished else ", gave up")
+        )
+
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--objects", type=int, default=20000)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-runs", type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # one line per page is too much here
+    run(args.objects, args.failure_rate, args.seed, args.max_runs)
@@ -0,0 +1,113 @@
+"""
+Peak memory of a large comment pull, collecting every page into a list (as
+`pull_reg_gov_data` returns it) against streaming it with
+`iter_reg_gov_data`. Pages come from an in-process fake of the search
+endpoint, so only the client side is measured.
+
+    python -m civiclens.benchmarks.bench_streaming_pull --objects 200000
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+from civiclens.collect.access_api_data import (
+    PAGE_SIZE,
+    format_datetime_for_api,
+    iter_reg_gov_data,
+)
+
+
+def make_fetch_page(num_objects: int):
+    """
+    Fake search endpoint serving `num_objects` comments, three to each
+    lastModifiedDate, built a page at a time so the fake itself holds no
+    results.
+    """
+    start = datetime(2024, 4, 15, 12, tzinfo=timezone.utc)
+
+    def modified(i):
+        return (start + timedelta(seconds=i // 3)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+
+    def fetch_page(api_key, data_type, params, work_class):
+        since = params.get("filter[lastModifiedDate][ge]")
+        # first object modified at or after `since`
+        first = 0
+        if since:
+            since_dt = datetime.strptime(since, "%Y-%m-%d %H:%M:%S")
+            offset = since_dt - datetime.strptime(
+                format_datetime_for_api(modified(0)), "%Y-%m-%d %H:%M:%S"
+            )
+            first = max(0, int(offset.total_seconds()) * 3)
+        first += (params["page[number]"] - 1) * PAGE_SIZE
+        last = min(first + PAGE_SIZE, num_objects)
+        return {
+            "data": [
+                {
+                    "id": f"BENCH-{i}",
+                    "attributes": {
+                        "lastModifiedDate": modified(i),
+                        "title": "Comment on a proposed rule " * 4,
+                    },
+                }
+                for i in range(first, last)
+            ],
+            "meta": {"hasNextPage": last < num_objects},
+        }
+
+    return fetch_page
+
+
+def measure(label: str, consume) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        count = consume()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:>9}: {count} comments in {elapsed:.1f}s, "
+        f"peak {peak / 2**20:.1f} MiB"
+    )
+
+
+def run(num_objects: int) -> None:
+    def pull():
+        return len(
+            list(
+                iter_reg_gov_data(
+                    "DEMO_KEY",
+                    "comments",
+                    prefetch=0,
+                    fetch_page=make_fetch_page(num_objects),
+                )
+            )
+        )
+
+    def stream():
+        return sum(
+            1
+            for _ in iter_reg_gov_data(
+                "DEMO_KEY",
+                "comments",
+                fetch_page=make_fetch_page(num_objects),
+            )
+        )
+
+    measure("list", pull)
+    measure("streaming", stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--objects", type=int, default=200000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.objects)
@@ -1,16 +1,24 @@
 from .access_api_data import api_date_format_params  # noqa: F401
+from .access_api_data import get_reg_gov_page  # noqa: F401
+from .access_api_data import iter_reg_gov_data  # noqa: F401
 from .access_api_data import pull_reg_gov_data  # noqa: F401
 from .bulk_dl import BulkDl  # noqa: F401
+from .comment_fetcher import iter_comment_details  # noqa: F401
+from .fr_xml import extract_fr_xml  # noqa: F401
 from .move_data_from_api_to_database import (  # noqa: F401
     add_comments_to_db,
     add_dockets_to_db,
     connect_db_and_get_cursor,
+    db_cursor,
+    existing_ids,
     extract_xml_text_from_doc,
     fetch_fr_document_details,
+    fetch_parsed_xml,
     fetch_xml_content,
     get_comment_text,
     get_most_recent_doc_comment_date,
     insert_comment_into_db,
+    insert_comments_into_db,
     insert_docket_into_db,
     merge_comment_text_and_data,
     parse_xml_content,
@@ -18,3 +26,4 @@ from .move_data_from_api_to_database import (  # noqa: F401
     query_register_API_and_merge_document_data,
     verify_database_existence,
 )
+from .sync import sync_date_range  # noqa: F401
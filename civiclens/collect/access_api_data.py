@@ -5,11 +5,20 @@ https://github.com/willjobs/regulations-public-comments
 https://github.com/jacobfeldgoise/regulations-comments-downloader
 """
 
-import time
+import logging
+import queue
+import threading
 from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Callable, Iterator, Optional
 
-import requests
-from requests.adapters import HTTPAdapter
+from civiclens.collect import http_client, partition, quota
+
+
+REG_GOV_API_URL = "https://api.regulations.gov/v4/"
+PAGE_SIZE = 250
+STATUS_CODE_OVER_RATE_LIMIT = 429
+API_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
 def _is_duplicated_on_server(response_json):
@@ -92,6 +101,264 @@ def format_datetime_for_api(dt_str):
     return eastern_dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
+def _last_modified_bounds(params: dict) -> tuple[datetime, datetime]:
+    """
+    Read the lastModifiedDate range of a request, defaulting to everything
+    up to now.
+    """
+    start = params.get("filter[lastModifiedDate][ge]")
+    end = params.get("filter[lastModifiedDate][le]")
+    return (
+        (
+            datetime.strptime(start, API_DATETIME_FORMAT)
+            if start
+            else partition.EARLIEST_DATE
+        ),
+        (
+            datetime.strptime(end, API_DATETIME_FORMAT)
+            if end
+            else datetime.now().replace(microsecond=0)
+        ),
+    )
+
+
+def get_reg_gov_page(
+    api_key: str,
+    data_type: str,
+    params: dict,
+    work_class: str = "sync",
+    api_url: str = REG_GOV_API_URL,
+    scheduler: Optional[quota.QuotaScheduler] = None,
+    skip_duplicates: bool = False,
+    print_remaining_requests: bool = False,
+) -> dict:
+    """
+    Request one page from a regulations.gov search endpoint, waiting for the
+    quota scheduler before each attempt and retrying after a 429.
+
+    Args:
+        api_key (str): regulations.gov API key
+        data_type (str): 'dockets', 'documents', or 'comments'
+        params (dict): query parameters, including any filters, sort order
+            and page number
+        work_class (str, optional): priority of the request for the quota
+            scheduler. Defaults to 'sync'.
+        api_url (str, optional): base url of the API, for pointing at a
+            local stub
+        scheduler (QuotaScheduler, optional): quota to draw the request
+            from, defaults to the shared scheduler
+        skip_duplicates (bool, optional): if the server reports duplicate
+            entries for the request, log it and return an empty last page
+            instead of raising. Defaults to False.
+        print_remaining_requests (bool, optional): print the number of
+            requests left this hour. Defaults to False.
+
+    Returns:
+        dict: JSON-ified response, with "data" and "meta" keys
+
+    Raises:
+        requests.HTTPError: if the API answers with any other error
+    """
+    scheduler = scheduler if scheduler is not None else quota.get_scheduler()
+    session = http_client.get_session(api_url)
+    while True:
+        scheduler.acquire(work_class)
+        r = session.get(
+            f"{api_url}{data_type}",
+            headers={"X-Api-Key": api_key},
+            params=params,
+            verify=True,
+        )
+        scheduler.record_response(r)
+        if r.status_code != STATUS_CODE_OVER_RATE_LIMIT:
+            break
+
+    if print_remaining_requests:
+        print(f"(Requests left: {r.headers.get('X-RateLimit-Remaining')})")
+    if (
+        skip_duplicates
+        and r.status_code != 200
+        and _is_duplicated_on_server(r.json())
+    ):
+        logging.warning(
+            f"Duplicate entries on server for {data_type} with {params}, "
+            f"skipping the rest of the results: "
+            f"{r.json()['errors'][0]['detail']}"
+        )
+        return {"data": [], "meta": {"hasNextPage": False}}
+    r.raise_for_status()
+    return r.json()
+
+
+def iter_reg_gov_pages(
+    api_key: str,
+    data_type: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    params: Optional[dict] = None,
+    work_class: str = "sync",
+    fetch_page: Callable[..., dict] = get_reg_gov_page,
+) -> Iterator[list[dict]]:
+    """
+    Page through documents or comments from the search endpoint, yielding
+    each page as it arrives.
+
+    Results are sorted by lastModifiedDate, and each request asks for the
+    first page modified on or after the last timestamp seen, so the only
+    objects that can come back twice are the ones sharing that timestamp.
+    Only their ids are remembered for removing repeats, which keeps memory
+    flat however many pages there are.
+
+    Args:
+        api_key (str): regulations.gov API key
+        data_type (str): 'documents' or 'comments'
+        start_date (str in YYYY-MM-DD format, optional): the inclusive start
+            date of our data pull
+        end_date (str in YYYY-MM-DD format, optional): the inclusive end date
+            of our data pull
+        params (dict, optional): other parameters for the request, eg
+            filters
+        work_class (str, optional): priority of the requests for the quota
+            scheduler. Defaults to 'sync'.
+        fetch_page (callable): sends one request, with the signature of
+            `get_reg_gov_page`
+
+    Yields:
+        list of the objects on each page that haven't been seen yet
+    """
+    params = dict(params) if params is not None else {}
+    if start_date or end_date:
+        params.update(api_date_format_params(start_date, end_date))
+    params.update(
+        {
+            "page[size]": PAGE_SIZE,
+            "sort": "lastModifiedDate,documentId",
+            "page[number]": 1,
+        }
+    )
+
+    boundary = None  # latest lastModifiedDate seen so far
+    seen_at_boundary = set()  # ids of the objects modified at that time
+    total = 0
+
+    while True:
+        r_json = fetch_page(api_key, data_type, dict(params), work_class)
+        page = []
+        for obj in r_json["data"]:
+            modified = obj["attributes"]["lastModifiedDate"]
+            if boundary is None or modified > boundary:
+                boundary = modified
+                seen_at_boundary = set()
+            if obj["id"] not in seen_at_boundary:
+                seen_at_boundary.add(obj["id"])
+                page.append(obj)
+
+        total += len(page)
+        print(f"Fetched {len(page)} objects, total: {total}")
+        yield page
+
+        if len(r_json["data"]) < PAGE_SIZE or not r_json["meta"].get(
+            "hasNextPage", False
+        ):
+            return
+
+        last_modified_date = format_datetime_for_api(
+            r_json["data"][-1]["attributes"]["lastModifiedDate"]
+        )
+        # if the whole page shares one timestamp, asking from that timestamp
+        # again would return the same page, so move to the next one instead
+        if last_modified_date == params.get("filter[lastModifiedDate][ge]"):
+            params["page[number]"] += 1
+        else:
+            params["page[number]"] = 1
+        params["filter[lastModifiedDate][ge]"] = last_modified_date
+        print(f"Fetching more data from {last_modified_date}")
+
+
+def iter_reg_gov_data(
+    api_key: str,
+    data_type: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    params: Optional[dict] = None,
+    work_class: str = "sync",
+    prefetch: int = 1,
+    fetch_page: Callable[..., dict] = get_reg_gov_page,
+) -> Iterator[dict]:
+    """
+    Streaming version of `pull_reg_gov_data` for documents and comments:
+    yields objects as their page arrives instead of returning a list at the
+    end, so callers can start writing before the pull has finished.
+
+    Args:
+        api_key (str): regulations.gov API key
+        data_type (str): 'documents' or 'comments'
+        start_date (str in YYYY-MM-DD format, optional): the inclusive start
+            date of our data pull
+        end_date (str in YYYY-MM-DD format, optional): the inclusive end date
+            of our data pull
+        params (dict, optional): other parameters for the request, eg
+            filters
+        work_class (str, optional): priority of the requests for the quota
+            scheduler. Defaults to 'sync'.
+        prefetch (int, optional): pages to fetch ahead in a background thread
+            while the caller works through the current one; 0 fetches each
+            page only when it is needed. Defaults to 1.
+        fetch_page (callable): sends one request, with the signature of
+            `get_reg_gov_page`
+
+    Yields:
+        dict: JSON object for each document or comment, once each
+    """
+    pages = iter_reg_gov_pages(
+        api_key, data_type, start_date, end_date, params, work_class, fetch_page
+    )
+    if prefetch > 0:
+        pages = _prefetch(pages, prefetch)
+    for page in pages:
+        yield from page
+
+
+_DONE = object()
+
+
+def _prefetch(items: Iterator, size: int) -> Iterator:
+    """
+    Run an iterator in a background thread, keeping up to `size` of its
+    items ready for the caller. Errors are re-raised in the calling thread.
+    """
+    results = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for item in items:
+                results.put(item)
+                if stop.is_set():
+                    return
+        except BaseException as e:  # re-raised in the calling thread
+            results.put(e)
+        finally:
+            results.put(_DONE)
+
+    worker = threading.Thread(target=pump, daemon=True)
+    worker.start()
+
+    try:
+        while (item := results.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # drain so the worker is never stuck on a full queue
+        while worker.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
 def pull_reg_gov_data(  # noqa: C901,E501
     api_key,
     data_type,
@@ -100,6 +367,7 @@ def pull_reg_gov_data(  # noqa: C901,E501
     params=None,
     print_remaining_requests=False,
     skip_duplicates=False,
+    work_class="sync",
 ):
     """
     Returns the JSON associated with a request to the API; max length of 24000
@@ -130,26 +398,23 @@ def pull_reg_gov_data(  # noqa: C901,E501
         skip_duplicates (bool, optional): If a request returns multiple items
             when only 1 was expected, should we skip that request? Defaults to
             False.
+        work_class (str, optional): Priority of the requests for the quota
+            scheduler, one of 'status', 'sync' or 'backfill'. Defaults to
+            'sync'.
 
     Returns:
         dict: JSON-ified request response
     """
     # generate the right API request
-    api_url = "https://api.regulations.gov/v4/"
+    api_url = REG_GOV_API_URL
     endpoint = f"{api_url}{data_type}"
     params = params if params is not None else {}
 
-    # Our API key has a rate limit of 1,000 requests/hour.
-    # If we hit that limit, we can
-    # retry every WAIT_MINUTES minutes (more frequently than once an hour, in
-    # case our request limit
-    # is updated sooner). We will sleep for POLL_SECONDS seconds at a time to
-    # see if we've been
-    # interrupted. Otherwise we'd have to wait a while before getting
-    # interrupted. We could do this
-    # with threads, but that gets more complicated than it needs to be.
-    STATUS_CODE_OVER_RATE_LIMIT = 429
-    WAIT_SECONDS = 3600  # Default to 1 hour
+    # Our API key has a rate limit of 1,000 requests/hour, shared with every
+    # other collector. Each request waits for the quota scheduler, which
+    # paces requests over the hour and holds them after a 429 until the
+    # limit resets.
+    scheduler = quota.get_scheduler()
 
     # if any dates are specified, format those and add to the params
     if start_date or end_date:
@@ -161,17 +426,35 @@ def pull_reg_gov_data(  # noqa: C901,E501
     if endpoint.split("/")[-1] in ["dockets", "documents", "comments"]:
         params = {**params, "page[size]": 250}  # always get max page size
 
-    # Rather than do requests.get(), use this approach to (attempt to)
-    # gracefully handle noisy connections to the server
+    # Rather than do requests.get(), use the shared keep-alive session, which
+    # also retries noisy connections to the server
     # We sometimes get SSL errors (unexpected EOF or ECONNRESET), so this
     # should hopefully help us retry.
-    session = requests.Session()
-    session.mount("https", HTTPAdapter(max_retries=4))
+    session = http_client.get_session(api_url)
 
     def poll_for_response(api_key, wait_for_rate_reset):
-        r = session.get(
-            endpoint, headers={"X-Api-Key": api_key}, params=params, verify=True
-        )
+        while True:
+            scheduler.acquire(work_class)
+            r = session.get(
+                endpoint,
+                headers={"X-Api-Key": api_key},
+                params=params,
+                verify=True,
+            )
+            scheduler.record_response(r)
+
+            if (
+                r.status_code != STATUS_CODE_OVER_RATE_LIMIT
+                or not wait_for_rate_reset
+            ):
+                break
+
+            the_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            wait_time = scheduler.budget()["blocked_for"]
+            print(
+                f"""Rate limit exceeded at {the_time}.
+                Waiting {wait_time:.0f} seconds to retry."""
+            )
 
         if r.status_code == 200:
             # SUCCESS! Return the JSON of the request
@@ -186,23 +469,7 @@ def pull_reg_gov_data(  # noqa: C901,E501
 
             return [True, r.json()]
         else:
-            if (
-                r.status_code == STATUS_CODE_OVER_RATE_LIMIT
-                and wait_for_rate_reset
-            ):
-                the_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                retry_after = r.headers.get("Retry-After", None)
-                wait_time = (
-                    int(retry_after)
-                    if retry_after and retry_after.isdigit()
-                    else WAIT_SECONDS
-                )
-                print(
-                    f"""Rate limit exceeded at {the_time}.
-                    Waiting {wait_time} seconds to retry."""
-                )
-                time.sleep(wait_time)
-            elif _is_duplicated_on_server(r.json()) and skip_duplicates:
+            if _is_duplicated_on_server(r.json()) and skip_duplicates:
                 print("****Duplicate entries on server. Skipping.")
                 print(r.json()["errors"][0]["detail"])
             else:  # some other kind of error
@@ -213,79 +480,39 @@ def pull_reg_gov_data(  # noqa: C901,E501
         return [False, r.json()]
 
     if data_type == "comments" or data_type == "documents":
-        all_objects = []
-        unique_objects = {}
-
-        params.update(
-            {
-                "page[size]": 250,
-                "sort": "lastModifiedDate,documentId",
-            }
-        )
-
-        last_modified_date = None
-        continue_fetching = True
-
-        while continue_fetching:
-            success, r_json = poll_for_response(
-                api_key, wait_for_rate_reset=True
+        return list(
+            iter_reg_gov_data(
+                api_key,
+                data_type,
+                params=params,
+                work_class=work_class,
+                prefetch=0,
+                fetch_page=partial(
+                    get_reg_gov_page,
+                    skip_duplicates=skip_duplicates,
+                    print_remaining_requests=print_remaining_requests,
+                ),
             )
-            if success:
-                all_objects.extend(r_json["data"])
-                print(
-                    f"""Fetched {len(r_json['data'])} objects,
-                    total: {len(all_objects)}"""
-                )
-
-                # Check and handle the pagination
-                has_next_page = r_json["meta"].get("hasNextPage", False)
-                print(f"Has next page: {has_next_page}")
-
-                if len(r_json["data"]) < 250 or not has_next_page:
-                    print(
-                        """No more pages or fewer than 250
-                        comments fetched, stopping..."""
-                    )
-                    continue_fetching = False
-                else:
-                    last_modified_date = format_datetime_for_api(
-                        r_json["data"][-1]["attributes"]["lastModifiedDate"]
-                    )
-                    params.update(
-                        {
-                            "filter[lastModifiedDate][ge]": last_modified_date,
-                            "page[size]": 250,
-                            "sort": "lastModifiedDate,documentId",
-                            "page[number]": 1,
-                            "api_key": api_key,
-                        }
-                    )
-                    if end_date:
-                        params.update(
-                            {
-                                "filter[lastModifiedDate][le]": f"{end_date} 23:59:59"  # noqa: E501
-                            }
-                        )
-                    print(f"Fetching more data from {last_modified_date}")
-            else:
-                print("Failed to fetch data")
-                continue_fetching = False
-
-        # Remove Duplicates
-        for obj in all_objects:
-            unique_objects[obj["id"]] = obj
-        return list(unique_objects.values())
+        )
 
     else:
-        doc_data = None  # Initialize doc_data to None
-        for i in range(1, 21):  # Fetch up to 20 pages
+        # dockets can't be sorted by documentId, so rather than moving a
+        # cursor along, the date range is split until each part fits within
+        # the 20 pages the API will return
+        def fetch_window(window_start, window_end, page_number):
             params.update(
                 {
+                    "filter[lastModifiedDate][ge]": window_start.strftime(
+                        API_DATETIME_FORMAT
+                    ),
+                    "filter[lastModifiedDate][le]": window_end.strftime(
+                        API_DATETIME_FORMAT
+                    ),
                     "page[size]": 250,
                     # Ensure that only lastModifiedDate is considered,
                     # dockets cant take in documentID
                     "sort": "lastModifiedDate",
-                    "page[number]": str(i),
+                    "page[number]": str(page_number),
                     "api_key": api_key,
                 }
             )
@@ -293,17 +520,17 @@ def pull_reg_gov_data(  # noqa: C901,E501
             success, r_json = poll_for_response(
                 api_key, wait_for_rate_reset=True
             )
+            window = f"{data_type} from {window_start} to {window_end}"
+            if not success and not _is_duplicated_on_server(r_json):
+                raise RuntimeError(f"Failed to fetch {window}: {r_json}")
+            if not success:  # a duplicate on the server we were told to skip
+                logging.warning(
+                    f"Duplicate entries on server, skipping {window}, "
+                    f"page {page_number}"
+                )
+                return {"data": [], "meta": {}}
+            return r_json
 
-            if success or (
-                _is_duplicated_on_server(r_json) and skip_duplicates
-            ):
-                if doc_data is not None:
-                    doc_data += r_json["data"]
-                else:
-                    doc_data = r_json["data"]
-
-            # Break if it's the last page
-            if r_json["meta"]["lastPage"]:
-                return doc_data
-
-    raise RuntimeError(f"Unrecoverable error; {r_json}")
+        return partition.pull_partitioned(
+            fetch_window, *_last_modified_bounds(params)
+        )
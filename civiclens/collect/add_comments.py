@@ -5,7 +5,7 @@ import polars as pl
 from civiclens.collect.move_data_from_api_to_database import (
     add_comments_to_db_for_existing_doc,
     add_comments_to_db_for_new_doc,
-    verify_database_existence,
+    existing_ids,
 )
 
 
@@ -19,6 +19,10 @@ def find_object_id(object_id, rin):
 
 
 def add_comments_for_existing_docs(df):
+    docs_with_comments = existing_ids(
+        "regulations_comment", df["document_id"], "document_id"
+    )
+
     for row in df.rows(named=True):
         document_id = row["document_id"]
         object_id = row["object_id"]
@@ -27,9 +31,8 @@ def add_comments_for_existing_docs(df):
         real_object_id = find_object_id(object_id, rin)
 
         if real_object_id is not None:
-            if not verify_database_existence(
-                "regulations_comment", document_id, "document_id"
-            ):  # doc doesn't exist in the db; it's new
+            # doc doesn't exist in the db; it's new
+            if document_id not in docs_with_comments:
                 print(
                     f"no comments found in database for document {document_id}"
                 )
@@ -58,8 +61,8 @@ def main(doc_to_start):
     reports.
 
     Takes the output of qa_doc_comment_num.py, gets docs that have fewer
-    comments in the table than in the API, iterates through those docs and
-    add the comments
+    comments in the table than in the API, iterates through those docs (most
+    comments missing first) and add the comments
     """
     df = pl.read_csv("comment_num_api_and_db.csv")
 
@@ -1,8 +1,44 @@
 import datetime
-import time
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import pandas as pd
-import requests
+import polars as pl
+
+from civiclens.collect import http_client, partition, quota
+
+
+# the search endpoints stop at page 20 of 250 items
+MAX_PAGES = partition.MAX_PAGES
+MAX_ITEMS_PER_PAGE = partition.PAGE_SIZE
+MAX_RESULTS = partition.MAX_RESULTS
+SHARD_WORKERS = 4
+
+DOCKET_SCHEMA = {
+    "docket_id": pl.Utf8,
+    "docket_type": pl.Utf8,
+    "last_modified": pl.Utf8,
+    "agency_id": pl.Utf8,
+    "title": pl.Utf8,
+    "obj_id": pl.Utf8,
+}
+DOCUMENT_SCHEMA = {
+    "Doc_ID": pl.Utf8,
+    "Doc_Type": pl.Utf8,
+    "Last_Modified": pl.Utf8,
+    "FR_Doc_Num": pl.Utf8,
+    "Withdrawn": pl.Boolean,
+    "Agency_ID": pl.Utf8,
+    "Comment_End_Date": pl.Utf8,
+    "Title": pl.Utf8,
+    "Posted_Date": pl.Utf8,
+    "Docket_ID": pl.Utf8,
+    "Subtype": pl.Utf8,
+    "Comment_Start_Date": pl.Utf8,
+    "Open_For_Comment": pl.Boolean,
+    "Object_ID": pl.Utf8,
+}
 
 
 class BulkDl:
@@ -21,8 +57,11 @@ class BulkDl:
                 key and content type.
             agencies (list[str]): List of agency identifiers (aggregated from
                 https://www.regulations.gov/agencies) to be used in API calls.
+            scheduler (QuotaScheduler): Shared hourly quota; bulk downloads
+                run as low priority backfill work.
         """
         self.api_key = api_key
+        self.scheduler = quota.get_scheduler()
         self.base_url = "https://api.regulations.gov/v4"
         self.headers = {
             "X-Api-Key": self.api_key,
@@ -271,67 +310,133 @@ class BulkDl:
             "WCPO",
             "WHD",
         ]
+        # the list above repeats some agencies; keep the first of each
+        self.agencies = list(dict.fromkeys(self.agencies))
 
-    def fetch_all_pages(self, endpoint, params, max_items_per_page=250):
+    def fetch_page(self, endpoint, params):
         """
-        Iterates through all the pages of API data for a given endpoint
-        until there are no more pages to fetch (occurs at 20 pages, or
-        5000 items).
+        Requests one page of API data, waiting for the shared quota and
+        retrying after a 429.
 
         Args:
             endpoint (str): The API endpoint to fetch data from.
                             ['dockets', 'documents', 'comments']
-            params (dict): Dictionary of parameters to send in the API request.
-            max_items_per_page (int): Maximum number of items per page to
-            request. Max (default) = 250.
+            params (dict): Dictionary of parameters to send in the API request,
+                including the page number and size.
 
         Returns:
-            list: A list of items (dictionaries) fetched from all pages of the
-                API endpoint.
+            dict: The JSON response, with "data" and "meta" keys, or None if
+                the request failed.
         """
-        items = []
-        page = 1
         while True:
-            params["page[number]"] = page
-            params["page[size]"] = max_items_per_page
-
-            response = requests.get(
+            self.scheduler.acquire("backfill")
+            response = http_client.get(
                 f"{self.base_url}/{endpoint}",
                 headers=self.headers,
                 params=params,
             )
+            self.scheduler.record_response(response)
             print(f"Requesting: {response.url}")
 
             if response.status_code == 200:
                 try:
-                    data = response.json()
+                    return response.json()
                 except ValueError:
                     print("Failed to decode JSON response")
-                    break
-                items.extend(data["data"])
-                if not data["meta"].get("hasNextPage", False):
-                    break
-                page += 1
+                    return None
             elif response.status_code == 429:  # Rate limit exceeded
-                retry_after = response.headers.get(
-                    "Retry-After", None
-                )  # Obtain reset time
-                wait_time = (
-                    int(retry_after)
-                    if retry_after and retry_after.isdigit()
-                    else 3600
-                )  # Default to 1 hour if no wait time provided
+                # the scheduler holds the next request until the limit resets
+                wait_time = self.scheduler.budget()["blocked_for"]
                 print(
                     f"""Rate limit exceeded.
-                    Waiting to {wait_time} seconds to retry."""
+                    Waiting {wait_time:.0f} seconds to retry."""
                 )
-                time.sleep(wait_time)
-                continue
             else:
-                print(f"Error fetching page {page}: {response.status_code}")
+                print(
+                    f"Error fetching page {params.get('page[number]')}: "
+                    f"{response.status_code}"
+                )
+                return None
+
+    def fetch_all_pages(
+        self, endpoint, params, max_items_per_page=MAX_ITEMS_PER_PAGE
+    ):
+        """
+        Iterates through all the pages of API data for a given endpoint
+        until there are no more pages to fetch (occurs at 20 pages, or
+        5000 items).
+
+        Args:
+            endpoint (str): The API endpoint to fetch data from.
+                            ['dockets', 'documents', 'comments']
+            params (dict): Dictionary of parameters to send in the API request.
+            max_items_per_page (int): Maximum number of items per page to
+            request. Max (default) = 250.
+
+        Returns:
+            list: A list of items (dictionaries) fetched from all pages of the
+                API endpoint.
+        """
+        items = []
+        page = 1
+        while True:
+            params["page[number]"] = page
+            params["page[size]"] = max_items_per_page
+
+            data = self.fetch_page(endpoint, params)
+            if data is None:
+                break
+            items.extend(data["data"])
+            if not data["meta"].get("hasNextPage", False):
                 break
+            page += 1
         return items
 
+    def fetch_partitioned(
+        self, endpoint, start_date, end_date, date_filter, agency=None
+    ):
+        """
+        Fetches every item in a date range, splitting the range into parts
+        small enough for the API to page through in full (see
+        `civiclens.collect.partition`).
+
+        Args:
+            endpoint (str): The API endpoint to fetch data from.
+                            ['dockets', 'documents', 'comments']
+            start_date (datetime.date): Start date of the range.
+            end_date (datetime.date): End date of the range.
+            date_filter (str): The date field the range applies to,
+                'postedDate' or 'lastModifiedDate'.
+            agency (str, optional): Only fetch items from this agency.
+
+        Returns:
+            list: The items (dictionaries) in the range, once each.
+
+        Raises:
+            RuntimeError: If a request for part of the range fails, rather
+                than leaving that part out.
+        """
+
+        def fetch_window(start, end, page_number):
+            params = self.shard_params((agency, start, end), date_filter)
+            params.update(
+                {"page[size]": MAX_ITEMS_PER_PAGE, "page[number]": page_number}
+            )
+            data = self.fetch_page(endpoint, params)
+            if data is None:
+                raise RuntimeError(
+                    f"Failed to fetch {endpoint} from {start} to {end}, "
+                    f"page {page_number}"
+                )
+            return data
+
+        return partition.pull_partitioned(
+            fetch_window,
+            start_date,
+            end_date,
+            resolution=datetime.timedelta(days=1),
+        )
+
     def get_all_dockets_by_agency(self):
         """
         Retrieves all docket IDs by looping through predefined agencies and
@@ -340,25 +445,17 @@ class BulkDl:
         all_dockets = []
 
         for agency in self.agencies:
-            filter_params = {"filter[agencyId]": agency}
-
-            agency_dockets = self.fetch_all_pages("dockets", filter_params)
+            agency_dockets = self.fetch_partitioned(
+                "dockets",
+                partition.EARLIEST_DATE.date(),
+                datetime.date.today(),
+                "lastModifiedDate",
+                agency,
+            )
 
             for docket in agency_dockets:
                 # Extract relevant information from each docket
-                docket_details = {
-                    "docket_id": docket.get("id"),
-                    "docket_type": docket.get("attributes", {}).get(
-                        "docketType"
-                    ),
-                    "last_modified": docket.get("attributes", {}).get(
-                        "lastModifiedDate"
-                    ),
-                    "agency_id": docket.get("attributes", {}).get("agencyId"),
-                    "title": docket.get("attributes", {}).get("title"),
-                    "obj_id": docket.get("attributes", {}).get("objectId"),
-                }
-                all_dockets.append(docket_details)
+                all_dockets.append(self.docket_details(docket))
 
         # Store as pandas dataframe.
         # We can change this mode of storage if you have a different idea,
@@ -378,54 +475,63 @@ class BulkDl:
             start_date (datetime.date): Start date for fetching documents.
             end_date (datetime.date): End date for fetching documents.
         """
-        all_documents = []
-        for start, end in self.generate_date_ranges(start_date, end_date):
-            print(f"Fetching documents from {start} to {end}")
-            params = {
-                "filter[postedDate][ge]": start.strftime("%Y-%m-%d"),
-                "filter[postedDate][le]": end.strftime("%Y-%m-%d"),
-            }
-            documents = self.fetch_all_pages("documents", params)
-            all_documents.extend(documents)
+        print(f"Fetching documents from {start_date} to {end_date}")
+        all_documents = self.fetch_partitioned(
+            "documents", start_date, end_date, "postedDate"
+        )
 
         print(f"Total documents fetched: {len(all_documents)}")
 
         # Extract relevant data from documents
         document_lst = []
         for document in all_documents:
-            doc_data = {
-                "Doc_ID": document.get("id"),
-                "Doc_Type": document.get("attributes", {}).get("documentType"),
-                "Last_Modified": document.get("attributes", {}).get(
-                    "lastModifiedDate"
-                ),
-                "FR_Doc_Num": document.get("attributes", {}).get("frDocNum"),
-                "Withdrawn": document.get("attributes", {}).get("withdrawn"),
-                "Agency_ID": document.get("attributes", {}).get("agencyId"),
-                "Comment_End_Date": document.get("attributes", {}).get(
-                    "commentEndDate"
-                ),
-                "Title": document.get("attributes", {}).get("title"),
-                "Posted_Date": document.get("attributes", {}).get("postedDate"),
-                "Docket_ID": document.get("attributes", {}).get("docketId"),
-                "Subtype": document.get("attributes", {}).get("subtype"),
-                "Comment_Start_Date": document.get("attributes", {}).get(
-                    "commentStartDate"
-                ),
-                "Open_For_Comment": document.get("attributes", {}).get(
-                    "openForComment"
-                ),
-                "Object_ID": document.get("attributes", {}).get("objectId"),
-            }
-            document_lst.append(doc_data)
+            document_lst.append(self.document_details(document))
 
         # Save to DataFrame and CSV
         df = pd.DataFrame(document_lst)
         df = df.drop_duplicates()
         df.to_csv("doc_detailed_2024.csv", index=False)
 
+    @staticmethod
+    def docket_details(docket):
+        """
+        Extracts the fields kept for a docket from its API JSON.
+        """
+        attributes = docket.get("attributes", {})
+        return {
+            "docket_id": docket.get("id"),
+            "docket_type": attributes.get("docketType"),
+            "last_modified": attributes.get("lastModifiedDate"),
+            "agency_id": attributes.get("agencyId"),
+            "title": attributes.get("title"),
+            "obj_id": attributes.get("objectId"),
+        }
+
+    @staticmethod
+    def document_details(document):
+        """
+        Extracts the fields kept for a document from its API JSON.
+        """
+        attributes = document.get("attributes", {})
+        return {
+            "Doc_ID": document.get("id"),
+            "Doc_Type": attributes.get("documentType"),
+            "Last_Modified": attributes.get("lastModifiedDate"),
+            "FR_Doc_Num": attributes.get("frDocNum"),
+            "Withdrawn": attributes.get("withdrawn"),
+            "Agency_ID": attributes.get("agencyId"),
+            "Comment_End_Date": attributes.get("commentEndDate"),
+            "Title": attributes.get("title"),
+            "Posted_Date": attributes.get("postedDate"),
+            "Docket_ID": attributes.get("docketId"),
+            "Subtype": attributes.get("subtype"),
+            "Comment_Start_Date": attributes.get("commentStartDate"),
+            "Open_For_Comment": attributes.get("openForComment"),
+            "Object_ID": attributes.get("objectId"),
+        }
+
     @staticmethod  # for now, we can put this in utils if that is preferred.
-    def generate_date_ranges(start_date, end_date):
+    def generate_date_ranges(start_date, end_date, days=7):
         """
         Generates weekly date ranges between two dates, inclusive.
         Helped function for fetch_documents_by_date_ranges().
@@ -433,14 +539,15 @@ class BulkDl:
         Args:
             start_date (datetime.date): The start date of the range.
             end_date (datetime.date): The end date of the range.
+            days (int): Length of each range in days. Default = 7.
 
         Yields:
             tuple: A tuple of (start_date, end_date) for each week within the
                 specified range.
         """
         current_date = start_date
-        while current_date < end_date:
-            week_end = current_date + datetime.timedelta(days=6)
+        while current_date <= end_date:
+            week_end = current_date + datetime.timedelta(days=days - 1)
             yield (current_date, min(week_end, end_date))
             current_date = week_end + datetime.timedelta(days=1)
 
@@ -467,9 +574,11 @@ class BulkDl:
             while continue_fetching:
                 params = {"filter[commentOnId]": commentId}
 
-                response = requests.get(
+                self.scheduler.acquire("backfill")
+                response = http_client.get(
                     base_url, headers=self.headers, params=params
                 )
+                self.scheduler.record_response(response)
                 if response.status_code == 200:
                     data = response.json()
                     total_elements = data["meta"]["totalElements"]
@@ -478,17 +587,11 @@ class BulkDl:
                     )
                     continue_fetching = False
                 elif response.status_code == 429:  # Rate limit exceeded
-                    retry_after = response.headers.get("Retry-After", None)
-                    wait_time = (
-                        int(retry_after)
-                        if retry_after and retry_after.isdigit()
-                        else 3600
-                    )
+                    wait_time = self.scheduler.budget()["blocked_for"]
                     print(
                         f"""Rate limit exceeded.
-                        Waiting {wait_time} seconds to retry."""
+                        Waiting {wait_time:.0f} seconds to retry."""
                     )
-                    time.sleep(wait_time)
                 else:
                     results.append(
                         {"id": commentId, "total_elements": "Failed to fetch"}
@@ -497,3 +600,269 @@ class BulkDl:
 
         results_df = pd.DataFrame(results)
         results_df.to_csv(file_output_path)
+
+    @staticmethod
+    def shard_params(shard, date_filter):
+        """
+        Builds the API filters for a shard.
+
+        Args:
+            shard (tuple): (agency, start date, end date); any of them may be
+                None to leave that filter out.
+            date_filter (str): The date field the window applies to,
+                'postedDate' or 'lastModifiedDate'.
+
+        Returns:
+            dict: The filter parameters.
+        """
+        agency, start, end = shard
+        params = {}
+        if agency is not None:
+            params["filter[agencyId]"] = agency
+        if start is not None:
+            if date_filter == "lastModifiedDate":
+                params[f"filter[{date_filter}][ge]"] = f"{start} 00:00:00"
+                params[f"filter[{date_filter}][le]"] = f"{end} 23:59:59"
+            else:
+                params[f"filter[{date_filter}][ge]"] = str(start)
+                params[f"filter[{date_filter}][le]"] = str(end)
+        return params
+
+    def plan_shards(self, agencies, start_date, end_date, window_days=7):
+        """
+        Lists the (agency, start date, end date) shards for every agency and
+        date window; the dates are None if there is no date range.
+        """
+        windows = (
+            list(self.generate_date_ranges(start_date, end_date, window_days))
+            if start_date is not None
+            else [(None, None)]
+        )
+        return [
+            (agency, start, end)
+            for agency in agencies
+            for start, end in windows
+        ]
+
+    @staticmethod
+    def split_shard(shard):
+        """
+        Splits a shard's date window in two halves.
+        """
+        agency, start, end = shard
+        middle = start + (end - start) // 2
+        return [
+            (agency, start, middle),
+            (agency, middle + datetime.timedelta(days=1), end),
+        ]
+
+    def unfinished_shards(self, output_dir, endpoint, shard, stats):
+        """
+        Lists the parts of a shard that aren't on disk yet, following the
+        halves of shards an earlier run split. Counts the parts already
+        written as skipped in `stats`.
+        """
+        path = self.shard_path(output_dir, endpoint, shard)
+        if os.path.exists(path):
+            stats["skipped"] += 1
+            return []
+        if os.path.exists(f"{path}.split"):
+            return [
+                unfinished
+                for half in self.split_shard(shard)
+                for unfinished in self.unfinished_shards(
+                    output_dir, endpoint, half, stats
+                )
+            ]
+        return [shard]
+
+    @staticmethod
+    def shard_path(output_dir, endpoint, shard):
+        """
+        Returns the Parquet file a shard's results are written to.
+        """
+        agency, start, end = shard
+        window = f"{start:%Y%m%d}-{end:%Y%m%d}" if start else "all-dates"
+        return os.path.join(
+            output_dir,
+            f"{endpoint}-{agency or 'all-agencies'}-{window}.parquet",
+        )
+
+    def download_shard(self, endpoint, shard, output_dir, date_filter):
+        """
+        Downloads every page of one shard and writes it to its own Parquet
+        file. A shard with more results than the API will page through is
+        split in two by date instead, if its window is longer than a day.
+
+        Args:
+            endpoint (str): 'dockets' or 'documents'
+            shard (tuple): (agency, start date, end date)
+            output_dir (str): Directory to write the Parquet file to.
+            date_filter (str): The date field the window applies to.
+
+        Returns:
+            tuple: ("done", number of items written), ("split", list of the
+                two new shards), or ("failed", 0) if a request failed, in
+                which case nothing is written and the shard is tried again
+                on the next run.
+        """
+        agency, start, end = shard
+        params = self.shard_params(shard, date_filter)
+        params.update({"page[size]": MAX_ITEMS_PER_PAGE, "page[number]": 1})
+
+        data = self.fetch_page(endpoint, dict(params))
+        if data is None:
+            return "failed", 0
+        total = data["meta"].get("totalElements", 0)
+        path = self.shard_path(output_dir, endpoint, shard)
+        if total > MAX_RESULTS:
+            if start is not None and start < end:
+                # mark the shard as split, so the next run looks for its
+                # halves instead of downloading it again
+                open(f"{path}.split", "w").close()
+                return "split", self.split_shard(shard)
+            logging.warning(
+                f"{total} {endpoint} in shard {shard}; only the first "
+                f"{MAX_RESULTS} can be downloaded"
+            )
+
+        items = data["data"]
+        while data["meta"].get("hasNextPage", False) and (
+            params["page[number]"] < MAX_PAGES
+        ):
+            params["page[number]"] += 1
+            data = self.fetch_page(endpoint, dict(params))
+            if data is None:
+                return "failed", 0
+            items.extend(data["data"])
+
+        if endpoint == "dockets":
+            rows, schema = map(self.docket_details, items), DOCKET_SCHEMA
+        else:
+            rows, schema = map(self.document_details, items), DOCUMENT_SCHEMA
+        df = pl.DataFrame(list(rows), schema=schema)
+
+        # write under a temporary name so a half-written file is never
+        # mistaken for a finished shard
+        df.write_parquet(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        return "done", df.height
+
+    def download_sharded(
+        self,
+        endpoint,
+        output_dir,
+        start_date=None,
+        end_date=None,
+        agencies=None,
+        window_days=7,
+        date_filter=None,
+        max_workers=SHARD_WORKERS,
+    ):
+        """
+        Downloads dockets or documents in shards of (agency, date window),
+        several at a time, writing each shard to its own Parquet file as it
+        finishes. Windows with more results than the API will page through
+        (20 pages of 250) are split until they fit. Shards already on disk
+        are skipped, so running the same download again picks up where an
+        interrupted run stopped. Use `load_shards` to read the results.
+
+        Args:
+            endpoint (str): 'dockets' or 'documents'
+            output_dir (str): Directory to write the Parquet files to.
+            start_date (datetime.date, optional): Start of the date range;
+                if None, shards are by agency only.
+            end_date (datetime.date, optional): End of the date range.
+            agencies (list[str], optional): Agencies to shard by. Defaults to
+                every agency for dockets, and no agency filter for documents.
+            window_days (int): Length of each date window. Default = 7.
+            date_filter (str, optional): The date field the windows apply
+                to. Defaults to 'postedDate' for documents and
+                'lastModifiedDate' for dockets.
+            max_workers (int): Number of shards to download at once; every
+                request still waits for the shared quota.
+
+        Returns:
+            dict: Counts of shards written, skipped, split and failed, and of
+                items written.
+        """
+        if date_filter is None:
+            date_filter = (
+                "lastModifiedDate" if endpoint == "dockets" else "postedDate"
+            )
+        if agencies is None:
+            agencies = self.agencies if endpoint == "dockets" else [None]
+        os.makedirs(output_dir, exist_ok=True)
+
+        stats = {
+            "written": 0,
+            "skipped": 0,
+            "split": 0,
+            "failed": 0,
+            "items": 0,
+        }
+        shards = []
+        for shard in self.plan_shards(
+            agencies, start_date, end_date, window_days
+        ):
+            shards.extend(
+                self.unfinished_shards(output_dir, endpoint, shard, stats)
+            )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def submit(shard):
+                return executor.submit(
+                    self.download_shard,
+                    endpoint,
+                    shard,
+                    output_dir,
+                    date_filter,
+                )
+
+            pending = {submit(shard) for shard in shards}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outcome, result = future.result()
+                    if outcome == "split":
+                        stats["split"] += 1
+                        pending.update(submit(shard) for shard in result)
+                    elif outcome == "done":
+                        stats["written"] += 1
+                        stats["items"] += result
+                    else:
+                        stats["failed"] += 1
+
+        print(
+            f"{stats['written']} shards written ({stats['items']} {endpoint}), "
+            f"{stats['skipped']} already on disk, {stats['split']} split, "
+            f"{stats['failed']} failed"
+        )
+        return stats
+
+    @staticmethod
+    def load_shards(output_dir, endpoint):
+        """
+        Reads every shard written by `download_sharded` into one polars
+        DataFrame, without duplicates.
+
+        Args:
+            output_dir (str): Directory the Parquet files were written to.
+            endpoint (str): 'dockets' or 'documents'
+
+        Returns:
+            pl.DataFrame: One row per docket or document.
+        """
+        id_column = "docket_id" if endpoint == "dockets" else "Doc_ID"
+        schema = DOCKET_SCHEMA if endpoint == "dockets" else DOCUMENT_SCHEMA
+        paths = sorted(
+            os.path.join(output_dir, name)
+            for name in os.listdir(output_dir)
+            if name.startswith(f"{endpoint}-") and name.endswith(".parquet")
+        )
+        if not paths:
+            return pl.DataFrame(schema=schema)
+        return pl.concat(pl.read_parquet(path) for path in paths).unique(
+            subset=[id_column], keep="first", maintain_order=True
+        )
@@ -2,15 +2,32 @@
 - if the closing date has passed, the status should be updated
 - if the closing date is null or in the future:
     - call the regulations.gov API to get the current status
+
+With --refresh, documents past their closing date are closed with one
+UPDATE, and the rest are checked in bulk: the documents modified since the
+oldest stored lastModifiedDate are paged through once, and only documents
+modified since they were stored are merged with the Federal Register text
+again and upserted.
 """
+import argparse
 import logging
-from datetime import datetime
+import math
+from datetime import datetime, timezone
+from typing import Callable, Optional
 
-from civiclens.collect.access_api_data import pull_reg_gov_data
+from civiclens.collect import fr_cache
+from civiclens.collect.access_api_data import (
+    PAGE_SIZE,
+    format_datetime_for_api,
+    get_reg_gov_page,
+    iter_reg_gov_pages,
+    pull_reg_gov_data,
+)
 from civiclens.collect.move_data_from_api_to_database import (
-    connect_db_and_get_cursor,
+    db_cursor,
     insert_document_into_db,
     query_register_API_and_merge_document_data,
+    upsert_documents,
 )
 from civiclens.utils.constants import REG_GOV_API_KEY
 
@@ -33,17 +50,13 @@ def get_open_docs() -> list:
     Returns:
         open_docs (list): a list of tuples of the form (id, closing_date)
     """
-    conn, cur = connect_db_and_get_cursor()
-    with conn:
+    with db_cursor() as cur:
         cur.execute(
             "SELECT id, comment_end_date \
                     FROM regulations_document WHERE open_for_comment = %s",
             ("true",),
         )
         open_docs = cur.fetchall()
-    if conn:
-        cur.close()
-        conn.close()
 
     return open_docs
 
@@ -56,17 +69,13 @@ def close_doc_comment(doc_id: str) -> None:
         doc_id (int): the id of the document to update
 
     """
-    conn, cur = connect_db_and_get_cursor()
-    with conn:
+    with db_cursor() as cur:
         cur.execute(
             "UPDATE regulations_document \
                     SET open_for_comment = %s \
                     WHERE id = %s",
             ("false", doc_id),
         )
-    if conn:
-        cur.close()
-        conn.close()
 
 
 def check_current_status(open_docs: list) -> None:
@@ -91,7 +100,10 @@ def check_current_status(open_docs: list) -> None:
         else:
             # call the regulations.gov API to get the current status
             doc_data = pull_reg_gov_data(
-                REG_GOV_API_KEY, "documents", params={"filter[searchTerm]": id}
+                REG_GOV_API_KEY,
+                "documents",
+                params={"filter[searchTerm]": id},
+                work_class="status",
             )
             logging.info(
                 f"Document {id} is still open. Checking the current status."
@@ -102,6 +114,222 @@ def check_current_status(open_docs: list) -> None:
             insert_document_into_db(full_doc_info)
 
 
+def close_passed_docs() -> int:
+    """
+    Close every open document whose closing date has passed, in one
+    statement.
+
+    Returns:
+        number of documents closed
+    """
+    with db_cursor() as cur:
+        cur.execute(
+            """UPDATE regulations_document
+                SET open_for_comment = false
+                WHERE open_for_comment
+                    AND comment_end_date < CURRENT_DATE;"""
+        )
+        return cur.rowcount
+
+
+def get_open_doc_versions() -> dict:
+    """
+    Get the last modified date stored for each open document.
+
+    Returns:
+        dict of document id to last_modified_date (datetime or None)
+    """
+    with db_cursor() as cur:
+        cur.execute(
+            """SELECT id, last_modified_date FROM regulations_document
+                WHERE open_for_comment;"""
+        )
+        return dict(cur.fetchall())
+
+
+def _as_utc(last_modified: datetime) -> datetime:
+    if last_modified.tzinfo is None:
+        return last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.astimezone(timezone.utc)
+
+
+def _api_window_start(last_modified: datetime) -> str:
+    """
+    Format a stored last_modified_date for a lastModifiedDate filter.
+    """
+    return format_datetime_for_api(
+        _as_utc(last_modified).strftime("%Y-%m-%dT%H:%M:%SZ")
+    )
+
+
+def _is_changed(doc: dict, stored: dict) -> bool:
+    """
+    Whether a document from the API is one of our open documents and was
+    modified after the version stored.
+    """
+    if doc["id"] not in stored:
+        return False
+    if stored[doc["id"]] is None:
+        return True
+    modified = datetime.strptime(
+        doc["attributes"]["lastModifiedDate"], "%Y-%m-%dT%H:%M:%SZ"
+    ).replace(tzinfo=timezone.utc)
+    return modified > _as_utc(stored[doc["id"]])
+
+
+def _plan_window(
+    api_key: str, stored: dict, fetch_page: Callable[..., dict]
+) -> tuple[Optional[dict], Optional[dict], list[str]]:
+    """
+    Find a lastModifiedDate window to page through for the open documents.
+
+    A window starting at the oldest stored date can hold far more documents
+    than there are open ones, so its size is checked against the cost of
+    looking the documents up one at a time. While paging would cost more,
+    the older half of the documents is left for one-at-a-time lookups and
+    the window starts later.
+
+    Args:
+        api_key (str): key for the regulations.gov API
+        stored (dict): document id to stored last_modified_date
+        fetch_page (callable): sends one request, with the signature of
+            `get_reg_gov_page`
+
+    Returns:
+        the parameters and first page of the window to page through (None
+        if no window is worth it), and the ids to look up one at a time
+    """
+    # documents without a stored date can only be checked one at a time
+    single = [doc_id for doc_id, modified in stored.items() if not modified]
+    pending = sorted(
+        (_as_utc(modified), doc_id)
+        for doc_id, modified in stored.items()
+        if modified
+    )
+
+    while pending:
+        params = {
+            "filter[lastModifiedDate][ge]": _api_window_start(pending[0][0])
+        }
+        first_page = fetch_page(
+            api_key,
+            "documents",
+            {
+                **params,
+                "page[size]": PAGE_SIZE,
+                "sort": "lastModifiedDate,documentId",
+                "page[number]": 1,
+            },
+            "status",
+        )
+        total = first_page["meta"].get("totalElements", 0)
+        if math.ceil(total / PAGE_SIZE) <= len(pending):
+            return params, first_page, single
+
+        half = max(1, len(pending) // 2)
+        single.extend(doc_id for _, doc_id in pending[:half])
+        pending = pending[half:]
+
+    return None, None, single
+
+
+def refresh_open_docs(
+    api_key: str = REG_GOV_API_KEY,
+    fetch_page: Callable[..., dict] = get_reg_gov_page,
+    **kwargs,
+) -> dict:
+    """
+    Bring the open documents in the database up to date with as few API
+    calls as possible. Documents past their closing date are closed with
+    one UPDATE; the rest are checked by paging through the documents
+    modified since the oldest stored lastModifiedDate (see `_plan_window`),
+    and only the ones modified since they were stored are merged with the
+    Federal Register text again and upserted.
+
+    Args:
+        api_key (str): key for the regulations.gov API
+        fetch_page (callable): sends one request, with the signature of
+            `get_reg_gov_page`
+        **kwargs: passed on to `upsert_documents`
+
+    Returns:
+        dict with the number of documents closed, checked and changed, the
+        API calls made, and the calls saved compared to looking up each
+        open document
+    """
+    api_calls = 0
+    replay = []  # a page fetched while planning, to be used again
+
+    def counted_fetch_page(*args):
+        nonlocal api_calls
+        if replay:
+            return replay.pop()
+        api_calls += 1
+        return fetch_page(*args)
+
+    closed = close_passed_docs()
+    logging.info(f"Closed {closed} documents past their closing date.")
+    stored = get_open_doc_versions()
+
+    params, first_page, single = _plan_window(
+        api_key, stored, counted_fetch_page
+    )
+    changed = {}
+    if params is not None:
+        replay.append(first_page)
+        for page in iter_reg_gov_pages(
+            api_key,
+            "documents",
+            params=params,
+            work_class="status",
+            fetch_page=counted_fetch_page,
+        ):
+            changed.update(
+                (doc["id"], doc) for doc in page if _is_changed(doc, stored)
+            )
+
+    for doc_id in single:
+        r_json = counted_fetch_page(
+            api_key, "documents", {"filter[searchTerm]": doc_id}, "status"
+        )
+        changed.update(
+            (doc["id"], doc)
+            for doc in r_json["data"]
+            if _is_changed(doc, stored)
+        )
+
+    upsert_documents(list(changed.values()), **kwargs)
+
+    summary = {
+        "closed": closed,
+        "checked": len(stored),
+        "changed": len(changed),
+        "api_calls": api_calls,
+        "api_calls_saved": len(stored) - api_calls,
+    }
+    logging.info(
+        f"Checked {summary['checked']} open documents with "
+        f"{summary['api_calls']} API calls "
+        f"({summary['api_calls_saved']} saved), "
+        f"{summary['changed']} changed"
+    )
+    return summary
+
+
 if __name__ == "__main__":
-    open_docs = get_open_docs()
-    check_current_status(open_docs)
+    parser = argparse.ArgumentParser(
+        description="Update the status of open documents in the database"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Check open documents in bulk and only update changed ones",
+    )
+    args = parser.parse_args()
+
+    if args.refresh:
+        refresh_open_docs()
+    else:
+        open_docs = get_open_docs()
+        check_current_status(open_docs)
+    fr_cache.log_stats()
@@ -0,0 +1,330 @@
+"""
+Concurrent fetcher for the per-comment detail calls to the regulations.gov API.
+
+The comments list endpoint does not return comment text, so every comment
+needs its own request to /comments/{id}. Doing those one at a time means a
+document with tens of thousands of comments spends most of its time waiting
+on round trips. This module overlaps the detail requests with asyncio while
+drawing every request from the shared hourly quota.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
+
+import requests
+
+from civiclens.collect import http_client, quota
+from civiclens.collect.quota import QuotaScheduler
+
+
+COMMENT_DETAIL_URL = "https://api.regulations.gov/v4/comments/"
+STATUS_CODE_OVER_RATE_LIMIT = 429
+WAIT_SECONDS = 3600  # Default to 1 hour
+REQUESTS_PER_HOUR = 1000
+MAX_CONCURRENCY = 8
+
+
+class TokenBucket:
+    """
+    Async token bucket for capping detail requests within one process.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. The
+    bucket is also kept in line with the server: `update` caps the local
+    token count at the X-RateLimit-Remaining header, and `block` pauses all
+    callers until a Retry-After period has passed.
+    """
+
+    def __init__(
+        self,
+        rate: float = REQUESTS_PER_HOUR / 3600,
+        capacity: float = 50,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            rate (float): tokens added per second
+            capacity (float): maximum number of tokens held at once, ie the
+                largest burst allowed
+            clock (callable): returns the current time in seconds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """
+        Wait until a token is available and take it.
+        """
+        async with self._lock:
+            while True:
+                now = self.clock()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update(self, headers) -> None:
+        """
+        Cap the local token count at the number of requests the server says
+        are left this hour.
+
+        Args:
+            headers (dict): response headers from the API
+        """
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None and str(remaining).isdigit():
+            self._refill(self.clock())
+            self.tokens = min(self.tokens, int(remaining))
+
+    def block(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for a number of seconds, eg after a 429.
+
+        Args:
+            seconds (float): how long to wait before the next request
+        """
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+def _get_detail(
+    session: requests.Session,
+    scheduler: QuotaScheduler,
+    api_key: str,
+    url: str,
+) -> requests.Response:
+    """
+    Send one detail request once the shared quota allows it. Runs in a
+    worker thread, so waiting on the scheduler doesn't block the event loop.
+    """
+    scheduler.acquire("sync")
+    response = session.get(url, headers={"X-Api-Key": api_key}, verify=True)
+    scheduler.record_response(response)
+    return response
+
+
+async def _fetch_one(
+    comment: dict,
+    send: Callable[[str], requests.Response],
+    limiter: Optional[TokenBucket],
+    base_url: str,
+    executor: ThreadPoolExecutor,
+) -> Optional[dict]:
+    """
+    Fetch the detail JSON for one comment and merge it into the list JSON.
+
+    Returns None if the API returns an error other than a rate limit.
+    """
+    url = f"{base_url}{comment['id']}?include=attachments"
+    loop = asyncio.get_running_loop()
+
+    while True:
+        if limiter is not None:
+            await limiter.acquire()
+        response = await loop.run_in_executor(executor, send, url)
+        if limiter is not None:
+            limiter.update(response.headers)
+
+        if response.status_code == 200:
+            # DECISION: same merge as merge_comment_text_and_data
+            return {**comment, **response.json()}
+        elif response.status_code == STATUS_CODE_OVER_RATE_LIMIT:
+            retry_after = response.headers.get("Retry-After", None)
+            wait_time = (
+                int(retry_after)
+                if retry_after and retry_after.isdigit()
+                else WAIT_SECONDS
+            )
+            the_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            logging.info(
+                f"""Rate limit exceeded at {the_time}.
+                Waiting up to {wait_time} seconds to retry."""
+            )
+            if limiter is not None:
+                limiter.block(wait_time)
+        else:
+            logging.info(
+                f"""Failed to retrieve comment data for {comment['id']}.
+                Status code: {response.status_code}"""
+            )
+            return None
+
+
+async def fetch_comment_details(
+    api_key: str,
+    comments: Iterable[dict],
+    max_concurrency: int = MAX_CONCURRENCY,
+    limiter: Optional[TokenBucket] = None,
+    scheduler: Optional[QuotaScheduler] = None,
+    session: Optional[requests.Session] = None,
+    base_url: str = COMMENT_DETAIL_URL,
+) -> AsyncIterator[dict]:
+    """
+    Fetch comment text for a stream of comments, yielding merged comment JSON
+    objects in the order the requests complete.
+
+    The input is consumed lazily, so at most `max_concurrency` comments are
+    in flight at any time. It is read in a worker thread, so an input that
+    waits on the API doesn't hold up requests already in flight. Comments
+    whose detail call fails are logged and skipped.
+
+    Args:
+        api_key (str): key for the regulations.gov API
+        comments (iterable of json): comment objects from the comments list
+            endpoint; only the "id" field is needed for the request
+        max_concurrency (int): number of detail requests to run at once
+        limiter (TokenBucket, optional): extra in-process rate limit on top
+            of the shared quota
+        scheduler (QuotaScheduler, optional): quota the requests are drawn
+            from, defaults to the one shared by all collectors
+        session (requests.Session, optional): session to send the requests
+            through, defaults to the shared session for the API host
+        base_url (str): url the comment id is appended to
+
+    Yields:
+        combined json object for the comment and text
+    """
+    session = (
+        session if session is not None else http_client.get_session(base_url)
+    )
+    scheduler = scheduler if scheduler is not None else quota.get_scheduler()
+    send = partial(_get_detail, session, scheduler, api_key)
+    # requests is blocking, so each in-flight request gets its own thread
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    comment_iter = iter(comments)
+    pending = set()
+    # the input can itself be paging through the API, so comments are
+    # pulled in a worker thread, one at a time, alongside the requests
+    pull = asyncio.create_task(asyncio.to_thread(next, comment_iter, None))
+
+    try:
+        while pull is not None or pending:
+            waiting = pending if pull is None else pending | {pull}
+            done, _ = await asyncio.wait(
+                waiting, return_when=asyncio.FIRST_COMPLETED
+            )
+            if pull in done:
+                comment, pull = pull.result(), None
+                if comment is None:
+                    comment_iter = None
+                else:
+                    pending.add(
+                        asyncio.create_task(
+                            _fetch_one(
+                                comment, send, limiter, base_url, executor
+                            )
+                        )
+                    )
+            for task in done & pending:
+                pending.discard(task)
+                result = task.result()
+                if result is not None:
+                    yield result
+            if (
+                pull is None
+                and comment_iter is not None
+                and len(pending) < max_concurrency
+            ):
+                pull = asyncio.create_task(
+                    asyncio.to_thread(next, comment_iter, None)
+                )
+    finally:
+        for task in pending:
+            task.cancel()
+        if pull is not None:
+            pull.cancel()
+        executor.shutdown(wait=False)
+
+
+_DONE = object()
+
+
+def _pump_to_queue(
+    api_key: str,
+    comments: Iterable[dict],
+    results: queue.Queue,
+    stop: threading.Event,
+    **kwargs,
+) -> None:
+    """
+    Run `fetch_comment_details` to completion in a fresh event loop, putting
+    each result on the queue. Errors are put on the queue to be re-raised by
+    the consumer, and `_DONE` always marks the end.
+    """
+
+    async def pump():
+        async for comment in fetch_comment_details(api_key, comments, **kwargs):
+            await asyncio.to_thread(results.put, comment)
+            if stop.is_set():
+                return
+
+    try:
+        asyncio.run(pump())
+    except BaseException as e:  # re-raised in the calling thread
+        results.put(e)
+    finally:
+        results.put(_DONE)
+
+
+def iter_comment_details(
+    api_key: str, comments: Iterable[dict], **kwargs
+) -> Iterator[dict]:
+    """
+    Synchronous wrapper around `fetch_comment_details` for use in the
+    collectors. The event loop runs in a background thread, so callers can
+    clean, QA and insert each comment while later requests are in flight.
+
+    Args:
+        api_key (str): key for the regulations.gov API
+        comments (iterable of json): comment objects from the comments list
+            endpoint
+        **kwargs: passed on to `fetch_comment_details`
+
+    Yields:
+        combined json object for the comment and text
+    """
+    max_concurrency = kwargs.get("max_concurrency", MAX_CONCURRENCY)
+    results = queue.Queue(maxsize=max_concurrency * 2)
+    stop = threading.Event()
+    worker = threading.Thread(
+        target=_pump_to_queue,
+        args=(api_key, comments, results, stop),
+        kwargs=kwargs,
+        daemon=True,
+    )
+    worker.start()
+
+    try:
+        while (item := results.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # drain so the worker is never stuck on a full queue
+        while worker.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,136 @@
+"""
+Data quality checks on API records, and the sink their flags go through.
+
+A check is a (message, predicate) pair. Every check is run on a record, so
+one pass flags all of a record's problems rather than the first failing
+assert; a predicate that raises, eg on a missing key, counts as a failure.
+
+Flags are buffered by a `QualityFlagSink` and written to the dataqa table
+in batches, when enough have built up, when the oldest has waited long
+enough, or when the process exits, instead of a connection and a commit for
+every flag.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Sequence
+
+
+FLAG_BATCH_SIZE = 500
+FLAG_FLUSH_SECONDS = 30
+
+Check = tuple[str, Callable[[Any], bool]]
+
+
+def run_checks(record: Any, checks: Sequence[Check]) -> list[str]:
+    """
+    Run every check on a record.
+
+    Args:
+        record (json): the record to check
+        checks (list of tuples): (message, predicate) pairs; the predicate
+            takes the record and returns whether it passes
+
+    Returns:
+        the messages of the checks that failed, in order
+    """
+    failures = []
+    for message, predicate in checks:
+        try:
+            passed = predicate(record)
+        except Exception as e:
+            failures.append(f"{message} ({type(e).__name__}: {e})")
+            continue
+        if not passed:
+            failures.append(message)
+    return failures
+
+
+class QualityFlagSink:
+    """
+    Thread-safe buffer of data quality flags, written out in batches.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[tuple]], None],
+        batch_size: int = FLAG_BATCH_SIZE,
+        flush_seconds: float = FLAG_FLUSH_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            write (callable): takes a list of (data_id, data_type,
+                error_message, added_at) rows and stores them
+            batch_size (int): number of flags to hold before writing
+            flush_seconds (float): longest a flag is held before the next
+                flag added writes it
+            clock (callable): returns the current time in seconds
+        """
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._flags = []
+        self._oldest = None
+        self._stats = {"flags": 0, "batches": 0, "dropped": 0}
+
+    def add(self, data_id: str, data_type: str, error_message: str) -> None:
+        """
+        Buffer a flag, writing the buffer if it is full or old enough.
+
+        Args:
+            data_id (str): id field of the data in question
+            data_type (str): whether docket, document, or comment
+            error_message (str): the check that failed
+        """
+        with self._lock:
+            if not self._flags:
+                self._oldest = self.clock()
+            self._flags.append(
+                (data_id, data_type, str(error_message), datetime.now())
+            )
+            self._stats["flags"] += 1
+            due = (
+                len(self._flags) >= self.batch_size
+                or self.clock() - self._oldest >= self.flush_seconds
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write every buffered flag in one batch. Flags that fail to write
+        are logged and dropped.
+
+        Returns:
+            number of flags written
+        """
+        with self._lock:
+            flags, self._flags = self._flags, []
+        if not flags:
+            return 0
+
+        try:
+            self.write(flags)
+        except Exception:
+            logging.exception(f"could not write {len(flags)} data QA flags")
+            with self._lock:
+                self._stats["dropped"] += len(flags)
+            return 0
+
+        with self._lock:
+            self._stats["batches"] += 1
+        logging.info(f"wrote {len(flags)} data quality flags")
+        return len(flags)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of flags added, batches written and flags
+        dropped.
+        """
+        with self._lock:
+            return dict(self._stats)
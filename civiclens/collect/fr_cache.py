@@ -0,0 +1,263 @@
+"""
+On-disk cache of Federal Register XML for documents we have already parsed.
+
+Documents are reprocessed often (every status check of a document still
+open for comment goes back to the Federal Register), but their XML rarely
+changes. For each frDocNum the cache keeps the XML url, the ETag and
+Last-Modified headers it was served with, and the fields parsed out of it.
+Callers send a conditional GET with those headers and, on a 304, reuse the
+parsed fields without downloading or parsing the XML again.
+
+Parsed fields are stored content-addressed, under the SHA-256 of the XML
+they came from, next to a small entry file per frDocNum. Files are written
+atomically, so several collector processes can share one cache directory.
+When the cache grows past its size limit, the least recently used entries
+are removed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from civiclens.utils.constants import FR_CACHE_DIR, FR_CACHE_MAX_BYTES
+
+
+class FederalRegisterCache:
+    """
+    Size-bounded LRU cache of parsed Federal Register XML, keyed by
+    frDocNum. An entry's last use is its file's modification time.
+    """
+
+    def __init__(self, path: str, max_bytes: int = FR_CACHE_MAX_BYTES):
+        """
+        Args:
+            path (str): directory to keep the cache in
+            max_bytes (int): size in bytes the cache may grow to before the
+                least recently used entries are removed
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._entry_dir = os.path.join(path, "entries")
+        self._blob_dir = os.path.join(path, "blobs")
+        os.makedirs(self._entry_dir, exist_ok=True)
+        os.makedirs(self._blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = None  # bytes on disk, counted on first put
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "not_modified": 0,
+            "downloads": 0,
+            "evictions": 0,
+        }
+
+    def _entry_path(self, fr_doc_num: str) -> str:
+        key = hashlib.sha256(fr_doc_num.encode()).hexdigest()
+        return os.path.join(self._entry_dir, f"{key}.json")
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self._blob_dir, f"{content_hash}.json")
+
+    def _write(self, path: str, data: dict) -> int:
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            written = f.tell()
+        os.replace(tmp_path, path)
+        return written
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get(self, fr_doc_num: str) -> Optional[dict]:
+        """
+        Look up the cached entry for a document.
+
+        Args:
+            fr_doc_num (str): Federal Register document number
+
+        Returns:
+            dict with the xml_url, etag, last_modified and parsed fields, or
+            None if the document isn't cached
+        """
+        entry_path = self._entry_path(fr_doc_num)
+        entry = self._read(entry_path)
+        parsed = entry and self._read(self._blob_path(entry["content_hash"]))
+        with self._lock:
+            self._stats["hits" if parsed else "misses"] += 1
+        if not parsed:
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+        return {**entry, "parsed": parsed}
+
+    def put(
+        self,
+        fr_doc_num: str,
+        xml_url: str,
+        xml_content: bytes,
+        parsed: dict,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """
+        Store the fields parsed from a document's XML, then trim the cache
+        if it has grown too big.
+
+        Args:
+            fr_doc_num (str): Federal Register document number
+            xml_url (str): where the XML was downloaded from
+            xml_content (bytes): the XML, for the content hash
+            parsed (dict): fields parsed from the XML
+            etag (str, optional): ETag header of the XML response
+            last_modified (str, optional): Last-Modified header of the XML
+                response
+        """
+        if self._size is None:
+            self._size = self.size()
+
+        content_hash = hashlib.sha256(xml_content).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        written = 0
+        if not os.path.exists(blob_path):
+            written += self._write(blob_path, parsed)
+        written += self._write(
+            self._entry_path(fr_doc_num),
+            {
+                "fr_doc_num": fr_doc_num,
+                "xml_url": xml_url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "content_hash": content_hash,
+            },
+        )
+        with self._lock:
+            self._stats["downloads"] += 1
+            self._size += written
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def record_not_modified(self) -> None:
+        """
+        Count a conditional request the server answered with 304.
+        """
+        with self._lock:
+            self._stats["not_modified"] += 1
+
+    def size(self) -> int:
+        """
+        Returns the total bytes of every file in the cache.
+        """
+        return sum(
+            entry.stat().st_size
+            for directory in (self._entry_dir, self._blob_dir)
+            for entry in os.scandir(directory)
+        )
+
+    def evict(self) -> int:
+        """
+        Remove parsed fields no entry points to any more, then the least
+        recently used entries until the cache is back under 90% of
+        max_bytes, so it isn't trimmed again on the very next put.
+
+        Returns:
+            number of entries removed
+        """
+        entries = []
+        for dir_entry in os.scandir(self._entry_dir):
+            if not dir_entry.name.endswith(".json"):
+                continue
+            entry = self._read(dir_entry.path)
+            if entry is not None:
+                stat = dir_entry.stat()
+                entries.append((stat.st_mtime, dir_entry.path, entry))
+        entries.sort(key=lambda item: item[0])
+
+        blob_refs = {}
+        for _, _, entry in entries:
+            content_hash = entry["content_hash"]
+            blob_refs[content_hash] = blob_refs.get(content_hash, 0) + 1
+
+        # left behind when a document's XML changed
+        for dir_entry in os.scandir(self._blob_dir):
+            content_hash, extension = os.path.splitext(dir_entry.name)
+            if extension == ".json" and content_hash not in blob_refs:
+                _remove(dir_entry.path)
+
+        total = self.size()
+        removed = 0
+        for _, entry_path, entry in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            total -= _remove(entry_path)
+            content_hash = entry["content_hash"]
+            blob_refs[content_hash] -= 1
+            if not blob_refs[content_hash]:
+                total -= _remove(self._blob_path(content_hash))
+            removed += 1
+
+        with self._lock:
+            self._stats["evictions"] += removed
+            self._size = total
+        return removed
+
+    def stats(self) -> dict:
+        """
+        Returns counts of cache hits and misses, conditional requests
+        answered with 304, XML downloads, and evicted entries.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+def _remove(path: str) -> int:
+    """
+    Delete a file, returning the bytes freed.
+    """
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+_cache = None
+
+
+def get_cache() -> Optional[FederalRegisterCache]:
+    """
+    Returns the process-wide cache in FR_CACHE_DIR, or None if FR_CACHE_DIR
+    is set to "" to turn caching off.
+    """
+    global _cache
+    if _cache is None and FR_CACHE_DIR:
+        _cache = FederalRegisterCache(FR_CACHE_DIR)
+    return _cache
+
+
+def log_stats() -> None:
+    """
+    Log a one-line summary of the cache's counts, if the cache is on.
+    """
+    if _cache is None:
+        return
+    cache_stats = _cache.stats()
+    logging.info(
+        f"federal register cache: {cache_stats['hits']} hits "
+        f"({cache_stats['not_modified']} unchanged), "
+        f"{cache_stats['misses']} misses, "
+        f"{cache_stats['downloads']} XML downloads, "
+        f"{cache_stats['evictions']} evictions"
+    )
@@ -0,0 +1,181 @@
+"""
+Single-pass extractor for Federal Register rule XML.
+
+`parse_xml_content` loads the whole document into a tree and searches it
+once per field, and only reads two levels into the supplementary
+information, so text in nested elements (emphasis, footnotes, lists) is
+lost. Here the XML is fed through the parser in chunks with a parser target
+that picks up each field as the parser reaches it, so no tree is ever
+built, and the supplementary information is collected in full along with
+its section headings. Memory use depends on the text extracted, not on the
+size of the document.
+"""
+
+import io
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Optional, Union
+
+
+NOT_FOUND = "Not Found"
+CHUNK_SIZE = 1 << 16
+
+FIELDS = (
+    "agencyType",
+    "CFR",
+    "RIN",
+    "title",
+    "summary",
+    "dates",
+    "furtherInformation",
+)
+
+# fields taken from the text of the first element with this tag
+FIELD_TAGS = {"CFR": "CFR", "RIN": "RIN", "SUBJECT": "title"}
+
+# fields taken from the text of the first paragraph of these sections
+PARAGRAPH_FIELDS = {
+    "SUM": "summary",
+    "DATES": "dates",
+    "FURINF": "furtherInformation",
+}
+
+
+class _RuleTarget:
+    """
+    Parser target collecting the fields of a rule as the parser reaches
+    them. The text of a field is the text of its element up to the first
+    child element, like `Element.text`.
+    """
+
+    def __init__(self):
+        self.extracted = {}
+        self.supplementary_texts = []
+        self.sections = []
+        self._open_tags = []
+        # field being read and the depth of its element
+        self._field = None
+        self._field_depth = None
+        self._field_text = []
+        # depth of the SUPLINF element being read, and the text of the
+        # child of it being read
+        self._suplinf_depth = None
+        self._child_text = None
+        self._child_heading = None
+
+    def _field_for(self, tag: str, attrib: dict) -> Optional[str]:
+        if tag == "AGENCY" and attrib.get("TYPE") == "S":
+            field = "agencyType"
+        elif tag in FIELD_TAGS:
+            field = FIELD_TAGS[tag]
+        elif tag == "P" and self._open_tags:
+            field = PARAGRAPH_FIELDS.get(self._open_tags[-1])
+        else:
+            field = None
+        return None if field in self.extracted else field
+
+    def start(self, tag: str, attrib: dict) -> None:
+        if self._field is not None:
+            # the field's text ends at its first child element
+            self._finish_field()
+        if field := self._field_for(tag, attrib):
+            self._field = field
+            self._field_depth = len(self._open_tags) + 1
+
+        self._open_tags.append(tag)
+        depth = len(self._open_tags)
+        if self._suplinf_depth is None:
+            if tag == "SUPLINF":
+                self._suplinf_depth = depth
+        elif depth == self._suplinf_depth + 1:
+            self._child_text = []
+            self._child_heading = attrib.get("SOURCE") if tag == "HD" else None
+        elif self._child_text is not None:
+            # keep the text of neighbouring elements apart
+            self._child_text.append(" ")
+
+    def data(self, text: str) -> None:
+        if self._field is not None:
+            self._field_text.append(text)
+        if self._child_text is not None:
+            self._child_text.append(text)
+
+    def end(self, tag: str) -> None:
+        depth = len(self._open_tags)
+        self._open_tags.pop()
+        if self._field is not None and depth == self._field_depth:
+            self._finish_field()
+
+        if self._suplinf_depth is None:
+            return
+        if depth == self._suplinf_depth + 1:
+            self._finish_child(tag)
+        elif depth == self._suplinf_depth:
+            self._suplinf_depth = None
+        elif self._child_text is not None:
+            self._child_text.append(" ")
+
+    def _finish_field(self) -> None:
+        self.extracted[self._field] = "".join(self._field_text) or None
+        self._field = None
+        self._field_text = []
+
+    def _finish_child(self, tag: str) -> None:
+        """
+        Add one child of SUPLINF to the supplementary text, starting a new
+        section at each heading.
+        """
+        text = " ".join("".join(self._child_text).split())
+        self._child_text = None
+        if tag == "HD":
+            self.sections.append(
+                {"heading": text, "level": self._child_heading, "text": []}
+            )
+        elif text:
+            if not self.sections:
+                self.sections.append(
+                    {"heading": None, "level": None, "text": []}
+                )
+            self.sections[-1]["text"].append(text)
+
+        if text:
+            self.supplementary_texts.append(text)
+
+    def close(self) -> dict:
+        extracted_data = {
+            field: self.extracted.get(field, NOT_FOUND) for field in FIELDS
+        }
+        extracted_data["supplementaryInformation"] = " ".join(
+            self.supplementary_texts
+        )
+        extracted_data["sections"] = [
+            {**section, "text": " ".join(section["text"])}
+            for section in self.sections
+        ]
+        return extracted_data
+
+
+def extract_fr_xml(source: Union[str, bytes, BinaryIO]) -> dict:
+    """
+    Extracts agency type, CFR, RIN, title, summary, dates, further
+    information and the full supplementary information from Federal
+    Register XML in one pass.
+
+    Args:
+        source (str, bytes or binary file): the XML, or an open file or
+            stream to read it from
+
+    Returns:
+        extracted_data (dict): the same fields as `parse_xml_content`, with
+            all of the supplementary information text, plus "sections": a
+            list of {"heading", "level", "text"} for each heading in the
+            supplementary information
+    """
+    parser = ET.XMLParser(target=_RuleTarget())
+    if isinstance(source, str):
+        source = source.encode()
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    while chunk := source.read(CHUNK_SIZE):
+        parser.feed(chunk)
+    return parser.close()
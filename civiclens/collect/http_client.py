@@ -0,0 +1,194 @@
+"""
+Shared HTTP sessions for every call to regulations.gov and the Federal
+Register.
+
+Each host gets one keep-alive `requests.Session` for the life of the process,
+so collectors reuse TLS connections instead of opening a new one per call.
+Retries, backoff and timeouts are set here once. The module also keeps
+per-host counts of requests and new connections, plus a latency histogram,
+which `stats` and `log_stats` report.
+"""
+
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_TIMEOUT = (10, 60)  # (connect, read) seconds
+POOL_MAXSIZE = 32
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+# Rate limits (429) and the duplicate-comment 500 are handled by callers, so
+# only retry on gateway errors and dropped connections
+RETRY_POLICY = Retry(
+    total=4,
+    backoff_factor=0.5,
+    status_forcelist=(502, 503, 504),
+    allowed_methods=frozenset({"GET", "HEAD"}),
+    raise_on_status=False,
+    respect_retry_after_header=False,
+)
+
+_sessions = {}
+_latencies = {}
+_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies DEFAULT_TIMEOUT when a caller doesn't pass one,
+    so a stalled server can't hang a nightly job.
+    """
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _record_latency(response: requests.Response, *args, **kwargs) -> None:
+    """
+    Response hook adding the request's latency to its host's histogram.
+    """
+    host = _host(response.url)
+    seconds = response.elapsed.total_seconds()
+    with _lock:
+        histogram = _latencies.setdefault(host, [0] * len(LATENCY_BUCKETS))
+        for i, upper in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper:
+                histogram[i] += 1
+                break
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        max_retries=RETRY_POLICY,
+        pool_connections=4,
+        pool_maxsize=POOL_MAXSIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_record_latency)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the shared session for the host of a url, creating it on first
+    use.
+
+    Args:
+        url (str): any url on the host we want to call
+
+    Returns:
+        requests.Session
+    """
+    host = _host(url)
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _build_session()
+            _sessions[host] = session
+    return session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    Sends a GET request through the shared session for the url's host.
+
+    Args:
+        url (str): the url to request
+        **kwargs: passed on to `requests.Session.get`
+
+    Returns:
+        requests.Response
+    """
+    return get_session(url).get(url, **kwargs)
+
+
+def _connection_counts(session: requests.Session) -> tuple[int, int]:
+    """
+    Sum the number of requests sent and connections opened across every
+    urllib3 pool behind a session.
+    """
+    num_requests = num_connections = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+    return num_requests, num_connections
+
+
+def stats() -> dict:
+    """
+    Report connection reuse and latency for every host called so far.
+
+    Returns:
+        dict keyed by host with the number of requests, new connections,
+        connection reuse ratio (share of requests that didn't need a new
+        connection) and a latency histogram of {bucket upper bound in
+        seconds: count}
+    """
+    with _lock:
+        sessions = dict(_sessions)
+        latencies = {host: list(hist) for host, hist in _latencies.items()}
+
+    report = {}
+    for host, session in sessions.items():
+        num_requests, num_connections = _connection_counts(session)
+        reuse_ratio = (
+            1 - num_connections / num_requests if num_requests else None
+        )
+        histogram = latencies.get(host, [0] * len(LATENCY_BUCKETS))
+        report[host] = {
+            "requests": num_requests,
+            "connections": num_connections,
+            "reuse_ratio": reuse_ratio,
+            "latency_histogram": dict(
+                zip(LATENCY_BUCKETS, histogram, strict=True)
+            ),
+        }
+    return report
+
+
+def log_stats() -> None:
+    """
+    Log a one-line summary per host of the numbers from `stats`.
+    """
+    for host, host_stats in stats().items():
+        if not host_stats["requests"]:
+            continue
+        histogram = ", ".join(
+            f"<={upper}s: {count}"
+            for upper, count in host_stats["latency_histogram"].items()
+            if count
+        )
+        logging.info(
+            f"{host}: {host_stats['requests']} requests, "
+            f"{host_stats['connections']} connections, "
+            f"reuse ratio {host_stats['reuse_ratio']:.2f}; "
+            f"latency {histogram}"
+        )
+
+
+def reset() -> None:
+    """
+    Close all shared sessions and clear the collected stats.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _latencies.clear()
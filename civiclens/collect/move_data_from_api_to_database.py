@@ -1,16 +1,42 @@
 import argparse
+import atexit
 import datetime as dt
 import json
 import logging
-import time
+import multiprocessing
+import os
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from functools import partial
+from typing import Iterable, Iterator, Optional
 
+import polars as pl
 import psycopg2
-import requests
-from requests.adapters import HTTPAdapter
-
-from civiclens.collect.access_api_data import pull_reg_gov_data
+from psycopg2.extras import execute_values
+
+from civiclens.collect import (
+    data_quality,
+    fr_cache,
+    http_client,
+    qa_rules,
+    quota,
+    raw_archive,
+    sync,
+)
+from civiclens.collect.access_api_data import (
+    iter_reg_gov_data,
+    pull_reg_gov_data,
+)
+from civiclens.collect.comment_fetcher import iter_comment_details
+from civiclens.collect.fr_xml import extract_fr_xml
+from civiclens.collect.pipeline import Pipeline, Stage
+from civiclens.collect.qa_rules import (  # noqa: F401
+    cfr_looks_right,
+    validate_fr_doc_num,
+)
 from civiclens.utils.constants import (
     DATABASE_HOST,
     DATABASE_NAME,
@@ -19,6 +45,7 @@ from civiclens.utils.constants import (
     DATABASE_USER,
     REG_GOV_API_KEY,
 )
+from civiclens.utils.database_access import db_connection, pool_stats
 from civiclens.utils.text import clean_text
 
 
@@ -41,7 +68,7 @@ def fetch_fr_document_details(fr_doc_num: str) -> str:
         xml url (str)
     """
     api_endpoint = f"https://www.federalregister.gov/api/v1/documents/{fr_doc_num}.json?fields[]=full_text_xml_url"  # noqa: E231
-    response = requests.get(api_endpoint)
+    response = http_client.get(api_endpoint)
     if response.status_code == 200:
         data = response.json()
         return data.get("full_text_xml_url")
@@ -60,7 +87,7 @@ def fetch_xml_content(url: str) -> str:
     Returns:
         response.text (str): the text
     """
-    response = requests.get(url)
+    response = http_client.get(url)
     if response.status_code == 200:
         return response.text
     else:
@@ -139,6 +166,109 @@ def parse_xml_content(xml_content: str) -> dict:
     return extracted_data
 
 
+def fetch_fr_xml(
+    fr_doc_num: str, cache: Optional[fr_cache.FederalRegisterCache] = None
+) -> dict:
+    """
+    Downloads a document's Federal Register XML, unless the XML cache has
+    the fields parsed from it and the server says it hasn't changed. A
+    cached document costs one conditional request.
+
+    Args:
+        fr_doc_num (str): the unique id (comes from regulations.gov api info)
+        cache (FederalRegisterCache, optional): defaults to the shared cache
+
+    Returns:
+        dict with the fr_doc_num, xml_url, etag and last_modified, and either
+        "parsed", the cached fields, or "content", the XML to parse (the
+        other is None)
+    """
+    cache = cache if cache is not None else fr_cache.get_cache()
+    entry = cache.get(fr_doc_num) if cache is not None else None
+
+    headers = {}
+    if entry is None:
+        xml_url = fetch_fr_document_details(fr_doc_num)
+    else:
+        xml_url = entry["xml_url"]
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = http_client.get(xml_url, headers=headers)
+    fetched = {
+        "fr_doc_num": fr_doc_num,
+        "xml_url": xml_url,
+        "parsed": None,
+        "content": None,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    if response.status_code == 304 and entry is not None:
+        cache.record_not_modified()
+        fetched["parsed"] = dict(entry["parsed"])
+    elif response.status_code == 200:
+        fetched["content"] = response.content
+    else:
+        raise Exception(
+            f"Error fetching XML content from {xml_url}: "
+            f"{response.status_code}"
+        )
+    return fetched
+
+
+def store_parsed_xml(
+    fetched: dict,
+    extracted_data: dict,
+    cache: Optional[fr_cache.FederalRegisterCache] = None,
+) -> None:
+    """
+    Add the fields parsed from XML downloaded by `fetch_fr_xml` to the XML
+    cache, if it is on.
+
+    Args:
+        fetched (dict): what `fetch_fr_xml` returned
+        extracted_data (dict): the fields parsed from fetched["content"]
+        cache (FederalRegisterCache, optional): defaults to the shared cache
+    """
+    cache = cache if cache is not None else fr_cache.get_cache()
+    if cache is not None:
+        cache.put(
+            fetched["fr_doc_num"],
+            fetched["xml_url"],
+            fetched["content"],
+            extracted_data,
+            etag=fetched["etag"],
+            last_modified=fetched["last_modified"],
+        )
+
+
+def fetch_parsed_xml(
+    fr_doc_num: str, cache: Optional[fr_cache.FederalRegisterCache] = None
+) -> dict:
+    """
+    Gets the fields parsed from a document's Federal Register XML, going
+    through the XML cache when it is on. The XML is only downloaded and
+    parsed again if the server says it changed.
+
+    Args:
+        fr_doc_num (str): the unique id (comes from regulations.gov api info)
+        cache (FederalRegisterCache, optional): defaults to the shared cache
+
+    Returns:
+        extracted_data (dict): contains key parts of the extracted text, as
+            returned by `extract_fr_xml`
+    """
+    fetched = fetch_fr_xml(fr_doc_num, cache)
+    if fetched["parsed"] is not None:
+        return fetched["parsed"]
+
+    extracted_data = extract_fr_xml(fetched["content"])
+    store_parsed_xml(fetched, extracted_data, cache)
+    return extracted_data
+
+
 def extract_xml_text_from_doc(doc: json) -> json:
     """
     Take a document's json object, pull the xml text, add the text to the
@@ -168,23 +298,77 @@ def extract_xml_text_from_doc(doc: json) -> json:
     return processed_data
 
 
+DATABASE_PARAMS = {
+    "database": DATABASE_NAME,
+    "user": DATABASE_USER,
+    "password": DATABASE_PASSWORD,
+    "host": DATABASE_HOST,
+    "port": DATABASE_PORT,
+}
+
+
 def connect_db_and_get_cursor() -> (
     tuple[psycopg2.extensions.connection, psycopg2.extensions.cursor]
 ):
     """
     Connect to the CivicLens database and return the objects
     """
-    connection = psycopg2.connect(
-        database=DATABASE_NAME,
-        user=DATABASE_USER,
-        password=DATABASE_PASSWORD,
-        host=DATABASE_HOST,
-        port=DATABASE_PORT,
-    )
+    connection = psycopg2.connect(**DATABASE_PARAMS)
     cursor = connection.cursor()
     return connection, cursor
 
 
+@contextmanager
+def db_cursor() -> Iterator[psycopg2.extensions.cursor]:
+    """
+    Check a connection to the CivicLens database out of the shared pool and
+    yield a cursor. The work is committed if the block finishes and rolled
+    back if it raises.
+    """
+    with db_connection(DATABASE_PARAMS) as connection:
+        with connection, connection.cursor() as cursor:
+            yield cursor
+
+
+# counts for existing_ids; every id checked would otherwise have been its
+# own verify_database_existence query
+EXISTENCE_STATS = {"queries": 0, "ids_checked": 0}
+
+
+def existing_ids(
+    table: str, ids: Iterable[str], db_field: str = "id"
+) -> set[str]:
+    """
+    Find which of a list of values already exist in a db table, in a single
+    query
+
+    Args:
+        table (str): one of the tables in the CivicLens db
+        ids (iterable of str): the values we're looking for in the table
+        db_field (str): the field in the table where we're looking for the
+        values
+
+    Returns:
+        set of the values that were found
+    """
+    ids = list({api_field_val for api_field_val in ids if api_field_val})
+    if not ids:
+        return set()
+
+    with db_cursor() as cursor:
+        query = (
+            f"SELECT DISTINCT {db_field} FROM {table} "
+            f"WHERE {db_field} = ANY(%s);"
+        )
+        cursor.execute(query, (ids,))
+        response = cursor.fetchall()
+
+    EXISTENCE_STATS["queries"] += 1
+    EXISTENCE_STATS["ids_checked"] += len(ids)
+
+    return {row[0] for row in response}
+
+
 def verify_database_existence(
     table: str, api_field_val: str, db_field: str = "id"
 ) -> bool:
@@ -200,56 +384,90 @@ def verify_database_existence(
     Returns:
         boolean indicating the value was found
     """
-    connection, cursor = connect_db_and_get_cursor()
-    with connection:
-        with cursor:
-            query = f"SELECT * FROM {table} WHERE {db_field} = %s;"  # noqa: E231, E702
-            cursor.execute(query, (api_field_val,))
-            response = cursor.fetchall()
-
-    if connection:
-        cursor.close()
-        connection.close()
+    with db_cursor() as cursor:
+        query = (
+            f"SELECT * FROM {table} WHERE {db_field} = %s;"  # noqa: E231, E702
+        )
+        cursor.execute(query, (api_field_val,))
+        response = cursor.fetchall()
 
     return bool(response)
 
 
+def write_data_quality_flags(flags: list[tuple]) -> None:
+    """
+    Insert a batch of flags into the regulations_dataqa table in one
+    statement
+
+    Args:
+        flags (list of tuples): (data_id, data_type, error_message,
+            added_at) rows, as buffered by the QA flag sink
+    """
+    with db_cursor() as cursor:
+        execute_values(
+            cursor,
+            """INSERT INTO regulations_dataqa (
+                "data_id",
+                "data_type",
+                "error_message",
+                "added_at"
+            ) VALUES %s""",
+            flags,
+        )
+
+
+# flags from the qa_*_data functions, written in batches and when the
+# process exits
+QA_FLAGS = data_quality.QualityFlagSink(write_data_quality_flags)
+atexit.register(QA_FLAGS.flush)
+
+
 def add_data_quality_flag(
     data_id: str, data_type: str, error_message: str
 ) -> None:
-    """Add data to the regulations_dataqa table is qa assert statements flag
+    """Flag data for the regulations_dataqa table when a qa check fails.
+    Flags are buffered and written in batches; call QA_FLAGS.flush() to
+    write them straight away
 
     Args:
         data_id (str): id field of the data in question
         data_type (str): whether docket, document, or comment
-        error_message (Error): the error and message raised by the assert
-            statement
-    Returns: nothing, add a row to regulations_dataqa
+        error_message (str): the check that failed
+    Returns: nothing, adds a row to regulations_dataqa
     """
-    connection, cursor = connect_db_and_get_cursor()
-    with connection:
-        with cursor:
-            cursor.execute(
-                """INSERT INTO regulations_dataqa (
-                    "data_id",
-                    "data_type",
-                    "error_message",
-                    "added_at"
-                ) VALUES (%s, %s, %s, %s)
-                ON CONFLICT (id) DO UPDATE SET
-                    data_id = EXCLUDED.data_id,
-                    data_type = EXCLUDED.data_type,
-                    error_message = EXCLUDED.error_message,
-                    added_at = EXCLUDED.added_at;""",
-                (data_id, data_type, str(error_message), datetime.now()),
-            )
-        connection.commit()
+    QA_FLAGS.add(data_id, data_type, error_message)
+
 
-    if connection:
-        cursor.close()
-        connection.close()
+def flag_failed_checks(
+    data_id: str, data_type: str, record: json, checks: list
+) -> bool:
+    """
+    Run every qa check on a record, logging and flagging each one that
+    fails
+
+    Args:
+        data_id (str): id field of the data in question
+        data_type (str): whether docket, document, or comment
+        record (json): the data to check
+        checks (list of tuples): (message, predicate) pairs, as taken by
+            `data_quality.run_checks`
 
-    logging.info(f"Added data quality flag for {data_id} of type {data_type}.")
+    Returns: (bool) whether every check passed
+    """
+    failures = data_quality.run_checks(record, checks)
+    if failures:
+        logging.error(
+            f"AssertionError: {data_type} {data_id} -- {'; '.join(failures)}"
+        )
+    for failure in failures:
+        add_data_quality_flag(data_id, data_type, failure)
+    return not failures
+
+
+# the per-record form of the shared qa rules
+DOCKET_QA_CHECKS = [rule.as_check() for rule in qa_rules.DOCKET_RULES]
+DOCUMENT_QA_CHECKS = [rule.as_check() for rule in qa_rules.DOCUMENT_RULES]
+COMMENT_QA_CHECKS = [rule.as_check() for rule in qa_rules.COMMENT_RULES]
 
 
 def get_most_recent_doc_comment_date(doc_id: str) -> str:
@@ -262,18 +480,12 @@ def get_most_recent_doc_comment_date(doc_id: str) -> str:
     Returns:
         response (datetime): the most recent date
     """
-    connection, cursor = connect_db_and_get_cursor()
-    with connection:
-        with cursor:
-            query = f"""SELECT MAX("posted_date")
-                FROM regulations_comment
-                WHERE "document_id" = '{doc_id}';"""  # noqa: E231, E702
-            cursor.execute(query)
-            response = cursor.fetchall()
-
-    if connection:
-        cursor.close()
-        connection.close()
+    with db_cursor() as cursor:
+        query = f"""SELECT MAX("posted_date")
+            FROM regulations_comment
+            WHERE "document_id" = '{doc_id}';"""  # noqa: E231, E702
+        cursor.execute(query)
+        response = cursor.fetchall()
 
     # format the text
     # it seems that the regulations.gov API returns postedDate rounded to the
@@ -292,50 +504,22 @@ def clean_docket_data(docket_data: json) -> None:
     pass
 
 
-def qa_docket_data(docket_data: json) -> None:
+def qa_docket_data(docket_data: json) -> bool:
     """
-    Run assert statements to check docket data looks right
+    Run every check that docket data looks right, flagging each failure
 
     Args:
         docket_data (json object): the docket data from the API
 
     Returns: (bool) whether data is in the expected format
     """
+    if not isinstance(docket_data, list) or len(docket_data) < 1:
+        logging.error("AssertionError: docket data in wrong format")
+        return False
 
-    attributes = docket_data[0]["attributes"]
-    data_for_db = docket_data[0]
-
-    try:
-        # need to check that docket_data is in the right format
-        assert (
-            isinstance(docket_data, list) or len(docket_data) < 1
-        ), "docket data in wrong format"
-
-        assert "attributes" in data_for_db, "'attributes' not in docket_data"
-
-        # check the fields
-        assert (
-            len(data_for_db["id"]) < 255
-        ), "id field longer than 255 characters"
-        assert attributes["docketType"] in [
-            "Rulemaking",
-            "Nonrulemaking",
-        ], "docketType unexpected value"
-        assert (
-            len(attributes["lastModifiedDate"]) == 20
-            and "202" in attributes["lastModifiedDate"]
-        ), "lastModifiedDate is unexpected length"
-        assert attributes["agencyId"].isalpha(), "agencyId is not just letter"
-        assert isinstance(attributes["title"], str), "title is not string"
-        assert (
-            attributes["objectId"][:2] == "0b"
-        ), "objectId does not start with '0b'"
-        # attributes["highlightedContent"]
-
-    except AssertionError as e:
-        id = data_for_db["id"]
-        logging.error(f"AssertionError: docket {id} -- {e}")
-        add_data_quality_flag(id, "docket", e)
+    return flag_failed_checks(
+        docket_data[0]["id"], "docket", docket_data[0], DOCKET_QA_CHECKS
+    )
 
 
 def insert_docket_into_db(docket_data: json) -> dict:
@@ -351,42 +535,38 @@ def insert_docket_into_db(docket_data: json) -> dict:
     data_for_db = docket_data[0]
     attributes = data_for_db["attributes"]
     try:
-        connection, cursor = connect_db_and_get_cursor()
-
-        with connection:
-            with cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO regulations_docket (
-                        "id",
-                        "docket_type",
-                        "last_modified_date",
-                        "agency_id",
-                        "title",
-                        "object_id",
-                        "highlighted_content"
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s
-                    )
-                    ON CONFLICT (id) DO UPDATE SET
-                        docket_type = EXCLUDED.docket_type,
-                        last_modified_date = EXCLUDED.last_modified_date,
-                        agency_id = EXCLUDED.agency_id,
-                        title = EXCLUDED.title,
-                        object_id = EXCLUDED.object_id,
-                        highlighted_content = EXCLUDED.highlighted_content;
-                    """,
-                    (
-                        data_for_db["id"],
-                        attributes["docketType"],
-                        attributes["lastModifiedDate"],
-                        attributes["agencyId"],
-                        attributes["title"],
-                        attributes["objectId"],
-                        attributes["highlightedContent"],
-                    ),
+        with db_cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO regulations_docket (
+                    "id",
+                    "docket_type",
+                    "last_modified_date",
+                    "agency_id",
+                    "title",
+                    "object_id",
+                    "highlighted_content"
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s
                 )
-                connection.commit()
+                ON CONFLICT (id) DO UPDATE SET
+                    docket_type = EXCLUDED.docket_type,
+                    last_modified_date = EXCLUDED.last_modified_date,
+                    agency_id = EXCLUDED.agency_id,
+                    title = EXCLUDED.title,
+                    object_id = EXCLUDED.object_id,
+                    highlighted_content = EXCLUDED.highlighted_content;
+                """,
+                (
+                    data_for_db["id"],
+                    attributes["docketType"],
+                    attributes["lastModifiedDate"],
+                    attributes["agencyId"],
+                    attributes["title"],
+                    attributes["objectId"],
+                    attributes["highlightedContent"],
+                ),
+            )
     except Exception as e:
         error_message = f"""Error inserting docket {data_for_db["id"]}
         into dockets table: {e}"""
@@ -416,18 +596,22 @@ def add_dockets_to_db(
         print_statements (boolean): whether to print info on progress
 
     """
-    for doc in doc_list:
-        docket_id = doc["attributes"]["docketId"]
-        commentable = doc["attributes"]["openForComment"]
+    docket_ids = [
+        doc["attributes"]["docketId"]
+        for doc in doc_list
+        if doc["attributes"]["openForComment"]
+    ]
+    dockets_in_db = existing_ids("regulations_docket", docket_ids)
+
+    for docket_id in dict.fromkeys(docket_ids):
         # if docket not in db, add it
-        if commentable and (
-            not verify_database_existence("regulations_docket", docket_id)
-        ):
+        if docket_id not in dockets_in_db:
             docket_data = pull_reg_gov_data(
                 REG_GOV_API_KEY,
                 "dockets",
                 params={"filter[searchTerm]": docket_id},
             )
+            raw_archive.archive("dockets", docket_data)
 
             # clean
             clean_docket_data(docket_data)
@@ -444,6 +628,19 @@ def add_dockets_to_db(
                     logging.info(f"Added docket {docket_id} to the db")
 
 
+# document fields that come from the Federal Register XML
+BLANK_XML_FIELDS = {
+    "agencyType": None,
+    "CFR": None,
+    "RIN": None,
+    "title": None,
+    "summary": None,
+    "dates": None,
+    "furtherInformation": None,
+    "supplementaryInformation": None,
+}
+
+
 def query_register_API_and_merge_document_data(doc: json) -> json:
     """
     Attempts to pull document text via federal register API and merge with reg
@@ -462,62 +659,25 @@ def query_register_API_and_merge_document_data(doc: json) -> json:
     document_id = doc["id"]
     if fr_doc_num:
         try:
-            xml_url = fetch_fr_document_details(fr_doc_num)
-            xml_content = fetch_xml_content(xml_url)
-            parsed_xml_content = parse_xml_content(xml_content)
+            parsed_xml_content = fetch_parsed_xml(fr_doc_num)
             doc.update(parsed_xml_content)  # merge the json objects
         except Exception:
             # if there's an error, that means we can't use the xml_url to get
             # the doc text, so we enter None for those fields
-            logging.error(
-                rf"""Error accessing federal register xml data for frDocNum
-                {fr_doc_num}, \ document id {document_id}"""
-            )
-            blank_xml_fields = {
-                "agencyType": None,
-                "CFR": None,
-                "RIN": None,
-                "title": None,
-                "summary": None,
-                "dates": None,
-                "furtherInformation": None,
-                "supplementaryInformation": None,
-            }
-            doc.update(blank_xml_fields)  # merge the json objects
+            _log_fr_error(fr_doc_num, document_id)
+            doc.update(BLANK_XML_FIELDS)  # merge the json objects
 
     else:
-        blank_xml_fields = {
-            "agencyType": None,
-            "CFR": None,
-            "RIN": None,
-            "title": None,
-            "summary": None,
-            "dates": None,
-            "furtherInformation": None,
-            "supplementaryInformation": None,
-        }
-        doc.update(blank_xml_fields)  # merge the json objects
+        doc.update(BLANK_XML_FIELDS)  # merge the json objects
 
     return doc
 
 
-def validate_fr_doc_num(field_value):
-    """
-    Check the fr_doc_num field is in the right format
-    """
-
-    # this is a decision: we accept None as a value
-    if field_value is None:
-        return True
-
-    if field_value == "Not Found":
-        return True
-
-    if all(char.isdigit() or char == "-" for char in field_value):
-        return True
-
-    # else
-    return False
+def _log_fr_error(fr_doc_num: str, document_id: str) -> None:
+    logging.error(
+        rf"""Error accessing federal register xml data for frDocNum
+        {fr_doc_num}, \ document id {document_id}"""
+    )
 
 
 def clean_document_data(document_data: json) -> None:
@@ -532,83 +692,212 @@ def check_CFR_data(document_data: json) -> bool:
     """
     Check that the CFR field looks right
     """
-    try:
-        assert (
-            document_data["CFR"] is None
-            or document_data["CFR"] == "Not Found"
-            or "CFR" in document_data["CFR"]
-            or document_data["CFR"].isalpha()
-        )
-        return True
-    except AssertionError:
-        return False
+    return document_data["CFR"] is None or cfr_looks_right(document_data["CFR"])
 
 
-def qa_document_data(document_data: json) -> True:
+def qa_document_data(document_data: json) -> bool:
     """
-    Run assert statements to check document data looks right
+    Run every check that document data looks right, flagging each failure
 
     Args:
         document_data (json object): the document data from the API
 
     Returns: (bool) whether data is in the expected format
     """
+    return flag_failed_checks(
+        document_data["id"], "document", document_data, DOCUMENT_QA_CHECKS
+    )
+
+
+# rows sent to the documents and comments tables this run, and how many of
+# them were unchanged and so not rewritten
+UPSERT_STATS = {
+    "documents": {"written": 0, "skipped": 0},
+    "comments": {"written": 0, "skipped": 0},
+}
+
+
+# rows are hashed as their values cast to text and joined, with nulls kept
+# apart from empty strings
+HASH_SEPARATOR = "\x1f"
+HASH_NULL = "\x00"
+HASH_SEED = 0
+
+
+def content_hash_expr(columns: Iterable[str]) -> pl.Expr:
+    """
+    Hash columns of a polars frame row by row, to tell whether a record
+    changed since it was last written
+
+    The hash is polars' 64 bit hash, which is only stable within a polars
+    version; rows hashed by another version are written again once.
+
+    Args:
+        columns (iterable): the row's columns, in column order
+
+    Returns:
+        expression giving the hash of each row as a decimal string
+    """
+    return (
+        pl.concat_str(
+            [
+                pl.col(column).cast(pl.Utf8).fill_null(HASH_NULL)
+                for column in columns
+            ],
+            separator=HASH_SEPARATOR,
+        )
+        .hash(HASH_SEED)
+        .cast(pl.Utf8)
+    )
+
+
+def _hash_text(value) -> Optional[str]:
+    # the text polars casts each type to
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    return json.dumps(value, default=str)
+
+
+def content_hash(values: Iterable) -> str:
+    """
+    Hash the values of a row the way `content_hash_expr` hashes a frame row
+
+    Args:
+        values (iterable): the row's values, in column order
+
+    Returns:
+        the hash as a decimal string
+    """
+    text = HASH_SEPARATOR.join(
+        HASH_NULL if text is None else text for text in map(_hash_text, values)
+    )
+    return pl.Series([text], dtype=pl.Utf8).hash(HASH_SEED).cast(pl.Utf8)[0]
+
+
+def record_upserts(table: str, written: int, sent: int) -> None:
+    """
+    Add the rows of an upsert to UPSERT_STATS
+
+    Args:
+        table (str): "documents" or "comments"
+        written (int): rows inserted or updated
+        sent (int): rows sent without error, written or not
+    """
+    UPSERT_STATS[table]["written"] += written
+    UPSERT_STATS[table]["skipped"] += sent - written
+
+
+def log_upsert_stats() -> None:
+    """
+    Log how many documents and comments were written or skipped as unchanged
+    """
+    for table, counts in UPSERT_STATS.items():
+        logging.info(
+            f"{table}: {counts['written']} written, {counts['skipped']} "
+            "unchanged and skipped"
+        )
+
+
+DOCUMENT_BATCH_SIZE = 100
+DOCUMENT_FETCH_WORKERS = 8
+# leave a CPU for the fetch and write threads; with only one, parse in a
+# thread rather than pay to ship the XML to another process
+DOCUMENT_PARSE_WORKERS = min(4, (os.cpu_count() or 1) - 1)
+
+# (table column, key in the document json); keys are read from the document
+# attributes unless marked as coming from the Federal Register XML
+DOCUMENT_FIELDS = (
+    ("document_type", "documentType"),
+    ("last_modified_date", "lastModifiedDate"),
+    ("fr_doc_num", "frDocNum"),
+    ("withdrawn", "withdrawn"),
+    ("agency_id", "agencyId"),
+    ("comment_end_date", "commentEndDate"),
+    ("posted_date", "postedDate"),
+    ("docket_id", "docketId"),
+    ("subtype", "subtype"),
+    ("comment_start_date", "commentStartDate"),
+    ("open_for_comment", "openForComment"),
+    ("object_id", "objectId"),
+    ("full_text_xml_url", "links"),
+    ("agency_type", "agencyType"),
+    ("cfr", "CFR"),
+    ("rin", "RIN"),
+    ("title", "title"),
+    ("summary", "summary"),
+    ("dates", "dates"),
+    ("further_information", "furtherInformation"),
+    ("supplementary_information", "supplementaryInformation"),
+)
+DOCUMENT_XML_KEYS = set(BLANK_XML_FIELDS) - {"title"}
+
+DOCUMENT_COLUMNS = (
+    ("id",) + tuple(column for column, _ in DOCUMENT_FIELDS) + ("content_hash",)
+)
+# rows whose content hash is unchanged are left alone, and only the ids of
+# the rows written are returned
+_DOCUMENT_UPSERT_TEMPLATE = """
+    INSERT INTO regulations_document ({columns})
+    {{source}}
+    ON CONFLICT (id) DO UPDATE SET
+        {updates}
+    WHERE regulations_document.content_hash
+        IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING id;
+""".format(
+    columns=", ".join(f'"{column}"' for column in DOCUMENT_COLUMNS),
+    updates=",\n        ".join(
+        f"{column} = EXCLUDED.{column}" for column in DOCUMENT_COLUMNS[1:]
+    ),
+)
+DOCUMENT_UPSERT_QUERY = _DOCUMENT_UPSERT_TEMPLATE.format(
+    source="VALUES (" + ", ".join(["%s"] * len(DOCUMENT_COLUMNS)) + ")"
+)
+# execute_values expands the single %s into the rows of a batch
+DOCUMENT_BATCH_UPSERT_QUERY = _DOCUMENT_UPSERT_TEMPLATE.format(
+    source="VALUES %s"
+)
+
+
+def document_row(document_data: json) -> tuple:
+    """
+    Map a document json object, merged with its Federal Register fields, to
+    a row of the regulations_document table
+
+    Args:
+        document_data (json): the document info from regulations.gov API
 
+    Returns:
+        tuple of values in the order of DOCUMENT_COLUMNS, ending with the
+        hash of the others
+    """
     attributes = document_data["attributes"]
 
-    try:
-        assert len(document_data["id"]) < 255
-        assert attributes["documentType"] in [
-            "Proposed Rule",
-            "Other",
-            "Notice",
-            "Not Found",
-            "Rule",
-        ]
-        # attributes["lastModifiedDate"]
-        assert validate_fr_doc_num(
-            attributes["frDocNum"]
-        ), "frDocNum contains unexpected characters or is None"
-        assert attributes["withdrawn"] is False, "withdrawn is True"
-        # attributes["agencyId"]
-        assert (
-            len((attributes["commentEndDate"])) == 20
-            and "202" in attributes["commentEndDate"]
-        ), "commentEndDate is unexpected length"
-        assert (
-            len(attributes["postedDate"]) == 20
-        ), "postedDate is unexpected length"
-        # attributes["docketId"]
-        # attributes["subtype"]
-        assert (
-            len(attributes["commentStartDate"]) == 20
-            and "202" in attributes["commentStartDate"]
-        ), "commentStartDate is expected length"
-        assert attributes["openForComment"] is True, "openForComment is False"
-        # attributes["objectId"]
-        assert (
-            "https" in document_data["links"]["self"]
-        ), "'https' is not in document_data['links']['self']"
-        assert (
-            ".gov" in document_data["links"]["self"]
-        ), "'.gov' is not in document_data['links']['self']"
-        # document_data["agencyType"]
-        assert check_CFR_data(document_data), "CFR is not alpha characters"
-        # document_data["RIN"]
-        assert isinstance(attributes["title"], str), "title is not string"
-        assert document_data["summary"] is None or isinstance(
-            document_data["summary"], str
-        ), "summary is not string"
-        # document_data["dates"]
-        # document_data["furtherInformation"]
-        assert document_data["supplementaryInformation"] is None or isinstance(
-            document_data["supplementaryInformation"], str
-        ), "supplementaryInformation is not string"
-
-    except AssertionError as e:
-        id = document_data["id"]
-        logging.error(f"AssertionError: document {id} -- {e}")
-        add_data_quality_flag(id, "document", e)
+    row = [document_data["id"]]
+    for _, key in DOCUMENT_FIELDS:
+        if key == "links":
+            row.append(document_data["links"]["self"])
+        elif key in DOCUMENT_XML_KEYS:
+            row.append(document_data[key])
+        else:
+            row.append(attributes[key])
+
+    return (*row, content_hash(row))
+
+
+def _document_insert_error(document_id: str, e: Exception) -> dict:
+    error_message = f"""Error inserting document
+        {document_id} into dockets table: {e}"""
+    logging.error(error_message)
+    return {
+        "error": True,
+        "message": e,
+        "description": error_message,
+    }
 
 
 def insert_document_into_db(document_data: json) -> dict:
@@ -621,102 +910,13 @@ def insert_document_into_db(document_data: json) -> dict:
     Returns:
         nothing unless an error; adds the info into the table
     """
-    attributes = document_data["attributes"]
-
-    fields_to_insert = (
-        document_data["id"],
-        attributes["documentType"],
-        attributes["lastModifiedDate"],
-        attributes["frDocNum"],
-        attributes["withdrawn"],
-        attributes["agencyId"],
-        attributes["commentEndDate"],
-        attributes["postedDate"],
-        attributes["docketId"],
-        attributes["subtype"],
-        attributes["commentStartDate"],
-        attributes["openForComment"],
-        attributes["objectId"],
-        document_data["links"]["self"],
-        document_data["agencyType"],
-        document_data["CFR"],
-        document_data["RIN"],
-        attributes["title"],
-        document_data["summary"],
-        document_data["dates"],
-        document_data["furtherInformation"],
-        document_data["supplementaryInformation"],
-    )
-
-    query = """INSERT INTO regulations_document ("id",
-                            "document_type",
-                            "last_modified_date",
-                            "fr_doc_num",
-                            "withdrawn",
-                            "agency_id",
-                            "comment_end_date",
-                            "posted_date",
-                            "docket_id",
-                            "subtype",
-                            "comment_start_date",
-                            "open_for_comment",
-                            "object_id",
-                            "full_text_xml_url",
-                            "agency_type",
-                            "cfr",
-                            "rin",
-                            "title",
-                            "summary",
-                            "dates",
-                            "further_information",
-                            "supplementary_information") \
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (id) DO UPDATE SET
-                        document_type = EXCLUDED.document_type,
-                        last_modified_date = EXCLUDED.last_modified_date,
-                        fr_doc_num = EXCLUDED.fr_doc_num,
-                        withdrawn = EXCLUDED.withdrawn,
-                        agency_id = EXCLUDED.agency_id,
-                        comment_end_date = EXCLUDED.comment_end_date,
-                        posted_date = EXCLUDED.posted_date,
-                        docket_id = EXCLUDED.docket_id,
-                        subtype = EXCLUDED.subtype,
-                        comment_start_date = EXCLUDED.comment_start_date,
-                        open_for_comment = EXCLUDED.open_for_comment,
-                        object_id = EXCLUDED.object_id,
-                        full_text_xml_url = EXCLUDED.full_text_xml_url,
-                        agency_type = EXCLUDED.agency_type,
-                        cfr = EXCLUDED.cfr,
-                        rin = EXCLUDED.rin,
-                        title = EXCLUDED.title,
-                        summary = EXCLUDED.summary,
-                        dates = EXCLUDED.dates,
-                        further_information = EXCLUDED.further_information,
-                        supplementary_information =
-                        EXCLUDED.supplementary_information;"""
     try:
-        connection, cursor = connect_db_and_get_cursor()
-        with connection:
-            with cursor:
-                cursor.execute(
-                    query,
-                    fields_to_insert,
-                )
-                connection.commit()
-        if connection:
-            cursor.close()
-            connection.close()
+        with db_cursor() as cursor:
+            cursor.execute(DOCUMENT_UPSERT_QUERY, document_row(document_data))
+            record_upserts("documents", int(cursor.fetchone() is not None), 1)
 
     except Exception as e:
-        error_message = f"""Error inserting document
-        {document_data['id']} into dockets table: {e}"""
-        logging.error(error_message)
-        return {
-            "error": True,
-            "message": e,
-            "description": error_message,
-        }
+        return _document_insert_error(document_data["id"], e)
 
     return {
         "error": False,
@@ -725,40 +925,275 @@ def insert_document_into_db(document_data: json) -> dict:
     }
 
 
+def upsert_document_rows(
+    rows: dict[str, tuple]
+) -> tuple[list[str], list[dict]]:
+    """
+    Upsert one batch of document rows over a single connection, falling back
+    to one row at a time if the batch fails, like `upsert_comment_rows`
+
+    Args:
+        rows (dict): document id to row, as returned by `document_row`
+
+    Returns:
+        ids of the documents written and a list of errors for the rows that
+        failed; documents whose content hash hasn't changed are neither
+    """
+    written, errors = [], []
+
+    with db_connection(DATABASE_PARAMS) as connection:
+        with connection.cursor() as cursor:
+            try:
+                written = [
+                    document_id
+                    for (document_id,) in execute_values(
+                        cursor,
+                        DOCUMENT_BATCH_UPSERT_QUERY,
+                        list(rows.values()),
+                        page_size=len(rows),
+                        fetch=True,
+                    )
+                ]
+                connection.commit()
+                record_upserts("documents", len(written), len(rows))
+                return written, errors
+            except psycopg2.Error as e:
+                connection.rollback()
+                logging.warning(
+                    f"batch of {len(rows)} documents failed ({e}), "
+                    "retrying one at a time"
+                )
+
+            for document_id, row in rows.items():
+                try:
+                    cursor.execute(DOCUMENT_UPSERT_QUERY, row)
+                    changed = cursor.fetchone() is not None
+                    connection.commit()
+                    if changed:
+                        written.append(document_id)
+                except psycopg2.Error as e:
+                    connection.rollback()
+                    errors.append(_document_insert_error(document_id, e))
+
+    record_upserts("documents", len(written), len(rows) - len(errors))
+    return written, errors
+
+
+def fetch_document_xml(doc: json) -> tuple[json, Optional[dict]]:
+    """
+    First stage of `add_documents_to_db`: download a document's Federal
+    Register XML, or merge in the cached fields when it hasn't changed
+
+    Args:
+        doc (json): the raw json for a document from regulations.gov API
+
+    Returns:
+        the document, and what `fetch_fr_xml` returned if the XML still
+        needs parsing (else None)
+    """
+    fr_doc_num = doc.get("attributes", {}).get("frDocNum")
+    if not fr_doc_num:
+        doc.update(BLANK_XML_FIELDS)
+        return doc, None
+
+    try:
+        fetched = fetch_fr_xml(fr_doc_num)
+    except Exception:
+        _log_fr_error(fr_doc_num, doc["id"])
+        doc.update(BLANK_XML_FIELDS)
+        return doc, None
+
+    if fetched["parsed"] is not None:
+        doc.update(fetched["parsed"])
+        return doc, None
+    return doc, fetched
+
+
+# process pools for parsing XML by number of workers, shared by every call to
+# `upsert_documents` so worker processes are only started once
+_PARSE_POOLS = {}
+_PARSE_POOLS_LOCK = threading.Lock()
+
+
+def get_parse_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Returns the process-wide pool for parsing XML in `workers` processes,
+    or None for 0 workers. The pool is created on first use and its
+    processes only start when XML is sent to it, so pages of documents
+    served from the Federal Register cache don't start any.
+
+    Args:
+        workers (int): number of processes in the pool
+
+    Returns:
+        the pool, shut down when the process exits
+    """
+    if not workers:
+        return None
+    with _PARSE_POOLS_LOCK:
+        if workers not in _PARSE_POOLS:
+            _PARSE_POOLS[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _PARSE_POOLS[workers]
+
+
+def _shutdown_parse_pools() -> None:
+    with _PARSE_POOLS_LOCK:
+        for pool in _PARSE_POOLS.values():
+            pool.shutdown(cancel_futures=True)
+        _PARSE_POOLS.clear()
+
+
+atexit.register(_shutdown_parse_pools)
+
+
+def parse_document_xml(
+    fetched_doc: tuple[json, Optional[dict]],
+    executor: Optional[Executor] = None,
+) -> json:
+    """
+    Second stage of `add_documents_to_db`: parse the downloaded XML, in a
+    worker process if given an executor, and merge the fields into the
+    document
+
+    Args:
+        fetched_doc (tuple): what `fetch_document_xml` returned
+        executor (Executor, optional): pool to parse the XML in
+
+    Returns:
+        the document with fields for text from federal register API
+    """
+    doc, fetched = fetched_doc
+    if fetched is None:
+        return doc
+
+    try:
+        if executor is not None:
+            extracted_data = executor.submit(
+                extract_fr_xml, fetched["content"]
+            ).result()
+        else:
+            extracted_data = extract_fr_xml(fetched["content"])
+    except ET.ParseError:
+        _log_fr_error(fetched["fr_doc_num"], doc["id"])
+        doc.update(BLANK_XML_FIELDS)
+        return doc
+
+    store_parsed_xml(fetched, extracted_data)
+    doc.update(extracted_data)
+    return doc
+
+
+def write_documents(docs: list[json]) -> list[str]:
+    """
+    Last stage of `add_documents_to_db`: QA and clean a batch of documents
+    and upsert them in one statement
+
+    Args:
+        docs (list of json): documents with their Federal Register fields
+
+    Returns:
+        ids of the documents written
+    """
+    rows = {}
+    for doc in docs:
+        qa_document_data(doc)
+        clean_document_data(doc)
+        rows[doc["id"]] = document_row(doc)
+
+    written, errors = upsert_document_rows(rows)
+    for error in errors:
+        logging.info(error["description"])
+    return written
+
+
+def upsert_documents(
+    docs: list[dict],
+    print_statements: bool = True,
+    fetch_workers: int = DOCUMENT_FETCH_WORKERS,
+    parse_workers: int = DOCUMENT_PARSE_WORKERS,
+    batch_size: int = DOCUMENT_BATCH_SIZE,
+) -> dict:
+    """
+    Merge the Federal Register text into documents and upsert them,
+    whether or not they are in the database already
+
+    The documents go through a pipeline of three stages joined by bounded
+    queues: threads that download the Federal Register XML, a process pool
+    that parses it, and a single writer that upserts documents in batches.
+    Downloads, parsing and writes for different documents overlap, and a
+    slow stage holds back the ones before it.
+
+    Args:
+        docs (list of json objects): documents from regulations.gov API
+        print_statements (boolean): whether to print info on progress
+        fetch_workers (int): number of threads downloading XML
+        parse_workers (int): number of processes parsing XML; 0 parses in
+            a thread of this process instead
+        batch_size (int): number of documents to write per statement
+
+    Returns:
+        the per-stage stats of the pipeline, as returned by
+        `Pipeline.stats`
+    """
+    if not docs:
+        return {}
+
+    document_pipeline = Pipeline(
+        [
+            Stage("fetch", fetch_document_xml, workers=fetch_workers),
+            Stage(
+                "parse",
+                partial(
+                    parse_document_xml, executor=get_parse_pool(parse_workers)
+                ),
+                workers=max(parse_workers, 1),
+            ),
+            Stage("write", write_documents, batch_size=batch_size),
+        ]
+    )
+    for document_id in document_pipeline.run(docs):
+        if print_statements:
+            logging.info(f"added document {document_id} to the db")
+
+    document_pipeline.log_stats()
+    return document_pipeline.stats()
+
+
 def add_documents_to_db(
-    doc_list: list[dict], print_statements: bool = True
-) -> None:
+    doc_list: list[dict], print_statements: bool = True, **kwargs
+) -> dict:
     """
-    Add a list of document json objects into the database
+    Add a list of document json objects into the database, skipping the
+    ones already there
 
     Args:
         doc_list (list of json objects): what is returned from an API call for
             documents
         print_statements (boolean): whether to print info on progress
+        **kwargs: passed on to `upsert_documents`
 
+    Returns:
+        the per-stage stats of the pipeline, as returned by
+        `Pipeline.stats`
     """
+    documents_in_db = existing_ids(
+        "regulations_document",
+        (doc["id"] for doc in doc_list if doc["attributes"]["openForComment"]),
+    )
+
+    new_docs = []
     for doc in doc_list:
         document_id = doc["id"]
         commentable = doc["attributes"]["openForComment"]
-        if commentable and (
-            not verify_database_existence("regulations_document", document_id)
-        ):
-            # add this doc to the documents table in the database
-            full_doc_info = query_register_API_and_merge_document_data(doc)
-            # qa step
-            qa_document_data(full_doc_info)
-
-            # clean step
-            clean_document_data(full_doc_info)
+        if commentable and document_id not in documents_in_db:
+            # skip repeats of this doc later in the list
+            documents_in_db.add(document_id)
+            new_docs.append(doc)
 
-            # insert step
-            insert_response = insert_document_into_db(full_doc_info)
-            if insert_response["error"]:
-                logging.info(insert_response["description"])
-                # would want to add logging here
-            else:
-                if print_statements:
-                    logging.info(f"added document {document_id} to the db")
+    return upsert_documents(new_docs, print_statements, **kwargs)
 
 
 def get_comment_text(api_key: str, comment_id: str) -> dict:
@@ -776,32 +1211,28 @@ def get_comment_text(api_key: str, comment_id: str) -> dict:
     endpoint = f"{api_url}{comment_id}?include=attachments"
 
     STATUS_CODE_OVER_RATE_LIMIT = 429
-    WAIT_SECONDS = 3600  # Default to 1 hour
 
-    session = requests.Session()
-    session.mount("https", HTTPAdapter(max_retries=4))
+    session = http_client.get_session(api_url)
+    scheduler = quota.get_scheduler()
 
     while True:
+        scheduler.acquire("sync")
         response = session.get(
             endpoint, headers={"X-Api-Key": api_key}, verify=True
         )
+        scheduler.record_response(response)
 
         if response.status_code == 200:
             # SUCCESS! Return the JSON of the request
             return response.json()
         elif response.status_code == STATUS_CODE_OVER_RATE_LIMIT:
-            retry_after = response.headers.get("Retry-After", None)
-            wait_time = (
-                int(retry_after)
-                if retry_after and retry_after.isdigit()
-                else WAIT_SECONDS
-            )
+            # the scheduler holds the next request until the limit resets
+            wait_time = scheduler.budget()["blocked_for"]
             the_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             logging.info(
                 f"""Rate limit exceeded at {the_time}.
-                Waiting {wait_time} seconds to retry."""
+                Waiting {wait_time:.0f} seconds to retry."""
             )
-            time.sleep(wait_time)
         else:
             logging.info(
                 f"""Failed to retrieve comment data.
@@ -855,272 +1286,198 @@ def clean_comment_data(comment_data: json) -> None:
         )
 
 
-def qa_comment_data(comment_data: json) -> None:
+def qa_comment_data(comment_data: json) -> bool:
     """
-    Run assert statements to check comment data looks right
+    Run every check that comment data looks right, flagging each failure
 
     Args:
-        comment_data (json object): the document data from the API
+        comment_data (json object): the comment data from the API
 
     Returns: (bool) whether data is in the expected format
     """
+    return flag_failed_checks(
+        comment_data["id"], "comment", comment_data, COMMENT_QA_CHECKS
+    )
 
-    attributes = comment_data["attributes"]
-    comment_text_attributes = comment_data["data"]["attributes"]
-    try:
-        assert len(comment_data["id"]) < 255, "id is more than 255 characters"
-
-        assert (
-            attributes["objectId"][:2] == "09"
-        ), "objectId does not start with '09'"
-        assert (
-            comment_text_attributes["commentOn"][:2] == "09"
-        ), "commentOn does not start with '09'"
-        # comment_data["commentOnDocumentId"]
-        assert (
-            comment_text_attributes["duplicateComments"] == 0
-        ), "duplicateComments != 0"
-        # assert comment_data["stateProvinceRegion"]
-        assert comment_text_attributes[
-            "subtype"
-        ] is None or comment_text_attributes["subtype"] in [
-            "Public Comment",
-            "Comment(s)",
-        ], "subtype is not an expected value"
-        assert isinstance(
-            comment_text_attributes["comment"], str
-        ), "comment is not string"
-        # comment_data["firstName"]
-        # comment_data["lastName"]
-        # comment_data["address1"]
-        # comment_data["address2"]
-        # comment_data["city"]
-        # comment_data["category"]
-        # comment_data["country"]
-        # comment_data["email"]
-        # comment_data["phone"]
-        # comment_data["govAgency"]
-        # comment_data["govAgencyType"]
-        # comment_data["organization"]
-        # comment_data["originalDocumentId"]
-        assert isinstance(
-            comment_text_attributes["modifyDate"], datetime
-        ), "modifyDate is not datetime"
-        # comment_data["pageCount"]
-        assert isinstance(
-            comment_text_attributes["postedDate"], datetime
-        ), "postedDate is not datetime"
-        assert isinstance(
-            comment_text_attributes["receiveDate"], datetime
-        ), "receiveDate is not datetime"
-        # comment_data["trackingNbr"]
-        assert (
-            comment_text_attributes["withdrawn"] is False
-        ), "withdrawn is not False"
-        # comment_data["reasonWithdrawn"]
-        # comment_data["zip"]
-        # comment_data["restrictReason"]
-        # comment_data["restrictReasonType"]
-        # comment_data["submitterRep"]
-        # comment_data["submitterRepAddress"]
-        # comment_data["submitterRepCityState"]
-
-    except AssertionError as e:
-        id = comment_data["id"]
-        logging.error(f"AssertionError: comment {id} -- {e}")
-        add_data_quality_flag(id, "comment", e)
 
+def flag_violations(violations: pl.DataFrame) -> int:
+    """
+    Log and flag the rule violations found by `qa_rules.validate_frame`
 
-def insert_comment_into_db(comment_data: json) -> dict:
+    Args:
+        violations (polars DataFrame): data_id, data_type and error_message
+            of each failed rule
+
+    Returns: (int) number of records with a violation
     """
-    Insert the info on a comment into the PublicComments table
+    for data_id, data_type, error_message in violations.iter_rows():
+        add_data_quality_flag(data_id, data_type, error_message)
+    by_record = violations.group_by(
+        "data_id", "data_type", maintain_order=True
+    ).agg(pl.col("error_message").str.concat("; "))
+    for data_id, data_type, failures in by_record.iter_rows():
+        logging.error(f"AssertionError: {data_type} {data_id} -- {failures}")
+    return by_record.height
+
+
+def qa_comment_batch(comments: list[json]) -> int:
+    """
+    Check a batch of comments against the same rules as `qa_comment_data`,
+    all at once, flagging each failure
 
     Args:
-        comment_data (json): the comment info from regulations.gov API
+        comments (list of json): cleaned comment data from the API
+
+    Returns: (int) number of comments with a failed check
+    """
+    if not comments:
+        return 0
+    return flag_violations(
+        qa_rules.validate_records(comments, qa_rules.COMMENT_RULES, "comment")
+    )
+
+
+COMMENT_BATCH_SIZE = 500
+
+# (table column, key in the comment json, default). Keys are read from the
+# comment detail attributes, except "objectId" and "title", which come from
+# the comments list attributes
+COMMENT_FIELDS = (
+    ("object_id", "objectId", ""),
+    ("comment_on", "commentOn", ""),
+    ("document_id", "commentOnDocumentId", ""),
+    ("duplicate_comments", "duplicateComments", 0),
+    ("state_province_region", "stateProvinceRegion", ""),
+    ("subtype", "subtype", ""),
+    ("comment", "comment", ""),
+    ("first_name", "firstName", ""),
+    ("last_name", "lastName", ""),
+    ("address1", "address1", ""),
+    ("address2", "address2", ""),
+    ("city", "city", ""),
+    ("category", "category", ""),
+    ("country", "country", ""),
+    ("email", "email", ""),
+    ("phone", "phone", ""),
+    ("gov_agency", "govAgency", ""),
+    ("gov_agency_type", "govAgencyType", ""),
+    ("organization", "organization", ""),
+    ("original_document_id", "originalDocumentId", ""),
+    ("modify_date", "modifyDate", ""),
+    ("page_count", "pageCount", 0),
+    ("posted_date", "postedDate", ""),
+    ("receive_date", "receiveDate", ""),
+    ("title", "title", ""),
+    ("tracking_nbr", "trackingNbr", ""),
+    ("withdrawn", "withdrawn", False),
+    ("reason_withdrawn", "reasonWithdrawn", ""),
+    ("zip", "zip", ""),
+    ("restrict_reason", "restrictReason", ""),
+    ("restrict_reason_type", "restrictReasonType", ""),
+    ("submitter_rep", "submitterRep", ""),
+    ("submitter_rep_address", "submitterRepAddress", ""),
+    ("submitter_rep_city_state", "submitterRepCityState", ""),
+)
+COMMENT_LIST_KEYS = {"objectId", "title"}
+
+COMMENT_COLUMNS = (
+    ("id",)
+    + tuple(column for column, _, _ in COMMENT_FIELDS)
+    + ("content_hash",)
+)
+# rows whose content hash is unchanged are left alone, so the row count of
+# the statement is the number of comments written
+_COMMENT_UPSERT_TEMPLATE = """
+    INSERT INTO regulations_comment ({columns})
+    {{source}}
+    ON CONFLICT (id) DO UPDATE SET
+        {updates}
+    WHERE regulations_comment.content_hash
+        IS DISTINCT FROM EXCLUDED.content_hash;
+""".format(
+    columns=", ".join(f'"{column}"' for column in COMMENT_COLUMNS),
+    updates=",\n        ".join(
+        f"{column} = EXCLUDED.{column}" for column in COMMENT_COLUMNS[1:]
+    ),
+)
+COMMENT_UPSERT_QUERY = _COMMENT_UPSERT_TEMPLATE.format(
+    source="VALUES (" + ", ".join(["%s"] * len(COMMENT_COLUMNS)) + ")"
+)
+# execute_values expands the single %s into the rows of a batch
+COMMENT_BATCH_UPSERT_QUERY = _COMMENT_UPSERT_TEMPLATE.format(source="VALUES %s")
+
+
+def comment_upsert_from_table(table: str) -> str:
+    """
+    Build a query that upserts every row of another table with the same
+    columns, eg a temporary staging table, into the comments table. Only
+    one row per comment id is kept.
+
+    Args:
+        table (str): name of the table to copy rows from
 
     Returns:
-        nothing unless an error; adds the info into the table
+        the SQL query
     """
-    connection, cursor = connect_db_and_get_cursor()
+    columns = ", ".join(f'"{column}"' for column in COMMENT_COLUMNS)
+    return _COMMENT_UPSERT_TEMPLATE.format(
+        source=f"SELECT DISTINCT ON (id) {columns} FROM {table}"
+    )
+
+
+def comment_row(comment_data: json) -> tuple:
+    """
+    Map a comment json object to a row of the regulations_comment table
+
+    Args:
+        comment_data (json): the comment info from regulations.gov API
 
+    Returns:
+        tuple of values in the order of COMMENT_COLUMNS, ending with the
+        hash of the others
+    """
     attributes = comment_data["attributes"]
     comment_text_attributes = comment_data["data"]["attributes"]
 
-    # Map JSON attributes to corresponding table columns
-    comment_id = comment_data["id"]
-    objectId = attributes.get("objectId", "")
-    commentOn = comment_text_attributes.get("commentOn", "")
-    document_id = comment_text_attributes.get("commentOnDocumentId", "")
-    duplicateComments = comment_text_attributes.get("duplicateComments", 0)
-    stateProvinceRegion = comment_text_attributes.get("stateProvinceRegion", "")
-    subtype = comment_text_attributes.get("subtype", "")
-    comment = comment_text_attributes.get("comment", "")
-    firstName = comment_text_attributes.get("firstName", "")
-    lastName = comment_text_attributes.get("lastName", "")
-    address1 = comment_text_attributes.get("address1", "")
-    address2 = comment_text_attributes.get("address2", "")
-    city = comment_text_attributes.get("city", "")
-    category = comment_text_attributes.get("category", "")
-    country = comment_text_attributes.get("country", "")
-    email = comment_text_attributes.get("email", "")
-    phone = comment_text_attributes.get("phone", "")
-    govAgency = comment_text_attributes.get("govAgency", "")
-    govAgencyType = comment_text_attributes.get("govAgencyType", "")
-    organization = comment_text_attributes.get("organization", "")
-    originalDocumentId = comment_text_attributes.get("originalDocumentId", "")
-    modifyDate = comment_text_attributes.get("modifyDate", "")
-    pageCount = comment_text_attributes.get("pageCount", 0)
-    postedDate = comment_text_attributes.get("postedDate", "")
-    receiveDate = comment_text_attributes.get("receiveDate", "")
-    title = attributes.get("title", "")
-    trackingNbr = comment_text_attributes.get("trackingNbr", "")
-    withdrawn = comment_text_attributes.get("withdrawn", False)
-    reasonWithdrawn = comment_text_attributes.get("reasonWithdrawn", "")
-    zip = comment_text_attributes.get("zip", "")
-    restrictReason = comment_text_attributes.get("restrictReason", "")
-    restrictReasonType = comment_text_attributes.get("restrictReasonType", "")
-    submitterRep = comment_text_attributes.get("submitterRep", "")
-    submitterRepAddress = comment_text_attributes.get("submitterRepAddress", "")
-    submitterRepCityState = comment_text_attributes.get(
-        "submitterRepCityState", ""
-    )
+    row = [comment_data["id"]]
+    for _, key, default in COMMENT_FIELDS:
+        if key in COMMENT_LIST_KEYS:
+            row.append(attributes.get(key, default))
+        else:
+            row.append(comment_text_attributes.get(key, default))
 
-    # SQL INSERT statement
-    query = """
-    INSERT INTO regulations_comment (
-        "id",
-        "object_id",
-        "comment_on",
-        "document_id",
-        "duplicate_comments",
-        "state_province_region",
-        "subtype",
-        "comment",
-        "first_name",
-        "last_name",
-        "address1",
-        "address2",
-        "city",
-        "category",
-        "country",
-        "email",
-        "phone",
-        "gov_agency",
-        "gov_agency_type",
-        "organization",
-        "original_document_id",
-        "modify_date",
-        "page_count",
-        "posted_date",
-        "receive_date",
-        "title",
-        "tracking_nbr",
-        "withdrawn",
-        "reason_withdrawn",
-        "zip",
-        "restrict_reason",
-        "restrict_reason_type",
-        "submitter_rep",
-        "submitter_rep_address",
-        "submitter_rep_city_state"
-    ) VALUES (
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-    )
-    ON CONFLICT (id) DO UPDATE SET
-        object_id = EXCLUDED.object_id,
-        comment_on = EXCLUDED.comment_on,
-        document_id = EXCLUDED.document_id,
-        duplicate_comments = EXCLUDED.duplicate_comments,
-        state_province_region = EXCLUDED.state_province_region,
-        subtype = EXCLUDED.subtype,
-        comment = EXCLUDED.comment,
-        first_name = EXCLUDED.first_name,
-        last_name = EXCLUDED.last_name,
-        address1 = EXCLUDED.address1,
-        address2 = EXCLUDED.address2,
-        city = EXCLUDED.city,
-        category = EXCLUDED.category,
-        country = EXCLUDED.country,
-        email = EXCLUDED.email,
-        phone = EXCLUDED.phone,
-        gov_agency = EXCLUDED.gov_agency,
-        gov_agency_type = EXCLUDED.gov_agency_type,
-        organization = EXCLUDED.organization,
-        original_document_id = EXCLUDED.original_document_id,
-        modify_date = EXCLUDED.modify_date,
-        page_count = EXCLUDED.page_count,
-        posted_date = EXCLUDED.posted_date,
-        receive_date = EXCLUDED.receive_date,
-        title = EXCLUDED.title,
-        tracking_nbr = EXCLUDED.tracking_nbr,
-        withdrawn = EXCLUDED.withdrawn,
-        reason_withdrawn = EXCLUDED.reason_withdrawn,
-        zip = EXCLUDED.zip,
-        restrict_reason = EXCLUDED.restrict_reason,
-        restrict_reason_type = EXCLUDED.restrict_reason_type,
-        submitter_rep = EXCLUDED.submitter_rep,
-        submitter_rep_address = EXCLUDED.submitter_rep_address,
-        submitter_rep_city_state = EXCLUDED.submitter_rep_city_state;
+    return (*row, content_hash(row))
+
+
+def _comment_insert_error(comment_id: str, e: Exception) -> dict:
+    error_message = f"""Error inserting comment {comment_id} into
+        comment table: {e}"""
+    logging.error(error_message)
+    return {
+        "error": True,
+        "message": e,
+        "description": error_message,
+    }
+
+
+def insert_comment_into_db(comment_data: json) -> dict:
     """
+    Insert the info on a comment into the PublicComments table
+
+    Args:
+        comment_data (json): the comment info from regulations.gov API
 
+    Returns:
+        nothing unless an error; adds the info into the table
+    """
     # Execute the SQL statement
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                query,
-                (
-                    comment_id,
-                    objectId,
-                    commentOn,
-                    document_id,
-                    duplicateComments,
-                    stateProvinceRegion,
-                    subtype,
-                    comment,
-                    firstName,
-                    lastName,
-                    address1,
-                    address2,
-                    city,
-                    category,
-                    country,
-                    email,
-                    phone,
-                    govAgency,
-                    govAgencyType,
-                    organization,
-                    originalDocumentId,
-                    modifyDate,
-                    pageCount,
-                    postedDate,
-                    receiveDate,
-                    title,
-                    trackingNbr,
-                    withdrawn,
-                    reasonWithdrawn,
-                    zip,
-                    restrictReason,
-                    restrictReasonType,
-                    submitterRep,
-                    submitterRepAddress,
-                    submitterRepCityState,
-                ),
-            )
-            connection.commit()
-
-        if connection:
-            connection.close()
+        with db_cursor() as cursor:
+            cursor.execute(COMMENT_UPSERT_QUERY, comment_row(comment_data))
+            record_upserts("comments", cursor.rowcount, 1)
 
     except Exception as e:
-        error_message = f"""Error inserting comment {comment_data['id']} into
-        comment table: {e}"""
-        logging.error(error_message)
-        return {
-            "error": True,
-            "message": e,
-            "description": error_message,
-        }
+        return _comment_insert_error(comment_data["id"], e)
 
     return {
         "error": False,
@@ -1129,6 +1486,103 @@ def insert_comment_into_db(comment_data: json) -> dict:
     }
 
 
+def upsert_comment_rows(rows: dict[str, tuple]) -> tuple[int, list[dict]]:
+    """
+    Upsert one batch of comment rows over a single connection. The batch is
+    sent as one multi-row statement; if that fails, it is rolled back and
+    the rows are retried one at a time so a bad row only loses itself.
+
+    Args:
+        rows (dict): comment id to row, as returned by `comment_row`
+
+    Returns:
+        number of rows written and a list of errors for the rows that
+        failed; rows whose content hash hasn't changed are neither
+    """
+    written, errors = 0, []
+
+    with db_connection(DATABASE_PARAMS) as connection:
+        with connection.cursor() as cursor:
+            try:
+                execute_values(
+                    cursor,
+                    COMMENT_BATCH_UPSERT_QUERY,
+                    list(rows.values()),
+                    page_size=len(rows),
+                )
+                written = cursor.rowcount
+                connection.commit()
+                record_upserts("comments", written, len(rows))
+                return written, errors
+            except psycopg2.Error as e:
+                connection.rollback()
+                logging.warning(
+                    f"batch of {len(rows)} comments failed ({e}), "
+                    "retrying one at a time"
+                )
+
+            for comment_id, row in rows.items():
+                try:
+                    cursor.execute(COMMENT_UPSERT_QUERY, row)
+                    written += cursor.rowcount
+                    connection.commit()
+                except psycopg2.Error as e:
+                    connection.rollback()
+                    errors.append(_comment_insert_error(comment_id, e))
+
+    record_upserts("comments", written, len(rows) - len(errors))
+    return written, errors
+
+
+def insert_comments_into_db(
+    comments: Iterable[json], batch_size: int = COMMENT_BATCH_SIZE
+) -> dict:
+    """
+    Upsert many comments into the comments table in batches, using one
+    connection and one transaction per batch instead of one per comment
+
+    Args:
+        comments (iterable of json): comment info from regulations.gov API,
+            or from `extract_fields_from_row` for bulk downloads
+        batch_size (int): number of comments to send per statement
+
+    Returns:
+        dict with the number of comments written, the number skipped as
+        unchanged, and a list of errors, in the format returned by
+        `insert_comment_into_db`, for the comments that could not be
+        inserted
+    """
+    summary = {"written": 0, "skipped": 0, "errors": []}
+    rows = {}
+
+    def flush():
+        written, errors = upsert_comment_rows(rows)
+        summary["written"] += written
+        summary["skipped"] += len(rows) - written - len(errors)
+        summary["errors"].extend(errors)
+        rows.clear()
+
+    for comment_data in comments:
+        try:
+            row = comment_row(comment_data)
+        except (KeyError, TypeError) as e:
+            summary["errors"].append(
+                _comment_insert_error(comment_data.get("id"), e)
+            )
+            continue
+
+        # Postgres rejects a statement that upserts the same id twice, so
+        # keep the latest version of a comment within a batch
+        rows[row[0]] = row
+        if len(rows) >= batch_size:
+            flush()
+
+    if rows:
+        flush()
+
+    return summary
+
+
 def add_comments_to_db_for_new_doc(document_object_id: str) -> None:
     """
     Add comments to the comments table for a new doc (ie, when we have just
@@ -1140,25 +1594,28 @@ def add_comments_to_db_for_new_doc(document_object_id: str) -> None:
 
     Returns: nothing; adds comments, if available, to the db
     """
-    comment_data = pull_reg_gov_data(
+    # stream the comment list so detail requests start after the first page
+    comment_data = iter_reg_gov_data(
         REG_GOV_API_KEY,
         "comments",
         params={"filter[commentOnId]": document_object_id},
     )
-    # add comment data to comments table in the database
-    for comment in comment_data:
-        all_comment_data = merge_comment_text_and_data(REG_GOV_API_KEY, comment)
 
-        # clean
-        clean_comment_data(all_comment_data)
+    def cleaned_comments():
+        for all_comment_data in raw_archive.archived(
+            "comments", iter_comment_details(REG_GOV_API_KEY, comment_data)
+        ):
+            # clean
+            clean_comment_data(all_comment_data)
 
-        # qa
-        qa_comment_data(all_comment_data)
+            # qa
+            qa_comment_data(all_comment_data)
 
-        insert_response = insert_comment_into_db(all_comment_data)
+            yield all_comment_data
 
-        if insert_response["error"]:
-            logging.error(insert_response["description"])
+    # add comment data to comments table in the database; failures are
+    # logged by insert_comments_into_db
+    insert_comments_into_db(cleaned_comments())
 
 
 def add_comments_to_db_for_existing_doc(
@@ -1186,7 +1643,7 @@ def add_comments_to_db_for_existing_doc(
             {most_recent_comment_date}"""
         )
 
-    comment_data = pull_reg_gov_data(
+    comment_data = iter_reg_gov_data(
         REG_GOV_API_KEY,
         "comments",
         params={
@@ -1195,13 +1652,15 @@ def add_comments_to_db_for_existing_doc(
         },
     )
 
-    for comment in comment_data:
-        all_comment_data = merge_comment_text_and_data(REG_GOV_API_KEY, comment)
-
+    # documents checked so far, so each is only looked up once
+    documents_checked = set()
+    for all_comment_data in raw_archive.archived(
+        "comments", iter_comment_details(REG_GOV_API_KEY, comment_data)
+    ):
         # if documumrnent is not in the db, add it
         document_id = all_comment_data.get("commentOnDocumentId", "")
-        if not verify_database_existence(
-            "regulations_document", document_id, "id"
+        if document_id not in documents_checked and not existing_ids(
+            "regulations_document", [document_id]
         ):
             # call the API to get the document info
             doc_list = pull_reg_gov_data(
@@ -1209,7 +1668,9 @@ def add_comments_to_db_for_existing_doc(
                 "documents",
                 params={"filter[objectId]": document_id},
             )
+            raw_archive.archive("documents", doc_list)
             add_documents_to_db(doc_list)
+        documents_checked.add(document_id)
 
         # clean
         clean_comment_data(all_comment_data)
@@ -1235,15 +1696,20 @@ def add_comments_to_db(
         print_statements (boolean): whether to print info on progress
 
     """
+    docs_with_comments = existing_ids(
+        "regulations_comment",
+        (doc["id"] for doc in doc_list if doc["attributes"]["openForComment"]),
+        "document_id",
+    )
+
     for doc in doc_list:
         document_id = doc["id"]
         document_object_id = doc["attributes"]["objectId"]
         commentable = doc["attributes"]["openForComment"]
         # get the comments, comment text, and add to db
         if commentable:
-            if not verify_database_existence(
-                "regulations_comment", document_id, "document_id"
-            ):  # doc doesn't exist in the db; it's new
+            # doc doesn't exist in the db; it's new
+            if document_id not in docs_with_comments:
                 if print_statements:
                     logging.info(
                         f"""no comments found in database for document
@@ -1279,29 +1745,50 @@ def add_comments_based_on_comment_date_range(
 
     Returns: nothing; adds comments, if available, to the db
     """
-    comment_data = pull_reg_gov_data(
+    comment_data = iter_reg_gov_data(
         REG_GOV_API_KEY,
         "comments",
         start_date=start_date,
         end_date=end_date,
     )
+    add_comment_page_to_db(comment_data)
 
-    for comment in comment_data:
-        logging.info(f"processing comment {comment['id']} ")
 
-        all_comment_data = merge_comment_text_and_data(REG_GOV_API_KEY, comment)
+def add_comment_page_to_db(
+    comment_data: Iterable[dict], documents_in_db: dict = None
+) -> None:
+    """
+    Fetch the details of a list of comments from the comments search
+    endpoint and add the ones on documents in the db to the comments table
+
+    Args:
+        comment_data (iterable of json objects): what is returned from an
+            API call for comments
+        documents_in_db (dict, optional): whether each document id is in the
+            db, filled in as documents are looked up; pass the same dict for
+            every page of a run so each document is only looked up once
+
+    Returns: nothing; adds comments, if available, to the db
+    """
+    if documents_in_db is None:
+        documents_in_db = {}
+
+    for all_comment_data in raw_archive.archived(
+        "comments", iter_comment_details(REG_GOV_API_KEY, comment_data)
+    ):
+        logging.info(f"processing comment {all_comment_data['id']} ")
 
         document_id = all_comment_data["data"]["attributes"].get(
             "commentOnDocumentId", ""
         )
 
-        logging.info(f"checking {document_id} is in the db")
+        if document_id not in documents_in_db:
+            logging.info(f"checking {document_id} is in the db")
+            documents_in_db[document_id] = bool(
+                existing_ids("regulations_document", [document_id])
+            )
 
-        if verify_database_existence(
-            "regulations_document",
-            document_id,
-            "id",
-        ):
+        if documents_in_db[document_id]:
             logging.info(
                 f"{document_id} is in the db! begin processing comment"
             )
@@ -1322,68 +1809,245 @@ def add_comments_based_on_comment_date_range(
                 )
 
 
+def add_document_page_to_db(
+    doc_list: list[dict], pull_dockets: bool, pull_documents: bool
+) -> None:
+    """
+    Add the documents open for comment in a page of API results, and the
+    dockets they belong to, to the db
+
+    Args:
+        doc_list (list of json objects): what is returned from an API call
+            for documents
+        pull_dockets (boolean): whether to add the dockets
+        pull_documents (boolean): whether to add the documents
+
+    Returns:
+        None; adds data to the db
+    """
+    raw_archive.archive("documents", doc_list)
+
+    # pull the commentable docs from that list
+    commentable_docs = [
+        doc
+        for doc in doc_list
+        if doc["attributes"]["docketId"] and doc["attributes"]["openForComment"]
+    ]
+    logging.info(
+        f"{len(commentable_docs)} of {len(doc_list)} documents open for comment"
+    )
+
+    # the db needs the docket primary key first, so add dockets before their
+    # documents
+    if pull_dockets:
+        add_dockets_to_db(commentable_docs)
+
+    if pull_documents:
+        add_documents_to_db(commentable_docs)
+
+
 def pull_all_api_data_for_date_range(
     start_date: str,
     end_date: str,
     pull_dockets: bool,
     pull_documents: bool,
     pull_comments: bool,
+    restart: bool = False,
 ) -> None:
     """
     Pull different types of data from regulations.gov API based on date range
 
+    Each page of documents and comments is written as it arrives and the
+    progress saved to the sync state table, so running the same date range
+    again after a failure resumes where the last run stopped.
+
     Args:
         start_date (str): the date in YYYY-MM-DD format to pull data from
             (inclusive)
         end_date (str): the date in YYYY-MM-DD format to stop the data pull
             (inclusive)
-        pull_dockets (boolean):
+        pull_dockets (boolean): add the dockets of documents open for comment
+        pull_documents (boolean): add the documents open for comment
+        pull_comments (boolean): add comments on documents in the db
+        restart (boolean): ignore saved progress and start from the beginning
+            of the date range
 
     Returns:
         None; adds data to the db
     """
+    state = sync.DatabaseSyncState(DATABASE_PARAMS)
+
+    if pull_dockets or pull_documents:
+        logging.info("syncing dockets and documents within date range")
+        cursor = sync.sync_date_range(
+            REG_GOV_API_KEY,
+            "documents",
+            start_date,
+            end_date,
+            partial(
+                add_document_page_to_db,
+                pull_dockets=pull_dockets,
+                pull_documents=pull_documents,
+            ),
+            state=state,
+            restart=restart,
+        )
+        logging.info(f"no more documents to add to db ({cursor['objects']})")
 
-    # get documents
-    logging.info("getting list of documents within date range")
-    doc_list = pull_reg_gov_data(
-        REG_GOV_API_KEY,
-        "documents",
-        start_date=start_date,
-        end_date=end_date,
+    if pull_comments:
+        logging.info("adding comments to the db")
+        cursor = sync.sync_date_range(
+            REG_GOV_API_KEY,
+            "comments",
+            start_date,
+            end_date,
+            partial(add_comment_page_to_db, documents_in_db={}),
+            state=state,
+            restart=restart,
+        )
+        logging.info(f"no more comments to add to db ({cursor['objects']})")
+
+    QA_FLAGS.flush()
+    log_upsert_stats()
+    http_client.log_stats()
+    fr_cache.log_stats()
+    raw_archive.log_stats()
+    logging.info(
+        f"existence checks: {EXISTENCE_STATS['queries']} queries for "
+        f"{EXISTENCE_STATS['ids_checked']} ids, "
+        f"{EXISTENCE_STATS['ids_checked'] - EXISTENCE_STATS['queries']} "
+        "queries saved"
     )
-    logging.info(f"got {len(doc_list)} documents")
-    logging.info("now extracting docs open for comments from that list")
+    db_stats = pool_stats()
+    logging.info(
+        f"database pool: {db_stats['checkouts']} checkouts, "
+        f"{db_stats['wait_seconds']:.1f}s waiting, "
+        f"exhausted {db_stats['exhausted']} times"
+    )
+    logging.info("process finished")
 
-    # pull the commentable docs from that list
-    commentable_docs = []
-    for doc in doc_list:
-        docket_id = doc["attributes"]["docketId"]
-        if docket_id and doc["attributes"]["openForComment"]:
-            commentable_docs.append(doc)
-            # can't add this doc to the db right now because docket needs to be
-            # added first
-            # the db needs the docket primary key first
 
-    logging.info(f"{len(commentable_docs)} documents open for comment")
+def _replay_dockets(dockets: Iterable[json]) -> int:
+    """
+    Clean, QA and upsert archived dockets, returning how many were written.
+    """
+    written = 0
+    for docket in dockets:
+        docket_data = [docket]
+        clean_docket_data(docket_data)
+        qa_docket_data(docket_data)
+        insert_response = insert_docket_into_db(docket_data)
+        if insert_response["error"]:
+            logging.error(insert_response["description"])
+        else:
+            written += 1
+    return written
 
-    if pull_dockets:
-        logging.info(
-            "getting dockets associated with the documents open for comment"
+
+def _replay_comments(comments: Iterable[json]) -> int:
+    """
+    Clean, QA and upsert archived comments on documents in the db, returning
+    how many were written.
+    """
+    documents_in_db = {}
+
+    def comments_on_documents_in_db():
+        for comment_data in comments:
+            document_id = comment_data["data"]["attributes"].get(
+                "commentOnDocumentId", ""
+            )
+            if document_id not in documents_in_db:
+                documents_in_db[document_id] = bool(
+                    existing_ids("regulations_document", [document_id])
+                )
+            if documents_in_db[document_id]:
+                clean_comment_data(comment_data)
+                yield comment_data
+
+    def checked_in_batches():
+        batch = []
+        for comment_data in comments_on_documents_in_db():
+            batch.append(comment_data)
+            if len(batch) >= COMMENT_BATCH_SIZE:
+                qa_comment_batch(batch)
+                yield from batch
+                batch = []
+        qa_comment_batch(batch)
+        yield from batch
+
+    summary = insert_comments_into_db(checked_in_batches())
+    for error in summary["errors"]:
+        logging.error(error["description"])
+    return summary["written"]
+
+
+def replay_archived_data(
+    start_date: Optional[str],
+    end_date: Optional[str],
+    replay_dockets: bool,
+    replay_documents: bool,
+    replay_comments: bool,
+    archive: Optional[raw_archive.RawArchive] = None,
+) -> dict:
+    """
+    Re-run cleaning, QA and inserts on payloads saved in the raw archive,
+    instead of calling the regulations.gov API again. Every archived object
+    is upserted, whether or not it is in the db already.
+
+    Args:
+        start_date (str, optional): first day, in YYYY-MM-DD format, the
+            payloads were fetched on
+        end_date (str, optional): last day, in YYYY-MM-DD format, the
+            payloads were fetched on
+        replay_dockets (boolean): upsert the archived dockets
+        replay_documents (boolean): upsert the archived documents open for
+            comment
+        replay_comments (boolean): upsert the archived comments on
+            documents in the db
+        archive (RawArchive, optional): defaults to the shared archive
+
+    Returns:
+        dict with the number of each type of object replayed
+    """
+    archive = archive if archive is not None else raw_archive.get_archive()
+    if archive is None:
+        raise ValueError("RAW_ARCHIVE_DIR is not set; nothing to replay")
+
+    days = [
+        dt.date.fromisoformat(day) if day else None
+        for day in (start_date, end_date)
+    ]
+    replayed = {"dockets": 0, "documents": 0, "comments": 0}
+
+    # dockets first, as documents need their docket in the db
+    if replay_dockets:
+        replayed["dockets"] = _replay_dockets(
+            archive.iter_payloads("dockets", *days)
         )
-        add_dockets_to_db(commentable_docs)
-        logging.info("no more dockets to add to db")
 
-    if pull_documents:
-        logging.info("adding documents to the db")
-        add_documents_to_db(commentable_docs)
-        logging.info("no more documents to add to db")
+    if replay_documents:
+        docs = [
+            doc
+            for doc in archive.iter_payloads("documents", *days)
+            if doc["attributes"]["docketId"]
+            and doc["attributes"]["openForComment"]
+        ]
+        upsert_documents(docs, print_statements=False)
+        replayed["documents"] = len(docs)
 
-    if pull_comments:
-        logging.info("adding comments to the db")
-        add_comments_based_on_comment_date_range(start_date, end_date)
-        logging.info("no more comments to add to db")
+    if replay_comments:
+        replayed["comments"] = _replay_comments(
+            archive.iter_payloads("comments", *days)
+        )
 
-    logging.info("process finished")
+    logging.info(
+        f"replayed {replayed['dockets']} dockets, "
+        f"{replayed['documents']} documents and {replayed['comments']} "
+        "comments from the raw archive"
+    )
+    QA_FLAGS.flush()
+    log_upsert_stats()
+    return replayed
 
 
 if __name__ == "__main__":
@@ -1419,11 +2083,36 @@ if __name__ == "__main__":
         help="Pull comments posted during date range, add to db if not there",
     )
 
-    args = parser.parse_args()
-    pull_all_api_data_for_date_range(
-        args.start_date,
-        args.end_date,
-        args.pull_dockets,
-        args.pull_documents,
-        args.pull_comments,
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore progress saved by an earlier run of this date range",
+    )
+
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help=(
+            "Instead of calling the API, re-run cleaning, QA and inserts on "
+            "payloads archived during the date range"
+        ),
     )
+
+    args = parser.parse_args()
+    if args.replay:
+        replay_archived_data(
+            args.start_date,
+            args.end_date,
+            args.pull_dockets,
+            args.pull_documents,
+            args.pull_comments,
+        )
+    else:
+        pull_all_api_data_for_date_range(
+            args.start_date,
+            args.end_date,
+            args.pull_dockets,
+            args.pull_documents,
+            args.pull_comments,
+            args.restart,
+        )
@@ -0,0 +1,150 @@
+"""
+Adaptive date partitioning for the regulations.gov search endpoints.
+
+A search only pages through its first 5,000 results (20 pages of 250), so a
+date range with more results than that is silently cut short. Fixed windows
+either waste requests on quiet periods or still overflow on busy ones.
+Instead, the first page of a range is requested, and if its
+`meta.totalElements` is over the limit, the range is split into as many
+equal parts as the total needs and each part is tried in turn. A part that
+fits is paged through from the first page already fetched, so the only
+requests spent on planning are the first pages of ranges that turned out
+too big.
+"""
+
+import logging
+import math
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, Union
+
+
+MAX_PAGES = 20
+PAGE_SIZE = 250
+MAX_RESULTS = MAX_PAGES * PAGE_SIZE
+# where a range with no start date begins
+EARLIEST_DATE = datetime(1990, 1, 1)
+
+Bound = Union[date, datetime]
+
+
+def split_window(
+    start: Bound, end: Bound, parts: int, resolution: timedelta
+) -> list[tuple[Bound, Bound]]:
+    """
+    Split an inclusive range into consecutive inclusive ranges of about
+    equal length.
+
+    Args:
+        start (date or datetime): first value in the range
+        end (date or datetime): last value in the range
+        parts (int): number of ranges wanted; fewer are returned if the
+            range has fewer values than that
+        resolution (timedelta): smallest step the API filter can express,
+            eg a day for a date filter or a second for a timestamp filter
+
+    Returns:
+        list of (start, end) tuples covering the range without overlap
+    """
+    steps = (end - start) // resolution + 1
+    parts = max(1, min(parts, steps))
+    bounds = [
+        start + resolution * (steps * part // parts) for part in range(parts)
+    ]
+    bounds.append(end + resolution)
+    return [
+        (bounds[part], bounds[part + 1] - resolution) for part in range(parts)
+    ]
+
+
+def iter_partitioned_pages(
+    fetch_page: Callable[[Bound, Bound, int], dict],
+    start: Bound,
+    end: Bound,
+    resolution: timedelta = timedelta(seconds=1),
+    limit: int = MAX_RESULTS,
+) -> Iterator[list[dict]]:
+    """
+    Page through every result between two dates, splitting the range into
+    parts small enough for the API to page through in full.
+
+    Parts are fetched in date order. If a single step of `resolution` still
+    holds more than `limit` results, a warning is logged and only the
+    results the API will return are yielded.
+
+    Args:
+        fetch_page (callable): takes the start and end of a range (both
+            inclusive) and a page number, and returns the API's JSON for
+            that page, with "data" and "meta" keys
+        start (date or datetime): first value in the range
+        end (date or datetime): last value in the range
+        resolution (timedelta): smallest step the date filter can express
+        limit (int): number of results the API will page through
+
+    Yields:
+        list of objects on each page
+    """
+    # ranges still to fetch, the next one last
+    ranges = [(start, end)]
+    while ranges:
+        part_start, part_end = ranges.pop()
+        r_json = fetch_page(part_start, part_end, 1)
+        total = r_json["meta"].get("totalElements", 0)
+
+        if total > limit and part_end - part_start >= resolution:
+            parts = split_window(
+                part_start,
+                part_end,
+                max(2, math.ceil(total / limit)),
+                resolution,
+            )
+            ranges.extend(reversed(parts))
+            continue
+        if total > limit:
+            logging.warning(
+                f"{total} results from {part_start} to {part_end}; only the "
+                f"first {limit} can be fetched"
+            )
+
+        yield r_json["data"]
+        page_number = 1
+        while (
+            r_json["meta"].get("hasNextPage", False)
+            and page_number * PAGE_SIZE < limit
+        ):
+            page_number += 1
+            r_json = fetch_page(part_start, part_end, page_number)
+            yield r_json["data"]
+
+
+def pull_partitioned(
+    fetch_page: Callable[[Bound, Bound, int], dict],
+    start: Bound,
+    end: Bound,
+    resolution: timedelta = timedelta(seconds=1),
+    limit: int = MAX_RESULTS,
+) -> list[dict]:
+    """
+    Collect every result between two dates with `iter_partitioned_pages`.
+    An object modified while the pull runs can move into a later part, so
+    each id is only kept once.
+
+    Args:
+        fetch_page (callable): see `iter_partitioned_pages`
+        start (date or datetime): first value in the range
+        end (date or datetime): last value in the range
+        resolution (timedelta): smallest step the date filter can express
+        limit (int): number of results the API will page through
+
+    Returns:
+        list of objects, in date order
+    """
+    results = []
+    seen = set()
+    for page in iter_partitioned_pages(
+        fetch_page, start, end, resolution, limit
+    ):
+        for obj in page:
+            if obj["id"] not in seen:
+                seen.add(obj["id"])
+                results.append(obj)
+    return results
@@ -0,0 +1,276 @@
+"""
+Staged pipeline for collectors that do several kinds of work per item.
+
+Adding a document means waiting on the network (the Federal Register
+lookup and the XML download), then parsing the XML, then writing to the
+database. Done one document at a time, the parser waits on the network and
+the network waits on the database. Here each kind of work is a stage with
+its own worker threads, and stages are joined by bounded queues: a stage
+that falls behind makes the stages before it wait rather than letting work
+pile up in memory. CPU-bound work can be handed to a process pool from
+inside a stage's function.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+
+_DONE = object()
+POLL_SECONDS = 0.1
+
+
+class Stage:
+    """
+    One step of a pipeline: a function run by a number of worker threads
+    over the items coming out of the step before.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        workers: int = 1,
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            name (str): name the stage's stats are reported under
+            func (callable): takes an item and returns the item to pass on,
+                or None to drop it. With `batch_size`, takes a list of items
+                and returns a list of items to pass on.
+            workers (int): number of threads running `func`
+            batch_size (int, optional): hand `func` up to this many items at
+                a time, eg for a writer that inserts rows in batches. A
+                batch is cut short when no more items are waiting.
+            queue_size (int, optional): number of items that can wait for
+                this stage, defaults to twice the number of workers (or of
+                the batch size)
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(
+            maxsize=queue_size or 2 * max(workers, batch_size or 1)
+        )
+        self._lock = threading.Lock()
+        self._running = 0
+        self._items = 0
+        self._busy_seconds = 0.0
+        self._max_depth = 0
+
+    def _record(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self._items += items
+            self._busy_seconds += seconds
+
+    def _record_depth(self) -> None:
+        depth = self.queue.qsize()
+        with self._lock:
+            self._max_depth = max(self._max_depth, depth)
+
+    def stats(self, elapsed: float) -> dict:
+        """
+        Args:
+            elapsed (float): seconds the pipeline has been running
+
+        Returns:
+            items processed, seconds the workers spent on them, items per
+            second of running time, and the current and largest number of
+            items waiting for the stage
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "items": self._items,
+                "busy_seconds": self._busy_seconds,
+                "items_per_second": self._items / elapsed if elapsed else 0.0,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self._max_depth,
+            }
+
+
+class Pipeline:
+    """
+    Runs items through a list of stages. Each stage's workers take items
+    from the stage's queue and put results on the next stage's queue; the
+    results of the last stage are yielded by `run` in the calling thread.
+    """
+
+    def __init__(self, stages: list[Stage]):
+        """
+        Args:
+            stages (list of Stage): the steps to run, in order
+        """
+        self.stages = stages
+        self._output = queue.Queue(maxsize=2 * stages[-1].workers)
+        self._stop = threading.Event()
+        self._error = None
+        self._started = None
+        self._finished = None
+
+    def _put(self, target: queue.Queue, item, stage=None) -> bool:
+        """
+        Put an item on a queue, waiting while it is full. Gives up and
+        returns False if the pipeline is stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=POLL_SECONDS)
+            except queue.Full:
+                continue
+            if stage is not None:
+                stage._record_depth()
+            return True
+        return False
+
+    def _get(self, source: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _next_queue(self, index: int) -> tuple[queue.Queue, Optional[Stage]]:
+        if index + 1 < len(self.stages):
+            next_stage = self.stages[index + 1]
+            return next_stage.queue, next_stage
+        return self._output, None
+
+    def _feed(self, items: Iterable) -> None:
+        try:
+            for item in items:
+                if not self._put(self.stages[0].queue, item, self.stages[0]):
+                    return
+        except BaseException as e:  # re-raised in the calling thread
+            self._fail(e)
+        finally:
+            self._put(self.stages[0].queue, _DONE)
+
+    def _take_batch(self, stage: Stage) -> tuple[list, bool]:
+        """
+        Take up to a batch of items from a stage's queue, waiting for the
+        first one only. Returns the items and whether the input has ended.
+        """
+        batch = []
+        while len(batch) < stage.batch_size:
+            try:
+                item = (
+                    self._get(stage.queue)
+                    if not batch
+                    else stage.queue.get_nowait()
+                )
+            except queue.Empty:
+                return batch, False
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        target, next_stage = self._next_queue(index)
+        finished = False
+        try:
+            while not finished:
+                if stage.batch_size:
+                    items, finished = self._take_batch(stage)
+                else:
+                    item = self._get(stage.queue)
+                    finished = item is _DONE
+                    items = [] if finished else [item]
+                if not items:
+                    continue
+
+                start = time.perf_counter()
+                if stage.batch_size:
+                    results = stage.func(items) or []
+                else:
+                    results = [stage.func(items[0])]
+                stage._record(len(items), time.perf_counter() - start)
+
+                for result in results:
+                    if result is not None:
+                        self._put(target, result, next_stage)
+        except BaseException as e:  # re-raised in the calling thread
+            self._fail(e)
+        finally:
+            with stage._lock:
+                stage._running -= 1
+                last = stage._running == 0
+            if last:
+                self._put(target, _DONE)
+            else:
+                # let this stage's other workers see the end of the input too
+                self._put(stage.queue, _DONE)
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def run(self, items: Iterable) -> Iterator:
+        """
+        Run items through every stage.
+
+        Args:
+            items (iterable): input to the first stage, consumed lazily and
+                only as fast as the first stage takes it
+
+        Yields:
+            the results of the last stage, in the order they finish
+        """
+        self._started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._feed, args=(items,), daemon=True)
+        ]
+        for index, stage in enumerate(self.stages):
+            stage._running = stage.workers
+            threads.extend(
+                threading.Thread(target=self._work, args=(index,), daemon=True)
+                for _ in range(stage.workers)
+            )
+        for thread in threads:
+            thread.start()
+
+        try:
+            while (item := self._get(self._output)) is not _DONE:
+                yield item
+        finally:
+            self._stop.set()
+            # the feeder may be stuck in the input iterator, so isn't waited on
+            for thread in threads[1:]:
+                thread.join()
+            self._finished = time.perf_counter()
+
+        if self._error is not None:
+            raise self._error
+
+    def stats(self) -> dict:
+        """
+        Returns the stats of each stage, keyed by stage name.
+        """
+        if self._started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished or time.perf_counter()) - self._started
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+    def log_stats(self) -> None:
+        """
+        Log one line for each stage's throughput and queue depth.
+        """
+        for name, stage_stats in self.stats().items():
+            logging.info(
+                f"pipeline stage {name}: {stage_stats['items']} items, "
+                f"{stage_stats['items_per_second']:.1f}/s with "
+                f"{stage_stats['workers']} workers "
+                f"({stage_stats['busy_seconds']:.1f}s busy), "
+                f"queue depth {stage_stats['queue_depth']} "
+                f"(max {stage_stats['max_queue_depth']})"
+            )
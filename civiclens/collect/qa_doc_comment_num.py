@@ -1,12 +1,34 @@
+"""
+Compare the number of comments regulations.gov reports for each open
+document with the number in regulations_comment.
+
+`reconcile_comment_counts` gets every database count in one GROUP BY query
+and asks the API for its counts concurrently, drawing each request from the
+shared quota as backfill work. API counts are cached for COMMENT_COUNT_TTL
+seconds, so running the check again soon after only asks about documents
+it hasn't seen. The result is ranked by how many comments are missing, so
+`add_comments.py` backfills the most under-collected documents first.
+"""
+
+import json
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
 
 import polars as pl
-import requests
 
-from civiclens.collect.move_data_from_api_to_database import (
-    connect_db_and_get_cursor,
+from civiclens.collect import http_client, quota
+from civiclens.collect.move_data_from_api_to_database import db_cursor
+from civiclens.utils.constants import (
+    COMMENT_COUNT_CACHE_FILE,
+    COMMENT_COUNT_TTL,
+    REG_GOV_API_KEY,
 )
-from civiclens.utils.constants import REG_GOV_API_KEY
+
+
+MAX_CONCURRENCY = 8
 
 
 def pull_list_of_doc_info() -> list[tuple[str]]:
@@ -19,18 +41,12 @@ def pull_list_of_doc_info() -> list[tuple[str]]:
         docs in regulations_document
 
     """
-    connection, cursor = connect_db_and_get_cursor()
-    with connection:
-        with cursor:
-            query = "SELECT id, object_id, rin \
-                    FROM regulations_document \
-                    WHERE comment_end_date > NOW();"
-            cursor.execute(query)
-            response = cursor.fetchall()
-
-    if connection:
-        cursor.close()
-        connection.close()
+    with db_cursor() as cursor:
+        query = "SELECT id, object_id, rin \
+                FROM regulations_document \
+                WHERE comment_end_date > NOW();"
+        cursor.execute(query)
+        response = cursor.fetchall()
 
     return response
 
@@ -54,11 +70,15 @@ def find_object_id(object_id, rin):
         return None
 
 
-def get_doc_api_comment_count(object_id: str) -> int:
+def get_doc_api_comment_count(
+    object_id: str, default: Optional[int] = 0
+) -> Optional[int]:
     """
     Pulls the comment count from the API for a given document
 
-    Args: object_id (str): the object id for a document
+    Args:
+        object_id (str): the object id for a document
+        default (int, optional): what to return if the request fails
 
     Returns: total_elements (int): the number of comments in the API for doc
 
@@ -68,9 +88,13 @@ def get_doc_api_comment_count(object_id: str) -> int:
     params = {"filter[commentOnId]": object_id}
     headers = {"X-Api-Key": REG_GOV_API_KEY, "Content-Type": "application/json"}
 
+    scheduler = quota.get_scheduler()
+
     continue_fetching = True
     while continue_fetching:
-        response = requests.get(base_url, headers=headers, params=params)
+        scheduler.acquire("backfill")
+        response = http_client.get(base_url, headers=headers, params=params)
+        scheduler.record_response(response)
 
         if response.status_code == 200:
             data = response.json()
@@ -78,14 +102,12 @@ def get_doc_api_comment_count(object_id: str) -> int:
             return total_elements
 
         elif response.status_code == 429:  # Rate limit exceeded
-            retry_after = response.headers.get("Retry-After", None)
-            wait_time = (
-                int(retry_after)
-                if retry_after and retry_after.isdigit()
-                else 3600
+            # the scheduler holds the next request until the limit resets
+            wait_time = scheduler.budget()["blocked_for"]
+            print(
+                f"""Rate limit exceeded.
+                Waiting {wait_time:.0f} seconds to retry."""
             )
-            print(f"Rate limit exceeded. Waiting {wait_time} seconds to retry.")
-            time.sleep(wait_time)
 
         else:
             print(
@@ -94,7 +116,7 @@ def get_doc_api_comment_count(object_id: str) -> int:
             continue_fetching = False
 
     # Return a default value
-    return 0
+    return default
 
 
 def get_doc_db_comment_count(document_id: str) -> int:
@@ -105,18 +127,12 @@ def get_doc_db_comment_count(document_id: str) -> int:
 
     Returns: db_count (int): the comment comment on doc in regulations_comment
     """
-    connection, cursor = connect_db_and_get_cursor()
-    with connection:
-        with cursor:
-            query = "SELECT COUNT(*) \
-                    FROM regulations_comment \
-                    WHERE document_id= %s;"
-            cursor.execute(query, (document_id,))
-            response = cursor.fetchone()
-
-    if connection:
-        cursor.close()
-        connection.close()
+    with db_cursor() as cursor:
+        query = "SELECT COUNT(*) \
+                FROM regulations_comment \
+                WHERE document_id= %s;"
+        cursor.execute(query, (document_id,))
+        response = cursor.fetchone()
 
     db_count = response[0]
     return db_count
@@ -181,8 +197,221 @@ def fetch_comment_count_for_docs_in_db():
     return results_df
 
 
+class CommentCountCache:
+    """
+    API comment counts by object id, each kept for `ttl` seconds. Saved to
+    a JSON file so later runs can reuse them.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = COMMENT_COUNT_CACHE_FILE,
+        ttl: float = COMMENT_COUNT_TTL,
+        clock=time.time,
+    ):
+        """
+        Args:
+            path (str, optional): file to keep the counts in; if empty the
+                counts are only kept in memory
+            ttl (float): seconds a count is reused before asking again
+            clock (callable): returns the current time in seconds
+        """
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._counts = {}
+        if path:
+            try:
+                with open(path) as f:
+                    self._counts = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    def get(self, object_id: str) -> Optional[int]:
+        """
+        Returns the cached count for a document, or None if there is none
+        or it has expired.
+        """
+        with self._lock:
+            cached = self._counts.get(object_id)
+        if cached is None or self.clock() - cached["fetched_at"] > self.ttl:
+            return None
+        return cached["count"]
+
+    def put(self, object_id: str, count: int) -> None:
+        with self._lock:
+            self._counts[object_id] = {
+                "count": count,
+                "fetched_at": self.clock(),
+            }
+
+    def save(self) -> None:
+        """
+        Write the unexpired counts to the cache file.
+        """
+        if not self.path:
+            return
+        now = self.clock()
+        with self._lock:
+            counts = {
+                object_id: cached
+                for object_id, cached in self._counts.items()
+                if now - cached["fetched_at"] <= self.ttl
+            }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(counts, f)
+        os.replace(tmp_path, self.path)
+
+
+def get_db_comment_counts(document_ids: Iterable[str]) -> dict[str, int]:
+    """
+    Count the comments on many documents in regulations_comment with one
+    query
+
+    Args:
+        document_ids (iterable of str): ids of the documents
+
+    Returns:
+        dict of document id to comment count; documents with no comments
+        are left out
+    """
+    document_ids = list(document_ids)
+    if not document_ids:
+        return {}
+
+    with db_cursor() as cursor:
+        cursor.execute(
+            """SELECT document_id, COUNT(*)
+                FROM regulations_comment
+                WHERE document_id = ANY(%s)
+                GROUP BY document_id;""",
+            (document_ids,),
+        )
+        return dict(cursor.fetchall())
+
+
+def get_api_comment_counts(
+    object_ids: Iterable[str],
+    cache: Optional[CommentCountCache] = None,
+    max_workers: int = MAX_CONCURRENCY,
+) -> tuple[dict[str, Optional[int]], dict]:
+    """
+    Get the API comment counts for many documents, using cached counts
+    where they are fresh and asking the API for the rest concurrently
+
+    Args:
+        object_ids (iterable of str): object ids of the documents
+        cache (CommentCountCache, optional): counts to reuse, defaults to a
+            cache in COMMENT_COUNT_CACHE_FILE
+        max_workers (int): number of requests to have in flight at once;
+            every request still waits for the shared quota
+
+    Returns:
+        dict of object id to count (None where the request failed), and
+        the number of cache hits and API requests
+    """
+    cache = cache if cache is not None else CommentCountCache()
+    counts = {}
+    to_fetch = []
+    for object_id in set(object_ids):
+        cached = cache.get(object_id)
+        if cached is None:
+            to_fetch.append(object_id)
+        else:
+            counts[object_id] = cached
+
+    stats = {"cache_hits": len(counts), "api_requests": len(to_fetch)}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = executor.map(
+            lambda object_id: get_doc_api_comment_count(object_id, None),
+            to_fetch,
+        )
+        for object_id, count in zip(to_fetch, fetched, strict=True):
+            counts[object_id] = count
+            if count is not None:
+                cache.put(object_id, count)
+
+    cache.save()
+    return counts, stats
+
+
+def reconcile_comment_counts(
+    doc_info: Optional[list[tuple[str]]] = None,
+    cache: Optional[CommentCountCache] = None,
+    max_workers: int = MAX_CONCURRENCY,
+) -> pl.DataFrame:
+    """
+    Compare the API and database comment counts of the open documents and
+    rank them by how many comments are missing from the database
+
+    Args:
+        doc_info (list of tuples, optional): (id, object_id, rin) of each
+            document, defaults to `pull_list_of_doc_info`
+        cache (CommentCountCache, optional): API counts to reuse
+        max_workers (int): number of API requests to have in flight at once
+
+    Returns:
+        polars dataframe with columns: document_id, object_id, rin,
+        db_count, api_count, diff, missing_share (the share of the API's
+        comments missing from the database), most missing first; documents
+        without an API count come last
+    """
+    doc_info = doc_info if doc_info is not None else pull_list_of_doc_info()
+    print(f"{len(doc_info)} documents in the database")
+
+    db_counts = get_db_comment_counts(
+        document_id for document_id, _, _ in doc_info
+    )
+    real_object_ids = {
+        document_id: find_object_id(object_id, rin)
+        for document_id, object_id, rin in doc_info
+    }
+    api_counts, stats = get_api_comment_counts(
+        (oid for oid in real_object_ids.values() if oid is not None),
+        cache,
+        max_workers,
+    )
+    print(
+        f"{stats['api_requests']} API requests, "
+        f"{stats['cache_hits']} counts reused from the cache"
+    )
+
+    results_df = pl.DataFrame(
+        {
+            "document_id": [document_id for document_id, _, _ in doc_info],
+            "object_id": [object_id for _, object_id, _ in doc_info],
+            "rin": [rin for _, _, rin in doc_info],
+            "db_count": [
+                db_counts.get(document_id, 0) for document_id, _, _ in doc_info
+            ],
+            "api_count": [
+                api_counts.get(real_object_ids[document_id])
+                for document_id, _, _ in doc_info
+            ],
+        },
+        schema={
+            "document_id": pl.Utf8,
+            "object_id": pl.Utf8,
+            "rin": pl.Utf8,
+            "db_count": pl.Int64,
+            "api_count": pl.Int64,
+        },
+    )
+    return (
+        results_df.with_columns(diff=pl.col("api_count") - pl.col("db_count"))
+        .with_columns(
+            missing_share=pl.when(pl.col("api_count") > 0)
+            .then(pl.col("diff") / pl.col("api_count"))
+            .otherwise(0.0)
+        )
+        .sort(["diff", "missing_share"], descending=True, nulls_last=True)
+    )
+
+
 def main():
-    df = fetch_comment_count_for_docs_in_db()
+    df = reconcile_comment_counts()
     df.write_csv("comment_num_api_and_db.csv")
 
 
@@ -0,0 +1,491 @@
+"""
+Declarative data quality rules for dockets, documents and comments.
+
+Each rule checks one field and is defined once, with both a predicate on
+the field's value and the equivalent polars expression on a column of
+values. The predicate backs the per-record `qa_*_data` functions as the
+API is pulled; the expressions check whole batches at a time for bulk
+loads and replays, where a million comments take seconds rather than
+minutes of Python asserts.
+
+A record, or a row, fails a rule if the check is false, if the field is
+missing or null (unless the rule allows nulls), or if the value is of the
+wrong type.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Sequence
+
+import polars as pl
+
+
+VIOLATION_SCHEMA = {
+    "data_id": pl.Utf8,
+    "data_type": pl.Utf8,
+    "error_message": pl.Utf8,
+}
+# polars type of the columns a kind of value is read into
+PYTHON_DTYPES = {str: pl.Utf8, bool: pl.Boolean, int: pl.Int64}
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def get_field(record: Any, field: tuple[str, ...]) -> Any:
+    """
+    Look up a nested field of a record, eg ("attributes", "title").
+    Raises KeyError if it is missing.
+    """
+    value = record
+    for key in field:
+        value = value[key]
+    return value
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    A check on one field of a record.
+
+    Attributes:
+        message (str): what is wrong when the check fails
+        field (tuple of str): path to the field in the record
+        predicate (callable): takes a non-null value and returns whether it
+            passes
+        expression (callable): takes a polars expression for the column
+            and returns a boolean expression that is true where a non-null
+            value passes
+        dtype (polars data type): the column type the expression works on;
+            a column of any other type fails the rule
+        nullable (bool): whether a null value passes
+    """
+
+    message: str
+    field: tuple[str, ...]
+    predicate: Callable[[Any], bool]
+    expression: Callable[[pl.Expr], pl.Expr]
+    dtype: type[pl.DataType] = pl.Utf8
+    nullable: bool = False
+
+    @property
+    def column(self) -> str:
+        """
+        Name of the field's column in a frame of records.
+        """
+        return ".".join(self.field)
+
+    def check(self, record: Any) -> bool:
+        """
+        Returns whether a record passes; raises if the field is missing.
+        """
+        value = get_field(record, self.field)
+        if value is None:
+            return self.nullable
+        return bool(self.predicate(value))
+
+    def as_check(self) -> tuple[str, Callable[[Any], bool]]:
+        """
+        Returns the (message, predicate) pair `data_quality.run_checks`
+        takes.
+        """
+        return self.message, self.check
+
+    def passes(self, column_dtype: pl.DataType) -> pl.Expr:
+        """
+        Build the expression for whether each row passes, for a column of
+        the given type.
+        """
+        column = pl.col(self.column)
+        if column_dtype == pl.Null:
+            return pl.lit(self.nullable)
+        if not _dtype_matches(column_dtype, self.dtype):
+            return column.is_null() if self.nullable else pl.lit(False)
+        return (
+            pl.when(column.is_null())
+            .then(self.nullable)
+            .otherwise(self.expression(column))
+        )
+
+
+def _dtype_matches(column_dtype: pl.DataType, dtype: type) -> bool:
+    if dtype == pl.Int64:
+        return column_dtype.is_integer()
+    return column_dtype == dtype
+
+
+def shorter_than(field: tuple[str, ...], limit: int, message: str) -> Rule:
+    """
+    Rule that a string has fewer than `limit` characters.
+    """
+    return Rule(
+        message,
+        field,
+        lambda value: len(value) < limit,
+        lambda column: column.str.len_chars() < limit,
+    )
+
+
+def starts_with(field: tuple[str, ...], prefix: str, message: str) -> Rule:
+    """
+    Rule that a string starts with a prefix.
+    """
+    return Rule(
+        message,
+        field,
+        lambda value: value.startswith(prefix),
+        lambda column: column.str.starts_with(prefix),
+    )
+
+
+def contains(field: tuple[str, ...], substring: str, message: str) -> Rule:
+    """
+    Rule that a string contains a substring.
+    """
+    return Rule(
+        message,
+        field,
+        lambda value: substring in value,
+        lambda column: column.str.contains(substring, literal=True),
+    )
+
+
+def one_of(field: tuple[str, ...], values: Sequence[str], message: str) -> Rule:
+    """
+    Rule that a string is one of a set of values; include None in `values`
+    to also allow nulls.
+    """
+    allowed = [value for value in values if value is not None]
+    return Rule(
+        message,
+        field,
+        lambda value: value in allowed,
+        lambda column: column.is_in(allowed),
+        nullable=None in values,
+    )
+
+
+def equals(field: tuple[str, ...], expected: Any, message: str) -> Rule:
+    """
+    Rule that a value is `expected`, and of the same type; eg False, not 0.
+    """
+    return Rule(
+        message,
+        field,
+        lambda value: type(value) is type(expected) and value == expected,
+        lambda column: column == expected,
+        dtype=PYTHON_DTYPES[type(expected)],
+    )
+
+
+def is_type(
+    field: tuple[str, ...], python_type: type, message: str, nullable=False
+) -> Rule:
+    """
+    Rule that a value is a str or a datetime.
+    """
+    return Rule(
+        message,
+        field,
+        lambda value: isinstance(value, python_type),
+        lambda column: pl.lit(True),
+        dtype=pl.Datetime if python_type is datetime else pl.Utf8,
+        nullable=nullable,
+    )
+
+
+def alphabetic(field: tuple[str, ...], message: str) -> Rule:
+    """
+    Rule that a string is only letters.
+    """
+    return Rule(
+        message,
+        field,
+        str.isalpha,
+        lambda column: column.str.contains(r"^\p{L}+$"),
+    )
+
+
+def api_timestamp(field: tuple[str, ...], message: str) -> Rule:
+    """
+    Rule that a string looks like a regulations.gov timestamp from the
+    2020s, eg "2024-05-01T04:00:00Z".
+    """
+    return Rule(
+        message,
+        field,
+        lambda value: len(value) == 20 and "202" in value,
+        lambda column: (column.str.len_chars() == 20)
+        & column.str.contains("202", literal=True),
+    )
+
+
+FR_DOC_NUM_PATTERN = r"[0-9-]*|Not Found"
+
+
+def validate_fr_doc_num(field_value: str) -> bool:
+    """
+    Check the fr_doc_num field is in the right format
+    """
+
+    # this is a decision: we accept None as a value
+    if field_value is None:
+        return True
+
+    return re.fullmatch(FR_DOC_NUM_PATTERN, field_value) is not None
+
+
+def cfr_looks_right(cfr: str) -> bool:
+    """
+    Check that the CFR field looks right
+    """
+    return cfr == "Not Found" or "CFR" in cfr or cfr.isalpha()
+
+
+DOCKET_RULES = [
+    shorter_than(("id",), 255, "id field longer than 255 characters"),
+    one_of(
+        ("attributes", "docketType"),
+        ["Rulemaking", "Nonrulemaking"],
+        "docketType unexpected value",
+    ),
+    api_timestamp(
+        ("attributes", "lastModifiedDate"),
+        "lastModifiedDate is unexpected length",
+    ),
+    alphabetic(("attributes", "agencyId"), "agencyId is not just letter"),
+    is_type(("attributes", "title"), str, "title is not string"),
+    starts_with(
+        ("attributes", "objectId"), "0b", "objectId does not start with '0b'"
+    ),
+]
+
+DOCUMENT_RULES = [
+    shorter_than(("id",), 255, "id field longer than 255 characters"),
+    one_of(
+        ("attributes", "documentType"),
+        ["Proposed Rule", "Other", "Notice", "Not Found", "Rule"],
+        "documentType unexpected value",
+    ),
+    Rule(
+        "frDocNum contains unexpected characters or is None",
+        ("attributes", "frDocNum"),
+        validate_fr_doc_num,
+        lambda column: column.str.contains(f"^(?:{FR_DOC_NUM_PATTERN})$"),
+        nullable=True,
+    ),
+    equals(("attributes", "withdrawn"), False, "withdrawn is True"),
+    api_timestamp(
+        ("attributes", "commentEndDate"), "commentEndDate is unexpected length"
+    ),
+    Rule(
+        "postedDate is unexpected length",
+        ("attributes", "postedDate"),
+        lambda value: len(value) == 20,
+        lambda column: column.str.len_chars() == 20,
+    ),
+    api_timestamp(
+        ("attributes", "commentStartDate"),
+        "commentStartDate is unexpected length",
+    ),
+    equals(("attributes", "openForComment"), True, "openForComment is False"),
+    contains(
+        ("links", "self"),
+        "https",
+        "'https' is not in document_data['links']['self']",
+    ),
+    contains(
+        ("links", "self"),
+        ".gov",
+        "'.gov' is not in document_data['links']['self']",
+    ),
+    Rule(
+        "CFR is not alpha characters",
+        ("CFR",),
+        cfr_looks_right,
+        lambda column: (column == "Not Found")
+        | column.str.contains("CFR", literal=True)
+        | column.str.contains(r"^\p{L}+$"),
+        nullable=True,
+    ),
+    is_type(("attributes", "title"), str, "title is not string"),
+    is_type(("summary",), str, "summary is not string", nullable=True),
+    is_type(
+        ("supplementaryInformation",),
+        str,
+        "supplementaryInformation is not string",
+        nullable=True,
+    ),
+]
+
+COMMENT_RULES = [
+    shorter_than(("id",), 255, "id is more than 255 characters"),
+    starts_with(
+        ("attributes", "objectId"), "09", "objectId does not start with '09'"
+    ),
+    starts_with(
+        ("data", "attributes", "commentOn"),
+        "09",
+        "commentOn does not start with '09'",
+    ),
+    equals(
+        ("data", "attributes", "duplicateComments"),
+        0,
+        "duplicateComments != 0",
+    ),
+    one_of(
+        ("data", "attributes", "subtype"),
+        [None, "Public Comment", "Comment(s)"],
+        "subtype is not an expected value",
+    ),
+    is_type(("data", "attributes", "comment"), str, "comment is not string"),
+    is_type(
+        ("data", "attributes", "modifyDate"),
+        datetime,
+        "modifyDate is not datetime",
+    ),
+    is_type(
+        ("data", "attributes", "postedDate"),
+        datetime,
+        "postedDate is not datetime",
+    ),
+    is_type(
+        ("data", "attributes", "receiveDate"),
+        datetime,
+        "receiveDate is not datetime",
+    ),
+    equals(
+        ("data", "attributes", "withdrawn"), False, "withdrawn is not False"
+    ),
+]
+
+
+def records_to_frame(
+    records: Iterable[Any], rules: Sequence[Rule]
+) -> pl.DataFrame:
+    """
+    Read the id and the fields the rules check out of a batch of records,
+    with a column per field named like `Rule.column`. Missing fields are
+    null.
+
+    Args:
+        records (iterable of json): records from the API
+        rules (list of Rules): the rules the frame will be checked against
+
+    Returns:
+        polars DataFrame with an "id" column and a column per field
+    """
+    records = list(records)
+    fields = dict.fromkeys([("id",)] + [rule.field for rule in rules])
+    parents = {}
+    return pl.DataFrame(
+        [
+            _to_series(".".join(field), _column_values(records, field, parents))
+            for field in fields
+        ]
+    )
+
+
+def _column_values(
+    records: list[Any], field: tuple[str, ...], parents: dict
+) -> list:
+    """
+    Read one field out of every record, or None where it is missing.
+    `parents` caches the values of the fields above it, so fields under the
+    same parent don't walk down to it again.
+    """
+    if not field:
+        return records
+    try:
+        # most batches have every field, so try the fast way first
+        prefix = field[:-1]
+        if prefix not in parents:
+            parents[prefix] = _column_values(records, prefix, parents)
+        return [value[field[-1]] for value in parents[prefix]]
+    except (KeyError, TypeError, IndexError):
+        pass
+
+    values = []
+    for record in records:
+        try:
+            values.append(get_field(record, field))
+        except (KeyError, TypeError, IndexError):
+            values.append(None)
+    return values
+
+
+def _to_series(name: str, values: list) -> pl.Series:
+    """
+    Make a column of values; a value of a different type from the rest of
+    the column is read as null.
+    """
+    if values and all(
+        type(value) is datetime and value.tzinfo is None or value is None
+        for value in values
+    ):
+        # polars converts datetime objects one at a time, far slower than
+        # it reads the integers they count up to
+        return pl.Series(
+            name,
+            [
+                None if value is None else (value - EPOCH) // MICROSECOND
+                for value in values
+            ],
+            dtype=pl.Int64,
+        ).cast(pl.Datetime("us"))
+    return pl.Series(name, values, strict=False)
+
+
+def validate_frame(
+    df: pl.DataFrame,
+    rules: Sequence[Rule],
+    data_type: str,
+    id_column: str = "id",
+) -> pl.DataFrame:
+    """
+    Check every row of a frame against every rule at once.
+
+    Args:
+        df (polars DataFrame): one row per record, with the id and a column
+            for each rule's field, as made by `records_to_frame`
+        rules (list of Rules): rules to check; a missing column is read
+            as all nulls
+        data_type (str): whether docket, document, or comment
+        id_column (str): column holding the record ids
+
+    Returns:
+        polars DataFrame of violations, with the data_id, data_type and the
+        error_message of the rule that failed, a row per failed rule per
+        record
+    """
+    schema = df.schema
+    lazy_df = df.lazy()
+    failed = [
+        lazy_df.filter(~rule.passes(schema.get(rule.column, pl.Null))).select(
+            pl.col(id_column).cast(pl.Utf8).alias("data_id"),
+            pl.lit(data_type).alias("data_type"),
+            pl.lit(rule.message).alias("error_message"),
+        )
+        for rule in rules
+    ]
+    if not failed:
+        return pl.DataFrame(schema=VIOLATION_SCHEMA)
+    return pl.concat(failed).collect()
+
+
+def validate_records(
+    records: Iterable[Any], rules: Sequence[Rule], data_type: str
+) -> pl.DataFrame:
+    """
+    Check a batch of records against every rule, like running the
+    `qa_*_data` function on each one.
+
+    Args:
+        records (iterable of json): records from the API
+        rules (list of Rules): rules to check
+        data_type (str): whether docket, document, or comment
+
+    Returns:
+        polars DataFrame of violations, as returned by `validate_frame`
+    """
+    return validate_frame(records_to_frame(records, rules), rules, data_type)
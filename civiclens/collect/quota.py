@@ -0,0 +1,253 @@
+"""
+Hourly quota scheduler for the regulations.gov API key.
+
+Every collector draws from the same 1,000 requests/hour key, often from
+separate processes (eg the nightly sync and check_doc_status). Instead of
+each one bursting until it gets a 429 and then sleeping for an hour, they all
+ask a shared scheduler for permission before each request. The scheduler
+state lives in a small JSON file guarded by a file lock, so every process on
+the machine sees the same budget.
+
+Requests are spread evenly over what is left of the hour, and each work
+class has a share of the budget it may not touch, so low priority backfills
+can never starve status checks.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from civiclens.utils.constants import REG_GOV_QUOTA_FILE
+
+
+REQUESTS_PER_HOUR = 1000
+WINDOW_SECONDS = 3600
+BURST = 10
+
+# share of the hourly budget each work class must leave for higher priority
+# work; a class can only spend while more than this share remains
+WORK_CLASSES = {
+    "status": 0.0,
+    "sync": 0.1,
+    "backfill": 0.3,
+}
+
+
+class QuotaScheduler:
+    """
+    Shares one hourly request budget between work classes and processes.
+
+    Pacing uses a generic cell rate algorithm per work class: each class has
+    a theoretical arrival time (TAT) that moves forward by one interval per
+    request, where the interval spreads the class's remaining budget over
+    the rest of the window. A request is allowed once the clock is within
+    `burst - 1` intervals of the TAT, so up to `burst` go back to back.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        limit: int = REQUESTS_PER_HOUR,
+        window: float = WINDOW_SECONDS,
+        burst: int = BURST,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        """
+        Args:
+            path (str, optional): file to keep the shared state in; if None
+                the state is only shared within this process
+            limit (int): requests allowed per window
+            window (float): length of the quota window in seconds
+            burst (int): requests a class may make back to back before
+                pacing kicks in
+            clock (callable): returns the current time in seconds
+            sleep (callable): waits for a number of seconds
+        """
+        self.path = path
+        self.limit = limit
+        self.window = window
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._memory_state = None
+        self._thread_lock = threading.Lock()
+
+    def _empty_state(self, now: float) -> dict:
+        return {"window_start": now, "used": 0, "blocked_until": 0, "tat": {}}
+
+    @contextmanager
+    def _state(self):
+        """
+        Load the state under an exclusive lock and save it back on exit.
+        """
+        with self._thread_lock:
+            if self.path is None:
+                if self._memory_state is None:
+                    self._memory_state = self._empty_state(self.clock())
+                yield self._memory_state
+                return
+
+            with open(self.path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    contents = f.read()
+                    try:
+                        state = json.loads(contents)
+                    except json.JSONDecodeError:
+                        state = self._empty_state(self.clock())
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _roll_window(self, state: dict, now: float) -> None:
+        if now >= state["window_start"] + self.window:
+            state["window_start"] = now
+            state["used"] = 0
+            state["tat"] = {}
+
+    def _available(self, state: dict, work_class: str) -> int:
+        reserve = int(self.limit * WORK_CLASSES[work_class])
+        return self.limit - reserve - state["used"]
+
+    def try_acquire(self, work_class: str = "sync") -> float:
+        """
+        Take one request from the budget if the work class may send now.
+
+        Args:
+            work_class (str): one of WORK_CLASSES
+
+        Returns:
+            0 if the request was granted, otherwise the number of seconds to
+            wait before asking again
+        """
+        if work_class not in WORK_CLASSES:
+            raise ValueError(f"Unknown work class: {work_class}")
+
+        with self._state() as state:
+            now = self.clock()
+            self._roll_window(state, now)
+            window_end = state["window_start"] + self.window
+
+            if now < state["blocked_until"]:
+                return state["blocked_until"] - now
+
+            available = self._available(state, work_class)
+            if available <= 0:
+                return window_end - now
+
+            interval = (window_end - now) / available
+            tat = max(state["tat"].get(work_class, now), now)
+            allowed_at = tat - (self.burst - 1) * interval
+            if now < allowed_at:
+                return allowed_at - now
+
+            state["tat"][work_class] = tat + interval
+            state["used"] += 1
+            return 0
+
+    def acquire(self, work_class: str = "sync") -> None:
+        """
+        Block until the work class may send a request, then take it from the
+        budget.
+
+        Args:
+            work_class (str): one of WORK_CLASSES
+        """
+        while (wait_time := self.try_acquire(work_class)) > 0:
+            if wait_time > 60:
+                logging.info(
+                    f"Quota for {work_class} requests used up, "
+                    f"waiting {wait_time:.0f} seconds"
+                )
+            self.sleep(wait_time)
+
+    def block(self, seconds: float) -> None:
+        """
+        Stop granting requests to every class for a number of seconds, eg
+        after a 429 with a Retry-After header.
+
+        Args:
+            seconds (float): how long to pause for
+        """
+        with self._state() as state:
+            until = self.clock() + seconds
+            state["blocked_until"] = max(state["blocked_until"], until)
+
+    def record_response(self, response) -> None:
+        """
+        Sync the budget with what the API reports. X-RateLimit-Remaining is
+        authoritative, since other clients may be using the same key, and a
+        429 blocks everyone for Retry-After seconds (or the rest of the
+        window when the header is missing).
+
+        Args:
+            response (requests.Response): response from regulations.gov
+        """
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        with self._state() as state:
+            now = self.clock()
+            self._roll_window(state, now)
+            if remaining is not None and str(remaining).isdigit():
+                state["used"] = max(0, self.limit - int(remaining))
+
+            if response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", None)
+                if retry_after and str(retry_after).isdigit():
+                    wait_time = int(retry_after)
+                else:
+                    # no hint from the server, so treat the window as spent
+                    wait_time = state["window_start"] + self.window - now
+                    state["used"] = self.limit
+                state["blocked_until"] = max(
+                    state["blocked_until"], now + wait_time
+                )
+
+    def budget(self) -> dict:
+        """
+        Report the current state of the hourly budget.
+
+        Returns:
+            dict with the requests used and remaining this window, seconds
+            until the window resets, seconds left on any block, and the
+            requests still available to each work class
+        """
+        with self._state() as state:
+            now = self.clock()
+            self._roll_window(state, now)
+            return {
+                "used": state["used"],
+                "remaining": max(0, self.limit - state["used"]),
+                "resets_in": state["window_start"] + self.window - now,
+                "blocked_for": max(0, state["blocked_until"] - now),
+                "available": {
+                    work_class: max(0, self._available(state, work_class))
+                    for work_class in WORK_CLASSES
+                },
+            }
+
+
+_scheduler = None
+
+
+def get_scheduler() -> QuotaScheduler:
+    """
+    Returns the process-wide scheduler, backed by REG_GOV_QUOTA_FILE so it is
+    shared with other collector processes.
+    """
+    global _scheduler
+    if _scheduler is None:
+        path = REG_GOV_QUOTA_FILE or None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _scheduler = QuotaScheduler(path=path)
+    return _scheduler
@@ -0,0 +1,305 @@
+"""
+Columnar archive of the raw JSON the regulations.gov API returns.
+
+Every docket, document and comment payload is appended, as it arrives, to a
+Parquet file under `<archive>/<data type>/date=<YYYY-MM-DD>/`, partitioned
+by the day it was fetched. Changing how data is cleaned or checked then
+only needs the payloads read back from disk, rather than a re-ingest spread
+over days of rate-limited API calls.
+
+An object fetched more than once is archived each time; reading the archive
+back returns only the latest version of each id. Part files are written to
+a temporary name and renamed, so a reader never sees a partial file and
+several collector processes can share one archive.
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from typing import Callable, Iterable, Iterator, Optional
+
+import polars as pl
+
+from civiclens.utils.constants import RAW_ARCHIVE_DIR
+
+
+DATA_TYPES = ("dockets", "documents", "comments")
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_SCHEMA = {
+    "id": pl.Utf8,
+    "fetched_at": pl.Datetime("us"),
+    "payload": pl.Utf8,
+}
+
+
+class RawArchive:
+    """
+    Append-only Parquet archive of API payloads, partitioned by data type
+    and fetch date.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ):
+        """
+        Args:
+            path (str): directory to keep the archive in
+            batch_size (int): number of payloads `archived` holds before
+                writing them to a part file
+            clock (callable): returns the current time as an aware datetime
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stats = {"payloads": 0, "files": 0}
+
+    def _partition_dir(self, data_type: str, day: date) -> str:
+        return os.path.join(self.path, data_type, f"date={day.isoformat()}")
+
+    def _write(self, data_type: str, rows: list[tuple[str, str]]) -> int:
+        """
+        Write (id, serialized payload) rows to a new part file.
+        """
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"unknown data type {data_type!r}")
+        if not rows:
+            return 0
+
+        fetched_at = self.clock().astimezone(timezone.utc)
+        df = pl.DataFrame(
+            {
+                "id": [obj_id for obj_id, _ in rows],
+                "fetched_at": [fetched_at.replace(tzinfo=None)] * len(rows),
+                "payload": [payload for _, payload in rows],
+            },
+            schema=ARCHIVE_SCHEMA,
+        )
+        partition_dir = self._partition_dir(data_type, fetched_at.date())
+        os.makedirs(partition_dir, exist_ok=True)
+        file_name = (
+            f"part-{fetched_at.strftime('%H%M%S%f')}-{uuid.uuid4().hex}"
+            ".parquet"
+        )
+        path = os.path.join(partition_dir, file_name)
+        tmp_path = f"{path}.tmp"
+        df.write_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._stats["payloads"] += len(rows)
+            self._stats["files"] += 1
+        return len(rows)
+
+    def append(self, data_type: str, payloads: Iterable[dict]) -> int:
+        """
+        Write a batch of payloads to a new part file.
+
+        Args:
+            data_type (str): one of "dockets", "documents" or "comments"
+            payloads (iterable of json): objects returned by the API, each
+                with an "id"
+
+        Returns:
+            number of payloads written
+        """
+        return self._write(
+            data_type,
+            [(payload["id"], json.dumps(payload)) for payload in payloads],
+        )
+
+    def archived(
+        self, data_type: str, payloads: Iterable[dict]
+    ) -> Iterator[dict]:
+        """
+        Pass a stream of payloads through, archiving them in batches. Each
+        payload is serialized before it is yielded, so the caller may clean
+        it in place.
+
+        Args:
+            data_type (str): one of "dockets", "documents" or "comments"
+            payloads (iterable of json): objects returned by the API
+
+        Yields:
+            the same payloads
+        """
+        rows = []
+        try:
+            for payload in payloads:
+                rows.append((payload["id"], json.dumps(payload)))
+                if len(rows) >= self.batch_size:
+                    self._write(data_type, rows)
+                    rows = []
+                yield payload
+        finally:
+            # also runs if the caller stops early
+            self._write(data_type, rows)
+
+    def part_files(
+        self,
+        data_type: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> list[str]:
+        """
+        List the part files for a data type, oldest first.
+
+        Args:
+            data_type (str): one of "dockets", "documents" or "comments"
+            start_date (date, optional): first fetch date to include
+            end_date (date, optional): last fetch date to include
+
+        Returns:
+            list of paths to Parquet files
+        """
+        type_dir = os.path.join(self.path, data_type)
+        if not os.path.isdir(type_dir):
+            return []
+
+        files = []
+        for partition in sorted(os.listdir(type_dir)):
+            day = date.fromisoformat(partition.removeprefix("date="))
+            if (start_date and day < start_date) or (
+                end_date and day > end_date
+            ):
+                continue
+            partition_dir = os.path.join(type_dir, partition)
+            files.extend(
+                os.path.join(partition_dir, file_name)
+                for file_name in sorted(os.listdir(partition_dir))
+                if file_name.endswith(".parquet")
+            )
+        return files
+
+    def latest_versions(self, files: list[str]) -> pl.DataFrame:
+        """
+        Find where the latest version of each id is, reading only the id
+        and fetched_at columns.
+
+        Args:
+            files (list of str): part files, from `part_files`
+
+        Returns:
+            polars DataFrame with the id, and the index of the file and the
+            row in it holding that id's latest payload
+        """
+        if not files:
+            return pl.DataFrame(
+                schema={"id": pl.Utf8, "file": pl.Int64, "row": pl.UInt32}
+            )
+
+        return (
+            pl.concat(
+                [
+                    pl.scan_parquet(path)
+                    .select("id", "fetched_at")
+                    .with_row_index("row")
+                    .with_columns(pl.lit(index, dtype=pl.Int64).alias("file"))
+                    for index, path in enumerate(files)
+                ]
+            )
+            .sort("fetched_at", "file", "row")
+            .unique(subset="id", keep="last")
+            .select("id", "file", "row")
+            .collect()
+        )
+
+    def iter_payloads(
+        self,
+        data_type: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> Iterator[dict]:
+        """
+        Read back the latest version of each payload fetched between two
+        dates, one part file at a time.
+
+        Args:
+            data_type (str): one of "dockets", "documents" or "comments"
+            start_date (date, optional): first fetch date to include
+            end_date (date, optional): last fetch date to include
+
+        Yields:
+            payloads as the API returned them, in the order they were
+            fetched
+        """
+        files = self.part_files(data_type, start_date, end_date)
+        latest = self.latest_versions(files)
+        for index, path in enumerate(files):
+            rows = latest.filter(pl.col("file") == index)["row"]
+            if rows.is_empty():
+                continue
+            payloads = pl.read_parquet(path, columns=["payload"])["payload"]
+            for row in rows.sort():
+                yield json.loads(payloads[row])
+
+    def stats(self) -> dict:
+        """
+        Returns the number of payloads and part files written.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+_archive = None
+
+
+def get_archive() -> Optional[RawArchive]:
+    """
+    Returns the process-wide archive in RAW_ARCHIVE_DIR, or None if
+    RAW_ARCHIVE_DIR isn't set and archiving is off.
+    """
+    global _archive
+    if _archive is None and RAW_ARCHIVE_DIR:
+        _archive = RawArchive(RAW_ARCHIVE_DIR)
+    return _archive
+
+
+def archive(data_type: str, payloads: Iterable[dict]) -> None:
+    """
+    Append payloads to the process-wide archive, if archiving is on.
+
+    Args:
+        data_type (str): one of "dockets", "documents" or "comments"
+        payloads (iterable of json): objects returned by the API
+    """
+    raw_archive = get_archive()
+    if raw_archive is not None:
+        raw_archive.append(data_type, payloads)
+
+
+def archived(data_type: str, payloads: Iterable[dict]) -> Iterable[dict]:
+    """
+    Pass payloads through `RawArchive.archived` on the process-wide archive,
+    or unchanged if archiving is off.
+
+    Args:
+        data_type (str): one of "dockets", "documents" or "comments"
+        payloads (iterable of json): objects returned by the API
+
+    Returns:
+        the same payloads
+    """
+    raw_archive = get_archive()
+    if raw_archive is None:
+        return payloads
+    return raw_archive.archived(data_type, payloads)
+
+
+def log_stats() -> None:
+    """
+    Log a one-line summary of what was archived, if archiving is on.
+    """
+    if _archive is None:
+        return
+    archive_stats = _archive.stats()
+    logging.info(
+        f"raw archive: {archive_stats['payloads']} payloads in "
+        f"{archive_stats['files']} files"
+    )
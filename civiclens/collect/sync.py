@@ -0,0 +1,343 @@
+"""
+Resumable incremental sync of regulations.gov search results.
+
+`pull_reg_gov_data` collects every page of a date range in memory before
+anything is written, so a run that dies partway through starts again from
+nothing and spends the hourly quota a second time. Here each page is handed
+to the caller as soon as it arrives, and once the caller has written it the
+position reached (the `lastModifiedDate` and id of the last object) is saved
+to the regulations_syncstate table. Running the same date range again picks
+up from that cursor.
+
+A crash between writing a page and saving the cursor means that page is
+written again on the next run, so page handlers should be idempotent (the
+inserts into the regulations tables are upserts).
+"""
+
+import logging
+from datetime import date, datetime, timezone
+from typing import Callable, Iterator, Optional
+from zoneinfo import ZoneInfo
+
+from civiclens.collect.access_api_data import (
+    PAGE_SIZE,
+    format_datetime_for_api,
+    get_reg_gov_page,
+)
+from civiclens.utils.database_access import db_connection
+
+
+SORT_ORDER = "lastModifiedDate,documentId"
+# the API's date filters are in Eastern Time
+API_TIMEZONE = ZoneInfo("America/New_York")
+
+
+def new_cursor() -> dict:
+    """
+    Returns the cursor for a date range nothing has been synced for yet.
+    """
+    return {
+        "last_modified_date": None,
+        "last_id": None,
+        "pages": 0,
+        "objects": 0,
+        "completed": False,
+    }
+
+
+class DatabaseSyncState:
+    """
+    Keeps sync cursors in the regulations_syncstate table, one row per type
+    of data and date range.
+    """
+
+    LOAD_QUERY = """
+        SELECT last_modified_date, last_id, pages_synced, objects_synced,
+            completed
+        FROM regulations_syncstate
+        WHERE entity_type = %s AND start_date = %s AND end_date = %s;
+    """
+    SAVE_QUERY = """
+        INSERT INTO regulations_syncstate (entity_type, start_date, end_date,
+            last_modified_date, last_id, pages_synced, objects_synced,
+            completed, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (entity_type, start_date, end_date) DO UPDATE SET
+            last_modified_date = EXCLUDED.last_modified_date,
+            last_id = EXCLUDED.last_id,
+            pages_synced = EXCLUDED.pages_synced,
+            objects_synced = EXCLUDED.objects_synced,
+            completed = EXCLUDED.completed,
+            updated_at = EXCLUDED.updated_at;
+    """
+
+    def __init__(self, params: Optional[dict] = None):
+        """
+        Args:
+            params (dict, optional): keyword arguments for `psycopg2.connect`,
+                defaults to `connection_params()`
+        """
+        self.params = params
+
+    def load(self, entity_type: str, start_date: str, end_date: str) -> dict:
+        with db_connection(self.params) as connection:
+            with connection, connection.cursor() as cursor:
+                cursor.execute(
+                    self.LOAD_QUERY, (entity_type, start_date, end_date)
+                )
+                row = cursor.fetchone()
+
+        if row is None:
+            return new_cursor()
+
+        last_modified_date, last_id, pages, objects, completed = row
+        if last_modified_date is not None:
+            last_modified_date = last_modified_date.astimezone(
+                timezone.utc
+            ).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return {
+            "last_modified_date": last_modified_date,
+            "last_id": last_id,
+            "pages": pages,
+            "objects": objects,
+            "completed": completed,
+        }
+
+    def save(
+        self, entity_type: str, start_date: str, end_date: str, cursor: dict
+    ) -> None:
+        with db_connection(self.params) as connection:
+            with connection, connection.cursor() as db_cursor:
+                db_cursor.execute(
+                    self.SAVE_QUERY,
+                    (
+                        entity_type,
+                        start_date,
+                        end_date,
+                        cursor["last_modified_date"],
+                        cursor["last_id"],
+                        cursor["pages"],
+                        cursor["objects"],
+                        cursor["completed"],
+                    ),
+                )
+
+
+class MemorySyncState:
+    """
+    Keeps sync cursors in a dict, for dry runs and tests.
+    """
+
+    def __init__(self):
+        self.cursors = {}
+
+    def load(self, entity_type: str, start_date: str, end_date: str) -> dict:
+        key = (entity_type, start_date, end_date)
+        return dict(self.cursors.get(key, new_cursor()))
+
+    def save(
+        self, entity_type: str, start_date: str, end_date: str, cursor: dict
+    ) -> None:
+        self.cursors[(entity_type, start_date, end_date)] = dict(cursor)
+
+
+def api_today(now: Optional[datetime] = None) -> date:
+    """
+    Returns the date in the API's timezone, which follows daylight saving
+    time, so it is UTC-4 in summer and UTC-5 in winter.
+
+    Args:
+        now (datetime, optional): an aware datetime, defaults to the current
+            time
+
+    Returns:
+        date: the date in Eastern Time
+    """
+    if now is None:
+        return datetime.now(API_TIMEZONE).date()
+    return now.astimezone(API_TIMEZONE).date()
+
+
+def range_is_open(end_date: str, today: Optional[date] = None) -> bool:
+    """
+    Whether objects can still be modified within a date range, ie it ends
+    today or later in the API's timezone.
+
+    Args:
+        end_date (str): the last date of the range in YYYY-MM-DD format
+        today (date, optional): defaults to the current date in Eastern Time
+
+    Returns:
+        bool: True if the range isn't over yet
+    """
+    if today is None:
+        today = api_today()
+    return date.fromisoformat(end_date) >= today
+
+
+def _after_cursor(objects: list[dict], cursor: dict) -> list[dict]:
+    """
+    Drop the objects on a page that were already handled before the cursor
+    was saved.
+    """
+    if cursor["last_modified_date"] is None:
+        return objects
+
+    ids = [obj["id"] for obj in objects]
+    if cursor["last_id"] in ids:
+        return objects[ids.index(cursor["last_id"]) + 1 :]
+
+    # ISO 8601 timestamps in UTC sort as strings
+    return [
+        obj
+        for obj in objects
+        if obj["attributes"]["lastModifiedDate"] >= cursor["last_modified_date"]
+    ]
+
+
+def iter_sync_pages(
+    api_key: str,
+    data_type: str,
+    start_date: str,
+    end_date: str,
+    cursor: Optional[dict] = None,
+    fetch_page: Callable[..., dict] = get_reg_gov_page,
+) -> Iterator[tuple[list[dict], dict]]:
+    """
+    Page through a date range of documents or comments from a saved cursor,
+    oldest changes first.
+
+    Like `pull_reg_gov_data`, each request asks for the first page modified
+    on or after the last timestamp seen, which keeps clear of the API's
+    limit on page numbers. If a whole page shares one timestamp the page
+    number moves on instead, so the loop can't get stuck.
+
+    Args:
+        api_key (str): regulations.gov API key
+        data_type (str): 'documents' or 'comments'
+        start_date (str): the date in YYYY-MM-DD format to sync from
+            (inclusive)
+        end_date (str): the date in YYYY-MM-DD format to sync to (inclusive)
+        cursor (dict, optional): where a previous run got to, from a sync
+            state store; defaults to the start of the range
+        fetch_page (callable): sends one request, with the signature of
+            `get_reg_gov_page`
+
+    Yields:
+        tuple of the new objects on each page and the cursor to save once
+        they are written
+    """
+    cursor = dict(cursor) if cursor is not None else new_cursor()
+    if cursor["last_modified_date"] is not None:
+        modified_since = format_datetime_for_api(cursor["last_modified_date"])
+    else:
+        modified_since = f"{start_date} 00:00:00"
+    page_number = 1
+
+    while True:
+        params = {
+            "filter[lastModifiedDate][ge]": modified_since,
+            "filter[lastModifiedDate][le]": f"{end_date} 23:59:59",
+            "sort": SORT_ORDER,
+            "page[size]": PAGE_SIZE,
+            "page[number]": page_number,
+        }
+        r_json = fetch_page(api_key, data_type, params)
+        page = r_json["data"]
+
+        objects = _after_cursor(page, cursor)
+        if objects:
+            cursor["last_modified_date"] = objects[-1]["attributes"][
+                "lastModifiedDate"
+            ]
+            cursor["last_id"] = objects[-1]["id"]
+        cursor["pages"] += 1
+        cursor["objects"] += len(objects)
+        cursor["completed"] = len(page) < PAGE_SIZE or not r_json["meta"].get(
+            "hasNextPage", False
+        )
+
+        yield objects, dict(cursor)
+
+        if cursor["completed"]:
+            return
+
+        last_modified = format_datetime_for_api(
+            page[-1]["attributes"]["lastModifiedDate"]
+        )
+        page_number = page_number + 1 if last_modified == modified_since else 1
+        modified_since = last_modified
+
+
+def sync_date_range(
+    api_key: str,
+    data_type: str,
+    start_date: str,
+    end_date: str,
+    handle_page: Callable[[list[dict]], None],
+    state=None,
+    restart: bool = False,
+    fetch_page: Callable[..., dict] = get_reg_gov_page,
+    today: Optional[date] = None,
+) -> dict:
+    """
+    Sync a date range of documents or comments, saving the cursor after each
+    page is handled so an interrupted run resumes where it stopped.
+
+    A range is only saved as completed once it has ended, so running a range
+    that ends today again picks up anything modified since the last run.
+
+    Args:
+        api_key (str): regulations.gov API key
+        data_type (str): 'documents' or 'comments'
+        start_date (str): the date in YYYY-MM-DD format to sync from
+            (inclusive)
+        end_date (str): the date in YYYY-MM-DD format to sync to (inclusive)
+        handle_page (callable): writes a list of objects from the API
+        state (optional): where cursors are kept, with `load` and `save`
+            methods; defaults to a DatabaseSyncState
+        restart (bool): ignore any saved cursor and start from the beginning
+            of the range
+        fetch_page (callable): sends one request, with the signature of
+            `get_reg_gov_page`
+        today (date, optional): the current date in the API's timezone,
+            defaults to the date now in Eastern Time
+
+    Returns:
+        dict: the final cursor, with the pages and objects synced so far
+    """
+    state = state if state is not None else DatabaseSyncState()
+    cursor = (
+        new_cursor() if restart else state.load(data_type, start_date, end_date)
+    )
+
+    still_open = range_is_open(end_date, today)
+
+    if cursor["completed"] and not still_open:
+        logging.info(
+            f"{data_type} from {start_date} to {end_date} already synced"
+        )
+        return cursor
+    if cursor["last_modified_date"] is not None:
+        logging.info(
+            f"resuming {data_type} sync after {cursor['last_id']} "
+            f"(modified {cursor['last_modified_date']}), "
+            f"{cursor['pages']} pages done"
+        )
+
+    pages = iter_sync_pages(
+        api_key, data_type, start_date, end_date, cursor, fetch_page
+    )
+    for objects, page_cursor in pages:
+        if objects:
+            handle_page(objects)
+        # objects can still change later today, so check again next run
+        page_cursor["completed"] &= not still_open
+        state.save(data_type, start_date, end_date, page_cursor)
+        cursor = page_cursor
+        logging.info(
+            f"synced page {cursor['pages']} of {data_type}: "
+            f"{len(objects)} new, {cursor['objects']} total"
+        )
+
+    return cursor
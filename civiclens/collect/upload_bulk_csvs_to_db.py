@@ -6,25 +6,57 @@ Adding comments to the db is faster with this method than via API
 """
 
 import argparse
+import io
+import logging
 from datetime import datetime
+from typing import Iterable, Iterator
 
 import polars as pl
+import psycopg2
 
 from civiclens.collect.access_api_data import pull_reg_gov_data
 from civiclens.collect.move_data_from_api_to_database import (
-    insert_comment_into_db,
+    COMMENT_COLUMNS,
+    DATABASE_PARAMS,
+    comment_upsert_from_table,
+    content_hash_expr,
+    record_upserts,
+    upsert_comment_rows,
 )
 from civiclens.utils.constants import REG_GOV_API_KEY
+from civiclens.utils.database_access import db_connection
+from civiclens.utils.text import clean_text_expr
 
 
-def load_data(file_name: str) -> pl.DataFrame([]):
-    """
-    Loads csv file into a polars df of comments and filters out null comments
-    """
-    q = pl.scan_csv(file_name).filter(~pl.col("Comment").is_null())
-    df = q.collect()
+CSV_BATCH_SIZE = 50_000
+BULK_DATE_FORMAT = "%Y-%m-%dT%H:%MZ"
+STAGING_TABLE = "comment_staging"
 
-    return df
+# bulk download csv header for each comments table column that is copied
+# across as text
+BULK_CSV_TEXT_COLUMNS = {
+    "id": "Document ID",  # this is the ID field, confusingly named
+    "document_id": "Comment on Document ID",
+    "state_province_region": "State/Province",
+    "subtype": "Document Subtype",
+    "first_name": "First Name",
+    "last_name": "Last Name",
+    "city": "City",
+    "category": "Category",
+    "country": "Country",
+    "gov_agency": "Government Agency",
+    "gov_agency_type": "Government Agency Type",
+    "organization": "Organization Name",
+    "title": "Title",
+    "tracking_nbr": "Tracking Number",
+    "reason_withdrawn": "Reason Withdrawn",
+    "zip": "Zip/Postal Code",
+    "restrict_reason": "Restrict Reason",
+    "restrict_reason_type": "Restrict Reason Type",
+    "submitter_rep": "Submitter Representative",
+    "submitter_rep_address": "Representative's Address",
+    "submitter_rep_city_state": "Representative's City, State & Zip",
+}
 
 
 def get_document_objectId(doc_id: str) -> str:
@@ -147,33 +179,202 @@ def extract_fields_from_row(
     return comment_data
 
 
-def load_bulk_comments_csv_to_db(file_name: str) -> None:
+def bulk_date_expr(column: str) -> pl.Expr:
+    """
+    Parse a bulk download date column (eg "2024-03-06T05:00Z") into UTC
+    datetimes; the polars equivalent of `format_date`. Blank or malformed
+    dates become null.
+    """
+    return (
+        pl.col(column)
+        .str.strptime(pl.Datetime("us"), BULK_DATE_FORMAT, strict=False)
+        .dt.replace_time_zone("UTC")
+    )
+
+
+def comment_frame(batch: pl.DataFrame, doc_objectId: str) -> pl.DataFrame:
+    """
+    Turn a batch of bulk download csv rows into rows of the comments table,
+    one column per COMMENT_COLUMNS entry, with the same values
+    `extract_fields_from_row` gives plus cleaned comment text. Rows without
+    a comment are dropped.
+
+    Args:
+        batch (polars df): csv rows, with every column read as a string
+        doc_objectId (str): the object id for the doc the comments are on
+
+    Returns: polars df of comments ready to be loaded into the db
+    """
+    exprs = {
+        column: pl.col(header).cast(pl.Utf8)
+        for column, header in BULK_CSV_TEXT_COLUMNS.items()
+    }
+    exprs.update(
+        {
+            "object_id": pl.lit(doc_objectId, dtype=pl.Utf8),
+            "duplicate_comments": pl.col("Duplicate Comments")
+            .cast(pl.Int64, strict=False)
+            .fill_null(0),
+            "page_count": pl.col("Page Count")
+            .cast(pl.Int64, strict=False)
+            .fill_null(0),
+            "withdrawn": pl.col("Is Withdrawn?")
+            .cast(pl.Utf8)
+            .str.to_lowercase()
+            .is_in(["true", "t", "yes", "1"])
+            .fill_null(False),
+            "posted_date": bulk_date_expr("Posted Date"),
+            "receive_date": bulk_date_expr("Received Date"),
+            "modify_date": pl.lit(None, dtype=pl.Datetime("us", "UTC")),
+            "comment": clean_text_expr("Comment"),
+        }
+    )
+
+    data_columns = COMMENT_COLUMNS[:-1]
+    return (
+        batch.filter(pl.col("Comment").is_not_null())
+        .select(
+            exprs.get(column, pl.lit(None, dtype=pl.Utf8)).alias(column)
+            for column in data_columns
+        )
+        .with_columns(
+            # the same hash as `comment_row`, so unchanged comments are
+            # skipped when a file is loaded again
+            content_hash_expr(data_columns).alias("content_hash")
+        )
+    )
+
+
+def iter_bulk_comment_frames(
+    file_name: str, batch_size: int = CSV_BATCH_SIZE
+) -> Iterator[pl.DataFrame]:
+    """
+    Stream a bulk download csv in batches of roughly `batch_size` rows,
+    so memory use doesn't grow with the size of the file
+
+    Args:
+        file_name (str): the filepath and name of the csv file
+        batch_size (int): rows to read at a time
+
+    Yields: polars df of comments ready to be loaded into the db
+    """
+    reader = pl.read_csv_batched(
+        file_name, batch_size=batch_size, infer_schema_length=0
+    )
+    doc_objectId = None
+    while batches := reader.next_batches(1):
+        for batch in batches:
+            if doc_objectId is None:
+                # get the document objectId, which is not included in the
+                # csv fields. We assume this id is the same for all rows,
+                # which is a reasonable assumption given the csv is based
+                # on a single document
+                doc_ids = batch.filter(pl.col("Comment").is_not_null())[
+                    "Comment on Document ID"
+                ]
+                if doc_ids.is_empty():
+                    continue
+                doc_objectId = doc_ids[0]
+            yield comment_frame(batch, doc_objectId)
+
+
+def _copy_frame_to_staging(cursor, frame: pl.DataFrame) -> None:
+    buffer = io.BytesIO()
+    frame.write_csv(
+        buffer, include_header=False, datetime_format="%Y-%m-%dT%H:%M:%S%z"
+    )
+    buffer.seek(0)
+    columns = ", ".join(f'"{column}"' for column in frame.columns)
+    cursor.copy_expert(
+        f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def copy_comment_frames_to_db(frames: Iterable[pl.DataFrame]) -> dict:
+    """
+    Load batches of comments into the comments table over one pooled
+    connection.
+    Each batch is COPYed into a temporary staging table and merged into
+    regulations_comment in its own transaction. If that fails, the batch is
+    rolled back and upserted row by row so only the bad rows are lost.
+
+    Args:
+        frames (iterable of polars df): batches from `comment_frame`
+
+    Returns: dict with the number of comments written, the number skipped
+        as unchanged, and a list of errors for the comments that could not
+        be inserted
+    """
+    summary = {"written": 0, "skipped": 0, "errors": []}
+    merge_query = comment_upsert_from_table(STAGING_TABLE)
+
+    with db_connection(DATABASE_PARAMS) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""CREATE TEMP TABLE IF NOT EXISTS
+                {STAGING_TABLE}
+                (LIKE regulations_comment INCLUDING DEFAULTS)
+                ON COMMIT DELETE ROWS;"""
+            )
+            connection.commit()
+
+            for frame in frames:
+                try:
+                    _copy_frame_to_staging(cursor, frame)
+                    cursor.execute(merge_query)
+                    written = cursor.rowcount
+                    connection.commit()
+                    record_upserts("comments", written, frame.height)
+                    summary["written"] += written
+                    summary["skipped"] += frame.height - written
+                    continue
+                except psycopg2.Error as e:
+                    connection.rollback()
+                    logging.warning(
+                        f"copying {frame.height} comments failed ({e}), "
+                        "retrying them with inserts"
+                    )
+
+                written, errors = upsert_comment_rows(
+                    {row[0]: row for row in frame.iter_rows()}
+                )
+                summary["written"] += written
+                summary["skipped"] += frame.height - written - len(errors)
+                summary["errors"].extend(errors)
+
+    return summary
+
+
+def load_bulk_comments_csv_to_db(
+    file_name: str, batch_size: int = CSV_BATCH_SIZE
+) -> None:
     """
     Takes a csv of bulk downloaded comments and puts them in the comments db
     table
 
     Args: file_name (str): the filepath and name of the csv file, eg,
         "~/Downloads/lve-blav-h8al.csv"
+        batch_size (int): rows to read and load at a time
 
     Returns: nothing; adds the comments to the db
     """
-    df = load_data(file_name)
-
-    # get the document objectId, which is not included in the csv fields.
-    # We assume this id is the same for all rows, which is a reasonable
-    # assumption given the csv is based on a single document
-    doc_objectId = df[0]["Comment on Document ID"].item()
-    print_counter = 0
-    print(f"{len(df)} comments to process")
-    for row in df.rows(named=True):
-        comment_data = extract_fields_from_row(row, doc_objectId)
-        response = insert_comment_into_db(comment_data)
-        if response["error"]:
-            print(response["description"])
-        if print_counter % 500 == 0:
+
+    def frames():
+        processed = 0
+        for frame in iter_bulk_comment_frames(file_name, batch_size):
+            yield frame
+            processed += frame.height
             the_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"processed {print_counter} comments at {the_time}")
-        print_counter += 1
+            print(f"processed {processed} comments at {the_time}")
+
+    # comments that fail to insert are logged as they happen
+    response = copy_comment_frames_to_db(frames())
+    print(
+        f"{response['written']} comments written, "
+        f"{response['skipped']} unchanged, "
+        f"{len(response['errors'])} failed"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+"""
+Approximate paraphrase mining for documents with too many comments to
+compare every pair.
+
+The embeddings are clustered with spherical k-means into inverted lists
+(an IVF index). Each comment is then only compared with the comments in
+the `n_probe` lists whose centroids are closest to it, so the work grows
+with the number of comments times the size of a few lists rather than with
+its square. Pairs are returned in the same [score, idx1, idx2] form as
+`sentence_transformers.util.paraphrase_mining`, keeping each comment's
+`top_k` neighbours above a similarity threshold.
+"""
+
+from typing import Optional
+
+import numpy as np
+import polars as pl
+
+
+ANN_TOP_K = 100
+ANN_MIN_SIMILARITY = 0.5
+ANN_N_PROBE = 8
+ANN_MAX_PAIRS = 500_000
+# documents with more comments than this use the index in "auto" mode
+ANN_MIN_COMMENTS = 20_000
+TRAIN_POINTS_PER_LIST = 64
+QUERY_CHUNK_SIZE = 1024
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Returns float32 copies of the vectors scaled to unit length, so their
+    dot products are cosine similarities.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def nearest_centroids(
+    vectors: np.ndarray, centroids: np.ndarray, n: int
+) -> np.ndarray:
+    """
+    Finds the `n` centroids most similar to each vector.
+
+    Args:
+        vectors (np.ndarray): unit length vectors
+        centroids (np.ndarray): unit length centroids
+        n (int): number of centroids to return per vector
+
+    Returns:
+        int array with a row of `n` centroid indices per vector, in no
+        particular order
+    """
+    nearest = np.empty((len(vectors), n), dtype=np.int64)
+    for start in range(0, len(vectors), QUERY_CHUNK_SIZE):
+        scores = vectors[start : start + QUERY_CHUNK_SIZE] @ centroids.T
+        if n < len(centroids):
+            top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        else:
+            top = np.argsort(-scores, axis=1)
+        nearest[start : start + QUERY_CHUNK_SIZE] = top
+    return nearest
+
+
+def train_centroids(
+    vectors: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0
+) -> np.ndarray:
+    """
+    Clusters a sample of the vectors with spherical k-means.
+
+    Args:
+        vectors (np.ndarray): unit length vectors
+        n_lists (int): number of clusters
+        n_iter (int): rounds of k-means to run
+        seed (int): seed for sampling the vectors and first centroids
+
+    Returns:
+        array of `n_lists` unit length centroids
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * TRAIN_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)]
+
+    for _ in range(n_iter):
+        assigned = nearest_centroids(sample, centroids, 1)[:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assigned, sample)
+        empty = np.bincount(assigned, minlength=n_lists) == 0
+        # restart empty clusters from random vectors
+        sums[empty] = sample[rng.choice(sample_size, empty.sum())]
+        centroids = normalize(sums)
+
+    return centroids
+
+
+def _group(keys: np.ndarray, n_groups: int) -> list[np.ndarray]:
+    """
+    Returns, for each key from 0 to `n_groups`, the positions holding it.
+    """
+    order = np.argsort(keys, kind="stable")
+    bounds = np.searchsorted(keys[order], np.arange(n_groups + 1))
+    return [order[bounds[i] : bounds[i + 1]] for i in range(n_groups)]
+
+
+class IVFIndex:
+    """
+    Inverted file index over a fixed set of embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = 10,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            embeddings (np.ndarray): one embedding per comment
+            n_lists (int): number of inverted lists, by default the square
+                root of the number of comments
+            n_iter (int): rounds of k-means to train the lists with
+            seed (int): seed for training
+        """
+        self.vectors = normalize(embeddings)
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(self.vectors)))
+        self.n_lists = max(1, min(n_lists, len(self.vectors)))
+        self.centroids = train_centroids(
+            self.vectors, self.n_lists, n_iter=n_iter, seed=seed
+        )
+        assigned = nearest_centroids(self.vectors, self.centroids, 1)[:, 0]
+        self.lists = _group(assigned, self.n_lists)
+
+    def _search_list(
+        self, members: np.ndarray, queries: np.ndarray, top_k: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds each query's `top_k` most similar vectors in one list.
+
+        Returns:
+            query, neighbour and similarity arrays of the same shape
+        """
+        k = min(top_k, len(members))
+        scores = self.vectors[queries] @ self.vectors[members].T
+        # a comment is not its own neighbour
+        scores[queries[:, None] == members[None, :]] = -np.inf
+        if k < len(members):
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(k), scores.shape)
+        return (
+            np.broadcast_to(queries[:, None], top.shape),
+            members[top],
+            np.take_along_axis(scores, top, axis=1),
+        )
+
+    def pairs(
+        self,
+        top_k: int = ANN_TOP_K,
+        min_similarity: float = ANN_MIN_SIMILARITY,
+        n_probe: int = ANN_N_PROBE,
+        max_pairs: int = ANN_MAX_PAIRS,
+    ) -> list[list]:
+        """
+        Mines pairs of similar comments from the index.
+
+        Args:
+            top_k (int): neighbours to keep per comment
+            min_similarity (float): lowest cosine similarity to keep
+            n_probe (int): lists each comment is compared against; probing
+                every list gives the exact result
+            max_pairs (int): most pairs to return
+
+        Returns:
+            list of [similarity, idx1, idx2] with idx1 < idx2, most similar
+            first
+        """
+        n_probe = min(n_probe, self.n_lists)
+        probes = nearest_centroids(self.vectors, self.centroids, n_probe)
+        query_ids = np.repeat(np.arange(len(self.vectors)), n_probe)
+        probing = _group(probes.ravel(), self.n_lists)
+
+        found = {"query": [], "neighbour": [], "similarity": []}
+        min_score, num_found = min_similarity, 0
+        for members, positions in zip(self.lists, probing, strict=True):
+            if not len(members):
+                continue
+            for start in range(0, len(positions), QUERY_CHUNK_SIZE):
+                queries = query_ids[positions[start : start + QUERY_CHUNK_SIZE]]
+                query, neighbour, similarity = self._search_list(
+                    members, queries, top_k
+                )
+                keep = similarity >= min_score
+                found["query"].append(query[keep])
+                found["neighbour"].append(neighbour[keep])
+                found["similarity"].append(similarity[keep])
+                num_found += int(keep.sum())
+
+            if num_found > 4 * max_pairs:
+                # each pair is found at most once from either end, so the
+                # best max_pairs are among the best 2 * max_pairs found
+                found, min_score = _best(found, 2 * max_pairs)
+                num_found = 2 * max_pairs
+
+        return _to_pairs(found, top_k, max_pairs)
+
+
+def _best(found: dict, n: int) -> tuple[dict, float]:
+    """
+    Keeps the `n` most similar candidates found so far.
+
+    Returns:
+        the remaining candidates and the lowest similarity among them
+    """
+    similarity = np.concatenate(found["similarity"])
+    keep = np.argpartition(-similarity, n - 1)[:n]
+    best = {
+        key: [np.concatenate(values)[keep]] for key, values in found.items()
+    }
+    return best, float(best["similarity"][0].min())
+
+
+def _to_pairs(found: dict, top_k: int, max_pairs: int) -> list[list]:
+    """
+    Keeps each comment's `top_k` neighbours and turns them into unique
+    pairs.
+    """
+    if not found["query"]:
+        return []
+    df = pl.DataFrame(
+        {key: np.concatenate(values) for key, values in found.items()}
+    )
+    df = (
+        df.sort("similarity", descending=True)
+        .group_by("query", maintain_order=True)
+        .head(top_k)
+        .select(
+            pl.min_horizontal("query", "neighbour").alias("idx1"),
+            pl.max_horizontal("query", "neighbour").alias("idx2"),
+            "similarity",
+        )
+        .sort("similarity", descending=True)
+        .unique(subset=["idx1", "idx2"], keep="first", maintain_order=True)
+        .head(max_pairs)
+    )
+    return [
+        [similarity, idx1, idx2] for idx1, idx2, similarity in df.iter_rows()
+    ]
+
+
+def paraphrase_mining_ann(
+    embeddings: np.ndarray,
+    top_k: int = ANN_TOP_K,
+    min_similarity: float = ANN_MIN_SIMILARITY,
+    n_probe: int = ANN_N_PROBE,
+    max_pairs: int = ANN_MAX_PAIRS,
+    n_lists: Optional[int] = None,
+) -> list[list]:
+    """
+    Approximate counterpart of `util.paraphrase_mining_embeddings`.
+
+    Args:
+        embeddings (np.ndarray): one embedding per comment
+        top_k (int): neighbours to keep per comment
+        min_similarity (float): lowest cosine similarity to keep
+        n_probe (int): inverted lists each comment is compared against
+        max_pairs (int): most pairs to return
+        n_lists (int): number of inverted lists, by default the square
+            root of the number of comments
+
+    Returns:
+        list of [similarity, idx1, idx2], most similar first
+    """
+    if len(embeddings) < 2:
+        return []
+    index = IVFIndex(embeddings, n_lists=n_lists)
+    return index.pairs(
+        top_k=top_k,
+        min_similarity=min_similarity,
+        n_probe=n_probe,
+        max_pairs=max_pairs,
+    )
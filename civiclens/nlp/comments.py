@@ -1,10 +1,22 @@
+from typing import Optional, Union
+
 import networkx as nx
 import numpy as np
 import polars as pl
+import torch
 from networkx.algorithms.community import louvain_communities
 from sentence_transformers import SentenceTransformer, util
 from sklearn.cluster import AgglomerativeClustering
 
+from civiclens.nlp.ann import ANN_MIN_COMMENTS, paraphrase_mining_ann
+from civiclens.nlp.dedup import collapse_duplicates
+from civiclens.nlp.embeddings import EmbeddingStore
+from civiclens.nlp.graph import (
+    SimilarityGraph,
+    central_nodes,
+    louvain_clusters,
+    similarity_graph,
+)
 from civiclens.nlp.tools import RepComments
 from civiclens.utils.database_access import Database, pull_data
 
@@ -46,8 +58,36 @@ def get_doc_comments(id: str) -> pl.DataFrame:
     return filtered_df
 
 
+def comment_embeddings(
+    df: pl.DataFrame,
+    model: SentenceTransformer,
+    store: Optional[EmbeddingStore] = None,
+) -> np.ndarray:
+    """Embeds the comments of a df, through the embedding store if there is
+    one
+
+    Args:
+        df (pl.DataFrame): df with comment data
+        model (SentenceTransformer): sbert sentence transformer model
+        store (EmbeddingStore): optional store of comment embeddings
+
+    Returns:
+        np.ndarray: one embedding per comment
+    """
+    if store is None:
+        return model.encode(
+            df["comment"].to_list(),
+            convert_to_numpy=True,
+            show_progress_bar=True,
+        )
+    return store.embed(df["id"].to_list(), df["comment"].to_list(), model)
+
+
 def comment_similarity(
-    df: pl.DataFrame, model: SentenceTransformer
+    df: pl.DataFrame,
+    model: SentenceTransformer,
+    store: Optional[EmbeddingStore] = None,
+    method: str = "exact",
 ) -> pl.DataFrame:
     """Create df with comment mappings and their semantic similarity scores
     according to the SBERT paraphrase mining method using the all-mpnet-base-v2
@@ -56,14 +96,32 @@ def comment_similarity(
     Args:
         df (pl.DataFrame): df with comment data
         model (SentenceTransformer): sbert sentence transformer model
+        store (EmbeddingStore): if given, comment embeddings are read from
+            it and only comments it does not have are encoded
+        method (str): "exact" compares every pair of comments, "ann" only
+            compares comments near each other in an IVF index and drops
+            pairs below its similarity threshold, and "auto" uses "ann" for
+            documents with more than ANN_MIN_COMMENTS comments
 
     Returns:
         df_paraphrase, df_form_letter (tuple[pl.DataFrame]): cosine
             similarities for form letters and non form letters
     """
-    paraphrases = util.paraphrase_mining(
-        model, df["comment"].to_list(), show_progress_bar=True
-    )
+    if method == "auto":
+        method = "ann" if df.shape[0] > ANN_MIN_COMMENTS else "exact"
+
+    if method == "ann":
+        paraphrases = paraphrase_mining_ann(
+            comment_embeddings(df, model, store)
+        )
+    elif store is None:
+        paraphrases = util.paraphrase_mining(
+            model, df["comment"].to_list(), show_progress_bar=True
+        )
+    else:
+        paraphrases = util.paraphrase_mining_embeddings(
+            torch.from_numpy(comment_embeddings(df, model, store))
+        )
     df_full = pl.DataFrame(
         {
             "similarity": pl.Series(
@@ -104,6 +162,27 @@ def count_unique_comments(df: pl.DataFrame) -> int:
     return len(set(indices))
 
 
+def duplicated_nodes(df: pl.DataFrame) -> list[int]:
+    """Finds the rows of a df of collapsed comments that stand for more than
+    one comment
+
+    Args:
+        df (pl.DataFrame): df of comments, with a copies column if
+            duplicates were collapsed
+
+    Returns:
+        list[int]: indices of the rows with copies
+    """
+    if "copies" not in df.columns:
+        return []
+    return (
+        df.with_row_index("idx")
+        .filter(pl.col("copies") > 1)["idx"]
+        .cast(pl.Int64)
+        .to_list()
+    )
+
+
 def build_graph(df: pl.DataFrame) -> nx.Graph:
     """Builds a network graph with comments as nodes and their similarities as
     weights
@@ -137,6 +216,28 @@ def get_clusters(G: nx.Graph) -> list[set[int]]:
     return louvain_communities(G=G)
 
 
+def cluster_labels(clusters: list[set[int]], rows: int) -> pl.Series:
+    """Turns clusters of row indices into a label per row
+
+    Args:
+        clusters (list[set[int]]): clusters from Louvain Communities
+        rows (int): number of rows in the df the clusters index
+
+    Returns:
+        pl.Series: position of each row's cluster in `clusters`, null for
+            rows in no cluster
+    """
+    sizes = [len(cluster) for cluster in clusters]
+    members = np.fromiter(
+        (row for cluster in clusters for row in cluster),
+        dtype=np.int64,
+        count=sum(sizes),
+    )
+    labels = np.full(rows, -1, dtype=np.int64)
+    labels[members] = np.repeat(np.arange(len(clusters)), sizes)
+    return pl.Series("cluster", labels).set(pl.Series(labels < 0), None)
+
+
 def assign_clusters(df: pl.DataFrame, clusters: list[set[int]]) -> pl.DataFrame:
     """Inserts cluster info into the polars df of data from the initial pull
 
@@ -145,34 +246,35 @@ def assign_clusters(df: pl.DataFrame, clusters: list[set[int]]) -> pl.DataFrame:
         clusters (list[set[int]]): clusters from Louvain Communities
 
     Returns:
-        pl.DataFrame: updated df
+        pl.DataFrame: updated df, rows in no cluster keep their old value
     """
-    rows = df.shape[0]
-    # go through clusters and add that info to df
-    for i, cluster_data in enumerate(clusters):
-        df = df.with_columns(
-            pl.when(pl.arange(0, rows).is_in(cluster_data))
-            .then(i)
-            .otherwise(pl.col("cluster"))
-            .alias("cluster")
-        )
-
-    return df
+    labels = cluster_labels(clusters, df.shape[0])
+    return df.with_columns(
+        pl.when(labels.is_not_null())
+        .then(labels)
+        .otherwise(pl.col("cluster"))
+        .alias("cluster")
+    )
 
 
-def find_central_node(G: nx.Graph, clusters: list[set[int]]) -> dict:
+def find_central_node(
+    G: Union[nx.Graph, SimilarityGraph], clusters: list[set[int]]
+) -> dict:
     """Find the most representative comment in a cluster by identifying the
     most central node
 
     Args:
-        G (nx.Graph): network graph with comments as nodes and their
-            similarities as weights
+        G (nx.Graph or SimilarityGraph): network graph with comments as nodes
+            and their similarities as weights
         clusters (list[set[int]]): clusters from Louvain Communities
 
     Returns:
         dict: dictionary with the central comment id as the key and the degree
             centrality as the value
     """
+    if isinstance(G, SimilarityGraph):
+        return central_nodes(G, clusters)
+
     centrality_per_cluster = {}
     for cluster in clusters:
         # focus on each specific cluster of comments
@@ -187,7 +289,10 @@ def find_central_node(G: nx.Graph, clusters: list[set[int]]) -> dict:
 
 
 def representative_comments(
-    G: nx.Graph, clusters: list[set[int]], df: pl.DataFrame, form_letter: bool
+    G: Union[nx.Graph, SimilarityGraph],
+    clusters: list[set[int]],
+    df: pl.DataFrame,
+    form_letter: bool,
 ) -> pl.DataFrame:
     """Creates a dataframe with the text of the representative comments along
     with the number of comments that are semantically represented by that text
@@ -210,7 +315,11 @@ def representative_comments(
         "form_letter": [],
     }
     for i, community in enumerate(clusters):
-        community_size = len(community)
+        # a comment collapsed from duplicates represents all its copies
+        if "copies" in df.columns:
+            community_size = df["copies"].gather(list(community)).sum()
+        else:
+            community_size = len(community)
         central_node = list(central_nodes.keys())[i]
         representative_dict.get("comments_represented").append(community_size)
         representative_dict.get("comment_id").append(df[central_node, 0])
@@ -251,7 +360,10 @@ def compute_similiarity_clusters(
 
 
 def find_form_letters(
-    df: pl.DataFrame, model: SentenceTransformer, form_threshold: int
+    df: pl.DataFrame,
+    model: SentenceTransformer,
+    form_threshold: int,
+    store: Optional[EmbeddingStore] = None,
 ) -> tuple[list[dict], int]:
     """
     Finds and extracts from letters by clustering, counts number of unique
@@ -261,6 +373,7 @@ def find_form_letters(
         df: dataframe of comments to extract form letters from
         model: vectorize model for text embeddings
         form_threshold: threshold to consider a comment a form letter
+        store: if given, embeddings of comments it already has are reused
 
     Returns:
         List of form letters, number of unique comments
@@ -273,7 +386,10 @@ def find_form_letters(
     if len(docs) <= 1:  # cannot cluster with less than 2 documents
         return form_letters, num_form_letters
 
-    embeds = model.encode(docs, convert_to_numpy=True)
+    if store is None:
+        embeds = model.encode(docs, convert_to_numpy=True)
+    else:
+        embeds = store.embed(df["comment_id"].to_list(), list(docs), model)
     clusters = compute_similiarity_clusters(embeds, sim_threshold=0.025)
     document_id = df.unique(subset="document_id").select("document_id").item()
 
@@ -314,7 +430,12 @@ def find_form_letters(
 
 
 def rep_comment_analysis(
-    comment_data: RepComments, df: pl.DataFrame, model: SentenceTransformer
+    comment_data: RepComments,
+    df: pl.DataFrame,
+    model: SentenceTransformer,
+    store: Optional[EmbeddingStore] = None,
+    similarity: str = "exact",
+    collapse: bool = True,
 ) -> RepComments:
     """Runs all representative comment code for a document
 
@@ -322,39 +443,61 @@ def rep_comment_analysis(
         comment_data (RepComment): empty RepComment object
         df (dataframe): dataframe of comments pertaining to a document
         model (SentenceTransformer): SBERT model for embeddings
+        store (EmbeddingStore): optional store of comment embeddings, so
+            only new or edited comments are encoded
+        similarity (str): paraphrase mining method for
+            `comment_similarity`, "exact", "ann" or "auto"
+        collapse (bool): whether to collapse exact and near duplicate
+            comments before embedding them, counting each collapsed comment
+            once per copy
 
     Returns:
         RepComment: dataclass with comment data
     """
-    df_paraphrases, df_form_letter = comment_similarity(df, model)
-
-    try:
-        G_paraphrase = build_graph(df_paraphrases)
-        clusters_paraphrase = get_clusters(G=G_paraphrase)
-        df = assign_clusters(df=df, clusters=clusters_paraphrase)
-        df_rep_paraphrase = representative_comments(
-            G_paraphrase, clusters_paraphrase, df, form_letter=False
-        ).sort(pl.col("comments_represented"), descending=True)
-    except ZeroDivisionError:
-        print("Paraphrase Clustering Not Possible: Empty DataFrame")
+    all_comments = df
+    if collapse:
+        df, all_comments = collapse_duplicates(df)
+
+    df_paraphrases, df_form_letter = comment_similarity(
+        df, model, store, method=similarity
+    )
 
-    try:
-        G_form_letter = build_graph(df_form_letter)
-        clusters_form_letter = get_clusters(G=G_form_letter)
-        df = assign_clusters(df=df, clusters=clusters_form_letter)
-        df_rep_form = representative_comments(
-            G_form_letter,
-            clusters_form_letter,
-            df,
-            form_letter=True,
-        ).sort(pl.col("comments_represented"), descending=True)
-    except ZeroDivisionError:
+    G_paraphrase = similarity_graph(df_paraphrases)
+    clusters_paraphrase = louvain_clusters(G_paraphrase)
+    if not clusters_paraphrase:
+        print("Paraphrase Clustering Not Possible: Empty DataFrame")
+    df = assign_clusters(df=df, clusters=clusters_paraphrase)
+    df_rep_paraphrase = representative_comments(
+        G_paraphrase, clusters_paraphrase, df, form_letter=False
+    ).sort(pl.col("comments_represented"), descending=True)
+
+    # collapsed copies are a form letter even if no other text is close
+    G_form_letter = similarity_graph(
+        df_form_letter, extra_nodes=duplicated_nodes(df)
+    )
+    clusters_form_letter = louvain_clusters(G_form_letter)
+    if not clusters_form_letter:
         print("Form Letter Clustering Not Possible: Empty DataFrame")
+    df = assign_clusters(df=df, clusters=clusters_form_letter)
+    df_rep_form = representative_comments(
+        G_form_letter,
+        clusters_form_letter,
+        df,
+        form_letter=True,
+    ).sort(pl.col("comments_represented"), descending=True)
+
+    if collapse:
+        # give every copy the cluster of the comment it was collapsed into
+        all_comments = all_comments.with_columns(
+            df["cluster"].gather(all_comments["group"]).alias("cluster")
+        ).drop("group")
+    else:
+        all_comments = df
 
     # fill out comment class
-    comment_data.doc_comments = df
+    comment_data.doc_comments = all_comments
     form_letters, num_form_letters = find_form_letters(
-        df_rep_form, model, form_threshold=10
+        df_rep_form, model, form_threshold=10, store=store
     )
 
     if df_rep_form.is_empty():
@@ -368,7 +511,7 @@ def rep_comment_analysis(
         comment_data.num_representative_comment = len(comment_data.rep_comments)
 
     num_paraphrased = count_unique_comments(df_paraphrases)
-    comment_data.num_total_comments = df.shape[0]
+    comment_data.num_total_comments = all_comments.shape[0]
     comment_data.num_unique_comments = (
         num_paraphrased + num_form_letters
         if num_paraphrased < comment_data.num_total_comments
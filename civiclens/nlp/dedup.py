@@ -0,0 +1,170 @@
+"""
+Collapses duplicate comments before they are embedded.
+
+Form letter campaigns leave many copies of the same text on a document.
+Comments whose text is the same once case, punctuation and spacing are
+ignored are collapsed first; the remaining texts are then grouped with
+near copies, eg a letter signed with a different name, using MinHash
+signatures of their word shingles and locality sensitive hashing. Each
+group keeps its first comment and the number of comments it stands for,
+so only one text per group needs embedding and counts can still be given
+in comments.
+"""
+
+import zlib
+
+import numpy as np
+import polars as pl
+
+
+NEAR_DUP_THRESHOLD = 0.8
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+LSH_BANDS = 16
+
+
+def normalize_text(texts: pl.Expr) -> pl.Expr:
+    """
+    Lowercases comment text and drops punctuation and extra whitespace.
+    """
+    return (
+        texts.fill_null("")
+        .str.to_lowercase()
+        .str.replace_all(r"[^\w\s]", "")
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars()
+    )
+
+
+def minhash_signatures(
+    texts: list[str], num_perm: int = NUM_PERM, seed: int = 0
+) -> np.ndarray:
+    """
+    MinHash signatures of the word shingles of each text.
+
+    Args:
+        texts (list): normalized texts
+        num_perm (int): number of hash functions in a signature
+        seed (int): seed for drawing the hash functions
+
+    Returns:
+        uint64 array with a signature row per text; the share of positions
+        two rows agree on estimates the Jaccard similarity of the texts'
+        shingles
+    """
+    rng = np.random.default_rng(seed)
+    # multiply-shift hashing of the 32 bit shingle hashes, modulo 2**64
+    a = rng.integers(0, 2**64, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**64, num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        words = text.split()
+        grams = {
+            " ".join(words[start : start + SHINGLE_WORDS])
+            for start in range(max(1, len(words) - SHINGLE_WORDS + 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(gram.encode("utf-8")) for gram in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        )
+        signatures[i] = ((hashes[:, None] * a + b) >> np.uint64(32)).min(axis=0)
+    return signatures
+
+
+def _find(parents: np.ndarray, i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def near_duplicate_groups(
+    texts: list[str],
+    threshold: float = NEAR_DUP_THRESHOLD,
+    num_perm: int = NUM_PERM,
+    bands: int = LSH_BANDS,
+) -> np.ndarray:
+    """
+    Groups texts whose shingles are at least `threshold` similar.
+
+    Texts sharing a band of their MinHash signatures are candidates, and
+    each candidate is compared with the first text in its bucket, so the
+    work stays linear in the number of texts.
+
+    Args:
+        texts (list): normalized texts
+        threshold (float): estimated Jaccard similarity to group texts at
+        num_perm (int): number of hash functions in a signature
+        bands (int): number of LSH bands the signature is split into
+
+    Returns:
+        int array giving the index of each text's group root
+    """
+    signatures = minhash_signatures(texts, num_perm=num_perm)
+    rows = num_perm // bands
+    parents = np.arange(len(texts))
+
+    for band in range(bands):
+        buckets = {}
+        keys = signatures[:, band * rows : (band + 1) * rows]
+        for i, key in enumerate(map(bytes, keys)):
+            first = buckets.setdefault(key, i)
+            if first == i:
+                continue
+            agree = np.mean(signatures[first] == signatures[i])
+            if agree >= threshold:
+                root_first, root_i = _find(parents, first), _find(parents, i)
+                parents[max(root_first, root_i)] = min(root_first, root_i)
+
+    return np.array([_find(parents, i) for i in range(len(texts))])
+
+
+def collapse_duplicates(
+    df: pl.DataFrame,
+    text_column: str = "comment",
+    threshold: float = NEAR_DUP_THRESHOLD,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Collapses exact and near duplicate comments.
+
+    Args:
+        df (pl.DataFrame): comments
+        text_column (str): column with the comment text
+        threshold (float): estimated Jaccard similarity of word shingles
+            above which comments are near duplicates
+
+    Returns:
+        unique_df, df (tuple[pl.DataFrame]): the first comment of each
+            group with a `copies` column counting the comments it stands
+            for, in order of first appearance; and the comments with a
+            `group` column giving the row of their group in unique_df
+    """
+    if df.is_empty():
+        return (
+            df.with_columns(pl.lit(1, dtype=pl.Int64).alias("copies")),
+            df.with_columns(pl.lit(0, dtype=pl.Int64).alias("group")),
+        )
+
+    normalized = df.select(normalize_text(pl.col(text_column)))[text_column]
+    exact_ids = normalized.rank("dense").cast(pl.Int64).to_numpy() - 1
+    texts = np.empty(exact_ids.max() + 1, dtype=object)
+    texts[exact_ids] = normalized.to_numpy()
+
+    roots = near_duplicate_groups(list(texts), threshold)
+    labels = roots[exact_ids]
+    _, first, inverse, counts = np.unique(
+        labels, return_index=True, return_inverse=True, return_counts=True
+    )
+    # number the groups in order of their first comment
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    unique_df = df[first[order]].with_columns(
+        pl.Series("copies", counts[order], dtype=pl.Int64)
+    )
+    return unique_df, df.with_columns(
+        pl.Series("group", rank[inverse], dtype=pl.Int64)
+    )
@@ -0,0 +1,250 @@
+"""
+Persistent store of comment embeddings, so each comment is encoded once.
+
+Vectors are kept per model in a memory-mapped matrix file under
+`<store>/<model id>/`, with an append-only index mapping each comment id to
+the hash of the text it was encoded from and its row in the matrix. A
+lookup returns the stored vector of every comment whose text is unchanged
+and encodes only the rest: new comments get a new row, and an edited
+comment's vector is overwritten in place.
+
+Vectors are written and flushed before their index lines are appended, so
+a crash can at worst leave rows past the end of the index, which are
+reused on the next run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+import polars as pl
+from sentence_transformers import SentenceTransformer
+
+
+INITIAL_ROWS = 1024
+ENCODE_BATCH_SIZE = 64
+INDEX_SCHEMA = {"comment_id": pl.Utf8, "text_hash": pl.Utf8, "row": pl.Int64}
+
+
+def text_hash(text: Optional[str]) -> str:
+    """
+    Returns a hex digest of a comment's text.
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Memory-mapped embeddings of comments keyed by comment id, text hash and
+    model id.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        model_id: str,
+        dtype: str = "float16",
+        initial_rows: int = INITIAL_ROWS,
+    ):
+        """
+        Args:
+            path (str): directory to keep the store in
+            model_id (str): id of the model the vectors come from; each
+                model gets its own matrix
+            dtype (str): float16 or float32, how vectors are stored on disk
+            initial_rows (int): rows to allocate when the matrix is created
+        """
+        self.path = os.path.join(path, model_id.replace("/", "__"))
+        self.model_id = model_id
+        self.dtype = np.dtype(dtype)
+        self.initial_rows = initial_rows
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "encoded": 0}
+        self._vectors = None
+        self.dim = None
+        self.index = {}
+        self._next_row = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @property
+    def _meta_file(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def _index_file(self) -> str:
+        return os.path.join(self.path, "index.tsv")
+
+    @property
+    def _vector_file(self) -> str:
+        return os.path.join(self.path, f"vectors.{self.dtype.name}")
+
+    def _load(self) -> None:
+        """
+        Opens the matrix and reads the index, compacting it if edits have
+        left it mostly superseded lines.
+        """
+        if not os.path.exists(self._meta_file):
+            return
+        with open(self._meta_file) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self._open(os.path.getsize(self._vector_file))
+
+        if not os.path.exists(self._index_file):
+            return
+        lines = pl.read_csv(
+            self._index_file,
+            separator="\t",
+            has_header=False,
+            new_columns=list(INDEX_SCHEMA),
+            schema=INDEX_SCHEMA,
+            quote_char=None,
+        )
+        self.index = {
+            comment_id: (hash_, row)
+            for comment_id, hash_, row in lines.iter_rows()
+        }
+        self._next_row = lines["row"].max() + 1 if lines.height else 0
+        if lines.height > 2 * len(self.index):
+            self._write_index()
+
+    def _open(self, size: int) -> None:
+        """
+        Maps the matrix file, growing it to at least `size` bytes.
+        """
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vector_file, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        rows = size // (self.dim * self.dtype.itemsize)
+        self._vectors = np.memmap(
+            self._vector_file,
+            dtype=self.dtype,
+            mode="r+",
+            shape=(rows, self.dim),
+        )
+
+    def _write_index(self) -> None:
+        """
+        Rewrites the index with one line per comment.
+        """
+        tmp_file = f"{self._index_file}.tmp"
+        with open(tmp_file, "w") as f:
+            for comment_id, (hash_, row) in self.index.items():
+                f.write(f"{comment_id}\t{hash_}\t{row}\n")
+        os.replace(tmp_file, self._index_file)
+
+    def _store(self, rows: dict, hashes: dict, vectors: np.ndarray) -> None:
+        """
+        Writes encoded vectors to the matrix, then records them in the
+        index.
+
+        Args:
+            rows (dict): comment id to position in `vectors`
+            hashes (dict): comment id to the hash of the encoded text
+            vectors (np.ndarray): the encoded vectors
+        """
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._open(self.initial_rows * self.dim * self.dtype.itemsize)
+            with open(self._meta_file, "w") as f:
+                json.dump({"model_id": self.model_id, "dim": self.dim}, f)
+
+        placed = {}
+        for comment_id in rows:
+            if comment_id in self.index:
+                placed[comment_id] = self.index[comment_id][1]
+            else:
+                placed[comment_id] = self._next_row
+                self._next_row += 1
+
+        needed = max(placed.values()) + 1
+        if needed > self._vectors.shape[0]:
+            rows_to_hold = max(needed, 2 * self._vectors.shape[0])
+            self._open(rows_to_hold * self.dim * self.dtype.itemsize)
+
+        for comment_id, position in rows.items():
+            self._vectors[placed[comment_id]] = vectors[position]
+        self._vectors.flush()
+
+        with open(self._index_file, "a") as f:
+            for comment_id, row in placed.items():
+                self.index[comment_id] = (hashes[comment_id], row)
+                f.write(f"{comment_id}\t{hashes[comment_id]}\t{row}\n")
+
+    def embed(
+        self,
+        comment_ids: list[str],
+        texts: list[str],
+        model: SentenceTransformer,
+        batch_size: int = ENCODE_BATCH_SIZE,
+    ) -> np.ndarray:
+        """
+        Get the embeddings of comments, encoding only those that are not
+        stored or whose text has changed since they were.
+
+        Args:
+            comment_ids (list): id of each comment
+            texts (list): text of each comment
+            model (SentenceTransformer): model to encode the misses with
+            batch_size (int): number of texts the model encodes at once
+
+        Returns:
+            float32 array with one row per comment, in the order given
+
+        Raises:
+            ValueError: if there isn't exactly one text per comment id
+        """
+        with self._lock:
+            hashes = {}
+            to_encode = {}
+            for comment_id, text in zip(comment_ids, texts, strict=True):
+                hash_ = text_hash(text)
+                stored = self.index.get(comment_id)
+                if stored is None or stored[0] != hash_:
+                    hashes[comment_id] = hash_
+                    to_encode[comment_id] = text or ""
+
+            if to_encode:
+                vectors = model.encode(
+                    list(to_encode.values()),
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                )
+                self._store(
+                    {comment_id: i for i, comment_id in enumerate(to_encode)},
+                    hashes,
+                    vectors,
+                )
+            self._stats["encoded"] += len(to_encode)
+            self._stats["hits"] += len(comment_ids) - len(to_encode)
+
+            if not comment_ids:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            rows = [self.index[comment_id][1] for comment_id in comment_ids]
+            return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of lookups served from the store, texts encoded
+        and comments stored.
+        """
+        with self._lock:
+            return {**self._stats, "stored": len(self.index)}
+
+    def log_stats(self) -> None:
+        """
+        Logs how many comments were encoded and how many were reused.
+        """
+        stats = self.stats()
+        logging.info(
+            f"embeddings for {self.model_id}: {stats['hits']} reused, "
+            f"{stats['encoded']} encoded, {stats['stored']} stored"
+        )
@@ -0,0 +1,300 @@
+"""
+Sparse similarity graphs of comments, clustered without networkx.
+
+The pairs from paraphrase mining are turned into one symmetric scipy CSR
+matrix in a single step. Communities are found with a parallel form of the
+Louvain method: every node's best move is computed at once from sparse
+products, a random half of the nodes that gain move (fewer if moving them
+together doesn't improve modularity), and the communities are then
+collapsed into nodes of a smaller graph and the process repeated while
+modularity improves. Degree centrality within each community is a
+masked degree sum over the matrix.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+import polars as pl
+import scipy.sparse as sp
+
+
+MAX_LEVELS = 10
+MAX_MOVE_ROUNDS = 32
+MIN_GAIN = 1e-7
+
+
+@dataclass
+class SimilarityGraph:
+    """
+    Comments as nodes of a weighted, undirected graph.
+
+    Attributes:
+        matrix (sp.csr_matrix): symmetric similarity weights between
+            nodes, by position
+        nodes (np.ndarray): the comment index each position stands for,
+            ascending
+    """
+
+    matrix: sp.csr_matrix
+    nodes: np.ndarray
+
+
+def similarity_graph(
+    df: pl.DataFrame, extra_nodes: Iterable[int] = ()
+) -> SimilarityGraph:
+    """Builds a sparse graph with comments as nodes and their similarities as
+    weights
+
+    Args:
+        df (pl.DataFrame): df with pairs of comment indices and a cosine
+            similarity
+        extra_nodes (iterable): comment indices to add as nodes even if they
+            are not in a pair
+
+    Returns:
+        SimilarityGraph: the comments in a pair or in `extra_nodes`
+    """
+    idx1 = df["idx1"].to_numpy().astype(np.int64)
+    idx2 = df["idx2"].to_numpy().astype(np.int64)
+    extra = np.fromiter(extra_nodes, dtype=np.int64)
+    nodes, positions = np.unique(
+        np.concatenate([idx1, idx2, extra]), return_inverse=True
+    )
+    rows, cols = positions[: len(idx1)], positions[len(idx1) : 2 * len(idx1)]
+    weights = df["similarity"].to_numpy().astype(np.float64)
+
+    matrix = sp.coo_matrix(
+        (
+            np.concatenate([weights, weights]),
+            (np.concatenate([rows, cols]), np.concatenate([cols, rows])),
+        ),
+        shape=(len(nodes), len(nodes)),
+    ).tocsr()
+    return SimilarityGraph(matrix=matrix, nodes=nodes)
+
+
+def modularity(
+    matrix: sp.csr_matrix, labels: np.ndarray, resolution: float = 1.0
+) -> float:
+    """
+    Modularity of a partition of a weighted graph.
+
+    Args:
+        matrix (sp.csr_matrix): symmetric weights, self loops on the
+            diagonal
+        labels (np.ndarray): community of each node
+        resolution (float): weight of the expected edges term
+
+    Returns:
+        float: modularity, 0 for a graph without edges
+    """
+    total = matrix.sum()
+    if total == 0:
+        return 0.0
+    coo = matrix.tocoo()
+    inside = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    degrees = np.bincount(
+        labels, weights=np.asarray(matrix.sum(axis=1)).ravel()
+    )
+    return inside / total - resolution * np.sum((degrees / total) ** 2)
+
+
+def _move_nodes(
+    matrix: sp.csr_matrix, resolution: float, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Moves nodes between communities, starting from one community per node,
+    for as long as modularity improves.
+
+    Returns:
+        np.ndarray: community of each node, the best partition found
+    """
+    n = matrix.shape[0]
+    total = matrix.sum()
+    degrees = np.asarray(matrix.sum(axis=1)).ravel()
+    coo = matrix.tocoo()
+    off_diagonal = coo.row != coo.col
+    rows, cols, weights = (
+        coo.row[off_diagonal],
+        coo.col[off_diagonal],
+        coo.data[off_diagonal],
+    )
+
+    labels = np.arange(n)
+    best = modularity(matrix, labels, resolution)
+    for _ in range(MAX_MOVE_ROUNDS):
+        community_degrees = np.bincount(labels, weights=degrees, minlength=n)
+        sizes = np.bincount(labels, minlength=n)
+        # weight from each node into each neighbouring community
+        links = sp.coo_matrix(
+            (weights, (rows, labels[cols])), shape=(n, n)
+        ).tocsr()
+        links.sum_duplicates()
+        link_rows = np.repeat(np.arange(n), np.diff(links.indptr))
+        targets = links.indices
+        own = targets == labels[link_rows]
+        # a node leaving its community no longer counts towards its degree
+        target_degrees = community_degrees[targets] - own * degrees[link_rows]
+        gains = (
+            links.data
+            - resolution * degrees[link_rows] * target_degrees / total
+        )
+
+        own_links = np.bincount(
+            link_rows[own], weights=links.data[own], minlength=n
+        )
+        stay = (
+            own_links
+            - resolution
+            * degrees
+            * (community_degrees[labels] - degrees)
+            / total
+        )
+
+        # best neighbouring community of each node, lowest label on ties;
+        # each row of links is sorted by community
+        starts = links.indptr[:-1][np.diff(links.indptr) > 0]
+        row_best = np.maximum.reduceat(gains, starts)
+        movers = link_rows[starts]
+        is_best = gains == np.repeat(
+            row_best, np.diff(np.r_[starts, len(gains)])
+        )
+        firsts = np.minimum.reduceat(
+            np.where(is_best, np.arange(len(gains)), len(gains)), starts
+        )
+        gain = gains[firsts] - stay[movers]
+        moves = (gain > MIN_GAIN) & (targets[firsts] != labels[movers])
+        # two lone nodes would swap places if both moved, so only the one
+        # with the higher label may join the other
+        lone = (sizes[labels[movers]] == 1) & (sizes[targets[firsts]] == 1)
+        moves &= ~lone | (targets[firsts] < labels[movers])
+        if not moves.any():
+            break
+
+        moved = _apply_moves(
+            matrix,
+            labels,
+            best,
+            movers[moves],
+            targets[firsts][moves],
+            resolution,
+            rng,
+        )
+        if moved is None:
+            break
+        labels, best = moved
+
+    return labels
+
+
+def _apply_moves(
+    matrix: sp.csr_matrix,
+    labels: np.ndarray,
+    best: float,
+    movers: np.ndarray,
+    targets: np.ndarray,
+    resolution: float,
+    rng: np.random.Generator,
+) -> Optional[tuple[np.ndarray, float]]:
+    """
+    Moves a random half of the nodes that gain to their best community,
+    halving the share moved until modularity improves. Moves that each
+    gain can cancel out when made together, but a single one always helps.
+
+    Returns:
+        the new labels and their modularity, or None if no share of the
+        moves improves on `best`
+    """
+    share = 0.5
+    while True:
+        chosen = rng.random(len(movers)) < share
+        if not chosen.any():
+            chosen[rng.integers(len(movers))] = True
+
+        candidate = labels.copy()
+        candidate[movers[chosen]] = targets[chosen]
+        score = modularity(matrix, candidate, resolution)
+        if score > best + MIN_GAIN:
+            return candidate, score
+        if chosen.sum() == 1:
+            return None
+        share /= 2
+
+
+def louvain_clusters(
+    graph: SimilarityGraph, resolution: float = 1.0, seed: int = 0
+) -> list[set[int]]:
+    """Defines clusters based on a parallel Louvain method run on the sparse
+    matrix
+
+    Args:
+        graph (SimilarityGraph): comments and their similarities
+        resolution (float): higher values give smaller communities
+        seed (int): seed for choosing which nodes move each round
+
+    Returns:
+        list[set[int]]: sets of comment indices are clusters
+    """
+    if not len(graph.nodes):
+        return []
+    rng = np.random.default_rng(seed)
+    matrix = graph.matrix
+    membership = np.arange(len(graph.nodes))
+
+    if matrix.sum() > 0:
+        for _ in range(MAX_LEVELS):
+            labels = _move_nodes(matrix, resolution, rng)
+            _, labels = np.unique(labels, return_inverse=True)
+            if labels.max() + 1 == matrix.shape[0]:
+                break
+            membership = labels[membership]
+            # collapse each community into one node of a smaller graph
+            assign = sp.csr_matrix(
+                (
+                    np.ones(len(labels)),
+                    (np.arange(len(labels)), labels),
+                ),
+                shape=(len(labels), labels.max() + 1),
+            )
+            matrix = (assign.T @ matrix @ assign).tocsr()
+
+    order = np.argsort(membership, kind="stable")
+    bounds = np.flatnonzero(np.diff(membership[order])) + 1
+    return [
+        set(graph.nodes[group].tolist()) for group in np.split(order, bounds)
+    ]
+
+
+def central_nodes(graph: SimilarityGraph, clusters: list[set[int]]) -> dict:
+    """Find the most representative comment in each cluster, the one with
+    the highest degree centrality among the comments in its cluster
+
+    Args:
+        graph (SimilarityGraph): comments and their similarities
+        clusters (list[set[int]]): clusters of comment indices
+
+    Returns:
+        dict: central comment index to its degree centrality, in the order
+            of the clusters
+    """
+    if not clusters:
+        return {}
+    labels = np.full(len(graph.nodes), -1)
+    for i, cluster in enumerate(clusters):
+        labels[np.searchsorted(graph.nodes, list(cluster))] = i
+    sizes = np.bincount(labels[labels >= 0], minlength=len(clusters))
+
+    coo = graph.matrix.tocoo()
+    inside = (labels[coo.row] == labels[coo.col]) & (coo.row != coo.col)
+    degrees = np.bincount(coo.row[inside], minlength=len(graph.nodes))
+    # like networkx, a comment alone in its cluster has centrality 1
+    centrality = np.where(
+        sizes[labels] > 1, degrees / np.maximum(sizes[labels] - 1, 1), 1.0
+    )
+
+    clustered = np.flatnonzero(labels >= 0)
+    order = clustered[np.lexsort((clustered, -centrality[clustered]))]
+    order = order[np.argsort(labels[order], kind="stable")]
+    firsts = order[np.r_[True, np.diff(labels[order]) != 0]]
+    return {int(graph.nodes[node]): float(centrality[node]) for node in firsts}
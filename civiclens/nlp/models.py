@@ -66,8 +66,9 @@ title_tokenizer_path = model_path(
 title_tokenizer = T5Tokenizer.from_pretrained(title_tokenizer_path)
 
 # topic models
+sentence_transformer_id = "all-MiniLM-L6-v2"
 sentence_transformer_path = model_path(
-    model="all-MiniLM-L6-v2",
+    model=sentence_transformer_id,
     tokenizer=False,
     sbert=True,
     model_func=SentenceTransformer,
@@ -12,7 +12,12 @@ from pydo import Client
 
 from civiclens.nlp import titles
 from civiclens.nlp.comments import get_doc_comments, rep_comment_analysis
-from civiclens.nlp.models import sentence_transformer, sentiment_pipeline
+from civiclens.nlp.embeddings import EmbeddingStore
+from civiclens.nlp.models import (
+    sentence_transformer,
+    sentence_transformer_id,
+    sentiment_pipeline,
+)
 from civiclens.nlp.tools import RepComments, sentiment_analysis
 from civiclens.nlp.topics import HDAModel, LabelChain, topic_comment_analysis
 from civiclens.utils import constants
@@ -36,6 +41,12 @@ logging.basicConfig(
 parser = argparse.ArgumentParser()
 parser.add_argument("--refresh", action="store_true", required=False)
 parser.add_argument("--cloud", action="store_true", required=False)
+parser.add_argument(
+    "--similarity",
+    choices=["exact", "ann", "auto"],
+    default="auto",
+    help="paraphrase mining method; auto uses ann for large documents",
+)
 
 
 def doc_generator(df: pl.DataFrame, doc_idx: int = 0):
@@ -122,6 +133,17 @@ if __name__ == "__main__":
     sentiment_analyzer = partial(
         sentiment_analysis, pipeline=sentiment_pipeline
     )
+    embedding_store = (
+        EmbeddingStore(constants.EMBEDDING_STORE_DIR, sentence_transformer_id)
+        if constants.EMBEDDING_STORE_DIR
+        else None
+    )
+    if embedding_store is None and args.cloud:
+        logger.warning(
+            "EMBEDDING_STORE_DIR is not set, so every comment is encoded; "
+            "point it at a volume that outlives the droplet to reuse "
+            "embeddings across runs"
+        )
 
     for doc_id in documents:
         # generate title if there is not already one
@@ -144,7 +166,11 @@ if __name__ == "__main__":
             continue
 
         comment_data = rep_comment_analysis(
-            comment_data, comment_df, sentence_transformer
+            comment_data,
+            comment_df,
+            sentence_transformer,
+            embedding_store,
+            similarity=args.similarity,
         )
 
         # topic modeling
@@ -159,6 +185,9 @@ if __name__ == "__main__":
         logger.info(f"Proccessed document: {doc_id}")
         upload_comments(Database(), comment_data)
 
+    if embedding_store is not None:
+        embedding_store.log_stats()
+
     if args.cloud:
         # kill instance after job finishes
         do_client = Client(token=constants.DIGITAL_OCEAN)
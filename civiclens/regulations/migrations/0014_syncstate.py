@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("regulations", "0013_alter_nlpoutput_document"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("entity_type", models.CharField(max_length=20)),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField()),
+                ("last_modified_date", models.DateTimeField(null=True)),
+                (
+                    "last_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("pages_synced", models.IntegerField(default=0)),
+                ("objects_synced", models.IntegerField(default=0)),
+                ("completed", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("entity_type", "start_date", "end_date"),
+                        name="unique_sync_range",
+                    )
+                ],
+            },
+        ),
+    ]
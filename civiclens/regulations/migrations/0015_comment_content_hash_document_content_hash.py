@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("regulations", "0014_syncstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
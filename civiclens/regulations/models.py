@@ -40,6 +40,8 @@ class Document(models.Model):
     dates = models.TextField(null=True)
     further_information = models.TextField(blank=True, null=True)
     supplementary_information = models.TextField(blank=True, null=True)
+    # hash of the other fields when last written, to skip unchanged upserts
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
 
 
 class Comment(models.Model):
@@ -89,6 +91,8 @@ class Comment(models.Model):
     submitter_rep_city_state = models.CharField(
         max_length=100, blank=True, null=True
     )
+    # hash of the other fields when last written, to skip unchanged upserts
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
 
 
 class AgencyReference(models.Model):
@@ -125,3 +129,26 @@ class DataQA(models.Model):
     data_id = models.CharField(max_length=255, blank=True, null=True)
     data_type = models.CharField(max_length=255, blank=True, null=True)
     error_message = models.TextField(null=True)
+
+
+class SyncState(models.Model):
+    """Model recording how far the incremental sync got through each type
+    of data for a date range, so an interrupted run can resume"""
+
+    entity_type = models.CharField(max_length=20)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    last_modified_date = models.DateTimeField(null=True)
+    last_id = models.CharField(max_length=255, blank=True, null=True)
+    pages_synced = models.IntegerField(default=0)
+    objects_synced = models.IntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entity_type", "start_date", "end_date"],
+                name="unique_sync_range",
+            )
+        ]
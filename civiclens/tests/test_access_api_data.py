@@ -1,4 +1,7 @@
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
 
 from civiclens.collect import access_api_data
 
@@ -120,15 +123,18 @@ def test_pagination_handling():
     mock_get.side_effect = responses
 
     # Inject mock session into your function
-    access_api_data.requests.Session = MagicMock(return_value=mock_session)
-
-    # Run the function that handles pagination
-    results = access_api_data.pull_reg_gov_data(
-        api_key="DEMO_KEY",
-        data_type="documents",
-        start_date="2024-04-15",
-        end_date="2024-04-20",
-    )
+    with patch.object(
+        access_api_data.http_client,
+        "get_session",
+        MagicMock(return_value=mock_session),
+    ):
+        # Run the function that handles pagination
+        results = access_api_data.pull_reg_gov_data(
+            api_key="DEMO_KEY",
+            data_type="documents",
+            start_date="2024-04-15",
+            end_date="2024-04-20",
+        )
 
     # Check that:
     # 1.) all items have been fetched and pagination handled correctly
@@ -144,3 +150,161 @@ def test_pagination_handling():
         last_call_params["filter[lastModifiedDate][ge]"]
         == "2024-04-16 08:00:00"
     )
+
+
+def make_page(ids, timestamps, has_next_page=True):
+    return {
+        "data": [
+            {"id": obj_id, "attributes": {"lastModifiedDate": timestamp}}
+            for obj_id, timestamp in zip(ids, timestamps, strict=True)
+        ],
+        "meta": {"hasNextPage": has_next_page},
+    }
+
+
+def test_iter_reg_gov_data_streams_and_dedupes():
+    """
+    Tests iter_reg_gov_data() yields the first page before asking for the
+    next, and drops objects repeated across the lastModifiedDate boundary.
+    """
+    # the last two objects on page one share a timestamp, so the API sends
+    # them again at the start of page two
+    first_ids = [f"data{i}" for i in range(250)]
+    first_times = ["2024-04-15T12:00:00Z"] * 248 + ["2024-04-16T12:00:00Z"] * 2
+    pages = [
+        make_page(first_ids, first_times),
+        make_page(
+            ["data248", "data249", "data250"],
+            ["2024-04-16T12:00:00Z"] * 2 + ["2024-04-17T12:00:00Z"],
+            has_next_page=False,
+        ),
+    ]
+    fetch_page = MagicMock(side_effect=pages)
+
+    results = access_api_data.iter_reg_gov_data(
+        "DEMO_KEY",
+        "documents",
+        start_date="2024-04-15",
+        end_date="2024-04-20",
+        prefetch=0,
+        fetch_page=fetch_page,
+    )
+
+    assert next(results)["id"] == "data0"
+    assert fetch_page.call_count == 1
+
+    assert [obj["id"] for obj in results] == [f"data{i}" for i in range(1, 251)]
+    assert fetch_page.call_count == 2
+    last_params = fetch_page.call_args.args[2]
+    assert last_params["filter[lastModifiedDate][ge]"] == "2024-04-16 08:00:00"
+    assert last_params["filter[lastModifiedDate][le]"] == "2024-04-20 23:59:59"
+
+
+def test_iter_reg_gov_data_prefetch():
+    """
+    Tests pages fetched in the background come back in order, and errors
+    from the background thread reach the caller.
+    """
+    pages = [
+        make_page(
+            [f"data{250 * page + i}" for i in range(250)],
+            [f"2024-04-{15 + page}T12:00:00Z"] * 250,
+        )
+        for page in range(2)
+    ] + [RuntimeError("server went away")]
+
+    results = access_api_data.iter_reg_gov_data(
+        "DEMO_KEY",
+        "comments",
+        prefetch=2,
+        fetch_page=MagicMock(side_effect=pages),
+    )
+
+    ids = []
+    with pytest.raises(RuntimeError, match="server went away"):
+        for obj in results:
+            ids.append(obj["id"])
+    assert ids == [f"data{i}" for i in range(500)]
+
+
+def test_pull_reg_gov_data_skip_duplicates(capsys):
+    """
+    Tests pull_reg_gov_data() passes skip_duplicates and
+    print_remaining_requests on when streaming documents: a duplicate error
+    from the server ends the pull with what was fetched, or raises when
+    skip_duplicates is False.
+    """
+    duplicate_error = {
+        "errors": [{"status": "500", "detail": "Wrong result size"}]
+    }
+
+    def make_session():
+        first = make_page(
+            [f"data{i}" for i in range(250)], ["2024-04-15T12:00:00Z"] * 250
+        )
+        responses = [
+            MagicMock(
+                status_code=200,
+                json=lambda: first,
+                headers={"X-RateLimit-Remaining": "900"},
+            ),
+            MagicMock(
+                status_code=500,
+                json=lambda: duplicate_error,
+                headers={"X-RateLimit-Remaining": "899"},
+                raise_for_status=MagicMock(
+                    side_effect=requests.HTTPError("500 Server Error")
+                ),
+            ),
+        ]
+        return MagicMock(get=MagicMock(side_effect=responses))
+
+    def pull(**kwargs):
+        with patch.object(
+            access_api_data.http_client,
+            "get_session",
+            MagicMock(return_value=make_session()),
+        ):
+            return access_api_data.pull_reg_gov_data(
+                "DEMO_KEY", "documents", **kwargs
+            )
+
+    results = pull(skip_duplicates=True, print_remaining_requests=True)
+
+    assert [obj["id"] for obj in results] == [f"data{i}" for i in range(250)]
+    assert "(Requests left: 899)" in capsys.readouterr().out
+    with pytest.raises(requests.HTTPError):
+        pull()
+
+
+def test_pull_reg_gov_data_dockets_warns_on_skipped_window(caplog):
+    """
+    Tests a docket window skipped for a duplicate error on the server is
+    logged with its dates rather than dropped silently.
+    """
+    response = MagicMock(
+        status_code=500,
+        json=lambda: {
+            "errors": [{"status": "500", "detail": "Wrong result size"}]
+        },
+    )
+    session = MagicMock(get=MagicMock(return_value=response))
+
+    with patch.object(
+        access_api_data.http_client,
+        "get_session",
+        MagicMock(return_value=session),
+    ):
+        results = access_api_data.pull_reg_gov_data(
+            "DEMO_KEY",
+            "dockets",
+            start_date="2024-04-15",
+            end_date="2024-04-20",
+            skip_duplicates=True,
+        )
+
+    assert results == []
+    assert (
+        "skipping dockets from 2024-04-15 00:00:00 to 2024-04-20 23:59:59"
+        in caplog.text
+    )
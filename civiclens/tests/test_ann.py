@@ -0,0 +1,59 @@
+import numpy as np
+import torch
+from sentence_transformers import util
+
+from civiclens.nlp.ann import IVFIndex, normalize, paraphrase_mining_ann
+
+
+def make_embeddings(n, dim=32, topics=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(topics, dim))
+    vectors = centres[rng.integers(0, topics, n)]
+    return normalize(vectors + rng.normal(scale=0.5, size=(n, dim)))
+
+
+def exact_pairs(embeddings, top_k, min_similarity):
+    pairs = util.paraphrase_mining_embeddings(
+        torch.from_numpy(embeddings), top_k=top_k, max_pairs=10**6
+    )
+    return {(i, j) for score, i, j in pairs if score >= min_similarity}
+
+
+def test_probing_every_list_matches_exact_search():
+    """
+    Check the index finds the same pairs as the exact search when every
+    list is probed, and most of them when only a few are
+    """
+    embeddings = make_embeddings(600)
+    expected = exact_pairs(embeddings, top_k=5, min_similarity=0.6)
+    index = IVFIndex(embeddings, n_lists=12)
+
+    pairs = index.pairs(top_k=5, min_similarity=0.6, n_probe=12)
+    assert {(i, j) for _, i, j in pairs} == expected
+    assert all(i < j for _, i, j in pairs)
+    assert [score for score, _, _ in pairs] == sorted(
+        (score for score, _, _ in pairs), reverse=True
+    )
+
+    found = {
+        (i, j)
+        for _, i, j in index.pairs(top_k=5, min_similarity=0.6, n_probe=3)
+    }
+    assert len(found & expected) >= 0.9 * len(expected)
+
+
+def test_paraphrase_mining_ann_keeps_best_pairs():
+    """
+    Check the pair cap keeps the most similar pairs, and tiny inputs give
+    no pairs
+    """
+    embeddings = make_embeddings(300, seed=1)
+    every_pair = paraphrase_mining_ann(
+        embeddings, top_k=10, min_similarity=0.0, n_probe=100
+    )
+    capped = paraphrase_mining_ann(
+        embeddings, top_k=10, min_similarity=0.0, n_probe=100, max_pairs=50
+    )
+
+    assert capped == every_pair[:50]
+    assert paraphrase_mining_ann(embeddings[:1]) == []
@@ -0,0 +1,117 @@
+import datetime
+import os
+from unittest.mock import patch
+
+import pytest
+
+from civiclens.collect.bulk_dl import MAX_RESULTS, BulkDl
+
+
+def make_document(doc_id, posted_date):
+    return {
+        "id": doc_id,
+        "attributes": {"postedDate": posted_date, "withdrawn": False},
+    }
+
+
+class FakeDocumentSearch:
+    """
+    Documents endpoint with one document a day, except for a single day
+    with more documents than the API will page through.
+    """
+
+    def __init__(self, busy_day=None):
+        self.busy_day = busy_day
+        self.requests = []
+
+    def __call__(self, endpoint, params):
+        self.requests.append(params)
+        start = datetime.date.fromisoformat(params["filter[postedDate][ge]"])
+        end = datetime.date.fromisoformat(params["filter[postedDate][le]"])
+        days = (end - start).days + 1
+        total = days
+        if self.busy_day is not None and start <= self.busy_day <= end:
+            total += MAX_RESULTS
+        docs = [
+            make_document(f"DOC-{start + datetime.timedelta(days=i)}", "x")
+            for i in range(days)
+        ]
+        return {"data": docs, "meta": {"totalElements": total}}
+
+
+def test_bulk_dl_agencies_are_unique():
+    """
+    Check each agency is only listed once
+    """
+    bulk_dl = BulkDl("DEMO_KEY")
+
+    assert len(bulk_dl.agencies) == len(set(bulk_dl.agencies))
+    assert "EPA" in bulk_dl.agencies
+
+
+def test_download_sharded_splits_and_resumes(tmp_path):
+    """
+    Check windows over the API's result limit are split, every shard is
+    written to Parquet, and shards already written are skipped next time
+    """
+    bulk_dl = BulkDl("DEMO_KEY")
+    search = FakeDocumentSearch(busy_day=datetime.date(2024, 1, 3))
+
+    with patch.object(bulk_dl, "fetch_page", side_effect=search):
+        stats = bulk_dl.download_sharded(
+            "documents",
+            str(tmp_path),
+            datetime.date(2024, 1, 1),
+            datetime.date(2024, 1, 14),
+        )
+
+    # the first week is split down to the busy day, which can't be split
+    assert stats["split"] == 3
+    assert stats["written"] == 5
+    assert stats["failed"] == 0
+    df = BulkDl.load_shards(str(tmp_path), "documents")
+    assert sorted(df["Doc_ID"].to_list()) == [
+        f"DOC-2024-01-{day:02d}" for day in range(1, 15)
+    ]
+
+    os.remove(
+        BulkDl.shard_path(
+            str(tmp_path),
+            "documents",
+            (None, datetime.date(2024, 1, 8), datetime.date(2024, 1, 14)),
+        )
+    )
+    search.requests.clear()
+    with patch.object(bulk_dl, "fetch_page", side_effect=search):
+        stats = bulk_dl.download_sharded(
+            "documents",
+            str(tmp_path),
+            datetime.date(2024, 1, 1),
+            datetime.date(2024, 1, 14),
+        )
+
+    assert stats["skipped"] == 4
+    assert stats["written"] == 1
+    assert search.requests[0]["filter[postedDate][ge]"] == "2024-01-08"
+
+
+def test_fetch_partitioned_raises_on_failed_window():
+    """
+    Check a window whose request fails raises instead of being left out
+    """
+    bulk_dl = BulkDl("DEMO_KEY")
+    search = FakeDocumentSearch(busy_day=datetime.date(2024, 1, 3))
+
+    def flaky(endpoint, params):
+        if params["filter[postedDate][ge]"] == "2024-01-08":
+            return None
+        return search(endpoint, params)
+
+    with patch.object(bulk_dl, "fetch_page", side_effect=flaky):
+        with pytest.raises(RuntimeError, match="2024-01-08 to 2024-01-14"):
+            bulk_dl.fetch_partitioned(
+                "documents",
+                datetime.date(2024, 1, 1),
+                datetime.date(2024, 1, 14),
+                "postedDate",
+            )
@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from civiclens.collect import check_doc_status
+
+
+STORED = {
+    "EPA-0001": datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc),
+    "EPA-0002": datetime(2024, 6, 2, 12, 0, tzinfo=timezone.utc),
+    "EPA-0003": datetime(2024, 6, 3, 12, 0, tzinfo=timezone.utc),
+}
+
+
+def make_doc(doc_id, last_modified):
+    return {"id": doc_id, "attributes": {"lastModifiedDate": last_modified}}
+
+
+def refresh(fetch_page):
+    with patch.object(
+        check_doc_status, "close_passed_docs", return_value=2
+    ), patch.object(
+        check_doc_status, "get_open_doc_versions", return_value=dict(STORED)
+    ), patch.object(
+        check_doc_status, "upsert_documents"
+    ) as mock_upsert:
+        summary = check_doc_status.refresh_open_docs("DEMO_KEY", fetch_page)
+    return summary, mock_upsert.call_args.args[0]
+
+
+def test_close_passed_docs():
+    """
+    Check documents past their closing date are closed in one statement
+    """
+    mock_cursor = MagicMock(rowcount=5)
+    with patch.object(check_doc_status, "db_cursor") as mock_db_cursor:
+        mock_db_cursor.return_value.__enter__.return_value = mock_cursor
+        assert check_doc_status.close_passed_docs() == 5
+
+    mock_cursor.execute.assert_called_once()
+    assert "CURRENT_DATE" in mock_cursor.execute.call_args.args[0]
+
+
+def test_refresh_open_docs_pages_through_window():
+    """
+    Check the open documents are checked with one window and only the
+    changed ones are updated
+    """
+    requests = []
+
+    def fetch_page(api_key, data_type, params, work_class):
+        requests.append(params)
+        return {
+            "data": [
+                make_doc("EPA-0001", "2024-06-01T12:00:00Z"),
+                make_doc("OTHER-0001", "2024-06-02T00:00:00Z"),
+                make_doc("EPA-0002", "2024-06-05T09:30:00Z"),
+            ],
+            "meta": {"totalElements": 3, "hasNextPage": False},
+        }
+
+    summary, changed = refresh(fetch_page)
+
+    assert [doc["id"] for doc in changed] == ["EPA-0002"]
+    assert len(requests) == 1
+    assert requests[0]["filter[lastModifiedDate][ge]"] == "2024-06-01 08:00:00"
+    assert summary == {
+        "closed": 2,
+        "checked": 3,
+        "changed": 1,
+        "api_calls": 1,
+        "api_calls_saved": 2,
+    }
+
+
+def test_refresh_open_docs_narrows_large_window():
+    """
+    Check the oldest documents are looked up one at a time when paging
+    from their date would cost more than that
+    """
+    requests = []
+
+    def fetch_page(api_key, data_type, params, work_class):
+        requests.append(params)
+        if "filter[searchTerm]" in params:
+            doc_id = params["filter[searchTerm]"]
+            return {
+                "data": [make_doc(doc_id, "2024-06-10T00:00:00Z")],
+                "meta": {"totalElements": 1},
+            }
+        window_start = params["filter[lastModifiedDate][ge]"]
+        # far more documents were modified since June 1st than since the 2nd
+        total = 10_000 if window_start < "2024-06-02" else 2
+        return {
+            "data": [make_doc("EPA-0003", "2024-06-03T12:00:00Z")],
+            "meta": {"totalElements": total, "hasNextPage": False},
+        }
+
+    summary, changed = refresh(fetch_page)
+
+    assert [doc["id"] for doc in changed] == ["EPA-0001"]
+    assert requests[-1] == {"filter[searchTerm]": "EPA-0001"}
+    assert summary["api_calls"] == 3
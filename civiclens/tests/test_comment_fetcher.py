@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from civiclens.collect import comment_fetcher
+from civiclens.collect.quota import QuotaScheduler
+
+
+class StubCommentHandler(BaseHTTPRequestHandler):
+    """
+    Serves /comments/{id} like the regulations.gov detail endpoint. Ids that
+    start with "missing" return a 404, and the first request for an id that
+    starts with "limited" returns a 429.
+    """
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    rate_limited = set()
+
+    def do_GET(self):
+        comment_id = self.path.split("/")[-1].split("?")[0]
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+
+        time.sleep(0.02)
+
+        with cls.lock:
+            cls.in_flight -= 1
+            first_limited = (
+                comment_id.startswith("limited")
+                and comment_id not in cls.rate_limited
+            )
+            cls.rate_limited.add(comment_id)
+
+        if comment_id.startswith("missing"):
+            self._send(404, {"errors": []})
+        elif first_limited:
+            self._send(429, {}, {"Retry-After": "0"})
+        else:
+            body = {"data": {"id": comment_id, "attributes": {"comment": "hi"}}}
+            self._send(200, body, {"X-RateLimit-Remaining": "900"})
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubCommentHandler.in_flight = 0
+    StubCommentHandler.max_in_flight = 0
+    StubCommentHandler.rate_limited = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCommentHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v4/comments/"
+    server.shutdown()
+    server.server_close()
+
+
+def fast_limiter():
+    return comment_fetcher.TokenBucket(rate=1000, capacity=1000)
+
+
+def unpaced_quota():
+    # the stub reports 900 of 1000 requests left, so allow them all at once
+    return QuotaScheduler(limit=1000, burst=1000)
+
+
+def test_iter_comment_details_merges_all(stub_url):
+    """
+    Every comment comes back merged with its detail JSON
+    """
+    comments = [{"id": f"c{i}", "type": "comments"} for i in range(20)]
+    results = list(
+        comment_fetcher.iter_comment_details(
+            "DEMO_KEY",
+            comments,
+            max_concurrency=4,
+            limiter=fast_limiter(),
+            scheduler=unpaced_quota(),
+            base_url=stub_url,
+        )
+    )
+
+    assert sorted(r["id"] for r in results) == sorted(c["id"] for c in comments)
+    for result in results:
+        assert result["type"] == "comments"
+        assert result["data"]["attributes"]["comment"] == "hi"
+
+
+def test_iter_comment_details_bounded_concurrency(stub_url):
+    """
+    No more than max_concurrency requests are in flight at once
+    """
+    comments = [{"id": f"c{i}"} for i in range(30)]
+    list(
+        comment_fetcher.iter_comment_details(
+            "DEMO_KEY",
+            comments,
+            max_concurrency=3,
+            limiter=fast_limiter(),
+            scheduler=unpaced_quota(),
+            base_url=stub_url,
+        )
+    )
+    assert 1 < StubCommentHandler.max_in_flight <= 3
+
+
+def test_iter_comment_details_retries_and_skips(stub_url):
+    """
+    429s are retried after Retry-After, other errors are skipped
+    """
+    comments = [{"id": "limited1"}, {"id": "missing1"}, {"id": "c1"}]
+    results = list(
+        comment_fetcher.iter_comment_details(
+            "DEMO_KEY",
+            comments,
+            limiter=fast_limiter(),
+            scheduler=unpaced_quota(),
+            base_url=stub_url,
+        )
+    )
+    assert sorted(r["id"] for r in results) == ["c1", "limited1"]
+
+
+def test_iter_comment_details_reads_input_off_the_loop(stub_url):
+    """
+    A slow input, eg one waiting on the next page of the comments list,
+    doesn't hold up comments already in flight
+    """
+    first_done = threading.Event()
+
+    def comments():
+        yield {"id": "c1"}
+        # only returns early if the first result arrives while waiting here
+        yield {"id": "c2", "released": first_done.wait(timeout=5)}
+
+    results = []
+    for result in comment_fetcher.iter_comment_details(
+        "DEMO_KEY",
+        comments(),
+        limiter=fast_limiter(),
+        scheduler=unpaced_quota(),
+        base_url=stub_url,
+    ):
+        results.append(result)
+        first_done.set()
+
+    assert [r["id"] for r in results] == ["c1", "c2"]
+    assert results[1]["released"] is True
+
+
+def test_token_bucket_honours_remaining_and_block():
+    """
+    The bucket never holds more tokens than the server says are left, and
+    stops handing them out while blocked
+    """
+    now = [0.0]
+    bucket = comment_fetcher.TokenBucket(
+        rate=1, capacity=10, clock=lambda: now[0]
+    )
+    bucket.update({"X-RateLimit-Remaining": "2"})
+    assert bucket.tokens == 2
+
+    bucket.block(30)
+    assert bucket.blocked_until == 30
+    now[0] = 5
+    bucket.update({})
+    assert bucket.tokens == 2
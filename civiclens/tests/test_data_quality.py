@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+from civiclens.collect import move_data_from_api_to_database as move_data
+from civiclens.collect.data_quality import QualityFlagSink, run_checks
+
+
+def test_run_checks_reports_every_failure():
+    """
+    Check every check is run, and one that raises counts as a failure
+    """
+    checks = [
+        ("id too long", lambda record: len(record["id"]) < 5),
+        ("no title", lambda record: record["title"]),
+        ("id is a string", lambda record: isinstance(record["id"], str)),
+    ]
+
+    failures = run_checks({"id": "EPA-HQ-0001"}, checks)
+
+    assert failures == ["id too long", "no title (KeyError: 'title')"]
+
+
+def test_sink_flushes_on_size_and_time():
+    """
+    Check flags are written in batches once enough have built up or the
+    oldest has waited long enough
+    """
+    batches = []
+    now = [0.0]
+    sink = QualityFlagSink(
+        batches.append, batch_size=3, flush_seconds=10, clock=lambda: now[0]
+    )
+
+    for i in range(4):
+        sink.add(f"C-{i}", "comment", "withdrawn is not False")
+    assert [len(batch) for batch in batches] == [3]
+
+    now[0] = 11.0
+    sink.add("C-4", "comment", "withdrawn is not False")
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert batches[1][0][:3] == ("C-3", "comment", "withdrawn is not False")
+
+    assert sink.flush() == 0
+    assert sink.stats() == {"flags": 5, "batches": 2, "dropped": 0}
+
+
+def test_qa_document_data_flags_all_failures():
+    """
+    Check a document failing several checks gets a flag for each one, and
+    the flags are only written when the sink is flushed
+    """
+    batches = []
+    sink = QualityFlagSink(batches.append)
+    doc = {
+        "id": "EPA-0001",
+        "attributes": {
+            "documentType": "Rule",
+            "frDocNum": "2024-01234",
+            "withdrawn": True,
+            "commentEndDate": "2024-06-01T03:59:59Z",
+            "postedDate": "2024-04-01T04:00:00Z",
+            "commentStartDate": "2024-04-01T04:00:00Z",
+            "openForComment": False,
+            "title": "A rule",
+        },
+        "links": {"self": "https://api.regulations.gov/v4/documents/EPA-0001"},
+        "CFR": "40 CFR Part 60",
+        "summary": None,
+        "supplementaryInformation": None,
+    }
+
+    with patch.object(move_data, "QA_FLAGS", sink):
+        assert move_data.qa_document_data(doc) is False
+        assert batches == []
+        sink.flush()
+
+    assert [flag[2] for flag in batches[0]] == [
+        "withdrawn is True",
+        "openForComment is False",
+    ]
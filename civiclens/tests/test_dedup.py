@@ -0,0 +1,105 @@
+import zlib
+
+import numpy as np
+import polars as pl
+import torch
+
+from civiclens.nlp import comments
+from civiclens.nlp.dedup import collapse_duplicates
+from civiclens.nlp.tools import RepComments
+
+
+LETTER = (
+    "I oppose the proposed rule because it would harm small farms in my "
+    "county and raise prices for the families who already struggle to "
+    "afford food. Please withdraw it and consult growers first."
+)
+OTHER_LETTER = (
+    "Protect the coastal wetlands that shelter our towns from storms and "
+    "keep the new mapping standards in the final rule."
+)
+
+
+class BagOfWordsModel:
+    """
+    Embeds a text as its hashed word counts, remembering what it encoded
+    """
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        self.encoded.extend(sentences)
+        vectors = np.zeros((len(sentences), 256), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for word in sentence.lower().split():
+                vectors[i, zlib.crc32(word.encode()) % 256] += 1
+        if convert_to_tensor:
+            return torch.from_numpy(vectors)
+        return vectors
+
+
+def make_comments():
+    texts = (
+        [LETTER] * 5
+        + [LETTER.upper().replace(".", "!")] * 3
+        + [f"{LETTER} Signed, Resident {i}" for i in range(4)]
+        + [OTHER_LETTER] * 6
+        + [
+            "The wetland maps in appendix B are out of date for my parish.",
+            "Extend the comment period by ninety days for rural counties.",
+            "Wetland maps in the appendix are outdated for several parishes.",
+        ]
+    )
+    return pl.DataFrame(
+        {
+            "id": [f"C-{i}" for i in range(len(texts))],
+            "document_id": "EPA-0001",
+            "comment": texts,
+            "cluster": pl.Series([None] * len(texts), dtype=pl.Utf8),
+        }
+    )
+
+
+def test_collapse_duplicates():
+    """
+    Check copies that differ in case, punctuation or a signature are
+    collapsed into their first comment, and distinct comments are kept
+    """
+    df = make_comments()
+
+    unique_df, df = collapse_duplicates(df)
+
+    assert unique_df["id"].to_list() == ["C-0", "C-12", "C-18", "C-19", "C-20"]
+    assert unique_df["copies"].to_list() == [12, 6, 1, 1, 1]
+    assert df["group"].to_list() == [0] * 12 + [1] * 6 + [2, 3, 4]
+
+
+def test_rep_comment_analysis_counts_collapsed_copies():
+    """
+    Check only unique texts are embedded, and collapsed copies still count
+    towards the comments a representative stands for and the totals
+    """
+    df = make_comments()
+    model = BagOfWordsModel()
+
+    comment_data = comments.rep_comment_analysis(
+        RepComments(document_id="EPA-0001"), df, model
+    )
+
+    # the unique texts, then the two letters to cluster them
+    assert len(model.encoded) == 5 + 2
+    assert comment_data.num_total_comments == 21
+    assert comment_data.doc_comments.columns == df.columns
+    assert comment_data.doc_comments["id"].to_list() == df["id"].to_list()
+    # form letters come before the paraphrase clusters
+    letters = {}
+    for comment in comment_data.rep_comments:
+        letters.setdefault(comment["comment_id"], comment)
+    assert letters["C-0"]["comments_represented"] == 12
+    assert letters["C-0"]["form_letter"] is True
+    assert letters["C-12"]["comments_represented"] == 6
+    assert letters["C-12"]["form_letter"] is False
+    clusters = comment_data.doc_comments["cluster"].to_list()
+    assert len(set(clusters[:12])) == 1
+    assert clusters[0] != clusters[12]
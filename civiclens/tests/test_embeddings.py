@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from civiclens.nlp.embeddings import EmbeddingStore
+
+
+class FakeModel:
+    """
+    Encodes a text as its length and word count, remembering what it was
+    asked to encode
+    """
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size, convert_to_numpy):
+        self.encoded.extend(texts)
+        return np.array(
+            [[len(text), len(text.split()), 1.0] for text in texts],
+            dtype=np.float32,
+        )
+
+
+def test_store_encodes_only_new_and_edited_comments(tmp_path):
+    """
+    Check stored embeddings are reused across runs, and only comments that
+    are new or whose text changed are encoded
+    """
+    model = FakeModel()
+    store = EmbeddingStore(str(tmp_path), "org/model")
+    ids = ["C-1", "C-2", "C-3"]
+    texts = ["one", "two words", "three whole words"]
+
+    first = store.embed(ids, texts, model)
+    assert model.encoded == texts
+    assert first.dtype == np.float32
+    assert first.tolist() == [[3, 1, 1], [9, 2, 1], [17, 3, 1]]
+
+    # the next run opens the store again
+    model = FakeModel()
+    store = EmbeddingStore(str(tmp_path), "org/model")
+    second = store.embed(
+        ["C-3", "C-2", "C-4"],
+        ["three whole words", "two edited words", "x"],
+        model,
+    )
+
+    assert model.encoded == ["two edited words", "x"]
+    assert second.tolist() == [[17, 3, 1], [16, 3, 1], [1, 1, 1]]
+    assert store.stats() == {"hits": 1, "encoded": 2, "stored": 4}
+    assert store.index["C-2"][1] == 1
+
+    # a different model keeps its own vectors
+    other = EmbeddingStore(str(tmp_path), "org/other-model")
+    other.embed(["C-1"], ["one"], model)
+    assert model.encoded[-1] == "one"
+
+
+def test_store_grows_and_compacts_index(tmp_path):
+    """
+    Check the matrix grows past its first allocation, and an index of
+    mostly superseded lines is rewritten when the store is opened
+    """
+    model = FakeModel()
+    store = EmbeddingStore(str(tmp_path), "model", initial_rows=2)
+    ids = [f"C-{i}" for i in range(5)]
+    store.embed(ids, [f"comment {i}" for i in ids], model)
+    for edit in range(3):
+        store.embed(ids, [f"edit {edit} of {i}" for i in ids], model)
+
+    index_file = tmp_path / "model" / "index.tsv"
+    assert len(index_file.read_text().splitlines()) == 20
+
+    store = EmbeddingStore(str(tmp_path), "model", initial_rows=2)
+    assert len(index_file.read_text().splitlines()) == 5
+    vectors = store.embed(ids, [f"edit 2 of {i}" for i in ids], model)
+    assert vectors[:, 0].tolist() == [len(f"edit 2 of {i}") for i in ids]
+    assert len(model.encoded) == 20
+
+
+def test_store_rejects_mismatched_texts(tmp_path):
+    """
+    Check a text missing for a comment id raises before anything is encoded
+    """
+    model = FakeModel()
+    store = EmbeddingStore(str(tmp_path), "org/model")
+
+    with pytest.raises(ValueError):
+        store.embed(["C-1", "C-2"], ["one"], model)
+    assert model.encoded == []
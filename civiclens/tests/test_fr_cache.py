@@ -0,0 +1,126 @@
+import os
+from unittest.mock import MagicMock, patch
+
+from civiclens.collect import move_data_from_api_to_database
+from civiclens.collect.fr_cache import FederalRegisterCache
+
+
+XML = b"<RULE><SUBJECT>Test rule</SUBJECT></RULE>"
+
+
+def mock_response(status_code, content=b"", headers=None):
+    response = MagicMock(status_code=status_code, content=content)
+    response.headers = headers or {}
+    return response
+
+
+def test_cache_put_and_get(tmp_path):
+    """
+    Check parsed fields come back for a cached document and not others
+    """
+    cache = FederalRegisterCache(str(tmp_path))
+    cache.put(
+        "2024-01234", "https://example.com/a.xml", XML, {"title": "Test rule"}
+    )
+
+    entry = cache.get("2024-01234")
+
+    assert entry["xml_url"] == "https://example.com/a.xml"
+    assert entry["parsed"] == {"title": "Test rule"}
+    assert cache.get("2024-99999") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """
+    Check the cache is trimmed from the least recently used entry, and
+    parsed fields shared by two documents are kept while either is cached
+    """
+    cache = FederalRegisterCache(str(tmp_path), max_bytes=10**6)
+    for i in range(4):
+        cache.put(
+            f"doc-{i}", f"url-{i}", XML + str(i).encode(), {"text": "x" * 1000}
+        )
+    cache.put("doc-copy", "url-copy", XML + b"3", {"text": "x" * 1000})
+
+    # use doc-0 last, and age the others in the order they were added
+    for i, fr_doc_num in enumerate(["doc-1", "doc-2", "doc-3", "doc-copy"]):
+        os.utime(cache._entry_path(fr_doc_num), (i, i))
+    cache.max_bytes = cache.size() - 1
+    cache.evict()
+
+    assert cache.get("doc-1") is None
+    assert cache.get("doc-0") is not None
+    assert cache.get("doc-copy") is not None
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert os.listdir(cache._blob_dir) == []
+
+
+def test_fetch_parsed_xml_revalidates(tmp_path):
+    """
+    Check a cached document is revalidated with a conditional request and
+    isn't downloaded or parsed again when unchanged
+    """
+    cache = FederalRegisterCache(str(tmp_path))
+    responses = [
+        mock_response(200, XML, {"ETag": '"v1"'}),
+        mock_response(304),
+    ]
+
+    with patch.object(
+        move_data_from_api_to_database,
+        "fetch_fr_document_details",
+        return_value="https://example.com/a.xml",
+    ) as mock_details, patch.object(
+        move_data_from_api_to_database.http_client,
+        "get",
+        side_effect=responses,
+    ) as mock_get:
+        first = move_data_from_api_to_database.fetch_parsed_xml(
+            "2024-01234", cache
+        )
+        second = move_data_from_api_to_database.fetch_parsed_xml(
+            "2024-01234", cache
+        )
+
+    assert first["title"] == "Test rule"
+    assert second == first
+    mock_details.assert_called_once()
+    assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+    assert cache.stats()["downloads"] == 1
+    assert cache.stats()["not_modified"] == 1
+
+
+def test_fetch_parsed_xml_changed(tmp_path):
+    """
+    Check a changed document is parsed again and the cache updated
+    """
+    cache = FederalRegisterCache(str(tmp_path))
+    new_xml = XML.replace(b"Test rule", b"Final rule")
+    responses = [
+        mock_response(200, XML, {"Last-Modified": "Mon, 01 Jan 2024"}),
+        mock_response(200, new_xml, {"Last-Modified": "Tue, 02 Jan 2024"}),
+    ]
+
+    with patch.object(
+        move_data_from_api_to_database,
+        "fetch_fr_document_details",
+        return_value="https://example.com/a.xml",
+    ), patch.object(
+        move_data_from_api_to_database.http_client,
+        "get",
+        side_effect=responses,
+    ) as mock_get:
+        move_data_from_api_to_database.fetch_parsed_xml("2024-01234", cache)
+        updated = move_data_from_api_to_database.fetch_parsed_xml(
+            "2024-01234", cache
+        )
+
+    assert mock_get.call_args.kwargs["headers"] == {
+        "If-Modified-Since": "Mon, 01 Jan 2024"
+    }
+    assert updated["title"] == "Final rule"
+    assert cache.get("2024-01234")["parsed"]["title"] == "Final rule"
@@ -0,0 +1,84 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from civiclens.collect.fr_xml import extract_fr_xml
+from civiclens.collect.move_data_from_api_to_database import parse_xml_content
+
+
+RULE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<RULE>
+<PREAMB>
+<AGENCY TYPE="S">Environmental Protection Agency</AGENCY>
+<CFR>40 CFR Part 63</CFR>
+<RIN>RIN 2060-AV00</RIN>
+<SUBJECT>National Emission Standards</SUBJECT>
+<SUM><HD SOURCE="HED">SUMMARY:</HD><P>The EPA is amending a rule.</P></SUM>
+<DATES><HD SOURCE="HED">DATES:</HD><P>Effective July 1, 2024.</P></DATES>
+<FURINF><HD SOURCE="HED">FOR FURTHER INFORMATION CONTACT:</HD>
+<P>Jane Doe.</P></FURINF>
+</PREAMB>
+<SUPLINF>
+<HD SOURCE="HED">SUPPLEMENTARY INFORMATION:</HD>
+<P>Opening paragraph.</P>
+<HD SOURCE="HD1">I. Background</HD>
+<P>Sources must comply within <E T="03">three years</E>.<SU>1</SU></P>
+<FTNT><P><SU>1</SU> See the docket.</P></FTNT>
+</SUPLINF>
+</RULE>
+"""
+
+
+def test_extract_fr_xml_matches_parse_xml_content():
+    """
+    Check the fields parse_xml_content finds are the same
+    """
+    extracted = extract_fr_xml(RULE_XML)
+    parsed = parse_xml_content(RULE_XML)
+
+    for field in parsed:
+        if field != "supplementaryInformation":
+            assert extracted[field] == parsed[field]
+    assert extracted["title"] == "National Emission Standards"
+    assert extracted["summary"] == "The EPA is amending a rule."
+
+
+def test_extract_fr_xml_supplementary_information():
+    """
+    Check text in nested elements is kept and split into sections
+    """
+    extracted = extract_fr_xml(io.BytesIO(RULE_XML.encode()))
+
+    assert extracted["supplementaryInformation"] == (
+        "SUPPLEMENTARY INFORMATION: Opening paragraph. I. Background "
+        "Sources must comply within three years . 1 1 See the docket."
+    )
+    assert extracted["sections"] == [
+        {
+            "heading": "SUPPLEMENTARY INFORMATION:",
+            "level": "HED",
+            "text": "Opening paragraph.",
+        },
+        {
+            "heading": "I. Background",
+            "level": "HD1",
+            "text": "Sources must comply within three years . 1 1 See the "
+            "docket.",
+        },
+    ]
+
+
+def test_extract_fr_xml_missing_fields():
+    """
+    Check missing fields are reported as not found and bad XML raises
+    """
+    extracted = extract_fr_xml("<RULE><SUBJECT>Only a title</SUBJECT></RULE>")
+
+    assert extracted["title"] == "Only a title"
+    assert extracted["RIN"] == "Not Found"
+    assert extracted["supplementaryInformation"] == ""
+    assert extracted["sections"] == []
+
+    with pytest.raises(ET.ParseError):
+        extract_fr_xml("<RULE><SUBJECT>Unclosed</RULE>")
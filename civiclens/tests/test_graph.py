@@ -0,0 +1,150 @@
+import networkx as nx
+import numpy as np
+import polars as pl
+import pytest
+import torch
+
+from civiclens.nlp import comments
+from civiclens.nlp.graph import (
+    central_nodes,
+    louvain_clusters,
+    similarity_graph,
+)
+from civiclens.nlp.tools import RepComments
+
+
+def make_pairs(groups=4, size=10, seed=0):
+    """
+    Pairs of comments that are similar within a group, with a weak link
+    from each group to the next, and a hub in each group linked to all of it
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for group in range(groups):
+        members = list(range(group * size, (group + 1) * size))
+        hub = members[0]
+        for i in members[1:]:
+            rows.append((0.9, hub, i))
+            for j in members[i % size + 1 :: 3]:
+                rows.append((rng.uniform(0.6, 0.8), i, j))
+        rows.append((0.1, members[-1], (members[-1] + 1) % (groups * size)))
+    similarity, idx1, idx2 = zip(*rows, strict=True)
+    return pl.DataFrame(
+        {
+            "similarity": similarity,
+            "idx1": np.minimum(idx1, idx2),
+            "idx2": np.maximum(idx1, idx2),
+        }
+    )
+
+
+def test_louvain_clusters_find_groups():
+    """
+    Check the sparse Louvain finds the planted groups as well as networkx,
+    and extra nodes come back as clusters of their own
+    """
+    df = make_pairs()
+    graph = similarity_graph(df, extra_nodes=[100])
+
+    clusters = louvain_clusters(graph)
+
+    expected = [set(range(start, start + 10)) for start in range(0, 40, 10)]
+    assert sorted(clusters, key=min) == expected + [{100}]
+    G = comments.build_graph(df)
+    assert (
+        nx.community.modularity(G, expected)
+        >= nx.community.modularity(G, comments.get_clusters(G)) - 1e-9
+    )
+
+
+def test_central_nodes_match_networkx():
+    """
+    Check the vectorised degree centrality picks the same comment as
+    networkx for each cluster
+    """
+    df = make_pairs()
+    clusters = [set(range(start, start + 10)) for start in range(0, 40, 10)]
+
+    central = central_nodes(similarity_graph(df), clusters)
+
+    assert central == comments.find_central_node(
+        comments.build_graph(df), clusters
+    )
+    assert list(central) == [0, 10, 20, 30]
+    assert central_nodes(similarity_graph(df, [100]), [{100}]) == {100: 1.0}
+
+
+def graph_pairs(G):
+    """
+    Pairs frame for the edges of a networkx graph
+    """
+    return pl.DataFrame(
+        {
+            "similarity": [1.0] * G.number_of_edges(),
+            "idx1": [min(u, v) for u, v in G.edges],
+            "idx2": [max(u, v) for u, v in G.edges],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "G",
+    [
+        nx.star_graph(2),
+        nx.star_graph(5),
+        # the hub labelled last, so no leaf may join it while both are alone
+        nx.relabel_nodes(nx.star_graph(5), {0: 5, 5: 0}),
+        nx.barbell_graph(4, 0),
+        nx.connected_caveman_graph(4, 5),
+        nx.karate_club_graph(),
+    ],
+)
+def test_louvain_clusters_match_networkx_on_small_graphs(G):
+    """
+    Check small graphs, where few nodes gain from moving each round, are
+    clustered like networkx's Louvain rather than left as singletons
+    """
+    clusters = louvain_clusters(similarity_graph(graph_pairs(G)))
+
+    expected = nx.community.louvain_communities(G, weight=None, seed=0)
+    assert sorted(map(sorted, clusters)) == sorted(map(sorted, expected))
+
+
+class OneHotModel:
+    """
+    Embeds each text as its own axis, so no two texts are similar
+    """
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        vectors = np.eye(len(sentences), dtype=np.float32)
+        if convert_to_tensor:
+            return torch.from_numpy(vectors)
+        return vectors
+
+
+def test_rep_comment_analysis_without_similar_comments():
+    """
+    Check a document with no form letters, so an empty form letter graph,
+    is still analysed
+    """
+    df = pl.DataFrame(
+        {
+            "id": ["C-0", "C-1"],
+            "document_id": "EPA-0001",
+            "comment": ["a b c", "d e f"],
+            "cluster": pl.Series([None, None], dtype=pl.Utf8),
+        }
+    )
+
+    assert central_nodes(similarity_graph(make_pairs().clear()), []) == {}
+    comment_data = comments.rep_comment_analysis(
+        RepComments(document_id="EPA-0001"), df, OneHotModel()
+    )
+
+    # each comment only stands for itself, and neither is a form letter
+    assert sorted(
+        (rep["comment_id"], rep["comments_represented"], rep["form_letter"])
+        for rep in comment_data.rep_comments
+    ) == [("C-0", 1, False), ("C-1", 1, False)]
+    assert comment_data.num_total_comments == 2
+    assert comment_data.doc_comments["id"].to_list() == ["C-0", "C-1"]
@@ -0,0 +1,72 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from civiclens.collect import http_client
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        payload = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    http_client.reset()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+    http_client.reset()
+
+
+def test_get_session_is_shared_per_host():
+    """
+    The same session comes back for any url on a host
+    """
+    http_client.reset()
+    first = http_client.get_session("https://api.regulations.gov/v4/comments")
+    second = http_client.get_session("https://api.regulations.gov/v4/dockets")
+    other = http_client.get_session("https://www.federalregister.gov/api/v1")
+
+    assert first is second
+    assert first is not other
+    http_client.reset()
+
+
+def test_connections_are_reused(server_url):
+    """
+    Sequential requests to one host go over a single kept-alive connection
+    """
+    for i in range(5):
+        response = http_client.get(f"{server_url}/item/{i}")
+        assert response.json() == {"ok": True}
+
+    host_stats = http_client.stats()[server_url.split("//")[1]]
+    assert host_stats["requests"] == 5
+    assert host_stats["connections"] == 1
+    assert host_stats["reuse_ratio"] == pytest.approx(0.8)
+    assert sum(host_stats["latency_histogram"].values()) == 5
+
+
+def test_default_timeout_applied(server_url, mocker):
+    """
+    Requests without a timeout get DEFAULT_TIMEOUT
+    """
+    send = mocker.spy(http_client.HTTPAdapter, "send")
+    http_client.get(server_url)
+
+    assert send.call_args.kwargs["timeout"] == http_client.DEFAULT_TIMEOUT
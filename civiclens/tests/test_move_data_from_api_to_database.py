@@ -1,13 +1,24 @@
 import datetime
 from unittest.mock import MagicMock, patch
 
+import polars as pl
+import psycopg2
 import pytest
 
+from civiclens.collect import move_data_from_api_to_database
 from civiclens.collect.move_data_from_api_to_database import (
+    COMMENT_COLUMNS,
+    add_documents_to_db,
+    comment_row,
+    content_hash,
+    content_hash_expr,
+    existing_ids,
     extract_xml_text_from_doc,
     fetch_fr_document_details,
     fetch_xml_content,
     get_most_recent_doc_comment_date,
+    get_parse_pool,
+    insert_comments_into_db,
     parse_xml_content,
     verify_database_existence,
 )
@@ -24,7 +35,7 @@ def test_fetch_fr_document_details_success():  # no
 
     api_endpoint = f"https://www.federalregister.gov/api/v1/documents/{url}.json?fields[]=full_text_xml_url"
 
-    with patch("requests.get") as mock_api_hit:
+    with patch("civiclens.collect.http_client.get") as mock_api_hit:
         mock_api_hit.return_value.json.return_value = mock_response
         mock_api_hit.return_value.status_code = 200
 
@@ -43,7 +54,7 @@ def test_fetch_fr_document_details_error():
 
     api_endpoint = f"https://www.federalregister.gov/api/v1/documents/{blank_fr_num}.json?fields[]=full_text_xml_url"
 
-    with patch("requests.get") as mock_api_hit:
+    with patch("civiclens.collect.http_client.get") as mock_api_hit:
         mock_api_hit.return_value.status_code = 404
 
         with pytest.raises(Exception) as e:
@@ -65,7 +76,7 @@ def test_fetch_xml_content_success():
     expected_text = "test text"
     mock_response = expected_text
 
-    with patch("requests.get") as mock_api_hit:
+    with patch("civiclens.collect.http_client.get") as mock_api_hit:
         # Configure the mock to return the expected response
         mock_api_hit.return_value.text = mock_response
         mock_api_hit.return_value.status_code = 200
@@ -81,7 +92,7 @@ def test_fetch_xml_content_failure():
     """
     url = "mock_url"
 
-    with patch("requests.get") as mock_api_hit:
+    with patch("civiclens.collect.http_client.get") as mock_api_hit:
         # Configure the mock to return the expected response
         mock_api_hit.return_value.status_code = 404
 
@@ -122,16 +133,10 @@ def test_verify_database_existence():
     Check that verify_database_existence works and runs the right query
     """
     with patch(
-        (
-            "civiclens.collect.move_data_from_api_to_database.connect_"
-            "db_and_get_cursor"
-        )
-    ) as mock_connect_db:
+        "civiclens.collect.move_data_from_api_to_database.db_cursor"
+    ) as mock_db_cursor:
         mock_cursor = MagicMock()
-        mock_connect_db.return_value = (
-            MagicMock(),
-            mock_cursor,
-        )
+        mock_db_cursor.return_value.__enter__.return_value = mock_cursor
 
         table = "example_table"
         api_field_val = "example_value"
@@ -172,16 +177,10 @@ def test_verify_database_existence_not_found():
     runs the right query
     """
     with patch(
-        (
-            "civiclens.collect.move_data_from_api_to_database."
-            "connect_db_and_get_cursor"
-        )
-    ) as mock_connect_db:
+        "civiclens.collect.move_data_from_api_to_database.db_cursor"
+    ) as mock_db_cursor:
         mock_cursor = MagicMock()
-        mock_connect_db.return_value = (
-            MagicMock(),
-            mock_cursor,
-        )
+        mock_db_cursor.return_value.__enter__.return_value = mock_cursor
 
         table = "example_table"
         api_field_val = "example_value"
@@ -219,14 +218,10 @@ def test_get_most_recent_doc_comment_date():
     max comment posted data
     """
     with patch(
-        (
-            "civiclens.collect.move_data_from_api_to_database."
-            "connect_db_and_get_cursor"
-        )
-    ) as mock_connect_db:
+        "civiclens.collect.move_data_from_api_to_database.db_cursor"
+    ) as mock_db_cursor:
         mock_cursor = MagicMock()
-        mock_connection = MagicMock()
-        mock_connect_db.return_value = (mock_connection, mock_cursor)
+        mock_db_cursor.return_value.__enter__.return_value = mock_cursor
 
         doc_id = "test_doc_id"
 
@@ -268,3 +263,243 @@ def test_get_most_recent_doc_comment_date():
             "2024-02-23 04:00:00"  # One hour prior to comment posted date
         )
         assert result == expected_date
+
+
+def make_comment(comment_id, comment="text"):
+    return {
+        "id": comment_id,
+        "attributes": {"objectId": "obj", "title": f"title {comment_id}"},
+        "data": {"attributes": {"comment": comment, "pageCount": 2}},
+    }
+
+
+def test_comment_row():
+    """
+    Check a comment maps to a row in the order of the table columns
+    """
+    row = dict(
+        zip(COMMENT_COLUMNS, comment_row(make_comment("c1")), strict=True)
+    )
+
+    assert len(row) == 36
+    assert row["id"] == "c1"
+    assert row["object_id"] == "obj"
+    assert row["title"] == "title c1"
+    assert row["comment"] == "text"
+    assert row["page_count"] == 2
+    assert row["duplicate_comments"] == 0
+    assert row["withdrawn"] is False
+    assert row["content_hash"] == content_hash(list(row.values())[:-1])
+    assert comment_row(make_comment("c1"))[-1] == row["content_hash"]
+    assert comment_row(make_comment("c1", "edited"))[-1] != row["content_hash"]
+
+
+def test_content_hash_matches_frames():
+    """
+    Check a row hashes the same as the frame row polars builds from the same
+    values, and that nulls and empty strings hash differently
+    """
+    row = ["c1", None, "", 3, True, {"title": "cfr"}]
+    df = pl.DataFrame(
+        {
+            "id": ["c1"],
+            "email": pl.Series([None], dtype=pl.Utf8),
+            "phone": [""],
+            "page_count": [3],
+            "withdrawn": [True],
+            "cfr": ['{"title": "cfr"}'],
+        }
+    )
+
+    assert df.select(content_hash_expr(df.columns)).item() == content_hash(row)
+    assert content_hash(["c1", None]) != content_hash(["c1", ""])
+
+
+def test_insert_comments_into_db_batches():
+    """
+    Check comments are written in batches, one connection per batch, and
+    that only the latest copy of a repeated id is sent
+    """
+    comments = [make_comment(f"c{i}") for i in range(5)]
+    comments.insert(2, make_comment("c0", "updated"))
+
+    with patch.object(
+        move_data_from_api_to_database, "db_connection"
+    ) as mock_db_connection, patch.object(
+        move_data_from_api_to_database,
+        "execute_values",
+        # the second batch has one unchanged comment
+        side_effect=lambda cursor, query, rows, page_size: setattr(
+            cursor, "rowcount", 3 if len(rows) == 3 else 1
+        ),
+    ) as mock_execute_values:
+        result = insert_comments_into_db(iter(comments), batch_size=3)
+
+    assert result == {"written": 4, "skipped": 1, "errors": []}
+    assert mock_db_connection.call_count == 2
+    batches = [call.args[2] for call in mock_execute_values.call_args_list]
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert batches[0][0][COMMENT_COLUMNS.index("comment")] == "updated"
+
+
+def test_insert_comments_into_db_isolates_bad_rows():
+    """
+    Check that when a batch fails, the good rows are retried one at a time
+    and only the bad ones are reported
+    """
+    comments = [make_comment("good1"), make_comment("bad"), {"id": "broken"}]
+    comments.append(make_comment("good2"))
+    mock_cursor = MagicMock(rowcount=1)
+
+    def execute(query, row):
+        if row[0] == "bad":
+            raise psycopg2.DataError("value too long")
+
+    mock_cursor.execute.side_effect = execute
+
+    with patch.object(
+        move_data_from_api_to_database, "db_connection"
+    ) as mock_db_connection, patch.object(
+        move_data_from_api_to_database,
+        "execute_values",
+        side_effect=psycopg2.DataError("value too long"),
+    ):
+        mock_connection = MagicMock()
+        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_db_connection.return_value.__enter__.return_value = mock_connection
+        result = insert_comments_into_db(comments)
+
+    assert result["written"] == 2
+    assert len(result["errors"]) == 2
+    assert "broken" in result["errors"][0]["description"]
+    assert "bad" in result["errors"][1]["description"]
+    assert mock_connection.commit.call_count == 2
+    mock_db_connection.assert_called_once()
+
+
+def test_existing_ids():
+    """
+    Check existing_ids checks every id in one query and returns the ones
+    found
+    """
+    with patch.object(
+        move_data_from_api_to_database, "db_cursor"
+    ) as mock_db_cursor, patch.dict(
+        move_data_from_api_to_database.EXISTENCE_STATS,
+        {"queries": 0, "ids_checked": 0},
+    ):
+        mock_cursor = mock_db_cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [("doc-1",)]
+
+        result = existing_ids(
+            "regulations_comment",
+            ["doc-1", "doc-2", "doc-1", ""],
+            "document_id",
+        )
+
+        query, (ids,) = mock_cursor.execute.call_args.args
+        assert query == (
+            "SELECT DISTINCT document_id FROM regulations_comment "
+            "WHERE document_id = ANY(%s);"
+        )
+        assert sorted(ids) == ["doc-1", "doc-2"]
+        assert result == {"doc-1"}
+        assert move_data_from_api_to_database.EXISTENCE_STATS == {
+            "queries": 1,
+            "ids_checked": 2,
+        }
+
+        assert existing_ids("regulations_comment", []) == set()
+        mock_cursor.execute.assert_called_once()
+
+
+def test_add_documents_to_db_checks_in_bulk():
+    """
+    Check add_documents_to_db looks up the whole page of documents at once
+    and only adds new, commentable documents, once each
+    """
+    doc_list = [
+        {"id": doc_id, "attributes": {"openForComment": open_for_comment}}
+        for doc_id, open_for_comment in [
+            ("in-db", True),
+            ("new", True),
+            ("closed", False),
+            ("new", True),
+        ]
+    ]
+
+    with patch.object(
+        move_data_from_api_to_database,
+        "existing_ids",
+        return_value={"in-db"},
+    ) as mock_existing_ids, patch.object(
+        move_data_from_api_to_database,
+        "fetch_document_xml",
+        side_effect=lambda doc: (doc, None),
+    ), patch.object(
+        move_data_from_api_to_database, "qa_document_data"
+    ), patch.object(
+        move_data_from_api_to_database, "clean_document_data"
+    ), patch.object(
+        move_data_from_api_to_database,
+        "document_row",
+        side_effect=lambda doc: (doc["id"],),
+    ), patch.object(
+        move_data_from_api_to_database,
+        "upsert_document_rows",
+        side_effect=lambda rows: (list(rows), []),
+    ) as mock_upsert:
+        stats = add_documents_to_db(doc_list, parse_workers=0)
+
+    mock_existing_ids.assert_called_once()
+    table, ids = mock_existing_ids.call_args.args
+    assert table == "regulations_document"
+    assert list(ids) == ["in-db", "new", "new"]
+    mock_upsert.assert_called_once_with({"new": ("new",)})
+    assert stats["write"]["items"] == 1
+
+
+def test_get_parse_pool_is_shared():
+    """
+    Check every call for the same number of workers gets the same process
+    pool, and that parsing stays in-thread when no workers are asked for
+    """
+    assert get_parse_pool(0) is None
+
+    pool = get_parse_pool(2)
+    assert get_parse_pool(2) is pool
+    assert get_parse_pool(3) is not pool
+
+
+def test_document_row():
+    """
+    Check a document maps to a row in the order of DOCUMENT_COLUMNS, with
+    the title from regulations.gov rather than the Federal Register
+    """
+    attributes = {
+        key: f"attr-{key}"
+        for _, key in move_data_from_api_to_database.DOCUMENT_FIELDS
+    }
+    doc = {
+        "id": "EPA-HQ-2024-0001-0001",
+        "attributes": attributes,
+        "links": {"self": "https://api.regulations.gov/v4/documents/x"},
+        **{
+            key: f"xml-{key}"
+            for key in move_data_from_api_to_database.BLANK_XML_FIELDS
+        },
+    }
+
+    row = dict(
+        zip(
+            move_data_from_api_to_database.DOCUMENT_COLUMNS,
+            move_data_from_api_to_database.document_row(doc),
+            strict=True,
+        )
+    )
+
+    assert row["id"] == "EPA-HQ-2024-0001-0001"
+    assert row["document_type"] == "attr-documentType"
+    assert row["title"] == "attr-title"
+    assert row["summary"] == "xml-summary"
+    assert row["full_text_xml_url"] == doc["links"]["self"]
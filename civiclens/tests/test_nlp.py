@@ -115,3 +115,15 @@ def test_empty_form_df():
     )
     assert out_lst == []
     assert num_comments == 0
+
+
+def test_cluster_labels_override():
+    df = sample_df.with_columns(pl.lit(None).cast(pl.Utf8).alias("cluster"))
+
+    labels = comments.cluster_labels([{1, 2}, {4}], rows=df.shape[0])
+    assert labels.to_list()[:6] == [None, 0, 0, None, 1, None]
+
+    # a later clustering only overwrites the rows it covers
+    df = comments.assign_clusters(df=df, clusters=[{0, 1, 2}])
+    df = comments.assign_clusters(df=df, clusters=[{2, 3}])
+    assert df["cluster"].to_list()[:5] == ["0", "0", "0", "0", None]
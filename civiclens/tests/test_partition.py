@@ -0,0 +1,155 @@
+import math
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from civiclens.collect import access_api_data
+from civiclens.collect.partition import (
+    MAX_RESULTS,
+    PAGE_SIZE,
+    pull_partitioned,
+    split_window,
+)
+
+
+class FakePaginatedAPI:
+    """
+    Search endpoint over a list of (timestamp, id) objects, filtered by an
+    inclusive date range, that like the real one stops at page 20.
+    """
+
+    def __init__(self, objects):
+        self.objects = sorted(objects)
+        self.requests = []
+
+    def __call__(self, start, end, page_number):
+        self.requests.append((start, end, page_number))
+        assert page_number <= MAX_RESULTS // PAGE_SIZE
+        matches = [obj for obj in self.objects if start <= obj[0] <= end]
+        offset = (page_number - 1) * PAGE_SIZE
+        return {
+            "data": [
+                {"id": obj_id, "attributes": {"lastModifiedDate": str(when)}}
+                for when, obj_id in matches[offset : offset + PAGE_SIZE]
+            ],
+            "meta": {
+                "totalElements": len(matches),
+                "hasNextPage": offset + PAGE_SIZE < len(matches),
+            },
+        }
+
+
+def test_split_window():
+    """
+    Check a range is split into about equal parts that cover it exactly
+    """
+    parts = split_window(date(2024, 1, 1), date(2024, 1, 10), 3, timedelta(1))
+
+    assert parts == [
+        (date(2024, 1, 1), date(2024, 1, 3)),
+        (date(2024, 1, 4), date(2024, 1, 6)),
+        (date(2024, 1, 7), date(2024, 1, 10)),
+    ]
+    # never more parts than values in the range
+    assert split_window(
+        date(2024, 1, 1), date(2024, 1, 2), 5, timedelta(1)
+    ) == [
+        (date(2024, 1, 1), date(2024, 1, 1)),
+        (date(2024, 1, 2), date(2024, 1, 2)),
+    ]
+
+
+def test_pull_partitioned_gets_past_the_page_limit():
+    """
+    Check a busy range is split until every object can be fetched, using
+    far fewer probe requests than there are pages of results
+    """
+    start = datetime(2024, 1, 1)
+    # a quiet month, with a burst of 12,000 objects on the 10th
+    objects = [(start + timedelta(hours=i), f"quiet-{i}") for i in range(720)]
+    objects += [
+        (datetime(2024, 1, 10) + timedelta(seconds=i), f"busy-{i}")
+        for i in range(12_000)
+    ]
+    api = FakePaginatedAPI(objects)
+
+    results = pull_partitioned(api, start, datetime(2024, 1, 31, 23, 59, 59))
+
+    assert [obj["id"] for obj in results] == [
+        obj_id for _, obj_id in api.objects
+    ]
+    pages_of_results = math.ceil(len(objects) / PAGE_SIZE)
+    probes = [request for request in api.requests if request[2] == 1]
+    assert len(api.requests) - len(probes) < pages_of_results
+    assert len(api.requests) < 2 * pages_of_results
+
+
+def test_pull_partitioned_unsplittable_range(caplog):
+    """
+    Check a range that can't be split further returns what the API allows
+    and warns about the rest
+    """
+    when = datetime(2024, 1, 10)
+    api = FakePaginatedAPI([(when, f"same-{i}") for i in range(6000)])
+
+    results = pull_partitioned(api, when, when)
+
+    assert len(results) == MAX_RESULTS
+    assert "only the first 5000" in caplog.text
+
+
+def test_pull_reg_gov_data_dockets_partitioned():
+    """
+    Check the dockets pull asks for smaller date ranges when a range has
+    more dockets than the API will page through
+    """
+    responses = [
+        {"data": [], "meta": {"totalElements": 6000}},
+        {
+            "data": [{"id": "EPA-HQ-2024-0001"}],
+            "meta": {"totalElements": 1, "hasNextPage": False},
+        },
+        {
+            "data": [{"id": "EPA-HQ-2024-0002"}],
+            "meta": {"totalElements": 1, "hasNextPage": False},
+        },
+    ]
+    windows = []
+
+    def get(endpoint, headers, params, verify):
+        windows.append(
+            (
+                params["filter[lastModifiedDate][ge]"],
+                params["filter[lastModifiedDate][le]"],
+            )
+        )
+        r_json = responses[len(windows) - 1]
+        return MagicMock(
+            status_code=200,
+            headers={"X-RateLimit-Remaining": "900"},
+            json=lambda: r_json,
+        )
+
+    mock_session = MagicMock()
+    mock_session.get.side_effect = get
+
+    with patch.object(
+        access_api_data.http_client,
+        "get_session",
+        MagicMock(return_value=mock_session),
+    ):
+        results = access_api_data.pull_reg_gov_data(
+            "DEMO_KEY",
+            "dockets",
+            start_date="2024-01-01",
+            end_date="2024-01-02",
+        )
+
+    assert [docket["id"] for docket in results] == [
+        "EPA-HQ-2024-0001",
+        "EPA-HQ-2024-0002",
+    ]
+    assert windows == [
+        ("2024-01-01 00:00:00", "2024-01-02 23:59:59"),
+        ("2024-01-01 00:00:00", "2024-01-01 23:59:59"),
+        ("2024-01-02 00:00:00", "2024-01-02 23:59:59"),
+    ]
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from civiclens.collect.pipeline import Pipeline, Stage
+
+
+def test_pipeline_runs_every_stage():
+    """
+    Check every item goes through each stage once, dropped items stop, and
+    batched stages see their items in batches
+    """
+    batches = []
+
+    def write(items):
+        batches.append(items)
+        return items
+
+    pipeline = Pipeline(
+        [
+            Stage("double", lambda x: x * 2, workers=4),
+            Stage("drop_tens", lambda x: None if x % 10 == 0 else x, workers=2),
+            Stage("write", write, batch_size=8),
+        ]
+    )
+
+    results = sorted(pipeline.run(range(100)))
+
+    assert results == [x * 2 for x in range(100) if (x * 2) % 10]
+    assert all(len(batch) <= 8 for batch in batches)
+    stats = pipeline.stats()
+    assert stats["double"]["items"] == 100
+    assert stats["drop_tens"]["items"] == 100
+    assert stats["write"]["items"] == len(results)
+    assert stats["write"]["queue_depth"] == 0
+
+
+def test_pipeline_backpressure():
+    """
+    Check a slow stage holds back the stages before it instead of letting
+    items pile up in the queues
+    """
+    taken = []
+    release = threading.Event()
+
+    def items():
+        for i in range(50):
+            taken.append(i)
+            yield i
+
+    def slow(x):
+        release.wait()
+        return x
+
+    pipeline = Pipeline(
+        [
+            Stage("fast", lambda x: x, workers=1, queue_size=2),
+            Stage("slow", slow, workers=1, queue_size=2),
+        ]
+    )
+    results = pipeline.run(items())
+    consumer = threading.Thread(target=lambda: results.__next__())
+    consumer.start()
+    time.sleep(0.3)
+
+    # one item in each worker, a full queue in front of each stage, and one
+    # held by the feeder
+    assert len(taken) <= 7
+    assert pipeline.stats()["slow"]["max_queue_depth"] == 2
+
+    release.set()
+    consumer.join()
+    assert len(list(results)) == 49
+
+
+def test_pipeline_raises_stage_errors():
+    """
+    Check an error in a stage stops the pipeline and is raised to the caller
+    """
+
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    pipeline = Pipeline([Stage("check", fail_on_three, workers=2)])
+
+    with pytest.raises(ValueError, match="bad item"):
+        list(pipeline.run(range(1000)))
@@ -0,0 +1,84 @@
+from unittest.mock import MagicMock, patch
+
+from civiclens.collect import qa_doc_comment_num
+from civiclens.collect.qa_doc_comment_num import (
+    CommentCountCache,
+    get_db_comment_counts,
+    reconcile_comment_counts,
+)
+
+
+DOC_INFO = [
+    ("EPA-0001", "0900000000000001", None),
+    ("EPA-0002", "0900000000000002", None),
+    ("EPA-0003", "0900000000000003", None),
+    ("EPA-0004", None, "2060-AV00"),  # no usable object id
+]
+API_COUNTS = {
+    "0900000000000001": 10,
+    "0900000000000002": 500,
+    "0900000000000003": 40,
+}
+
+
+def test_get_db_comment_counts():
+    """
+    Check the counts for every document come from one GROUP BY query
+    """
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [("EPA-0001", 3), ("EPA-0002", 7)]
+
+    with patch.object(qa_doc_comment_num, "db_cursor") as mock_db_cursor:
+        mock_db_cursor.return_value.__enter__.return_value = mock_cursor
+        counts = get_db_comment_counts(["EPA-0001", "EPA-0002", "EPA-0003"])
+
+    assert counts == {"EPA-0001": 3, "EPA-0002": 7}
+    mock_cursor.execute.assert_called_once()
+    assert "GROUP BY" in mock_cursor.execute.call_args.args[0]
+
+
+def test_reconcile_comment_counts_ranks_and_caches():
+    """
+    Check documents are ranked by missing comments, and a second run reuses
+    the cached API counts
+    """
+    cache = CommentCountCache(path="")
+
+    with patch.object(
+        qa_doc_comment_num,
+        "get_db_comment_counts",
+        return_value={"EPA-0001": 10, "EPA-0002": 300},
+    ), patch.object(
+        qa_doc_comment_num,
+        "get_doc_api_comment_count",
+        side_effect=lambda object_id, default: API_COUNTS[object_id],
+    ) as mock_api_count:
+        df = reconcile_comment_counts(DOC_INFO, cache)
+        reconcile_comment_counts(DOC_INFO, cache)
+
+    assert df["document_id"].to_list() == [
+        "EPA-0002",
+        "EPA-0003",
+        "EPA-0001",
+        "EPA-0004",
+    ]
+    assert df["diff"].to_list() == [200, 40, 0, None]
+    assert df["missing_share"].to_list()[:2] == [0.4, 1.0]
+    assert mock_api_count.call_count == 3
+
+
+def test_comment_count_cache_expires(tmp_path):
+    """
+    Check cached counts are saved for the next run and expire after the TTL
+    """
+    now = [1000.0]
+    path = str(tmp_path / "counts.json")
+    cache = CommentCountCache(path, ttl=60, clock=lambda: now[0])
+    cache.put("0900000000000001", 12)
+    cache.save()
+
+    reloaded = CommentCountCache(path, ttl=60, clock=lambda: now[0])
+    assert reloaded.get("0900000000000001") == 12
+
+    now[0] += 61
+    assert reloaded.get("0900000000000001") is None
@@ -0,0 +1,143 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import polars as pl
+
+from civiclens.collect import move_data_from_api_to_database as move_data
+from civiclens.collect import qa_rules
+from civiclens.collect.data_quality import QualityFlagSink, run_checks
+
+
+def make_comment(comment_id, **attributes):
+    comment_attributes = {
+        "commentOn": "0900006486d7b0c8",
+        "duplicateComments": 0,
+        "subtype": None,
+        "comment": "Please reconsider this rule.",
+        "modifyDate": datetime(2024, 5, 1, 12),
+        "postedDate": datetime(2024, 5, 1, 12),
+        "receiveDate": datetime(2024, 4, 30, 9),
+        "withdrawn": False,
+    }
+    comment_attributes.update(attributes)
+    return {
+        "id": comment_id,
+        "attributes": {"objectId": "0900006486e1a2b3"},
+        "data": {"attributes": comment_attributes},
+    }
+
+
+def make_document(document_id, **fields):
+    document = {
+        "id": document_id,
+        "attributes": {
+            "documentType": "Rule",
+            "frDocNum": "2024-01234",
+            "withdrawn": False,
+            "commentEndDate": "2024-06-01T03:59:59Z",
+            "postedDate": "2024-04-01T04:00:00Z",
+            "commentStartDate": "2024-04-01T04:00:00Z",
+            "openForComment": True,
+            "title": "A rule",
+        },
+        "links": {"self": "https://api.regulations.gov/v4/documents/x"},
+        "CFR": "40 CFR Part 60",
+        "summary": None,
+        "supplementaryInformation": None,
+    }
+    for key, value in fields.items():
+        if key in document["attributes"]:
+            document["attributes"][key] = value
+        else:
+            document[key] = value
+    return document
+
+
+def per_record_violations(records, rules, data_type):
+    checks = [rule.as_check() for rule in rules]
+    return sorted(
+        (record["id"], data_type, failure.split(" (")[0])
+        for record in records
+        for failure in run_checks(record, checks)
+    )
+
+
+def test_frame_and_per_record_rules_agree():
+    """
+    Check validating a batch of comments and documents as a frame finds
+    the same violations as checking each record on its own
+    """
+    comments = [
+        make_comment("C-ok"),
+        make_comment("C-dup", duplicateComments=3, subtype="Letter"),
+        make_comment("C-text", comment=None, postedDate=None),
+        make_comment("C-subtype", subtype="Comment(s)", withdrawn=True),
+    ]
+    documents = [
+        make_document("D-ok"),
+        make_document("D-fr", frDocNum="2024/01234", CFR="40 part 60!"),
+        make_document("D-none", frDocNum=None, CFR=None, summary="text"),
+        make_document("D-closed", openForComment=False, commentEndDate="x"),
+    ]
+
+    for records, rules, data_type in [
+        (comments, qa_rules.COMMENT_RULES, "comment"),
+        (documents, qa_rules.DOCUMENT_RULES, "document"),
+    ]:
+        violations = qa_rules.validate_records(records, rules, data_type)
+        assert sorted(violations.iter_rows()) == per_record_violations(
+            records, rules, data_type
+        )
+
+    assert per_record_violations(
+        comments, qa_rules.COMMENT_RULES, "comment"
+    ) == [
+        ("C-dup", "comment", "duplicateComments != 0"),
+        ("C-dup", "comment", "subtype is not an expected value"),
+        ("C-subtype", "comment", "withdrawn is not False"),
+        ("C-text", "comment", "comment is not string"),
+        ("C-text", "comment", "postedDate is not datetime"),
+    ]
+
+
+def test_validate_frame_wrong_type_fails_every_row():
+    """
+    Check a column of the wrong type fails the rule for every row, unless
+    the rule allows nulls and the value is null
+    """
+    df = pl.DataFrame(
+        {
+            "id": ["C-1", "C-2"],
+            "data.attributes.postedDate": ["2024-05-01T12:00:00Z", None],
+            "data.attributes.subtype": [None, None],
+        }
+    )
+    rules = [
+        rule
+        for rule in qa_rules.COMMENT_RULES
+        if rule.column in df.columns and rule.column != "id"
+    ]
+
+    violations = qa_rules.validate_frame(df, rules, "comment")
+
+    assert violations.rows() == [
+        ("C-1", "comment", "postedDate is not datetime"),
+        ("C-2", "comment", "postedDate is not datetime"),
+    ]
+
+
+def test_qa_comment_batch_flags_violations():
+    """
+    Check the batch QA of comments flags each failed rule through the sink
+    """
+    batches = []
+    sink = QualityFlagSink(batches.append)
+    comments = [make_comment("C-ok"), make_comment("C-bad", withdrawn=None)]
+
+    with patch.object(move_data, "QA_FLAGS", sink):
+        assert move_data.qa_comment_batch(comments) == 1
+        sink.flush()
+
+    assert [flag[:3] for flag in batches[0]] == [
+        ("C-bad", "comment", "withdrawn is not False")
+    ]
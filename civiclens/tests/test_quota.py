@@ -0,0 +1,117 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from civiclens.collect.quota import QuotaScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_scheduler(clock, **kwargs):
+    kwargs.setdefault("limit", 100)
+    kwargs.setdefault("window", 100)
+    kwargs.setdefault("burst", 5)
+    return QuotaScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def response(status_code=200, **headers):
+    return MagicMock(status_code=status_code, headers=headers)
+
+
+def test_burst_then_paced():
+    """
+    A class can send `burst` requests straight away, after which requests
+    are spread over the rest of the window
+    """
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, burst=5)
+
+    granted = [scheduler.try_acquire("status") for _ in range(6)]
+    assert granted[:5] == [0] * 5
+    assert granted[5] > 0
+
+    scheduler.acquire("status")
+    assert clock.now >= granted[5]
+    assert scheduler.budget()["used"] == 6
+
+
+def test_work_class_reserve():
+    """
+    Backfills stop once only their reserved share of the budget is left,
+    while status checks can still use it
+    """
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, burst=100)
+
+    while scheduler.try_acquire("backfill") == 0:
+        pass
+
+    budget = scheduler.budget()
+    assert budget["used"] == 70
+    assert budget["available"]["backfill"] == 0
+    assert budget["available"]["status"] == 30
+    assert scheduler.try_acquire("status") == 0
+
+    with pytest.raises(ValueError):
+        scheduler.try_acquire("unknown")
+
+
+def test_record_response_syncs_with_server():
+    """
+    X-RateLimit-Remaining replaces the local count, and a 429 blocks every
+    class for Retry-After seconds
+    """
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+
+    scheduler.record_response(response(**{"X-RateLimit-Remaining": "40"}))
+    assert scheduler.budget()["used"] == 60
+
+    scheduler.record_response(response(429, **{"Retry-After": "30"}))
+    assert scheduler.try_acquire("status") == pytest.approx(30)
+    clock.now = 30
+    assert scheduler.try_acquire("status") == 0
+
+
+def test_429_without_retry_after_waits_for_window():
+    """
+    Without a Retry-After header the rest of the window is treated as spent
+    """
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.try_acquire("status")
+    clock.now = 40
+
+    scheduler.record_response(response(429))
+    assert scheduler.budget()["remaining"] == 0
+    assert scheduler.try_acquire("status") == pytest.approx(60)
+
+    clock.now = 100
+    assert scheduler.try_acquire("status") == 0
+    assert scheduler.budget()["used"] == 1
+
+
+def test_state_is_shared_through_file(tmp_path):
+    """
+    Two schedulers on the same file draw from the same budget
+    """
+    clock = FakeClock()
+    path = str(tmp_path / "quota.json")
+    first = make_scheduler(clock, path=path)
+    second = make_scheduler(clock, path=path)
+
+    for _ in range(3):
+        assert first.try_acquire("sync") == 0
+    second.try_acquire("sync")
+
+    assert first.budget()["used"] == 4
+    assert second.budget()["used"] == 4
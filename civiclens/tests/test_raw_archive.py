@@ -0,0 +1,118 @@
+from datetime import date, datetime, timezone
+from unittest.mock import patch
+
+from civiclens.collect import move_data_from_api_to_database as move_data
+from civiclens.collect.raw_archive import RawArchive
+
+
+def make_archive(tmp_path, now):
+    return RawArchive(str(tmp_path), batch_size=2, clock=lambda: now[0])
+
+
+def test_archive_keeps_latest_version(tmp_path):
+    """
+    Check payloads are partitioned by fetch date, and reading them back
+    gives the latest version of each id once
+    """
+    now = [datetime(2024, 5, 1, 12, tzinfo=timezone.utc)]
+    archive = make_archive(tmp_path, now)
+    archive.append("documents", [{"id": "EPA-0001", "v": 1}])
+    now[0] = datetime(2024, 5, 2, 12, tzinfo=timezone.utc)
+    archive.append(
+        "documents", [{"id": "EPA-0002", "v": 1}, {"id": "EPA-0001", "v": 2}]
+    )
+
+    assert (tmp_path / "documents" / "date=2024-05-01").is_dir()
+    assert list(archive.iter_payloads("documents")) == [
+        {"id": "EPA-0002", "v": 1},
+        {"id": "EPA-0001", "v": 2},
+    ]
+    assert list(
+        archive.iter_payloads("documents", end_date=date(2024, 5, 1))
+    ) == [{"id": "EPA-0001", "v": 1}]
+    assert list(archive.iter_payloads("comments")) == []
+
+
+def test_archived_writes_batches_before_cleaning(tmp_path):
+    """
+    Check a stream is archived in batches, including a last partial batch,
+    and changes made to payloads after they pass through are not archived
+    """
+    now = [datetime(2024, 5, 1, 12, tzinfo=timezone.utc)]
+    archive = make_archive(tmp_path, now)
+    comments = [{"id": f"C-{i}", "text": " raw "} for i in range(5)]
+
+    for comment in archive.archived("comments", comments):
+        comment["text"] = comment["text"].strip()
+
+    assert archive.stats() == {"payloads": 5, "files": 3}
+    assert [c["text"] for c in archive.iter_payloads("comments")] == [
+        " raw "
+    ] * 5
+
+
+def test_replay_archived_data(tmp_path):
+    """
+    Check replaying upserts archived dockets, the documents open for
+    comment, and comments on documents in the db, without calling the API
+    """
+    now = [datetime(2024, 5, 1, 12, tzinfo=timezone.utc)]
+    archive = make_archive(tmp_path, now)
+    archive.append("dockets", [{"id": "EPA-HQ-0001", "attributes": {}}])
+    archive.append(
+        "documents",
+        [
+            {
+                "id": "EPA-0001",
+                "attributes": {"docketId": "EPA-HQ-0001", "openForComment": 1},
+            },
+            {
+                "id": "EPA-0002",
+                "attributes": {"docketId": "EPA-HQ-0001", "openForComment": 0},
+            },
+        ],
+    )
+    archive.append(
+        "comments",
+        [
+            {
+                "id": f"C-{document_id}",
+                "data": {"attributes": {"commentOnDocumentId": document_id}},
+            }
+            for document_id in ("EPA-0001", "EPA-0002")
+        ],
+    )
+    inserted_comments = []
+
+    def insert_comments(comments):
+        inserted_comments.extend(comment["id"] for comment in comments)
+        return {"written": len(inserted_comments), "errors": []}
+
+    with patch.object(move_data, "qa_docket_data"), patch.object(
+        move_data, "insert_docket_into_db", return_value={"error": False}
+    ) as mock_insert_docket, patch.object(
+        move_data, "upsert_documents"
+    ) as mock_upsert_documents, patch.object(
+        move_data,
+        "existing_ids",
+        side_effect=lambda table, ids: set(ids) & {"EPA-0001"},
+    ), patch.object(
+        move_data, "clean_comment_data"
+    ), patch.object(
+        move_data, "qa_comment_data"
+    ), patch.object(
+        move_data, "insert_comments_into_db", side_effect=insert_comments
+    ), patch.object(
+        move_data, "pull_reg_gov_data"
+    ) as mock_api:
+        replayed = move_data.replay_archived_data(
+            "2024-05-01", "2024-05-01", True, True, True, archive=archive
+        )
+
+    assert replayed == {"dockets": 1, "documents": 1, "comments": 1}
+    assert mock_insert_docket.call_args.args[0][0]["id"] == "EPA-HQ-0001"
+    assert [doc["id"] for doc in mock_upsert_documents.call_args.args[0]] == [
+        "EPA-0001"
+    ]
+    assert inserted_comments == ["C-EPA-0001"]
+    mock_api.assert_not_called()
@@ -0,0 +1,302 @@
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from civiclens.collect import sync
+from civiclens.collect.access_api_data import format_datetime_for_api
+
+
+def make_objects(num_objects, per_timestamp=1):
+    """
+    Objects sorted like the API returns them, `per_timestamp` sharing each
+    lastModifiedDate
+    """
+    start = datetime(2024, 4, 15, 12, tzinfo=timezone.utc)
+    return [
+        {
+            "id": f"DOC-{i:04}",
+            "attributes": {
+                "lastModifiedDate": (
+                    start + timedelta(minutes=i // per_timestamp)
+                ).strftime("%Y-%m-%dT%H:%M:%SZ")
+            },
+        }
+        for i in range(num_objects)
+    ]
+
+
+class FakeSearchAPI:
+    """
+    Stand-in for get_reg_gov_page serving `objects`, which fails with a 500
+    on the calls listed in `fail_on`
+    """
+
+    def __init__(self, objects, fail_on=()):
+        self.objects = objects
+        self.fail_on = set(fail_on)
+        self.calls = 0
+
+    def __call__(self, api_key, data_type, params):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise requests.HTTPError("500 Server Error")
+
+        matches = [
+            obj
+            for obj in self.objects
+            if format_datetime_for_api(obj["attributes"]["lastModifiedDate"])
+            >= params["filter[lastModifiedDate][ge]"]
+        ]
+        start = (params["page[number]"] - 1) * params["page[size]"]
+        page = matches[start : start + params["page[size]"]]
+        return {
+            "data": page,
+            "meta": {"hasNextPage": start + len(page) < len(matches)},
+        }
+
+
+def run_until_complete(api, state, handle_page):
+    """
+    Rerun the sync after every failure, as the nightly job would
+    """
+    while True:
+        try:
+            return sync.sync_date_range(
+                "DEMO_KEY",
+                "documents",
+                "2024-04-15",
+                "2024-04-20",
+                handle_page,
+                state=state,
+                fetch_page=api,
+            )
+        except requests.HTTPError:
+            continue
+
+
+def test_iter_sync_pages_from_start():
+    """
+    Check every object is returned once, in order, with a cursor per page
+    """
+    objects = make_objects(600)
+    api = FakeSearchAPI(objects)
+
+    pages = list(
+        sync.iter_sync_pages(
+            "DEMO_KEY", "documents", "2024-04-15", "2024-04-20", fetch_page=api
+        )
+    )
+
+    assert [obj for page, _ in pages for obj in page] == objects
+    cursor = pages[-1][1]
+    assert cursor["last_id"] == "DOC-0599"
+    assert cursor["objects"] == 600
+    assert cursor["completed"]
+    assert not pages[0][1]["completed"]
+
+
+def test_iter_sync_pages_with_shared_timestamps():
+    """
+    Check paging moves on when a whole page has the same lastModifiedDate
+    """
+    objects = make_objects(700, per_timestamp=300)
+
+    pages = list(
+        sync.iter_sync_pages(
+            "DEMO_KEY",
+            "documents",
+            "2024-04-15",
+            "2024-04-20",
+            fetch_page=FakeSearchAPI(objects),
+        )
+    )
+
+    assert [obj["id"] for page, _ in pages for obj in page] == [
+        obj["id"] for obj in objects
+    ]
+
+
+def test_sync_resumes_after_failures():
+    """
+    Check a sync interrupted by API errors writes every object exactly once
+    across reruns and never re-requests finished pages
+    """
+    objects = make_objects(1000, per_timestamp=3)
+    api = FakeSearchAPI(objects, fail_on={2, 4, 5, 7})
+    state = sync.MemorySyncState()
+    written = []
+
+    cursor = run_until_complete(api, state, written.extend)
+
+    assert written == objects
+    assert cursor["completed"]
+    assert cursor["objects"] == 1000
+    # each request starts at the last timestamp seen, so the 1000 objects
+    # take 5 pages; plus one request for each failure
+    assert api.calls == 5 + 4
+
+    # a finished date range isn't requested again
+    cursor = run_until_complete(api, state, written.extend)
+    assert api.calls == 9
+    assert len(written) == 1000
+
+
+def test_sync_resumes_after_handler_failure():
+    """
+    Check a page that failed to write is retried on the next run
+    """
+    objects = make_objects(600)
+    api = FakeSearchAPI(objects)
+    state = sync.MemorySyncState()
+    written = []
+
+    def handle_page(page):
+        if len(written) == 250 and not handle_page.failed:
+            handle_page.failed = True
+            raise requests.HTTPError("database went away")
+        written.extend(page)
+
+    handle_page.failed = False
+
+    cursor = run_until_complete(api, state, handle_page)
+
+    assert written == objects
+    assert cursor["pages"] == 3
+
+
+def test_range_is_open_across_dst():
+    """
+    Check the current date in the API's timezone follows daylight saving
+    time, so a range ending on a winter evening in Eastern Time is still
+    open after midnight UTC
+    """
+    # 00:30 EDT on Nov 3rd, and 23:30 EST on Nov 3rd after clocks go back
+    before_change = datetime(2024, 11, 3, 4, 30, tzinfo=timezone.utc)
+    after_change = datetime(2024, 11, 4, 4, 30, tzinfo=timezone.utc)
+    assert sync.api_today(before_change) == date(2024, 11, 3)
+    assert sync.api_today(after_change) == date(2024, 11, 3)
+    assert sync.range_is_open("2024-11-03", sync.api_today(after_change))
+
+    # 23:30 EDT on Mar 10th after clocks go forward
+    spring = datetime(2024, 3, 11, 3, 30, tzinfo=timezone.utc)
+    assert sync.api_today(spring) == date(2024, 3, 10)
+    # midnight EST on Mar 10th, before the change, closes the day before
+    assert not sync.range_is_open(
+        "2024-03-09",
+        sync.api_today(datetime(2024, 3, 10, 5, tzinfo=timezone.utc)),
+    )
+
+
+def test_sync_open_range_checks_again():
+    """
+    Check a range ending today isn't saved as completed, so a rerun the
+    same day picks up objects modified since, and the range is closed once
+    a run after it ended reaches the end
+    """
+    objects = make_objects(300)
+    api = FakeSearchAPI(objects)
+    state = sync.MemorySyncState()
+    written = []
+
+    def run(today):
+        return sync.sync_date_range(
+            "DEMO_KEY",
+            "documents",
+            "2024-04-15",
+            "2024-04-20",
+            written.extend,
+            state=state,
+            fetch_page=api,
+            today=today,
+        )
+
+    cursor = run(date(2024, 4, 20))
+    assert not cursor["completed"]
+    assert written == objects
+
+    api.objects = objects + make_objects(320)[300:]
+    cursor = run(date(2024, 4, 20))
+    assert written == api.objects
+    assert not cursor["completed"]
+
+    cursor = run(date(2024, 4, 21))
+    assert cursor["completed"]
+    assert written == api.objects
+    calls = api.calls
+    run(date(2024, 4, 22))
+    assert api.calls == calls
+
+
+def test_restart_ignores_saved_cursor():
+    """
+    Check restart=True syncs the whole range again
+    """
+    objects = make_objects(300)
+    state = sync.MemorySyncState()
+    written = []
+    run_until_complete(FakeSearchAPI(objects), state, written.extend)
+
+    sync.sync_date_range(
+        "DEMO_KEY",
+        "documents",
+        "2024-04-15",
+        "2024-04-20",
+        written.extend,
+        state=state,
+        restart=True,
+        fetch_page=FakeSearchAPI(objects),
+    )
+
+    assert len(written) == 600
+
+
+def test_database_sync_state_load():
+    """
+    Check saved cursors are read back with the timestamp in API format
+    """
+    mock_connection = MagicMock()
+    mock_cursor = mock_connection.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = (
+        datetime(2024, 4, 15, 8, tzinfo=timezone(timedelta(hours=-4))),
+        "DOC-0001",
+        3,
+        750,
+        False,
+    )
+
+    with patch.object(sync, "db_connection") as mock_db_connection:
+        mock_db_connection.return_value.__enter__.return_value = mock_connection
+        cursor = sync.DatabaseSyncState().load(
+            "documents", "2024-04-15", "2024-04-20"
+        )
+
+    assert cursor == {
+        "last_modified_date": "2024-04-15T12:00:00Z",
+        "last_id": "DOC-0001",
+        "pages": 3,
+        "objects": 750,
+        "completed": False,
+    }
+    assert mock_cursor.execute.call_args.args[1] == (
+        "documents",
+        "2024-04-15",
+        "2024-04-20",
+    )
+
+
+def test_database_sync_state_load_new_range():
+    """
+    Check a date range with no saved cursor starts from the beginning
+    """
+    mock_connection = MagicMock()
+    mock_cursor = mock_connection.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = None
+
+    with patch.object(sync, "db_connection") as mock_db_connection:
+        mock_db_connection.return_value.__enter__.return_value = mock_connection
+        cursor = sync.DatabaseSyncState().load(
+            "comments", "2024-04-15", "2024-04-20"
+        )
+
+    assert cursor == sync.new_cursor()
@@ -1,6 +1,8 @@
-from unittest.mock import patch
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
 
 import polars as pl
+import psycopg2
 import pytest
 
 from civiclens.collect import upload_bulk_csvs_to_db
@@ -293,3 +295,101 @@ def test_extract_fields_from_row_bad_data():
         upload_bulk_csvs_to_db.extract_fields_from_row(pl_row_bad, "test_id")
     except Exception as e:
         assert str(e) == "'Comment on Document ID'"
+
+
+def write_bulk_csv(path, num_rows):
+    """
+    Write a small bulk download csv with the columns the loader reads
+    """
+    headers = list(upload_bulk_csvs_to_db.BULK_CSV_TEXT_COLUMNS.values())
+    headers += ["Duplicate Comments", "Page Count", "Is Withdrawn?"]
+    headers += ["Posted Date", "Received Date", "Comment"]
+    rows = []
+    for i in range(num_rows):
+        row = dict.fromkeys(headers)
+        row.update(
+            {
+                "Document ID": f"FWS-HQ-NWRS-2022-0106-{i}",
+                "Comment on Document ID": "FWS-HQ-NWRS-2022-0106-35375",
+                "Page Count": "1",
+                "Is Withdrawn?": "false",
+                "Posted Date": "2024-03-06T05:00Z",
+                "Received Date": "2024-03-05T05:00Z",
+                "Comment": f"I support&#39; this <br/> rule {i}",
+            }
+        )
+        rows.append(row)
+    rows[1]["Comment"] = None
+    pl.DataFrame(rows).write_csv(path)
+
+
+def test_iter_bulk_comment_frames(tmp_path):
+    """
+    Check the csv is streamed in batches of comments table rows, with null
+    comments dropped and the same values extract_fields_from_row gives
+    """
+    path = tmp_path / "bulk.csv"
+    write_bulk_csv(path, 5)
+
+    frames = list(upload_bulk_csvs_to_db.iter_bulk_comment_frames(str(path), 2))
+    df = pl.concat(frames)
+
+    assert len(frames) > 1
+    assert df.columns == list(upload_bulk_csvs_to_db.COMMENT_COLUMNS)
+    assert df["id"].to_list() == [
+        f"FWS-HQ-NWRS-2022-0106-{i}" for i in (0, 2, 3, 4)
+    ]
+    first = df.row(0, named=True)
+    assert first["object_id"] == "FWS-HQ-NWRS-2022-0106-35375"
+    assert first["comment"] == "I support' this rule 0"
+    assert first["posted_date"] == datetime(2024, 3, 6, 5, tzinfo=timezone.utc)
+    assert first["page_count"] == 1
+    assert first["duplicate_comments"] == 0
+    assert first["withdrawn"] is False
+    assert first["email"] is None
+
+
+def test_copy_comment_frames_to_db_falls_back_to_inserts(tmp_path):
+    """
+    Check each batch is copied and merged in its own transaction, a batch
+    that fails is retried with row inserts, and unchanged comments the
+    merge skips are counted
+    """
+    path = tmp_path / "bulk.csv"
+    write_bulk_csv(path, 6)
+    csv = pl.read_csv(path, infer_schema_length=0)
+    frames = [
+        upload_bulk_csvs_to_db.comment_frame(csv[start : start + 2], "doc")
+        for start in (0, 2, 4)
+    ]
+
+    mock_connection, mock_cursor = MagicMock(), MagicMock(rowcount=2)
+    mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
+    outcomes = iter([1, psycopg2.DataError("bad row"), 1])
+
+    def copy_expert(query, file):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        mock_cursor.rowcount = outcome
+
+    mock_cursor.copy_expert.side_effect = copy_expert
+    with patch.object(
+        upload_bulk_csvs_to_db, "db_connection"
+    ) as mock_db_connection, patch.object(
+        upload_bulk_csvs_to_db,
+        "upsert_comment_rows",
+        return_value=(2, []),
+    ) as mock_upsert:
+        mock_db_connection.return_value.__enter__.return_value = mock_connection
+        result = upload_bulk_csvs_to_db.copy_comment_frames_to_db(frames)
+
+    assert result == {"written": 4, "skipped": 1, "errors": []}
+    assert mock_cursor.copy_expert.call_count == 3
+    mock_connection.rollback.assert_called_once()
+    (rows,) = mock_upsert.call_args.args
+    assert list(rows) == [
+        "FWS-HQ-NWRS-2022-0106-2",
+        "FWS-HQ-NWRS-2022-0106-3",
+    ]
+    mock_db_connection.assert_called_once()
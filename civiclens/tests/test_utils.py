@@ -1,11 +1,14 @@
 import sqlite3
+import threading
 from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 import polars as pl
 import pytest
 
+from civiclens.utils import database_access
 from civiclens.utils.database_access import pull_data
-from civiclens.utils.text import clean_text
+from civiclens.utils.text import clean_text, clean_text_expr
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -57,3 +60,58 @@ def test_clean_user_regex():
     dirty = "The cat is home"
     clean = "The dog is home"
     assert clean_text(dirty, patterns=[(r"cat", "dog")]) == clean
+
+
+def test_clean_text_expr_matches_clean_text():
+    texts = [
+        "<br/> Here's some text. ndash Also more text",
+        "Fish &amp; wildlife&#39;s &rdquo;plan&rdquo; \u00e2 <br >  caf\u00e9",
+        "  spaced\tout\n\ntext?: 1.5 - 2  ",
+        "",
+        None,
+    ]
+    out = pl.DataFrame({"comment": texts}).select(clean_text_expr("comment"))
+    assert out["comment"].to_list() == [
+        clean_text(text) if text is not None else None for text in texts
+    ]
+
+
+def test_clean_text_expr_user_regex():
+    df = pl.DataFrame({"comment": ["The cat is home"]})
+    out = df.select(clean_text_expr("comment", patterns=[(r"cat", "dog")]))
+    assert out["comment"].to_list() == ["The dog is home"]
+
+
+@pytest.fixture
+def fake_pool():
+    with patch.object(database_access, "ThreadedConnectionPool") as pool_cls:
+        pool_cls.return_value.getconn.side_effect = lambda: MagicMock(closed=0)
+        yield database_access.ConnectionPool(maxconn=1, timeout=0.05)
+
+
+def test_pool_waits_and_counts(fake_pool):
+    first = fake_pool.getconn()
+    with pytest.raises(database_access.PoolError):
+        fake_pool.getconn()
+
+    threading.Timer(0.01, fake_pool.putconn, args=(first,)).start()
+    fake_pool.timeout = 5
+    fake_pool.putconn(fake_pool.getconn())
+
+    stats = fake_pool.stats()
+    assert stats["checkouts"] == 2
+    assert stats["exhausted"] == 2
+    assert stats["wait_seconds"] > 0
+
+
+def test_db_connection_returns_connection(fake_pool):
+    params = {"database": "civiclens"}
+    with patch.object(database_access, "get_pool", return_value=fake_pool):
+        with pytest.raises(RuntimeError):
+            with database_access.db_connection(params):
+                raise RuntimeError("query failed")
+
+        with database_access.db_connection(params) as connection:
+            assert connection is not None
+
+    assert fake_pool.stats()["checkouts"] == 2
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -25,3 +26,37 @@ DROPLET_ID = os.environ.get("DROPLET_ID")
 
 # Regulations.GOV
 REG_GOV_API_KEY = os.environ.get("REG_GOV_API_KEY")
+# shared by every collector process; set to "" to keep the quota in memory
+REG_GOV_QUOTA_FILE = os.environ.get(
+    "REG_GOV_QUOTA_FILE",
+    os.path.join(tempfile.gettempdir(), "civiclens_reg_gov_quota.json"),
+)
+
+# Federal Register XML cache; set FR_CACHE_DIR to "" to turn it off
+FR_CACHE_DIR = os.environ.get(
+    "FR_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "civiclens_fr_cache"),
+)
+FR_CACHE_MAX_BYTES = int(os.environ.get("FR_CACHE_MAX_BYTES", 256 * 2**20))
+
+# regulations.gov comment counts from qa_doc_comment_num, reused for
+# COMMENT_COUNT_TTL seconds; set COMMENT_COUNT_CACHE_FILE to "" to keep them
+# in memory
+COMMENT_COUNT_CACHE_FILE = os.environ.get(
+    "COMMENT_COUNT_CACHE_FILE",
+    os.path.join(tempfile.gettempdir(), "civiclens_comment_counts.json"),
+)
+COMMENT_COUNT_TTL = int(os.environ.get("COMMENT_COUNT_TTL", 6 * 3600))
+
+# every raw payload from the regulations.gov API, kept so cleaning and QA can
+# be re-run with --replay without calling the API again. Off unless
+# RAW_ARCHIVE_DIR is set; it grows by a partition a day and is never pruned,
+# so point it at durable storage and remove old date= directories as needed
+RAW_ARCHIVE_DIR = os.environ.get("RAW_ARCHIVE_DIR", "")
+
+# SBERT embeddings of comments, so the nlp pipeline only encodes new or edited
+# comments. Off unless EMBEDDING_STORE_DIR is set, so by default every comment
+# is encoded each run. It has to outlive the machine the pipeline runs on (the
+# droplet is destroyed after a --cloud run), eg a mounted volume; vectors of
+# deleted comments are never pruned, so remove the directory to reclaim space
+EMBEDDING_STORE_DIR = os.environ.get("EMBEDDING_STORE_DIR", "")
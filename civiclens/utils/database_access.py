@@ -1,37 +1,211 @@
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
 import polars as pl
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
-from civiclens.nlp.tools import RepComments
+
+if TYPE_CHECKING:
+    from civiclens.nlp.tools import RepComments
 
 
 load_dotenv()
 
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+POOL_TIMEOUT = 30  # seconds to wait for a free connection
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to one database.
+
+    psycopg2's ThreadedConnectionPool raises as soon as every connection is
+    checked out; this waits up to `timeout` seconds for one to come back
+    instead, and keeps the counters reported by `stats`.
+    """
+
+    def __init__(
+        self,
+        maxconn: int = POOL_MAX_CONNECTIONS,
+        timeout: float = POOL_TIMEOUT,
+        **connect_kwargs,
+    ):
+        """
+        Args:
+            maxconn (int): most connections to hold open at once
+            timeout (float): seconds to wait for a free connection
+            **connect_kwargs: passed on to `psycopg2.connect`
+        """
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(
+            POOL_MIN_CONNECTIONS, maxconn, **connect_kwargs
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._stats = {"checkouts": 0, "wait_seconds": 0.0, "exhausted": 0}
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """
+        Check out a connection, waiting if they are all in use.
+        """
+        start = time.monotonic()
+        exhausted = not self._slots.acquire(blocking=False)
+        if exhausted and not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["exhausted"] += 1
+            raise PoolError(
+                f"no database connection free after {self.timeout} seconds"
+            )
+
+        try:
+            connection = self._pool.getconn()
+            if connection.closed:
+                # the server dropped it while it sat in the pool
+                self._pool.putconn(connection, close=True)
+                connection = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds"] += time.monotonic() - start
+            self._stats["exhausted"] += exhausted
+        return connection
+
+    def putconn(self, connection: psycopg2.extensions.connection) -> None:
+        """
+        Return a connection to the pool. Any open transaction is rolled
+        back, and closed connections are discarded.
+        """
+        self._pool.putconn(connection, close=bool(connection.closed))
+        self._slots.release()
+
+    def stats(self) -> dict:
+        """
+        Returns the number of checkouts, total seconds spent waiting for a
+        connection and how many checkouts found every connection in use.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def closeall(self) -> None:
+        self._pool.closeall()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connection_params() -> dict:
+    """
+    Connection settings for the CivicLens database from the environment.
+    """
+    return {
+        "database": os.getenv("DATABASE"),
+        "user": os.getenv("DATABASE_USER"),
+        "password": os.getenv("DATABASE_PASSWORD"),
+        "host": os.getenv("DATABASE_HOST"),
+        "port": os.getenv("DATABASE_PORT"),
+    }
+
+
+def get_pool(params: Optional[dict] = None) -> ConnectionPool:
+    """
+    Returns the shared pool for a set of connection settings, creating it on
+    first use.
+
+    Args:
+        params (dict): keyword arguments for `psycopg2.connect`, defaults to
+            `connection_params()`
+
+    Returns:
+        ConnectionPool
+    """
+    params = params if params is not None else connection_params()
+    key = tuple(sorted(params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(**params)
+            _pools[key] = pool
+    return pool
+
+
+@contextmanager
+def db_connection(
+    params: Optional[dict] = None,
+) -> Iterator[psycopg2.extensions.connection]:
+    """
+    Check a connection out of the shared pool for the length of a `with`
+    block. Commit before leaving the block; anything uncommitted is rolled
+    back when the connection goes back to the pool.
+
+    Args:
+        params (dict): keyword arguments for `psycopg2.connect`, defaults to
+            `connection_params()`
+
+    Yields:
+        psycopg2 connection
+    """
+    pool = get_pool(params)
+    connection = pool.getconn()
+    try:
+        yield connection
+    finally:
+        pool.putconn(connection)
+
+
+def pool_stats() -> dict:
+    """
+    Report checkouts, total seconds spent waiting for a connection and the
+    number of times every connection was in use, summed over all pools.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+
+    totals = {"checkouts": 0, "wait_seconds": 0.0, "exhausted": 0}
+    for pool in pools:
+        for key, value in pool.stats().items():
+            totals[key] += value
+    return totals
+
+
+def close_pools() -> None:
+    """
+    Close every pooled connection.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
 
 class Database:
     """
-    Wrapper for CivicLens postrgres DB.
+    Wrapper for CivicLens postrgres DB. Holds a connection from the shared
+    pool until `close` hands it back.
     """
 
     def __init__(self):
-        self.conn = psycopg2.connect(
-            database=os.getenv("DATABASE"),
-            user=os.getenv("DATABASE_USER"),
-            password=os.getenv("DATABASE_PASSWORD"),
-            host=os.getenv("DATABASE_HOST"),
-            port=os.getenv("DATABASE_PORT"),
-        )
+        self._pool = get_pool()
+        self.conn = self._pool.getconn()
 
     def cursor(self):
         return self.conn.cursor()
 
     def close(self):
-        return self.conn.close()
+        if self.conn is not None:
+            self._pool.putconn(self.conn)
+            self.conn = None
 
     def commit(self):
         return self.conn.commit()
@@ -78,7 +252,7 @@ def pull_data(
     return results
 
 
-def upload_comments(connection: Database, comments: RepComments) -> None:
+def upload_comments(connection: Database, comments: "RepComments") -> None:
     """
     Uploads comment data to database.
 
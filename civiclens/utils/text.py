@@ -1,6 +1,8 @@
 import re
 from typing import Optional
 
+import polars as pl
+
 
 def regex_tokenize(text: str, pattern: str = r"\W+"):
     """
@@ -49,6 +51,44 @@ def clean_text(text: str, patterns: Optional[list[tuple]] = None) -> str:
     return re.sub(r"\s+", " ", text).strip()
 
 
+def clean_text_expr(
+    column: str, patterns: Optional[list[tuple]] = None
+) -> pl.Expr:
+    r"""
+    Polars expression version of `clean_text`, for cleaning a whole column
+    of comments at once. Nulls are left as nulls.
+
+    Args:
+        column (str): name of the column holding comment text
+        patterns (list[str]): optional list of regular expression patterns
+            to pass in (eg. [(r'\w+', "-")]); replacements refer to groups
+            as $1 rather than \1
+
+    Returns:
+        Expression giving the cleaned version of the column
+    """
+    if patterns is None:
+        patterns = []
+
+    text = (
+        pl.col(column)
+        .str.replace_all("&#39;", "'", literal=True)
+        .str.replace_all("&rdquo;", '"', literal=True)
+        .str.replace_all("&amp;", "&", literal=True)
+        .str.replace_all("â", "", literal=True)
+        .str.replace_all(r"<br\s*/?>", "")
+        .str.replace_all(r"<\s*br\s*/>", " ")
+        .str.replace_all(r"[^a-zA-Z0-9.'\"?: -]", "")
+        .str.replace_all(r"\w*ndash\w*", "")
+    )
+
+    for pattern, replacement in patterns:
+        text = text.str.replace_all(pattern, replacement)
+
+    # remove extra whitespace
+    return text.str.replace_all(r"\s+", " ").str.strip_chars()
+
+
 def truncate(text: str, num_words: int) -> str:
     """
     Truncates commments: